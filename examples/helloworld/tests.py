@@ -3,11 +3,12 @@ import unittest
 
 from pulsar import send, SERVER_SOFTWARE, get_application, get_actor
 from pulsar.apps.http import HttpClient
-from pulsar.apps.test import dont_run_with_thread
+from pulsar.apps.test import dont_run_with_thread, non_parallel
 
 from .manage import server
 
 
+@non_parallel
 class TestHelloWorldThread(unittest.TestCase):
     app_cfg = None
     concurrency = 'thread'
@@ -28,7 +28,8 @@ from random import random
 
 from pulsar import HttpRedirect, HttpException, version, JAPANESE, CHINESE
 from pulsar.utils.httpurl import (Headers, ENCODE_URL_METHODS,
-                                  ENCODE_BODY_METHODS)
+                                  ENCODE_BODY_METHODS, http_date)
+from pulsar.utils.string import random_string
 from pulsar.utils.html import escape
 from pulsar.apps import wsgi, ws
 from pulsar.apps.wsgi import (route, Html, Json, HtmlDocument, GZipMiddleware,
@@ -175,6 +176,16 @@ class HttpBin(BaseRouter):
         response = self.info_data_response(request, gzipped=True)
         return GZipMiddleware(10)(request.environ, response)
 
+    @route('gzip/stream/<int(min=1):m>/<int(min=1):n>',
+           title='Stream m chunk of gzip encoded data n times',
+           defaults={'m': 300, 'n': 20})
+    def gzip_stream(self, request):
+        m = request.urlargs['m']
+        n = request.urlargs['n']
+        request.response.content_type = 'text/plain'
+        request.response.content = repeat(b'a' * m, n)
+        return GZipMiddleware(10)(request.environ, request.response)
+
     @route(title='Returns cookie data')
     def cookies(self, request):
         cookies = request.cookies
@@ -191,6 +202,27 @@ class HttpBin(BaseRouter):
         request.response.headers['location'] = '/cookies'
         return request.response
 
+    @route(title='Returns 304 if an If-Modified-Since or If-None-Match '
+                 'header is present')
+    def cache(self, request):
+        if (request.get('HTTP_IF_MODIFIED_SINCE') or
+                request.get('HTTP_IF_NONE_MATCH')):
+            request.response.status_code = 304
+            return request.response
+        response = self.info_data_response(request)
+        response.headers['etag'] = '"%s"' % random_string()
+        response.headers['last-modified'] = http_date()
+        return response
+
+    @route('cache/<int(min=0):maxage>',
+           title='Sets a Cache-Control header for n seconds',
+           defaults={'maxage': 60})
+    def cache_control(self, request):
+        response = self.info_data_response(request)
+        response.headers['cache-control'] = ('public, max-age=%s' %
+                                             request.urlargs['maxage'])
+        return response
+
     @route('status/<int(min=100,max=505):status>',
            title='Returns given HTTP Status code',
            defaults={'status': 418})
@@ -322,6 +354,8 @@ class Site(wsgi.LazyWsgi):
                                  wsgi.authorization_middleware,
                                  wsgi.MediaRouter('media', ASSET_DIR,
                                                   show_indexes=True),
+                                 wsgi.MediaRouter('cached', ASSET_DIR,
+                                                  cache=True),
                                  ws.WebSocket('/graph-data', Graph()),
                                  router],
                                 async=True)
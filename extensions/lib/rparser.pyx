@@ -10,6 +10,7 @@ cdef bytes RESPONSE_STATUS = b'+'
 cdef bytes RESPONSE_ERROR = b'-'
 cdef bytes nil = b'$-1\r\n'
 cdef bytes null_array = b'*-1\r\n'
+cdef Py_ssize_t COMPACT_SIZE = 65536
 
 
 cdef class RedisParser:
@@ -17,12 +18,14 @@ cdef class RedisParser:
     cdef object _responseError
     cdef object _encoding
     cdef object _inbuffer
+    cdef Py_ssize_t _offset
     cdef Task _current
 
     def __cinit__(self, object perr, object rerr):
         self._protocolError = perr
         self._responseError = rerr
         self._inbuffer = bytearray()
+        self._offset = 0
 
     def on_connect(self, connection):
         if connection.decode_responses:
@@ -39,10 +42,22 @@ cdef class RedisParser:
             return self._get(None)
 
     def feed(self, stream):
-        self._inbuffer.extend(stream)
+        b = self._inbuffer
+        cdef Py_ssize_t offset = self._offset
+        if offset:
+            if offset == len(b):
+                del b[:]
+                self._offset = 0
+            elif offset >= COMPACT_SIZE or 2*offset >= len(b):
+                del b[:offset]
+                self._offset = 0
+        b.extend(stream)
 
     def buffer(self):
-        return self._inbuffer
+        return bytes(self._inbuffer[self._offset:])
+
+    def pending(self):
+        return bool(self._current) or self._offset < len(self._inbuffer)
 
     # CLIENT ENCODERS
     def pack_command(self, args):
@@ -114,10 +129,12 @@ cdef class RedisParser:
 
     cdef object _get(self, Task next):
         b = self._inbuffer
-        cdef int length = b.find(b'\r\n')
+        cdef Py_ssize_t offset = self._offset
+        cdef Py_ssize_t length = b.find(b'\r\n', offset)
         if length >= 0:
-            self._inbuffer, response = b[length+2:], bytes(b[:length])
-            rtype, response = response[:1], response[1:]
+            self._offset = length + 2
+            rtype = bytes(b[offset:offset+1])
+            response = bytes(b[offset+1:length])
             if rtype == RESPONSE_ERROR:
                 return self._responseError(response.decode('utf-8'))
             elif rtype == RESPONSE_INTEGER:
@@ -133,6 +150,7 @@ cdef class RedisParser:
             else:
                 # Clear the buffer and raise
                 self._inbuffer = bytearray()
+                self._offset = 0
                 raise self._protocolError('Protocol Error')
         else:
             return False
@@ -155,12 +173,16 @@ cdef class Task:
 
     cdef object decode(self, RedisParser parser, object result):
         cdef long length = self._length
+        cdef Py_ssize_t start, end
         cdef bytes chunk
         parser._current = None
         if length >= 0:
             b = parser._inbuffer
-            if len(b) >= length+2:
-                parser._inbuffer, chunk = b[length+2:], bytes(b[:length])
+            start = parser._offset
+            end = start + length
+            if len(b) >= end+2:
+                parser._offset = end + 2
+                chunk = bytes(b[start:end])
                 if parser._encoding:
                     return chunk.decode(parser._encoding)
                 else:
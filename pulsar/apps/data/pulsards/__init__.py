@@ -8,7 +8,7 @@ __all__ = ['PulsarStore', 'start_store']
 
 
 class PulsarStore(store.RedisStore):
-    pass
+    client_cache = True
 
 
 register_store('pulsar', 'pulsar.apps.data.PulsarStore')
@@ -0,0 +1,274 @@
+'''Client side caching for :class:`.RedisStore`.
+
+When a store is created with a positive ``cache_size``, the replies of
+the :data:`CACHED_COMMANDS` are kept in a per store least recently used
+cache, bounded by an approximate memory budget and keyed on the
+``(db, key)`` pair the command reads.
+
+The cache subscribes to the :data:`~pulsar.apps.ds.INVALIDATE_CHANNEL`,
+where pulsar-ds publishes the keys written by any client, and drops the
+entries of the published keys. Write commands executed through the store
+invalidate their keys locally as soon as they are sent, so that a
+coroutine always reads its own writes. Until the subscription is
+confirmed, or after it is lost, replies are not cached.
+
+The cache is therefore only available to stores connected to pulsar-ds.
+Redis servers do not publish written keys unless ``CLIENT TRACKING`` is
+enabled, which this cache does not issue.
+'''
+import sys
+from copy import copy
+from collections import OrderedDict
+
+from pulsar import Future, async
+from pulsar.utils.pep import to_string, to_bytes
+from pulsar.apps.ds import COMMANDS_INFO, INVALIDATE_CHANNEL
+
+from .pubsub import PubsubProtocol
+
+
+# Read commands whose replies are cached, their key is the first argument
+CACHED_COMMANDS = frozenset((
+    'EXISTS', 'GET', 'GETBIT', 'GETRANGE', 'HEXISTS', 'HGET', 'HGETALL',
+    'HKEYS', 'HLEN', 'HMGET', 'HVALS', 'LINDEX', 'LLEN', 'LRANGE', 'SCARD',
+    'SISMEMBER', 'SMEMBERS', 'STRLEN', 'TYPE', 'ZCARD', 'ZCOUNT', 'ZRANK',
+    'ZREVRANK', 'ZSCORE'))
+# Commands which replace all keys of a database
+FLUSH_COMMANDS = frozenset(('FLUSHDB', 'FLUSHALL'))
+# Commands which write keys not described by the command table
+SCRIPT_COMMANDS = frozenset(('EVAL', 'EVALSHA'))
+# Extra cost of a cache entry, the key tuple and the ordered dict links
+ENTRY_OVERHEAD = 200
+MISSING = object()
+
+
+def reply_size(value):
+    '''Approximate number of bytes used by a decoded reply'''
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v)
+                    for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(sys.getsizeof(v) for v in value)
+    return size
+
+
+def unshared(value):
+    '''A copy of a mutable reply, callers may modify replies'''
+    return copy(value) if isinstance(value, (dict, list, set)) else value
+
+
+class InvalidationProtocol(PubsubProtocol):
+    '''Subscription of a :class:`ClientCache` to the invalidation channel
+    '''
+    def data_received(self, data):
+        parser = self.parser
+        parser.feed(data)
+        response = parser.get()
+        while response is not False:
+            if isinstance(response, Exception):
+                raise response
+            elif response[0] == b'message':
+                self.handler.invalidate(response[2])
+            elif response[0] == b'subscribe':
+                self.handler.subscribed(self)
+            response = parser.get()
+
+
+class ClientCache:
+    '''A least recently used cache of replies for a :class:`.RedisStore`.
+
+    :param store: the :class:`.RedisStore` executing commands.
+    :param max_memory: maximum number of bytes used by cached replies.
+
+    .. attribute:: hits
+
+        Number of commands served by the cache
+
+    .. attribute:: misses
+
+        Number of cacheable commands sent to the server
+
+    .. attribute:: evictions
+
+        Number of keys evicted to stay within ``max_memory``
+
+    .. attribute:: invalidations
+
+        Number of keys invalidated while cached
+    '''
+    def __init__(self, store, max_memory):
+        self.store = store
+        self.max_memory = max_memory
+        self.used_memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._loop = store._loop
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._connection = None
+        self._subscribing = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def ready(self):
+        '''``True`` when the subscription to the invalidation channel is
+        confirmed and replies are cached'''
+        return self._connection is not None
+
+    def info(self):
+        return {'keys': len(self._entries),
+                'used_memory': self.used_memory,
+                'max_memory': self.max_memory,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations}
+
+    def execute(self, args, options):
+        '''Execute a command, from the cache when possible'''
+        command = to_string(args[0]).upper()
+        if command in CACHED_COMMANDS and len(args) > 1:
+            key = (self.store._database, to_bytes(args[1]))
+            try:
+                subkey = (command, args[2:], tuple(sorted(options.items())))
+                hash(subkey)
+            except TypeError:
+                pass
+            else:
+                value = self.get(key, subkey, MISSING)
+                if value is not MISSING:
+                    self.hits += 1
+                    future = Future(loop=self._loop)
+                    future.set_result(unshared(value))
+                    return future
+                self.misses += 1
+                return self._fetch(key, subkey, args, options)
+        else:
+            self.written(((args, options),))
+        return self.store._send(args, options)
+
+    def get(self, key, subkey, default=None):
+        '''Cached reply of ``subkey``, a command and its arguments, for
+        the ``(db, key)`` pair ``key``'''
+        entry = self._entries.get(key)
+        if entry is None or subkey not in entry[1]:
+            return default
+        self._entries.move_to_end(key)
+        return entry[1][subkey]
+
+    def set(self, key, subkey, value):
+        '''Cache ``value``, evicting least recently used keys'''
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [ENTRY_OVERHEAD +
+                                          sys.getsizeof(key[1]), {}]
+            self.used_memory += entry[0]
+        else:
+            self._entries.move_to_end(key)
+        old = entry[1].get(subkey)
+        size = reply_size(value)
+        if old is not None:
+            size -= reply_size(old)
+        entry[1][subkey] = value
+        entry[0] += size
+        self.used_memory += size
+        entries = self._entries
+        while entries and self.used_memory > self.max_memory:
+            _, (size, _) = entries.popitem(False)
+            self.used_memory -= size
+            self.evictions += 1
+
+    def invalidate(self, key=None):
+        '''Drop ``key`` from the cache, all keys if ``key`` is ``None``.
+
+        :param key: a key or a list of keys.
+        '''
+        if key is None:
+            self.invalidations += len(self._entries)
+            self.clear()
+        else:
+            keys = key if isinstance(key, list) else (key,)
+            for key in keys:
+                key = (self.store._database, to_bytes(key))
+                self._pending.pop(key, None)
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self.used_memory -= entry[0]
+                    self.invalidations += 1
+
+    def written(self, commands):
+        '''Invalidate the keys of write ``commands`` before they are sent
+        '''
+        for args, _ in commands:
+            if not self._entries and not self._pending:
+                return
+            command = to_string(args[0]).upper()
+            info = COMMANDS_INFO.get(command.lower())
+            if command in FLUSH_COMMANDS:
+                self.clear()
+            elif info is None or info.write or command in SCRIPT_COMMANDS:
+                self.invalidate([a for a in args[1:]
+                                 if isinstance(a, (bytes, str))])
+
+    def clear(self):
+        self._entries.clear()
+        self._pending.clear()
+        self.used_memory = 0
+
+    def subscribed(self, connection):
+        self._subscribing = False
+        self._connection = connection
+
+    def close(self):
+        connection = self._connection
+        self._connection_lost(connection)
+        if connection is not None:
+            connection.close()
+
+    # INTERNALS
+    def _fetch(self, key, subkey, args, options):
+        if self._connection is None:
+            self._subscribe()
+            token = None
+        else:
+            # a reply is cached only if the key is not invalidated while
+            # the command is in flight
+            token = self._pending[key] = object()
+        try:
+            value = yield from self.store._send(args, options)
+        finally:
+            if token is not None and self._pending.get(key) is token:
+                self._pending.pop(key)
+            else:
+                token = None
+        if token is not None:
+            self.set(key, subkey, value)
+            value = unshared(value)
+        return value
+
+    def _subscribe(self):
+        if not self._subscribing:
+            self._subscribing = True
+            future = async(self.store.connect(
+                lambda: InvalidationProtocol(self, producer=self.store)),
+                loop=self._loop)
+            future.add_done_callback(self._connected)
+
+    def _connected(self, future):
+        if future.cancelled() or future.exception():
+            self._subscribing = False
+        else:
+            connection = future.result()
+            connection.bind_event('connection_lost', self._connection_lost)
+            async(connection.execute('SUBSCRIBE', INVALIDATE_CHANNEL),
+                  loop=self._loop)
+
+    def _connection_lost(self, connection, exc=None):
+        self._subscribing = False
+        self._connection = None
+        self.clear()
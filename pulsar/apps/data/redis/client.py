@@ -129,7 +129,7 @@ class Consumer(pulsar.ProtocolConsumer):
                             lambda v: float(v) if v is not None else v),
         string_keys_to_dict('ZRANGE ZRANGEBYSCORE ZREVRANGE ZREVRANGEBYSCORE',
                             values_to_zset),
-        string_keys_to_dict('EXISTS EXPIRE EXPIREAT PEXPIRE PEXPIREAT '
+        string_keys_to_dict('EXPIRE EXPIREAT PEXPIRE PEXPIREAT '
                             'PERSIST RENAMENX',
                             lambda r: bool(r)),
         {
@@ -183,6 +183,10 @@ class Consumer(pulsar.ProtocolConsumer):
                     responses.append(response)
                     response = parser.get()
                 if len(responses) == len(commands):
+                    if isinstance(responses[-1], Exception):
+                        # EXEC failed and the transaction was discarded
+                        return self.finished(
+                            ResponseError(error or responses[-1]))
                     response = []
                     for cmds, resp in zip(commands[1:-1], responses[-1]):
                         args, options = cmds
@@ -197,6 +201,52 @@ class Consumer(pulsar.ProtocolConsumer):
             self.finished(exc=exc)
 
 
+class MultiplexConsumer(Consumer):
+    '''Consumer of a connection shared by concurrent commands.
+
+    The request is the queue of ``(args, options, future)`` triplets
+    waiting for a reply, the consumer never finishes until the connection
+    is lost.
+    '''
+    def start_request(self):
+        pass
+
+    def send(self, commands):
+        conn = self._connection
+        conn._transport.write(conn.parser.pack_pipeline(
+            [(args, options) for args, options, _ in commands]))
+        self._request.extend(commands)
+
+    def data_received(self, data):
+        parser = self._connection.parser
+        parser.feed(data)
+        waiting = self._request
+        response = parser.get()
+        while response is not False:
+            args, options, future = waiting.popleft()
+            if not future.done():
+                if isinstance(response, Exception):
+                    future.set_exception(response)
+                else:
+                    try:
+                        response = self.parse_response(response, args[0],
+                                                       options)
+                    except Exception as exc:
+                        future.set_exception(exc)
+                    else:
+                        future.set_result(response)
+            response = parser.get()
+
+    def connection_lost(self, exc):
+        waiting = self._request
+        while waiting:
+            _, _, future = waiting.popleft()
+            if not future.done():
+                future.set_exception(
+                    exc or ConnectionResetError('Connection lost'))
+        return super(MultiplexConsumer, self).connection_lost(exc)
+
+
 class RedisClient(object):
     '''Client for :class:`.RedisStore`.
 
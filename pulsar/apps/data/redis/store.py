@@ -1,12 +1,26 @@
 from functools import partial
+from collections import deque
 
-from pulsar import Connection, Pool, get_actor
+from pulsar import (Connection, Pool, Future, get_actor, async,
+                    ImproperlyConfigured)
 from pulsar.utils.pep import to_string
 from pulsar.apps.data import RemoteStore
 from pulsar.apps.ds import redis_parser
+from pulsar.apps.ds.memory import parse_memory
 
-from .client import RedisClient, Pipeline, Consumer, ResponseError
+from .client import (RedisClient, Pipeline, Consumer, MultiplexConsumer,
+                     ResponseError)
 from .pubsub import RedisPubSub
+from .cache import ClientCache
+
+
+# Commands which change or block the state of their connection and are
+# never multiplexed
+EXCLUSIVE_COMMANDS = frozenset(('AUTH', 'BLPOP', 'BRPOP', 'BRPOPLPUSH',
+                                'CLIENT', 'DISCARD', 'EXEC', 'MONITOR',
+                                'MULTI', 'PSUBSCRIBE', 'PUNSUBSCRIBE', 'QUIT',
+                                'SELECT', 'SUBSCRIBE', 'UNSUBSCRIBE',
+                                'UNWATCH', 'WATCH'))
 
 
 class RedisStoreConnection(Connection):
@@ -26,14 +40,104 @@ class RedisStoreConnection(Connection):
         return consumer.on_finished
 
 
+class Multiplexer:
+    '''Send the commands of concurrent coroutines on one connection.
+
+    Commands executed during a loop iteration are queued and written
+    together, in one pipeline, on a connection shared by all coroutines.
+    Replies are matched to the waiting futures in FIFO order by the
+    :class:`.MultiplexConsumer` of the connection.
+
+    .. attribute:: commands
+
+        Number of commands sent
+
+    .. attribute:: writes
+
+        Number of writes into the transport
+    '''
+    def __init__(self, store):
+        self.store = store
+        self.commands = 0
+        self.writes = 0
+        self._loop = store._loop
+        self._consumer = None
+        self._connecting = False
+        self._scheduled = False
+        self._queue = []
+
+    def execute(self, args, options):
+        future = Future(loop=self._loop)
+        self._queue.append((args, options, future))
+        if not self._scheduled:
+            self._scheduled = True
+            self._loop.call_soon(self._flush)
+        return future
+
+    def close(self):
+        consumer, self._consumer = self._consumer, None
+        if consumer and consumer.connection:
+            consumer.connection.close()
+
+    def _flush(self):
+        self._scheduled = False
+        if not self._queue:
+            return
+        elif self._consumer is not None:
+            queue, self._queue = self._queue, []
+            self.commands += len(queue)
+            self.writes += 1
+            self._consumer.send(queue)
+        elif not self._connecting:
+            self._connecting = True
+            async(self._connect(), loop=self._loop)
+
+    def _connect(self):
+        try:
+            connection = yield from self.store.connect()
+        except Exception as exc:
+            self._connecting = False
+            queue, self._queue = self._queue, []
+            for _, _, future in queue:
+                if not future.done():
+                    future.set_exception(exc)
+        else:
+            self._connecting = False
+            connection.upgrade(MultiplexConsumer)
+            consumer = connection.current_consumer()
+            consumer.start(deque())
+            connection.bind_event('connection_lost', self._connection_lost)
+            self._consumer = consumer
+            self._flush()
+
+    def _connection_lost(self, connection, exc=None):
+        if self._consumer and self._consumer.connection in (connection,
+                                                             None):
+            self._consumer = None
+
+
 class RedisStore(RemoteStore):
     '''Redis :class:`.Store` implementation.
+
+    :param multiplex: when ``True``, commands are sent through a
+        :class:`.Multiplexer` rather than on a connection checked out of
+        the :attr:`pool`. Blocking commands, transactions and
+        :data:`EXCLUSIVE_COMMANDS` always use the pool.
+    :param cache_size: when positive, the maximum memory, in bytes or as
+        a string such as ``10mb``, of the :class:`.ClientCache` of
+        replies to read commands. Only available when
+        :attr:`client_cache` is ``True``.
     '''
     protocol_factory = partial(RedisStoreConnection, Consumer)
     supported_queries = frozenset(('filter', 'exclude'))
+    client_cache = False
+    '''Whether the server publishes the keys written by its clients on the
+    :data:`~pulsar.apps.ds.INVALIDATE_CHANNEL`, which the
+    :class:`.ClientCache` requires'''
 
     def _init(self, namespace=None, parser_class=None, pool_size=50,
-              decode_responses=False, **kwargs):
+              decode_responses=False, multiplex=False, cache_size=0,
+              **kwargs):
         self._decode_responses = decode_responses
         if not parser_class:
             actor = get_actor()
@@ -43,6 +147,12 @@ class RedisStore(RemoteStore):
         if namespace:
             self._urlparams['namespace'] = namespace
         self._pool = Pool(self.connect, pool_size=pool_size, loop=self._loop)
+        self._multiplexer = Multiplexer(self) if multiplex else None
+        cache_size = parse_memory(cache_size)
+        if cache_size and not self.client_cache:
+            raise ImproperlyConfigured('client side caching is not '
+                                       'supported by %s' % self.name)
+        self._cache = ClientCache(self, cache_size) if cache_size else None
         if self._database is None:
             self._database = 0
         self._database = int(self._database)
@@ -52,6 +162,11 @@ class RedisStore(RemoteStore):
     def pool(self):
         return self._pool
 
+    @property
+    def cache(self):
+        '''The :class:`.ClientCache` of this store or ``None``'''
+        return self._cache
+
     @property
     def namespace(self):
         '''The prefix namespace to append to all transaction on keys
@@ -77,6 +192,18 @@ class RedisStore(RemoteStore):
         return self.client().ping()
 
     def execute(self, *args, **options):
+        if self._cache is not None:
+            return self._cache.execute(args, options)
+        return self._send(args, options)
+
+    def _send(self, args, options):
+        multiplexer = self._multiplexer
+        if (multiplexer is not None and
+                to_string(args[0]).upper() not in EXCLUSIVE_COMMANDS):
+            return multiplexer.execute(args, options)
+        return self._execute(args, options)
+
+    def _execute(self, args, options):
         connection = yield from self._pool.connect()
         with connection:
             result = yield from connection.execute(*args, **options)
@@ -85,6 +212,8 @@ class RedisStore(RemoteStore):
             return result
 
     def execute_pipeline(self, commands, raise_on_error=True):
+        if self._cache is not None:
+            self._cache.written(commands)
         conn = yield from self._pool.connect()
         with conn:
             result = yield from conn.execute_pipeline(commands, raise_on_error)
@@ -99,8 +228,9 @@ class RedisStore(RemoteStore):
             transport, connection = yield from self._loop.create_connection(
                 protocol_factory, host, port)
         else:
-            raise NotImplementedError('Could not connect to %s' %
-                                      str(self._host))
+            transport, connection = (
+                yield from self._loop.create_unix_connection(
+                    protocol_factory, self._host))
         if self._password:
             yield from connection.execute('AUTH', self._password)
         if self._database:
@@ -112,6 +242,10 @@ class RedisStore(RemoteStore):
 
     def close(self):
         '''Close all open connections.'''
+        if self._multiplexer:
+            self._multiplexer.close()
+        if self._cache is not None:
+            self._cache.close()
         return self._pool.close()
 
     def has_query(self, query_type):
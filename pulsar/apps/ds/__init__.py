@@ -1,4 +1,4 @@
 from .server import PulsarDS, DEFAULT_PULSAR_STORE_ADDRESS, pulsards_url
-from .client import COMMANDS_INFO, redis_to_py_pattern
+from .client import COMMANDS_INFO, INVALIDATE_CHANNEL, redis_to_py_pattern
 from .parser import (PyRedisParser, RedisParser, redis_parser, ResponseError,
                      InvalidResponse, NoScriptError)
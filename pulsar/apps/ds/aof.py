@@ -0,0 +1,268 @@
+'''Append only file for pulsar-ds.
+
+When the :ref:`key_value_appendonly <setting-key_value_appendonly>`
+setting is on, every write command executed by the server is appended,
+in the redis protocol, to the
+:ref:`key_value_appendfilename <setting-key_value_appendfilename>` file.
+Commands are buffered and written once per event loop iteration, the
+file is synced according to the
+:ref:`key_value_appendfsync <setting-key_value_appendfsync>` policy:
+
+* ``always`` sync before replies are sent to clients
+* ``everysec`` sync once every second in the loop executor
+* ``no`` leave it to the operating system
+
+On start-up the file is replayed through the redis parser. The file is
+compacted by a background rewrite which dumps the current data set as
+commands from a forked child while new commands are kept in memory and
+appended to the new file once the child is done.
+'''
+import os
+import time
+from collections import deque
+
+from pulsar.utils.structures import Zset
+
+from .encoding import Packed
+
+
+CHUNK_SIZE = 65536
+FSYNC_POLICIES = ('always', 'everysec', 'no')
+# Number of items per command when rewriting collections
+REWRITE_ITEMS_PER_COMMAND = 64
+# Commands replaced by an absolute PEXPIREAT in the log
+EXPIRE_COMMANDS = frozenset(('expire', 'pexpire', 'expireat', 'pexpireat'))
+# Commands followed by an absolute PEXPIREAT in the log
+TIMEOUT_COMMANDS = frozenset(('set', 'setex', 'psetex', 'restore'))
+# Blocking commands are logged as their non-blocking equivalent
+BLOCKING_COMMANDS = frozenset(('blpop', 'brpop', 'brpoplpush'))
+
+
+class AppendOnlyFile:
+    '''The append only log of write commands.
+
+    .. attribute:: auto_rewrite_min_size
+
+        Minimum size of the file before an automatic rewrite is triggered
+
+    .. attribute:: auto_rewrite_percentage
+
+        Grow percentage, with respect to the size after the latest
+        rewrite, which triggers an automatic rewrite
+    '''
+    auto_rewrite_min_size = 64*1024*1024
+    auto_rewrite_percentage = 100
+
+    def __init__(self, filename, fsync, loop, parser, logger):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError('Unknown fsync policy "%s"' % fsync)
+        self.filename = filename
+        self.fsync = fsync
+        self.logger = logger
+        self._loop = loop
+        self._parser = parser
+        self._file = open(filename, 'ab', 0)
+        self._buffer = []
+        self._scheduled = False
+        self._unsynced = False
+        self._db = None
+        self._rewrite_buffer = None
+        self._rewrite_db = None
+        self._rewrite_pid = None
+        self._rewrite_started = None
+        self.size = self.base_size = os.path.getsize(filename)
+        self.last_rewrite_status = 'ok'
+        self.last_rewrite_duration = -1
+        self.commands = 0
+        self.writes = 0
+        self.fsyncs = 0
+
+    @property
+    def rewrite_in_progress(self):
+        return self._rewrite_pid is not None
+
+    def append(self, db, request):
+        '''Append ``request`` executed on database number ``db``.
+        '''
+        data = self._parser.pack_command(request)
+        self.commands += 1
+        if db != self._db:
+            self._db = db
+            self._buffer.append(self._parser.pack_command(('select', db)))
+        self._buffer.append(data)
+        if self._rewrite_buffer is not None:
+            if db != self._rewrite_db:
+                self._rewrite_db = db
+                self._rewrite_buffer.append(
+                    self._parser.pack_command(('select', db)))
+            self._rewrite_buffer.append(data)
+        if not self._scheduled:
+            self._scheduled = True
+            self._loop.call_soon(self.flush)
+
+    def flush(self):
+        '''Write pending commands into the file'''
+        self._scheduled = False
+        if self._buffer:
+            data = b''.join(self._buffer)
+            self._buffer = []
+            self._file.write(data)
+            self.size += len(data)
+            self.writes += 1
+            if self.fsync == 'always':
+                os.fsync(self._file.fileno())
+                self.fsyncs += 1
+            else:
+                self._unsynced = True
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def cron(self, dbs):
+        '''Invoked every second by the server.
+
+        :param dbs: callable returning the data to rewrite the file with.
+        '''
+        if self._unsynced and self.fsync == 'everysec':
+            self._unsynced = False
+            self.fsyncs += 1
+            self._loop.run_in_executor(None, os.fsync, self._file.fileno())
+        if self._rewrite_pid:
+            self._check_rewrite()
+        elif (self.size >= self.auto_rewrite_min_size and
+              self.size >= self.base_size*(
+                  1 + 0.01*self.auto_rewrite_percentage)):
+            self.logger.info('Starting automatic rewrite of "%s"',
+                             self.filename)
+            self.rewrite(dbs())
+
+    def rewrite(self, dbs):
+        '''Rewrite the file from ``dbs`` in a forked child process.
+
+        :param dbs: list of ``(num, data, expires, delta)`` tuples.
+        '''
+        if self._rewrite_pid:
+            return False
+        self._rewrite_started = time.time()
+        temp = self._rewrite_filename()
+        if not hasattr(os, 'fork'):
+            self._rewrite_buffer = []
+            self._rewrite_db = None
+            rewrite_aof(temp, dbs, self._parser)
+            return self._rewrite_done(True)
+        pid = os.fork()
+        if pid:
+            self._rewrite_pid = pid
+            self._rewrite_buffer = []
+            self._rewrite_db = None
+            return True
+        code = 1
+        try:
+            rewrite_aof(temp, dbs, self._parser)
+            code = 0
+        except Exception:
+            self.logger.exception('Could not rewrite append only file')
+        finally:
+            os._exit(code)
+
+    def _rewrite_filename(self):
+        return '%s.rewrite' % self.filename
+
+    def _check_rewrite(self):
+        try:
+            pid, status = os.waitpid(self._rewrite_pid, os.WNOHANG)
+        except ChildProcessError:
+            pid, status = self._rewrite_pid, 1
+        if pid:
+            self._rewrite_pid = None
+            self._rewrite_done(status == 0)
+
+    def _rewrite_done(self, success):
+        temp = self._rewrite_filename()
+        buffer, self._rewrite_buffer = self._rewrite_buffer, None
+        self.last_rewrite_duration = time.time() - self._rewrite_started
+        if not success:
+            self.last_rewrite_status = 'err'
+            self.logger.error('Append only file rewrite failed')
+            return False
+        self.flush()
+        with open(temp, 'ab') as file:
+            file.write(b''.join(buffer))
+            file.flush()
+            os.fsync(file.fileno())
+        self._file.close()
+        os.replace(temp, self.filename)
+        self._file = open(self.filename, 'ab', 0)
+        self._db = self._rewrite_db
+        self.size = self.base_size = os.path.getsize(self.filename)
+        self.last_rewrite_status = 'ok'
+        self.logger.info('Rewritten append only file "%s", %d bytes',
+                         self.filename, self.size)
+        return True
+
+
+class AofReader:
+    '''Decode the requests stored in an append only ``file``
+    '''
+    def __init__(self, file, parser):
+        self._file = file
+        self._parser = parser
+        self.loaded = 0
+        self.keys = 0
+
+    def requests(self):
+        parser = self._parser
+        while True:
+            chunk = self._file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            self.loaded += len(chunk)
+            parser.feed(chunk)
+            request = parser.get()
+            while request is not False:
+                self.keys += 1
+                yield request
+                request = parser.get()
+        if parser.pending():
+            raise ValueError('Append only file is truncated')
+
+
+def rewrite_aof(filename, dbs, parser):
+    '''Write the commands which rebuild ``dbs`` into ``filename``
+    '''
+    pack = parser.pack_command
+    n = REWRITE_ITEMS_PER_COMMAND
+    with open(filename, 'wb', CHUNK_SIZE) as file:
+        write = file.write
+        for num, data, expires, delta in dbs:
+            write(pack(('select', num)))
+            for key, value in data.items():
+                if isinstance(value, Packed):
+                    value = value.unpack()
+                if isinstance(value, bytearray):
+                    write(pack(('set', key, bytes(value))))
+                elif isinstance(value, dict):
+                    items = []
+                    for pair in value.items():
+                        items.extend(pair)
+                    for i in range(0, len(items), 2*n):
+                        write(pack(['hmset', key] + items[i:i+2*n]))
+                elif isinstance(value, Zset):
+                    items = []
+                    for pair in value.items():
+                        items.extend(pair)
+                    for i in range(0, len(items), 2*n):
+                        write(pack(['zadd', key] + items[i:i+2*n]))
+                else:
+                    command = 'sadd' if isinstance(value, set) else 'rpush'
+                    assert isinstance(value, (set, deque))
+                    items = list(value)
+                    for i in range(0, len(items), n):
+                        write(pack([command, key] + items[i:i+n]))
+                deadline = expires.get(key)
+                if deadline is not None:
+                    write(pack(('pexpireat', key,
+                                int(1000*(deadline + delta)))))
+        file.flush()
+        os.fsync(file.fileno())
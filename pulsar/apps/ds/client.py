@@ -1,12 +1,18 @@
 import time
 from functools import partial
+from collections import deque
 
 import pulsar
 from pulsar.utils.structures import OrderedDict
 from pulsar.utils.pep import to_string, to_bytes
 
+from .memory import NO_DENY_COMMANDS
+
 
 COMMANDS_INFO = OrderedDict()
+# Channel where the server publishes the keys modified by write commands,
+# the channel redis uses to broadcast client side caching invalidations
+INVALIDATE_CHANNEL = b'__redis__:invalidate'
 
 
 class CommandError(Exception):
@@ -44,6 +50,7 @@ class command:
 
 
 class ClientMixin(object):
+    loading_allowed = False
 
     def __init__(self, store):
         self.store = store
@@ -52,6 +59,7 @@ class ClientMixin(object):
         self.last_command = ''
         self.flag = 0
         self.blocked = None
+        self.errors = 0
 
     @property
     def db(self):
@@ -74,7 +82,7 @@ class ClientMixin(object):
                 return self.reply_error('Blocked client cannot request')
             if self.transaction is not None and command not in 'exec':
                 self.transaction.append((handle, request))
-                return self._transport.write(self.store.QUEUED)
+                return self._send(self.store.QUEUED)
         self._execute_command(handle, request)
 
     def _execute_command(self, handle, request):
@@ -88,7 +96,30 @@ class ClientMixin(object):
                     if command != 'auth':
                         return self.reply_error(
                             'Authentication required', 'NOAUTH')
-                handle(self, request, len(request) - 1)
+                if (self.store._loading and not self.loading_allowed and
+                        command not in ('info', 'ping')):
+                    return self.reply_error(
+                        'Loading the dataset in memory', 'LOADING')
+                store = self.store
+                if (store._maxmemory and handle._info.write and
+                        command not in NO_DENY_COMMANDS and
+                        not store._free_memory()):
+                    store._rejected_commands += 1
+                    return self.reply_error(
+                        "command not allowed when used memory > 'maxmemory'",
+                        'OOM')
+                errors = self.errors
+                writing, store._writing = store._writing, handle._info.write
+                try:
+                    handle(self, request, len(request) - 1)
+                finally:
+                    store._writing = writing
+                if (self.store._aof is not None and handle._info.write and
+                        self.errors == errors):
+                    self.store._aof_append(self.db, request)
+                if store._maxmemory and handle._info.write:
+                    # Keep within the limit once the write is done too
+                    store._free_memory()
             else:
                 command = ''
                 return self.reply_error("no command")
@@ -133,7 +164,14 @@ class ClientMixin(object):
 
 
 class PulsarStoreClient(pulsar.Protocol, ClientMixin):
-    '''Used both by client and server'''
+    '''Used both by client and server
+
+    Replies to the requests decoded during one :meth:`data_received` call
+    are collected in an output buffer and written to the transport in one
+    go once all requests have been executed, or earlier if the buffer
+    exceeds :attr:`output_buffer_size` bytes.
+    '''
+    output_buffer_size = 65536
 
     def __init__(self, cfg, *args, **kw):
         super(PulsarStoreClient, self).__init__(*args, **kw)
@@ -145,9 +183,24 @@ class PulsarStoreClient(pulsar.Protocol, ClientMixin):
         self.patterns = set()
         self.watched_keys = None
         self.password = b''
+        self.replies = 0
+        self.writes = 0
+        self._outbuffer = None
+        self._outsize = 0
+        # Replies of requests proxied to other shards, see _defer
+        self._deferred = None
+        self.router = None
         self.bind_event('connection_lost',
                         partial(self.store._remove_connection, self))
 
+    def execute(self, request):
+        router = self.router
+        if (router is not None and request and not self.blocked and
+                self.store._password == self.password and
+                router.route(request)):
+            return
+        super(PulsarStoreClient, self).execute(request)
+
     # Client Mixin Implementation
     def reply_ok(self):
         self._write(self.store.OK)
@@ -166,10 +219,12 @@ class PulsarStoreClient(pulsar.Protocol, ClientMixin):
 
     def reply_error(self, value, prefix=None):
         prefix = prefix or 'ERR'
+        self.errors += 1
         self._write(('-%s %s\r\n' % (prefix, value)).encode('utf-8'))
 
     def reply_wrongtype(self):
         # Quick wrong type method
+        self.errors += 1
         self._write((b'-WRONGTYPE Operation against a key holding '
                      b'the wrong kind of value\r\n'))
 
@@ -186,21 +241,98 @@ class PulsarStoreClient(pulsar.Protocol, ClientMixin):
         self._write(self.store._parser.multi_bulk_len(value))
 
     # Protocol Implementaton
+    def connection_made(self, transport):
+        super(PulsarStoreClient, self).connection_made(transport)
+        cluster = self.store._cluster
+        if cluster is not None:
+            if transport.get_extra_info('sockname') in cluster.peers:
+                # Requests proxied by other workers are executed locally
+                self.password = self.store._password
+            else:
+                self.router = cluster.router(self)
+                self.bind_event('connection_lost', self.router.close)
+
     def data_received(self, data):
         self.parser.feed(data)
         request = self.parser.get()
-        while request is not False:
-            if self.store._monitors:
-                self.store._write_to_monitors(self, request)
-            self.execute(request)
-            request = self.parser.get()
+        if request is not False:
+            self.store._reply_batches += 1
+            self._outbuffer = []
+            try:
+                while request is not False:
+                    if self.store._monitors:
+                        self.store._write_to_monitors(self, request)
+                    self.execute(request)
+                    request = self.parser.get()
+            finally:
+                aof = self.store._aof
+                if aof is not None and aof.fsync == 'always':
+                    aof.flush()
+                self._flush()
+                self._outbuffer = None
 
     # Internals
     def _write(self, response):
         if self.transaction is not None:
             self.transaction.append(response)
+        else:
+            self._send(response)
+
+    def _send(self, data):
+        self.replies += 1
+        self.store._replies += 1
+        deferred = self._deferred
+        if deferred:
+            # hold the reply until the replies before it are available
+            deferred[-1][1].append(data)
+        else:
+            self._output(data)
+
+    def _output(self, data):
+        buffer = self._outbuffer
+        if buffer is not None:
+            buffer.append(data)
+            self._outsize += len(data)
+            if self._outsize >= self.output_buffer_size:
+                self._flush()
         elif not self._transport._closing:
-            self._transport.write(response)
+            self.writes += 1
+            self.store._reply_writes += 1
+            self._transport.write(data)
+
+    def _flush(self):
+        buffer = self._outbuffer
+        if buffer:
+            self._outbuffer = []
+            self._outsize = 0
+            if not self._transport._closing:
+                self.writes += 1
+                self.store._reply_writes += 1
+                self._transport.write(b''.join(buffer))
+
+    def _defer(self):
+        '''Reserve the place of a reply which is not available yet.
+
+        Replies sent after this call are held until the reply is set via
+        :meth:`_resolve`, so that clients receive replies in the order
+        requests were received.
+        '''
+        if self._deferred is None:
+            self._deferred = deque()
+        entry = [None, []]
+        self._deferred.append(entry)
+        return entry
+
+    def _resolve(self, entry, data):
+        entry[0] = data
+        self.replies += 1
+        self.store._replies += 1
+        deferred = self._deferred
+        while deferred and deferred[0][0] is not None:
+            data, held = deferred.popleft()
+            if held:
+                data = b''.join([data] + held)
+            self._output(data)
 
 
 class LuaClient(ClientMixin):
@@ -235,9 +367,11 @@ class LuaClient(ClientMixin):
         self.result = self.status_reply(status)
 
     def reply_error(self, value, prefix=None):
+        self.errors += 1
         self.result = self.error_reply(value, prefix)
 
     def reply_wrongtype(self):
+        self.errors += 1
         self.result = self.error_reply('WRONGTYPE')
 
     def reply_int(self, value):
@@ -271,6 +405,39 @@ class LuaClient(ClientMixin):
             return self.reply_error(str(e))
 
 
+class ReplayClient(ClientMixin):
+    '''Client replaying the commands stored in the append only file.
+
+    Replies are discarded, errors are logged.
+    '''
+    loading_allowed = True
+    channels = patterns = ()
+
+    def __init__(self, store):
+        super(ReplayClient, self).__init__(store)
+        self.password = store._password
+        self._loop = store._loop
+
+    def reply_error(self, value, prefix=None):
+        self.errors += 1
+        self._loop.logger.warning('Error while replaying append only '
+                                  'file: %s', value)
+
+    def reply_wrongtype(self):
+        self.reply_error('WRONGTYPE')
+
+    def reply_ok(self):
+        pass
+
+    def reply_status(self, status):
+        pass
+
+    def reply_int(self, value):
+        pass
+    reply_one = reply_zero = reply_ok
+    reply_bulk = reply_multi_bulk = reply_multi_bulk_len = reply_int
+
+
 class Blocked:
     '''Handle blocked keys for a client
     '''
@@ -0,0 +1,785 @@
+'''Sharded pulsar-ds.
+
+When the :ref:`key_value_shards <setting-key_value_shards>` setting is on
+and the server runs more than one worker, the key space is split into the
+:data:`SLOTS` hash slots of redis cluster. The slot of a key is the CRC16
+of the key, or of its ``{hash tag}``, and each worker owns a contiguous
+range of slots, its shard, together with the snapshot and append only
+files of the shard.
+
+Clients connect to any worker. A command on keys owned by another shard
+is proxied, in one hop, through a connection the client session keeps
+with the owning worker, so that the selected database, watched keys and
+blocking commands behave as they do on a single server. Replies are
+returned in the order requests were received. Workers accept proxied
+connections on a private socket and execute them locally.
+
+Commands on keys owned by several shards are handled as follows:
+
+* ``MGET``, ``MSET``, ``DEL`` and ``EXISTS`` are split by shard and the
+  replies merged;
+* ``SUNION``, ``SINTER``, ``SDIFF``, the ``*STORE`` commands, ``BITOP``,
+  ``RENAME``, ``RENAMENX``, ``SMOVE`` and ``RPOPLPUSH`` fetch copies of
+  their keys, are executed on a scratch database and the keys they write
+  are restored on their owners, they are not atomic;
+* ``DBSIZE``, ``KEYS``, ``RANDOMKEY``, ``SCAN``, ``PUBLISH``, ``FLUSHDB``,
+  ``FLUSHALL``, ``SAVE``, ``BGSAVE``, ``BGREWRITEAOF``, ``SCRIPT`` and
+  ``CONFIG SET`` are sent to all shards;
+* any other command, ``WATCH`` and ``MULTI``/``EXEC`` blocks fail with a
+  ``CROSSSLOT`` error. Hash tags keep related keys in the same shard.
+
+Keys written on a shard are published, for client side caches, to the
+subscribers of the :data:`.INVALIDATE_CHANNEL` on that shard only, a
+subscription to the channel is therefore mirrored on all shards.
+'''
+import os
+import asyncio
+from binascii import crc_hqx
+from collections import deque
+from functools import partial
+from random import choice
+
+from pulsar import async
+from pulsar.utils.pep import to_string
+
+from .parser import PyRedisParser
+from .client import (ClientMixin, COMMANDS_INFO, INVALIDATE_CHANNEL,
+                     CommandError)
+
+
+SLOTS = 16384
+CROSSSLOT = "Keys in request don't hash to the same shard"
+# Commands without keys
+KEYLESS_GROUPS = frozenset(('Server', 'Connections', 'Pub/Sub',
+                            'Transactions', 'Scripting'))
+# First key, last key (negative from the end of the request) and step
+KEY_SPECS = {'bitop': (2, -1, 1),
+             'blpop': (1, -2, 1),
+             'brpop': (1, -2, 1),
+             'brpoplpush': (1, 2, 1),
+             'del': (1, -1, 1),
+             'exists': (1, -1, 1),
+             'memory': (2, 2, 1),
+             'mget': (1, -1, 1),
+             'mset': (1, -1, 2),
+             'msetnx': (1, -1, 2),
+             'object': (2, 2, 1),
+             'rename': (1, 2, 1),
+             'renamenx': (1, 2, 1),
+             'rpoplpush': (1, 2, 1),
+             'sdiff': (1, -1, 1),
+             'sdiffstore': (1, -1, 1),
+             'sinter': (1, -1, 1),
+             'sinterstore': (1, -1, 1),
+             'smove': (1, 2, 1),
+             'sunion': (1, -1, 1),
+             'sunionstore': (1, -1, 1),
+             'watch': (1, -1, 1)}
+# Commands executed on a scratch database when keys are in several shards
+SCRATCH_COMMANDS = frozenset(('bitop', 'rename', 'renamenx', 'rpoplpush',
+                              'sdiff', 'sdiffstore', 'sinter', 'sinterstore',
+                              'smove', 'sunion', 'sunionstore', 'zinterstore',
+                              'zunionstore'))
+# Scratch commands which write all their keys rather than the first one
+MOVE_COMMANDS = frozenset(('rename', 'renamenx', 'rpoplpush', 'smove'))
+
+
+def key_slot(key):
+    '''The hash slot of ``key``.
+
+    Only the first non empty ``{tag}`` in the key is hashed, if present.
+    '''
+    start = key.find(b'{')
+    if start >= 0:
+        end = key.find(b'}', start + 1)
+        if end > start + 1:
+            key = key[start+1:end]
+    return crc_hqx(key, 0) % SLOTS
+
+
+def command_keys(request):
+    '''The keys of a ``request`` with a lower case command name'''
+    command = request[0]
+    try:
+        if command in ('eval', 'evalsha'):
+            return request[3:3+int(request[2])]
+        elif command in ('zunionstore', 'zinterstore'):
+            return request[1:2] + request[3:3+int(request[2])]
+    except (IndexError, ValueError):
+        return ()
+    spec = KEY_SPECS.get(command)
+    if spec:
+        first, last, step = spec
+        if last < 0:
+            last += len(request)
+        return request[first:last+1:step]
+    elif command == 'sort':
+        keys = request[1:2]
+        for i, value in enumerate(request[2:-1], 2):
+            if value.lower() == b'store':
+                keys.append(request[i+1])
+        return keys
+    info = COMMANDS_INFO.get(command)
+    if info is None or info.group in KEYLESS_GROUPS:
+        return ()
+    return request[1:2]
+
+
+def reply_end(buffer, start=0):
+    '''The end of the reply which starts at ``start`` in ``buffer``.
+
+    Return -1 if the reply is not complete.
+    '''
+    end = buffer.find(b'\r\n', start)
+    if end < 0:
+        return -1
+    rtype = buffer[start]
+    end += 2
+    if rtype == 36:     # $
+        length = int(buffer[start+1:end-2])
+        if length >= 0:
+            end += length + 2
+            if end > len(buffer):
+                return -1
+    elif rtype == 42:   # *
+        for _ in range(int(buffer[start+1:end-2])):
+            end = reply_end(buffer, end)
+            if end < 0:
+                break
+    return end
+
+
+def decode(reply):
+    '''Decode a single ``reply``, errors are returned not raised'''
+    parser = PyRedisParser()
+    parser.feed(reply)
+    return parser.get()
+
+
+def is_error(reply):
+    return reply[:1] == b'-'
+
+
+def shard_filename(filename, index):
+    '''The name of the file of shard ``index``'''
+    root, ext = os.path.splitext(filename)
+    return '%s.%d%s' % (root, index, ext)
+
+
+def create_shard_sockets(loop, shards):
+    '''Create the private sockets of ``shards`` workers'''
+    sockets = []
+    for _ in range(shards):
+        server = yield from loop.create_server(asyncio.Protocol,
+                                               '127.0.0.1', 0)
+        sock = server.sockets[0]
+        loop.remove_reader(sock.fileno())
+        sockets.append(sock)
+    return sockets
+
+
+class Cluster:
+    '''The shards of the key space.
+
+    :param index: the shard owned by this worker.
+    :param addresses: the private address of each shard.
+    '''
+    def __init__(self, index, addresses):
+        self.index = index
+        self.addresses = [tuple(address) for address in addresses]
+        self.peers = frozenset(self.addresses)
+        self.shards = len(self.addresses)
+        self.first_slot = -(-index*SLOTS // self.shards)
+        self.last_slot = -(-(index + 1)*SLOTS // self.shards) - 1
+
+    def __repr__(self):
+        return 'shard %d/%d' % (self.index, self.shards)
+    __str__ = __repr__
+
+    def shard(self, key):
+        '''The shard owning ``key``'''
+        return key_slot(key)*self.shards // SLOTS
+
+    def owner(self, keys):
+        '''The shard owning all ``keys``, ``None`` if there isn't one'''
+        shards = set(map(self.shard, keys))
+        return shards.pop() if len(shards) == 1 else None
+
+    def split(self, keys):
+        '''Dictionary mapping shards to the positions of their ``keys``'''
+        groups = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self.shard(key), []).append(i)
+        return groups
+
+    def router(self, client):
+        return ShardRouter(client, self)
+
+    def info(self):
+        return {'cluster_enabled': 1,
+                'shard': self.index,
+                'shards': self.shards,
+                'slots': '%d-%d' % (self.first_slot, self.last_slot)}
+
+
+class ShardConnection(asyncio.Protocol):
+    '''Connection of a client session with the worker owning a shard.
+
+    Replies are not decoded, they are split and passed as bytes to the
+    callbacks of the requests which produced them. Replies which no
+    request is waiting for, the messages of a subscribed connection, are
+    passed to the optional ``push`` callable.
+    '''
+    def __init__(self, push=None):
+        self.database = 0
+        self.push = push
+        self.closed = False
+        self._transport = None
+        self._outgoing = []
+        self._waiting = deque()
+        self._replies = []
+        self._buffer = bytearray()
+
+    def send(self, data, count, callback):
+        '''Send ``data`` encoding ``count`` requests, ``callback`` is
+        invoked with the list of replies.
+        '''
+        if self.closed:
+            callback([b'-ERR connection with shard lost\r\n']*count)
+        else:
+            self._waiting.append((count, callback))
+            if self._transport:
+                self._transport.write(data)
+            else:
+                self._outgoing.append(data)
+
+    def close(self):
+        if self._transport:
+            self._transport.close()
+        self.closed = True
+
+    def connected(self, future):
+        if future.cancelled() or future.exception():
+            self.connection_lost(future.exception())
+
+    def connection_made(self, transport):
+        self._transport = transport
+        if self._outgoing:
+            transport.write(b''.join(self._outgoing))
+        self._outgoing = None
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self._transport = None
+        waiting, self._waiting = self._waiting, deque()
+        for count, callback in waiting:
+            callback([b'-ERR connection with shard lost\r\n']*count)
+
+    def data_received(self, data):
+        buffer = self._buffer
+        buffer.extend(data)
+        waiting = self._waiting
+        start = 0
+        while True:
+            end = reply_end(buffer, start)
+            if end < 0:
+                break
+            self._replies.append(bytes(buffer[start:end]))
+            start = end
+            while waiting and len(self._replies) >= waiting[0][0]:
+                count, callback = waiting.popleft()
+                replies = self._replies
+                self._replies = replies[count:]
+                callback(replies[:count])
+        if not waiting and self._replies and self.push:
+            replies, self._replies = self._replies, []
+            for reply in replies:
+                self.push(reply)
+        del buffer[:start]
+
+
+class ScratchClient(ClientMixin):
+    '''Execute a command on a scratch database, outside the key space.
+
+    The reply is stored, encoded, in the :attr:`result` attribute.
+    '''
+    channels = patterns = ()
+
+    def __init__(self, store):
+        super(ScratchClient, self).__init__(store)
+        self.password = store._password
+        self.scratch = store._scratch_db()
+        self.result = None
+        self._loop = store._loop
+
+    @property
+    def db(self):
+        return self.scratch
+
+    def execute(self, request):
+        store = self.store
+        handle = getattr(store, COMMANDS_INFO[request[0]].method_name)
+        writing, store._writing = store._writing, handle._info.write
+        try:
+            handle(self, request, len(request) - 1)
+        except CommandError as e:
+            self.reply_error(str(e))
+        except Exception:
+            self._loop.logger.exception("Server error on '%s' command",
+                                        request[0])
+            self.reply_error('Server Error')
+        finally:
+            store._writing = writing
+
+    def reply_ok(self):
+        self.result = self.store.OK
+
+    def reply_status(self, value):
+        self.result = ('+%s\r\n' % value).encode('utf-8')
+
+    def reply_int(self, value):
+        self.result = (':%d\r\n' % value).encode('utf-8')
+
+    def reply_one(self):
+        self.result = self.store.ONE
+
+    def reply_zero(self):
+        self.result = self.store.ZERO
+
+    def reply_error(self, value, prefix=None):
+        self.errors += 1
+        self.result = ('-%s %s\r\n' % (prefix or 'ERR', value)).encode(
+            'utf-8')
+
+    def reply_wrongtype(self):
+        self.reply_error('Operation against a key holding the wrong kind '
+                         'of value', 'WRONGTYPE')
+
+    def reply_bulk(self, value=None):
+        self.result = self.store._parser.bulk(value)
+
+    def reply_multi_bulk(self, value=None):
+        self.result = self.store._parser.multi_bulk(value)
+
+    def _write(self, data):
+        self.result = data
+
+
+class ShardRouter:
+    '''Route the requests of a client session to the shards owning their
+    keys.
+    '''
+    _handlers = {'bgrewriteaof': '_all_first',
+                 'bgsave': '_all_first',
+                 'config': '_config',
+                 'dbsize': '_all_sum',
+                 'flushall': '_all_first',
+                 'flushdb': '_all_first',
+                 'keys': '_keys',
+                 'multi': '_multi',
+                 'publish': '_all_sum',
+                 'randomkey': '_randomkey',
+                 'save': '_all_first',
+                 'scan': '_scan',
+                 'script': '_script',
+                 'unwatch': '_unwatch',
+                 'watch': '_watch'}
+    _split = {'del': '_split_sum',
+              'exists': '_split_sum',
+              'mget': '_split_mget',
+              'mset': '_split_mset'}
+
+    def __init__(self, client, cluster):
+        self.client = client
+        self.store = client.store
+        self.cluster = cluster
+        self._connections = {}
+        self._mirrors = []
+        self._transaction = None
+        self._aborted = False
+        self._watching = set()
+
+    def route(self, request):
+        '''Route ``request`` to the shard owning its keys.
+
+        :return: ``True`` if the request was handled, ``False`` if it
+            should be executed locally.
+        '''
+        request[0] = command = to_string(request[0]).lower()
+        if command in ('subscribe', 'unsubscribe'):
+            self._mirror_invalidations(command, request)
+            return False
+        elif self.client.channels or self.client.patterns:
+            return False
+        elif self._transaction is not None:
+            return self._queue(command, request)
+        handler = self._handlers.get(command)
+        if handler:
+            return getattr(self, handler)(request)
+        keys = command_keys(request)
+        if not keys:
+            return False
+        shard = self.cluster.owner(keys)
+        if shard is None:
+            return self._cross_shard(command, request, keys)
+        elif shard == self.cluster.index:
+            return False
+        self._gather({shard: [request]})
+        return True
+
+    def close(self, *args, **kw):
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+        for connection in self._mirrors:
+            connection.close()
+        self._mirrors = []
+
+    # INTERNALS
+    def _connection(self, shard):
+        connection = self._connections.get(shard)
+        if connection is None or connection.closed:
+            connection = self._open(shard)
+            self._connections[shard] = connection
+        return connection
+
+    def _open(self, shard, push=None):
+        loop = self.client._loop
+        host, port = self.cluster.addresses[shard]
+        connection = ShardConnection(push)
+        future = async(loop.create_connection(lambda: connection,
+                                              host, port), loop=loop)
+        future.add_done_callback(connection.connected)
+        return connection
+
+    def _mirror_invalidations(self, command, request):
+        # Keys are published on the invalidation channel by the shard
+        # executing the write, subscriptions to the channel are mirrored
+        # on all shards and their messages relayed to the client
+        if command == 'subscribe':
+            if INVALIDATE_CHANNEL in request[1:] and not self._mirrors:
+                data = self.store._parser.pack_command(
+                    ('subscribe', INVALIDATE_CHANNEL))
+                for shard in range(self.cluster.shards):
+                    if shard != self.cluster.index:
+                        connection = self._open(shard, self.client._send)
+                        connection.send(data, 1, lambda replies: None)
+                        self._mirrors.append(connection)
+        elif self._mirrors and (len(request) == 1 or
+                                INVALIDATE_CHANNEL in request[1:]):
+            for connection in self._mirrors:
+                connection.close()
+            self._mirrors = []
+
+    def _send(self, shard, requests, callback):
+        connection = self._connection(shard)
+        database = self.client.database
+        pack = self.store._parser.pack_command
+        data = b''.join([pack(request) for request in requests])
+        if connection.database != database:
+            connection.database = database
+            data = pack(('select', database)) + data
+            connection.send(data, len(requests) + 1,
+                            lambda replies: callback(replies[1:]))
+        else:
+            connection.send(data, len(requests), callback)
+
+    def _gather(self, batches, merge=None, entry=None):
+        '''Send ``batches`` of requests to shards.
+
+        :param batches: dictionary mapping shards to lists of requests.
+        :param merge: optional callable receiving the dictionary of replies
+            of each shard and returning the reply for the client, or
+            ``None`` when it resolves ``entry`` itself. By default the last
+            reply is used.
+        '''
+        client = self.client
+        if entry is None:
+            entry = client._defer()
+        results = {}
+
+        def _done(shard, replies):
+            results[shard] = replies
+            if len(results) == len(batches):
+                if merge is None:
+                    client._resolve(entry, replies[-1])
+                else:
+                    try:
+                        data = merge(results)
+                    except Exception:
+                        client._loop.logger.exception('Could not merge '
+                                                      'shard replies')
+                        data = b'-ERR Server Error\r\n'
+                    if data is not None:
+                        client._resolve(entry, data)
+
+        for shard, requests in batches.items():
+            self._send(shard, requests, partial(_done, shard))
+
+    def _all(self, request, merge):
+        self._gather(dict(((shard, [request]) for shard
+                           in range(self.cluster.shards))), merge)
+        return True
+
+    def _first_error(self, results):
+        for replies in results.values():
+            for reply in replies:
+                if is_error(reply):
+                    return reply
+
+    # FAN OUT
+    def _all_first(self, request):
+        return self._all(request, lambda results: (self._first_error(results)
+                                                   or results[0][-1]))
+
+    def _all_sum(self, request):
+        def _merge(results):
+            return self._first_error(results) or self._int(
+                sum((decode(replies[0]) for replies in results.values())))
+        return self._all(request, _merge)
+
+    def _keys(self, request):
+        def _merge(results):
+            keys = []
+            for replies in results.values():
+                keys.extend(decode(replies[0]))
+            return self.store._parser.multi_bulk(keys)
+        if len(request) != 2:
+            return False
+        return self._all(request, lambda results: (self._first_error(results)
+                                                   or _merge(results)))
+
+    def _randomkey(self, request):
+        def _merge(results):
+            keys = [replies[0] for replies in results.values()
+                    if replies[0] != self.store.NIL]
+            return choice(keys) if keys else self.store.NIL
+        return self._all(request, _merge)
+
+    def _config(self, request):
+        if (len(request) > 1 and
+                request[1].lower() in (b'set', b'resetstat')):
+            return self._all_first(request)
+        return False
+
+    def _script(self, request):
+        if len(request) > 1 and request[1].lower() == b'exists':
+            def _merge(results):
+                values = [decode(replies[0]) for replies in results.values()]
+                return self.store._parser.multi_bulk(
+                    [min(flags) for flags in zip(*values)])
+            return self._all(request, lambda results: (
+                self._first_error(results) or _merge(results)))
+        return self._all_first(request)
+
+    def _scan(self, request):
+        # the shard is encoded in the cursor, the shard cursor is
+        # multiplied by the number of shards
+        shards = self.cluster.shards
+        try:
+            cursor = int(request[1])
+        except (IndexError, ValueError):
+            return False
+        if cursor < 0:
+            return False
+        shard = cursor % shards
+
+        def _merge(results):
+            reply = results[shard][0]
+            if is_error(reply):
+                return reply
+            cursor, keys = decode(reply)
+            cursor = int(cursor)
+            if cursor:
+                cursor = cursor*shards + shard
+            elif shard + 1 < shards:
+                cursor = shard + 1
+            return self.store._parser.multi_bulk(
+                [str(cursor).encode('utf-8'), keys])
+
+        request = [request[0], cursor // shards] + request[2:]
+        self._gather({shard: [request]}, _merge)
+        return True
+
+    # TRANSACTIONS
+    def _multi(self, request):
+        if len(request) != 1:
+            return False
+        self._transaction = []
+        self._aborted = False
+        self.client.reply_ok()
+        return True
+
+    def _queue(self, command, request):
+        client = self.client
+        if command == 'exec':
+            self._exec()
+        elif command == 'discard':
+            self._transaction = None
+            self._release_watched()
+            client.reply_ok()
+        elif command == 'multi':
+            client.reply_error('MULTI calls can not be nested')
+        elif command == 'watch':
+            client.reply_error('WATCH inside MULTI is not allowed')
+        elif command not in COMMANDS_INFO:
+            self._aborted = True
+            client.reply_error("unknown command '%s'" % command)
+        else:
+            self._transaction.append(request)
+            client._send(self.store.QUEUED)
+        return True
+
+    def _exec(self):
+        transaction, self._transaction = self._transaction, None
+        watching, self._watching = self._watching, set()
+        shards = set(watching)
+        for request in transaction:
+            shards.update(map(self.cluster.shard, command_keys(request)))
+        if self._aborted or len(shards) > 1:
+            self._watching = watching
+            self._release_watched()
+            if self._aborted:
+                self.client.reply_error('Transaction discarded because of '
+                                        'previous errors.', 'EXECABORT')
+            else:
+                self.client.reply_error(CROSSSLOT, 'CROSSSLOT')
+        else:
+            shard = shards.pop() if shards else self.cluster.index
+            self._gather({shard: [['multi']] + transaction + [['exec']]})
+
+    def _watch(self, request):
+        keys = request[1:]
+        if not keys:
+            return False
+        shards = set(map(self.cluster.shard, keys))
+        shards.update(self._watching)
+        if len(shards) > 1:
+            self.client.reply_error(CROSSSLOT, 'CROSSSLOT')
+        else:
+            shard = shards.pop()
+            self._watching.add(shard)
+            self._gather({shard: [request]})
+        return True
+
+    def _unwatch(self, request):
+        if not self._watching or len(request) != 1:
+            return False
+        self._release_watched(True)
+        return True
+
+    def _release_watched(self, reply=False):
+        watching, self._watching = self._watching, set()
+        batches = dict(((shard, [['unwatch']]) for shard in watching))
+        if reply:
+            self._gather(batches, lambda results: self.store.OK)
+        else:
+            for shard, requests in batches.items():
+                self._send(shard, requests, lambda replies: None)
+
+    # MULTI-KEY COMMANDS
+    def _cross_shard(self, command, request, keys):
+        handler = self._split.get(command)
+        if handler:
+            return getattr(self, handler)(request, keys)
+        elif command in SCRATCH_COMMANDS:
+            return self._scratch(request, keys)
+        else:
+            self.client.reply_error(CROSSSLOT, 'CROSSSLOT')
+            return True
+
+    def _split_sum(self, request, keys):
+        groups = self.cluster.split(keys)
+        batches = dict(((shard, [[request[0]] + [keys[i] for i in positions]])
+                        for shard, positions in groups.items()))
+
+        def _merge(results):
+            return self._first_error(results) or self._int(
+                sum((decode(replies[0]) for replies in results.values())))
+        self._gather(batches, _merge)
+        return True
+
+    def _split_mget(self, request, keys):
+        groups = self.cluster.split(keys)
+        batches = dict(((shard, [['mget'] + [keys[i] for i in positions]])
+                        for shard, positions in groups.items()))
+
+        def _merge(results):
+            error = self._first_error(results)
+            if error:
+                return error
+            values = [None]*len(keys)
+            for shard, positions in groups.items():
+                for i, value in zip(positions, decode(results[shard][0])):
+                    values[i] = value
+            return self.store._parser.multi_bulk(values)
+        self._gather(batches, _merge)
+        return True
+
+    def _split_mset(self, request, keys):
+        if len(request) % 2 == 0:
+            return False
+        batches = {}
+        for shard, positions in self.cluster.split(keys).items():
+            args = ['mset']
+            for i in positions:
+                args.extend(request[2*i+1:2*i+3])
+            batches[shard] = [args]
+        self._gather(batches, lambda results: (self._first_error(results) or
+                                               self.store.OK))
+        return True
+
+    def _scratch(self, request, keys):
+        keys = list(set(keys))
+        groups = self.cluster.split(keys)
+        batches = dict(((shard, [args for i in positions for args in
+                                 (['dump', keys[i]], ['pttl', keys[i]])])
+                        for shard, positions in groups.items()))
+        entry = self.client._defer()
+        merge = partial(self._scratch_execute, entry, request, keys, groups)
+        self._gather(batches, merge, entry)
+        return True
+
+    def _scratch_execute(self, entry, request, keys, groups, results):
+        # Execute a request on copies of its keys, with their time to live,
+        # and restore the keys it writes on their shards
+        error = self._first_error(results)
+        if error:
+            return error
+        store = self.store
+        loop = store._loop
+        client = ScratchClient(store)
+        db = client.db
+        data = db._data
+        for shard, positions in groups.items():
+            replies = results[shard]
+            for n, i in enumerate(positions):
+                value = decode(replies[2*n])
+                if value is not None:
+                    data[keys[i]] = store.encoder.loads(value)
+                    ttl = decode(replies[2*n+1])
+                    if ttl > 0:
+                        db._expires.add(keys[i], loop.time() + ttl/1000)
+        client.execute(request)
+        if client.errors or not COMMANDS_INFO[request[0]].write:
+            return client.result
+        if request[0] in MOVE_COMMANDS:
+            written = command_keys(request)
+        else:
+            written = command_keys(request)[:1]
+        batches = {}
+        for key in written:
+            value = data.get(key)
+            if value is None:
+                args = ['del', key]
+            else:
+                deadline = db._expires.get(key)
+                ttl = 0 if deadline is None else max(
+                    int(1000*(deadline - loop.time())), 1)
+                args = ['restore', key, ttl, store.encoder.dumps(value)]
+            batches.setdefault(self.cluster.shard(key), []).append(args)
+        self._gather(batches, lambda results: (self._first_error(results) or
+                                               client.result), entry)
+
+    def _int(self, value):
+        return (':%d\r\n' % value).encode('utf-8')
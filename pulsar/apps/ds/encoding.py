@@ -0,0 +1,140 @@
+'''Compact encodings of small collections.
+
+A hash, list, set or sorted set holding a few short elements costs far
+more as a python object (a hash table, a deque of blocks or a skiplist of
+nodes) than its elements. Small collections are therefore stored as a
+single :class:`Packed` bytes string, in the same spirit as the redis
+listpack encoding, of length prefixed entries:
+
+* hashes store field and value pairs;
+* lists and sets store their elements;
+* sorted sets store member and score pairs in score order.
+
+Commands never see packed values: :meth:`.Db.get` unpacks a value into
+the full structure the first time it is accessed and the server packs it
+again, once it is no longer being accessed, if it is still within the
+size thresholds given by the ``key_value_*_max_entries`` and
+:ref:`key_value_compact_entry_size <setting-key_value_compact_entry_size>`
+settings.
+'''
+import struct
+
+from pulsar.utils.structures import Dict, Deque, Zset
+
+
+LARGE = 255
+uint32 = struct.Struct('>I')
+
+
+class Packed(bytes):
+    '''Base class for packed collections
+    '''
+    __slots__ = ()
+    encoding = 'listpack'
+
+    @classmethod
+    def pack(cls, entries, max_size):
+        '''Pack ``entries``, return ``None`` if an entry is longer than
+        ``max_size`` bytes.
+        '''
+        b = bytearray()
+        for entry in entries:
+            size = len(entry)
+            if size > max_size:
+                return None
+            elif size < LARGE:
+                b.append(size)
+            else:
+                b.append(LARGE)
+                b.extend(uint32.pack(size))
+            b.extend(entry)
+        return cls(b)
+
+    def entries(self):
+        '''Generator over the entries of this packed value'''
+        i, n = 0, len(self)
+        while i < n:
+            size = self[i]
+            i += 1
+            if size == LARGE:
+                size = uint32.unpack_from(self, i)[0]
+                i += 4
+            yield self[i:i+size]
+            i += size
+
+    def unpack(self):
+        raise NotImplementedError
+
+
+class PackedHash(Packed):
+    __slots__ = ()
+
+    @classmethod
+    def from_value(cls, value, max_size):
+        return cls.pack((e for pair in value.items() for e in pair),
+                        max_size)
+
+    def unpack(self):
+        entries = self.entries()
+        return Dict(zip(entries, entries))
+
+
+class PackedList(Packed):
+    __slots__ = ()
+
+    @classmethod
+    def from_value(cls, value, max_size):
+        return cls.pack(value, max_size)
+
+    def unpack(self):
+        return Deque(self.entries())
+
+
+class PackedSet(Packed):
+    __slots__ = ()
+
+    @classmethod
+    def from_value(cls, value, max_size):
+        return cls.pack(value, max_size)
+
+    def unpack(self):
+        return set(self.entries())
+
+
+class PackedZset(Packed):
+    __slots__ = ()
+
+    @classmethod
+    def from_value(cls, value, max_size):
+        entries = []
+        for score, member in value.items():
+            if len(member) > max_size:
+                return None
+            entries.append(member)
+            entries.append(repr(score).encode('utf-8'))
+        return cls.pack(entries, max_size)
+
+    def unpack(self):
+        entries = self.entries()
+        return Zset(((float(score), member) for member, score
+                     in zip(entries, entries)))
+
+
+packed_types = {Dict: PackedHash,
+                Deque: PackedList,
+                set: PackedSet,
+                Zset: PackedZset}
+
+
+def full_encoding(value):
+    '''The encoding name of an unpacked ``value``'''
+    if isinstance(value, bytearray):
+        return 'raw'
+    elif isinstance(value, Dict):
+        return 'hashtable'
+    elif isinstance(value, Deque):
+        return 'linkedlist'
+    elif isinstance(value, set):
+        return 'hashtable'
+    else:
+        return 'skiplist'
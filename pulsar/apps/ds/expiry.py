@@ -0,0 +1,73 @@
+'''Key expiry for pulsar-ds.
+
+Volatile keys are not scheduled individually with the event loop. Each
+:class:`.Db` keeps an :class:`ExpiryIndex` which maps keys to their
+deadline (in event loop time) and maintains a binary heap of deadlines.
+Keys are expired in two ways, in the same fashion as redis:
+
+* lazily, when a command accesses a key whose deadline has passed;
+* actively, by a periodic cycle driven by the
+  :ref:`key_value_hz <setting-key_value_hz>` setting which pops expired
+  deadlines from the heap within a time budget.
+'''
+from heapq import heappush, heappop, heapify
+
+
+class ExpiryIndex(dict):
+    '''A dictionary of ``key -> deadline`` pairs with a deadline heap.
+
+    Removing a key (via :meth:`pop` or ``del``) does not touch the heap,
+    its entry becomes stale and it is discarded once it reaches the top
+    of the heap or when the heap is compacted.
+    '''
+    __slots__ = ('_heap',)
+
+    def __init__(self):
+        super().__init__()
+        self._heap = []
+
+    def add(self, key, deadline):
+        '''Set the ``deadline`` for ``key``'''
+        self[key] = deadline
+        heap = self._heap
+        heappush(heap, (deadline, key))
+        if len(heap) > 2*len(self) + 64:
+            self.compact()
+
+    def clear(self):
+        super().clear()
+        self._heap = []
+
+    def compact(self):
+        '''Rebuild the heap removing stale entries'''
+        heap = [(deadline, key) for key, deadline in self.items()]
+        heapify(heap)
+        self._heap = heap
+
+    def next_deadline(self):
+        '''The earliest deadline in the index or ``None``'''
+        heap = self._heap
+        get = self.get
+        while heap:
+            deadline, key = heap[0]
+            if get(key) == deadline:
+                return deadline
+            heappop(heap)
+
+    def expired(self, now):
+        '''Generator of keys with deadline less or equal to ``now``.
+
+        Keys are removed from the index as they are yielded.
+        '''
+        heap = self._heap
+        get = self.get
+        while heap and heap[0][0] <= now:
+            deadline, key = heappop(heap)
+            if get(key) == deadline:
+                self.pop(key)
+                yield key
+
+    @property
+    def stale(self):
+        '''Number of stale entries in the heap'''
+        return len(self._heap) - len(self)
@@ -0,0 +1,110 @@
+'''Approximate memory accounting and eviction for pulsar-ds.
+
+When the :ref:`key_value_maxmemory <setting-key_value_maxmemory>` setting
+is positive, each database keeps an estimate of the memory used by each
+key, refreshed whenever the key is written, and the server evicts keys
+before executing write commands once the total exceeds the limit.
+
+Estimates are computed in constant time: containers use
+``sys.getsizeof`` plus the number of elements times the average size of
+a few sampled elements.
+
+The keys to evict are chosen according to the
+:ref:`key_value_maxmemory_policy <setting-key_value_maxmemory_policy>`
+setting and per-key access clocks updated by :meth:`.Db.get`:
+
+* ``allkeys-lru`` the least recently used key;
+* ``allkeys-lfu`` the least frequently used key among the
+  ``key_value_maxmemory_samples`` least recently used keys;
+* ``volatile-lru`` the least recently used key among
+  ``key_value_maxmemory_samples`` random keys with an expiry;
+* ``volatile-ttl`` the key with the nearest expiry;
+* ``noeviction`` write commands fail with an ``OOM`` error.
+
+Frequencies are logarithmic counters, as in redis, which are halved
+for every minute the key is not accessed.
+'''
+import sys
+from collections import deque
+from itertools import islice
+from random import random
+
+from .encoding import Packed
+
+
+POLICIES = ('noeviction', 'allkeys-lru', 'allkeys-lfu', 'volatile-lru',
+            'volatile-ttl')
+# Policies which need per-key access clocks
+ACCESS_POLICIES = frozenset(('allkeys-lru', 'allkeys-lfu', 'volatile-lru'))
+# Write commands which do not increase memory, allowed when out of memory
+NO_DENY_COMMANDS = frozenset((
+    'del', 'hdel', 'srem', 'zrem', 'zremrangebyrank', 'zremrangebyscore',
+    'lpop', 'rpop', 'spop', 'ltrim', 'lrem', 'flushdb', 'flushall',
+    'expire', 'pexpire', 'expireat', 'pexpireat', 'persist'))
+UNITS = {'': 1, 'b': 1, 'k': 1000, 'kb': 1024, 'm': 1000**2, 'mb': 1024**2,
+         'g': 1000**3, 'gb': 1024**3}
+SAMPLE = 8
+# Extra cost of a key in the database dictionary
+KEY_OVERHEAD = 64
+# Extra cost of a sorted set member, skiplist node and level lists
+ZSET_MEMBER_OVERHEAD = 200
+LFU_INIT_VAL = 5
+LFU_LOG_FACTOR = 10
+LFU_DECAY_MINUTES = 1
+
+
+def parse_memory(value):
+    '''Parse a memory size such as ``100mb`` into a number of bytes'''
+    if isinstance(value, int):
+        return value
+    value = str(value).strip().lower()
+    number = value.rstrip('bkmg')
+    unit = value[len(number):]
+    try:
+        return int(float(number) * UNITS[unit])
+    except (KeyError, ValueError):
+        raise TypeError('Invalid memory size "%s"' % value)
+
+
+def estimate(key, value):
+    '''Approximate number of bytes used by ``key`` and its ``value``'''
+    size = KEY_OVERHEAD + sys.getsizeof(key)
+    if isinstance(value, (bytearray, Packed)):
+        return size + sys.getsizeof(value)
+    n = len(value)
+    if not n:
+        return size
+    if isinstance(value, dict):
+        sample = list(islice(value.items(), SAMPLE))
+        sample = [e for pair in sample for e in pair]
+        size += sys.getsizeof(value)
+    elif isinstance(value, (set, deque)):
+        sample = list(islice(value, SAMPLE))
+        size += sys.getsizeof(value)
+    else:
+        sample = list(islice(value._dict, SAMPLE))
+        size += sys.getsizeof(value._dict) + n*ZSET_MEMBER_OVERHEAD
+    average = sum(sys.getsizeof(e) for e in sample)/len(sample)
+    return size + int(n*average*len(sample)/min(n, SAMPLE))
+
+
+def lfu_touch(clock, minutes):
+    '''Return the LFU ``clock`` of a key accessed at ``minutes``.
+
+    The clock packs the time of the last decrement in minutes and an
+    8 bits logarithmic access counter.
+    '''
+    counter = lfu_counter(clock, minutes)
+    if counter < 255:
+        base = max(counter - LFU_INIT_VAL, 0)
+        if random() < 1.0/(base*LFU_LOG_FACTOR + 1):
+            counter += 1
+    return (minutes << 8) | counter
+
+
+def lfu_counter(clock, minutes):
+    '''The access counter of an LFU ``clock`` decayed at ``minutes``'''
+    if clock is None:
+        return LFU_INIT_VAL
+    periods = (minutes - (clock >> 8)) // LFU_DECAY_MINUTES
+    return (clock & 255) >> min(periods, 8)
@@ -23,8 +23,11 @@ class String(object):
         length = self._length
         if length >= 0:
             b = parser._inbuffer
-            if len(b) >= length+2:
-                parser._inbuffer, chunk = b[length+2:], bytes(b[:length])
+            start = parser._offset
+            end = start + length
+            if len(b) >= end+2:
+                parser._offset = end + 2
+                chunk = bytes(b[start:end])
                 if parser.encoding:
                     return chunk.decode(parser.encoding)
                 else:
@@ -63,14 +66,23 @@ class ArrayTask(object):
 
 
 class Parser(object):
-    '''A python parser for redis.'''
+    '''A python parser for redis.
+
+    Incoming data is appended to a single bytearray and decoded by moving
+    a read offset forward, so that each token is copied once regardless of
+    how much data is pipelined in the buffer. Consumed bytes are discarded
+    when new data is fed and the offset has moved past
+    :attr:`compact_size` bytes or past half of the buffer.
+    '''
     encoding = None
+    compact_size = 65536
 
     def __init__(self, protocolError, responseError):
         self.protocolError = protocolError
         self.responseError = responseError
         self._current = None
         self._inbuffer = bytearray()
+        self._offset = 0
 
     def on_connect(self, connection):
         if connection.decode_responses:
@@ -81,7 +93,16 @@ class Parser(object):
 
     def feed(self, buffer):
         '''Feed new data into the buffer'''
-        self._inbuffer.extend(buffer)
+        b = self._inbuffer
+        offset = self._offset
+        if offset:
+            if offset == len(b):
+                del b[:]
+                self._offset = 0
+            elif offset >= self.compact_size or 2*offset >= len(b):
+                del b[:offset]
+                self._offset = 0
+        b.extend(buffer)
 
     def get(self):
         '''Called by the protocol consumer'''
@@ -168,32 +189,38 @@ class Parser(object):
 
     def _get(self, next):
         b = self._inbuffer
-        length = b.find(b'\r\n')
+        offset = self._offset
+        length = b.find(b'\r\n', offset)
         if length >= 0:
-            self._inbuffer, response = b[length+2:], bytes(b[:length])
-            rtype, response = response[:1], response[1:]
-            if rtype == b'-':
+            self._offset = length + 2
+            rtype, response = b[offset], bytes(b[offset+1:length])
+            if rtype == 45:     # -
                 return self.responseError(response.decode('utf-8'))
-            elif rtype == b':':
+            elif rtype == 58:   # :
                 return int(response)
-            elif rtype == b'+':
+            elif rtype == 43:   # +
                 return response
-            elif rtype == b'$':
+            elif rtype == 36:   # $
                 task = String(int(response), next)
                 return task.decode(self, False)
-            elif rtype == b'*':
+            elif rtype == 42:   # *
                 task = ArrayTask(int(response), next)
                 return task.decode(self, False)
             else:
                 # Clear the buffer and raise
                 self._inbuffer = bytearray()
+                self._offset = 0
                 raise self.protocolError('Protocol Error')
         else:
             return False
 
     def buffer(self):
         '''Current buffer'''
-        return bytes(self._inbuffer)
+        return bytes(self._inbuffer[self._offset:])
+
+    def pending(self):
+        '''``True`` if there is data not yet decoded into a reply'''
+        return bool(self._current) or self._offset < len(self._inbuffer)
 
     def _resume(self, task, result):
         result = task.decode(self, result)
@@ -0,0 +1,135 @@
+'''Cursor based iteration for the ``SCAN`` family of commands.
+
+Python dictionaries and sets do not expose their hash table, therefore a
+cursor cannot encode a bucket position as it does in redis. Instead, the
+cursor encodes the position of the next element in the iteration order
+of the collection, the insertion order for the keyspace and hashes,
+together with the size of the collection when the cursor was returned.
+The server keeps no state a cursor depends on: starting an iteration
+copies nothing and a cursor never becomes invalid.
+
+Finding a position from the start of the collection is O(N), although
+it runs in C, so the live iterators of the most recent iterations are
+cached by :class:`ScanCursors` and a call which continues one of them
+costs O(COUNT). Losing a cached iterator, once more than
+:attr:`ScanCursors.max_cursors` iterations are in progress, only costs
+time.
+
+When the collection changes size between two calls, a cached iterator
+resumes from the current position of the last element it returned which
+is still in the collection.
+Otherwise, when the collection shrinks, the position moves back by the
+number of removed elements so that no element is skipped, at the cost of
+returning some elements more than once, which ``SCAN`` allows.
+Elements present for the whole iteration are returned at least once
+provided the iteration order of the collection does not change, which
+holds for the keyspace and hashes but not for a set resized during the
+iteration. Elements added during the iteration may or may not be
+returned.
+
+Collections with no more than ``COUNT`` elements are returned in one
+call, the same shortcut redis takes for small encodings.
+'''
+import re
+from itertools import islice
+from operator import indexOf
+from collections import OrderedDict
+
+from .client import redis_to_py_pattern
+
+
+GLOB_CHARS = frozenset(b'*?[\\')
+POSITION_BITS = 32
+POSITION_MASK = (1 << POSITION_BITS) - 1
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def pattern_matcher(pattern):
+    '''Return a callable which matches bytes against a glob ``pattern``.
+
+    Returns ``None`` when the pattern matches everything. Patterns made
+    of a literal prefix followed by ``*`` are matched with
+    ``bytes.startswith`` rather than a regular expression.
+    '''
+    if pattern == b'*':
+        return None
+    glob = GLOB_CHARS.intersection(pattern)
+    if not glob:
+        return pattern.__eq__
+    elif glob == {42} and pattern.index(b'*') == len(pattern) - 1:
+        prefix = pattern[:-1]
+        return lambda value: value.startswith(prefix)
+    else:
+        match = re.compile(redis_to_py_pattern(
+            pattern.decode('utf-8', 'ignore'))).match
+        return lambda value: match(value.decode('utf-8', 'ignore'))
+
+
+class ScanCursors:
+    '''A cache of the iterators of the collections being scanned
+    '''
+    max_cursors = 1024
+
+    def __init__(self):
+        self._iterators = OrderedDict()
+
+    def __len__(self):
+        return len(self._iterators)
+
+    def clear(self):
+        self._iterators.clear()
+
+    def scan(self, cursor, owner, collection, count):
+        '''Advance the iteration over ``collection``.
+
+        :param cursor: the cursor sent by the client, ``0`` to start a new
+            iteration.
+        :param owner: hashable identifying the collection, cached
+            iterators are only used for their owner.
+        :param count: maximum number of elements to return.
+        :return: a two elements tuple with the next cursor, ``0`` once the
+            iteration is over, and the list of elements.
+        '''
+        if cursor >> (2*POSITION_BITS):
+            raise InvalidCursor('invalid cursor')
+        size = len(collection)
+        if not cursor and size <= count:
+            return 0, list(collection)
+        position, previous = cursor & POSITION_MASK, cursor >> POSITION_BITS
+        entry = self._iterators.pop((owner, cursor), None)
+        elements = None
+        if entry is not None and entry[0] is collection:
+            try:
+                elements = list(islice(entry[1], count))
+            except RuntimeError:
+                # The collection changed size, resume after the last
+                # element returned which is still there
+                for element in reversed(entry[2]):
+                    if element in collection:
+                        position = indexOf(collection, element) + 1
+                        previous = 0
+                        break
+                else:
+                    # at least the elements returned were removed
+                    previous = max(previous, size + len(entry[2]))
+            else:
+                iterator = entry[1]
+        if elements is None:
+            if previous > size:
+                position = max(position - previous + size, 0)
+            iterator = iter(collection)
+            if position:
+                next(islice(iterator, position, position), None)
+            elements = list(islice(iterator, count))
+        position += len(elements)
+        if len(elements) < count or position >= size:
+            return 0, elements
+        cursor = (size << POSITION_BITS) | position
+        iterators = self._iterators
+        iterators[(owner, cursor)] = (collection, iterator, elements)
+        while len(iterators) > self.max_cursors:
+            iterators.popitem(last=False)
+        return cursor, elements
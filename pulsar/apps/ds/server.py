@@ -2,7 +2,9 @@
 Pulsar-ds is a python implementation of the popular redis_
 data store. It uses pulsar asynchronous framework to create a
 single-threaded worker responding to TCP-requests in the same way
-as redis does.
+as redis does. With the
+:ref:`key_value_shards <setting-key_value_shards>` flag, the key space is
+split across several workers, see :mod:`pulsar.apps.ds.cluster`.
 
 To run a stand alone server create a script with the following code::
 
@@ -45,16 +47,20 @@ import re
 import time
 import math
 import pickle
+import logging
 from random import choice
 from hashlib import sha1
-from itertools import islice, chain
+from itertools import islice
 from functools import partial, reduce
 from collections import namedtuple
 from itertools import zip_longest
+from collections import OrderedDict
 
 import pulsar
 from pulsar.apps.socket import SocketServer
+from pulsar.utils.string import gen_unique_id
 from pulsar.utils.config import Global
+from pulsar.utils.internet import format_address
 from pulsar.utils.structures import Dict, Zset, Deque
 try:
     from pulsar.utils.lua import Lua
@@ -63,9 +69,23 @@ except ImportError:     # pragma    nocover
 
 
 from .parser import redis_parser
-from .utils import sort_command, count_bytes, and_op, or_op, xor_op, save_data
-from .client import (command, PulsarStoreClient, LuaClient, Blocked,
-                     COMMANDS_INFO, check_input, redis_to_py_pattern)
+from .utils import sort_command, count_bytes, and_op, or_op, xor_op
+from .expiry import ExpiryIndex
+from .scan import ScanCursors, InvalidCursor, pattern_matcher
+from .encoding import (Packed, PackedHash, PackedList, PackedSet, PackedZset,
+                       packed_types, full_encoding)
+from .memory import (POLICIES, ACCESS_POLICIES, parse_memory, estimate,
+                     lfu_touch, lfu_counter)
+from .snapshot import (save_snapshot, is_snapshot, SnapshotReader,
+                       TYPE_STRING, TYPE_LIST, TYPE_SET, TYPE_HASH, TYPE_ZSET)
+from .cluster import (Cluster, shard_filename, create_shard_sockets,
+                      SLOTS)
+from .aof import (AppendOnlyFile, AofReader, FSYNC_POLICIES, EXPIRE_COMMANDS,
+                  TIMEOUT_COMMANDS, BLOCKING_COMMANDS)
+from .client import (command, PulsarStoreClient, LuaClient, ReplayClient,
+                     Blocked,
+                     COMMANDS_INFO, INVALIDATE_CHANNEL, CommandError,
+                     check_input, redis_to_py_pattern)
 
 
 DEFAULT_PULSAR_STORE_ADDRESS = '127.0.0.1:6410'
@@ -126,6 +146,41 @@ class KeyValueDatabases(PulsarDsSetting):
     desc = 'Number of databases for the key value store.'
 
 
+class KeyValueMaxMemory(PulsarDsSetting):
+    name = "key_value_maxmemory"
+    flags = ["--key-value-maxmemory"]
+    default = 0
+    validator = parse_memory
+    desc = '''\
+        Maximum memory, in bytes or with a unit such as ``100mb``, used by
+        the data store before evicting keys. 0 for no limit.
+
+        Memory usage is estimated per key, the limit does not account
+        for the memory used by the python process itself.
+    '''
+
+
+class KeyValueMaxMemoryPolicy(PulsarDsSetting):
+    name = "key_value_maxmemory_policy"
+    flags = ["--key-value-maxmemory-policy"]
+    choices = POLICIES
+    default = 'noeviction'
+    desc = '''\
+        How keys are evicted when the maxmemory limit is reached.
+    '''
+
+
+class KeyValueMaxMemorySamples(PulsarDsSetting):
+    name = "key_value_maxmemory_samples"
+    flags = ["--key-value-maxmemory-samples"]
+    type = int
+    default = 5
+    desc = '''\
+        Number of keys sampled by the ``allkeys-lfu`` and ``volatile-lru``
+        eviction policies.
+    '''
+
+
 class KeyValuePassword(PulsarDsSetting):
     name = "key_value_password"
     flags = ["--key-value-password"]
@@ -159,11 +214,138 @@ class KeyValueFileName(PulsarDsSetting):
     desc = '''The filename where to dump the DB.'''
 
 
+class KeyValueCompression(PulsarDsSetting):
+    name = "key_value_compression"
+    flags = ["--key-value-compression"]
+    action = "store_true"
+    default = False
+    desc = '''Compress the DB dump with zlib.'''
+
+
+class KeyValueAppendOnly(PulsarDsSetting):
+    name = "key_value_appendonly"
+    flags = ["--key-value-appendonly"]
+    action = "store_true"
+    default = False
+    desc = '''\
+        Log every write command into an append only file.
+
+        When enabled the append only file, rather than the DB dump, is
+        used to rebuild the data set at start-up.
+    '''
+
+
+class KeyValueAppendFilename(PulsarDsSetting):
+    name = "key_value_appendfilename"
+    flags = ["--key-value-appendfilename"]
+    default = 'pulsards.aof'
+    desc = '''The name of the append only file.'''
+
+
+class KeyValueAppendFsync(PulsarDsSetting):
+    name = "key_value_appendfsync"
+    flags = ["--key-value-appendfsync"]
+    choices = FSYNC_POLICIES
+    default = 'everysec'
+    desc = '''\
+        How often the append only file is synced to disk.
+
+        ``always`` before replying to clients, ``everysec`` once every
+        second or ``no`` to let the operating system decide.
+    '''
+
+
+class KeyValueHashMaxEntries(PulsarDsSetting):
+    name = "key_value_hash_max_entries"
+    flags = ["--key-value-hash-max-entries"]
+    type = int
+    default = 128
+    desc = '''\
+        Maximum number of fields of a hash stored with the compact
+        encoding, 0 to disable it.
+    '''
+
+
+class KeyValueListMaxEntries(PulsarDsSetting):
+    name = "key_value_list_max_entries"
+    flags = ["--key-value-list-max-entries"]
+    type = int
+    default = 128
+    desc = '''\
+        Maximum number of elements of a list stored with the compact
+        encoding, 0 to disable it.
+    '''
+
+
+class KeyValueSetMaxEntries(PulsarDsSetting):
+    name = "key_value_set_max_entries"
+    flags = ["--key-value-set-max-entries"]
+    type = int
+    default = 128
+    desc = '''\
+        Maximum number of members of a set stored with the compact
+        encoding, 0 to disable it.
+    '''
+
+
+class KeyValueZsetMaxEntries(PulsarDsSetting):
+    name = "key_value_zset_max_entries"
+    flags = ["--key-value-zset-max-entries"]
+    type = int
+    default = 128
+    desc = '''\
+        Maximum number of members of a sorted set stored with the compact
+        encoding, 0 to disable it.
+    '''
+
+
+class KeyValueCompactEntrySize(PulsarDsSetting):
+    name = "key_value_compact_entry_size"
+    flags = ["--key-value-compact-entry-size"]
+    type = int
+    default = 64
+    desc = '''\
+        Maximum size in bytes of the elements of a collection stored
+        with the compact encoding.
+    '''
+
+
+class KeyValueHz(PulsarDsSetting):
+    name = "key_value_hz"
+    flags = ["--key-value-hz"]
+    type = int
+    default = 10
+    desc = '''\
+        Frequency of the active expire cycle.
+
+        Expired keys are removed lazily when accessed and, in the
+        background, by a cycle which runs ``key_value_hz`` times per second
+        and uses at most 25% of its interval.
+    '''
+
+
+class KeyValueShards(PulsarDsSetting):
+    name = "key_value_shards"
+    flags = ["--key-value-shards"]
+    action = "store_true"
+    default = False
+    desc = '''\
+        Split the key space among workers.
+
+        By default the data store runs in a single worker. When this flag
+        is set, each of the ``workers`` owns a range of the %d hash slots
+        of the key space and requests received by any worker are proxied
+        to the worker owning their keys.
+    ''' % SLOTS
+
+
 class TcpServer(pulsar.TcpServer):
 
     def __init__(self, cfg, *args, **kwargs):
         super(TcpServer, self).__init__(*args, **kwargs)
         self.cfg = cfg
+        # index and private addresses of the shards when sharded
+        self._shard = getattr(pulsar.get_actor(), 'pulsards_shard', None)
         self._parser_class = redis_parser(cfg.redis_py_parser)
         self._key_value_store = Storage(self, cfg)
 
@@ -189,9 +371,34 @@ class PulsarDS(SocketServer):
 
     def monitor_start(self, monitor):
         cfg = self.cfg
-        workers = min(1, cfg.workers)
-        cfg.set('workers', workers)
-        return super(PulsarDS, self).monitor_start(monitor)
+        if not cfg.key_value_shards:
+            cfg.set('workers', min(1, cfg.workers))
+        yield from super(PulsarDS, self).monitor_start(monitor)
+        if cfg.key_value_shards and cfg.workers > 1:
+            monitor.shard_sockets = yield from create_shard_sockets(
+                monitor._loop, cfg.workers)
+            monitor.shard_owners = {}
+
+    def actorparams(self, monitor, params):
+        super(PulsarDS, self).actorparams(monitor, params)
+        sockets = getattr(monitor, 'shard_sockets', None)
+        if sockets:
+            # Assign a shard not owned by a live worker
+            owners = monitor.shard_owners
+            for aid in list(owners):
+                if aid not in monitor.managed_actors:
+                    owners.pop(aid)
+            free = set(range(len(sockets))).difference(owners.values())
+            if not free:
+                raise pulsar.ImproperlyConfigured(
+                    'All %d shards are owned by a worker' % len(sockets))
+            index = min(free)
+            aid = gen_unique_id()[:8]
+            owners[aid] = index
+            params['aid'] = aid
+            params['sockets'] = params['sockets'] + [sockets[index]]
+            params['pulsards_shard'] = (index, [sock.getsockname()
+                                                for sock in sockets])
 
 
 # #############################################################################
@@ -205,14 +412,56 @@ class Storage(object):
     def __init__(self, server, cfg):
         self.cfg = cfg
         self._password = cfg.key_value_password.encode('utf-8')
+        self._cluster = Cluster(*server._shard) if server._shard else None
         self._filename = cfg.key_value_filename
+        self._aof_filename = cfg.key_value_appendfilename
+        if self._cluster:
+            index = self._cluster.index
+            self._filename = shard_filename(self._filename, index)
+            self._aof_filename = shard_filename(self._aof_filename, index)
         self._writer = None
+        self._save_started = None
+        self._last_save_status = 'ok'
+        self._last_save_duration = -1
+        self._last_save_size = -1
+        self._loading = None
+        self._aof = None
+        self._scan_cursors = ScanCursors()
+        self._max_entries = {PackedHash: cfg.key_value_hash_max_entries,
+                             PackedList: cfg.key_value_list_max_entries,
+                             PackedSet: cfg.key_value_set_max_entries,
+                             PackedZset: cfg.key_value_zset_max_entries}
+        self._packed_values = 0
+        self._unpacked_values = 0
+        # True while a write command is executed
+        self._writing = False
+        self._maxmemory = cfg.key_value_maxmemory
+        self._maxmemory_policy = cfg.key_value_maxmemory_policy
+        self._track_access = bool(self._maxmemory and
+                                  self._maxmemory_policy in ACCESS_POLICIES)
+        self._lfu = self._maxmemory_policy == 'allkeys-lfu'
+        self._used_memory = 0
+        self._used_memory_type = dict.fromkeys(
+            ('string', 'hash', 'list', 'set', 'zset'), 0)
+        self._evicted_keys = 0
+        self._rejected_commands = 0
+        self._loading_started = None
+        self._loading_size = 0
+        self._last_load_duration = -1
         self._server = server
         self._loop = server._loop
         self._parser = server._parser_class()
         self._missed_keys = 0
         self._hit_keys = 0
         self._expired_keys = 0
+        self._replies = 0
+        self._reply_writes = 0
+        self._reply_batches = 0
+        self._expire_cycles = 0
+        self._expire_cycle_keys = 0
+        self._expire_cycle_time = 0
+        self._expire_cycle_time_total = 0
+        self._expire_cycle_timeouts = 0
         self._dirty = 0
         self._bpop_blocked_clients = 0
         self._last_save = int(time.time())
@@ -249,7 +498,9 @@ class Storage(object):
                                 self.NOTIFY_SET: self._set_event,
                                 self.NOTIFY_HASH: self._hash_event,
                                 self.NOTIFY_LIST: self._list_event,
-                                self.NOTIFY_ZSET: self._zset_event}
+                                self.NOTIFY_ZSET: self._zset_event,
+                                self.NOTIFY_EXPIRED: self._expired_event,
+                                self.NOTIFY_EVICTED: self._generic_event}
         self._set_options = (b'ex', b'px', 'nx', b'xx')
         self.OK = b'+OK\r\n'
         self.QUEUED = b'+QUEUED\r\n'
@@ -284,7 +535,11 @@ class Storage(object):
                                self.hash_type: 'hash',
                                self.list_type: 'list',
                                set: 'set',
-                               self.zset_type: 'zset'}
+                               self.zset_type: 'zset',
+                               PackedHash: 'hash',
+                               PackedList: 'list',
+                               PackedSet: 'set',
+                               PackedZset: 'zset'}
         self.databases = dict(((num, Db(num, self))
                                for num in range(cfg.key_value_databases)))
         # Initialise lua
@@ -299,6 +554,7 @@ class Storage(object):
             self.version = '2.4.10'
         self._loaddb()
         self._cron()
+        self._active_expire_cycle()
 
     # #########################################################################
     # #    KEYS COMMANDS
@@ -320,11 +576,9 @@ class Storage(object):
 
     @command('Keys')
     def exists(self, client, request, N):
-        check_input(request, N != 1)
-        if client.db.exists(request[1]):
-            client.reply_one()
-        else:
-            client.reply_zero()
+        check_input(request, not N)
+        exists = client.db.exists
+        client.reply_int(sum(1 for key in request[1:] if exists(key)))
 
     @command('Keys', True)
     def expire(self, client, request, N, m=1):
@@ -359,15 +613,16 @@ class Storage(object):
 
     @command('Keys')
     def keys(self, client, request, N):
-        err = 'ignore'
         check_input(request, N != 1)
-        pattern = request[1].decode('utf-8', err)
-        allkeys = pattern == '*'
-        gr = None
-        if not allkeys:
-            gr = re.compile(redis_to_py_pattern(pattern))
-        result = [key for key in client.db if allkeys or
-                  gr.search(key.decode('utf-8', err))]
+        pattern = request[1]
+        db = client.db
+        matcher = pattern_matcher(pattern)
+        if matcher is None:
+            result = list(db)
+        elif matcher == pattern.__eq__:
+            result = [pattern] if db.exists(pattern) else []
+        else:
+            result = [key for key in db if matcher(key)]
         client.reply_multi_bulk(result)
 
     @command('Keys', supported=False)
@@ -389,15 +644,53 @@ class Storage(object):
         if db2.exists(key) or value is None:
             return client.reply_zero()
         assert value
+        deadline = db._expires.get(key)
         db.pop(key)
         self._signal(self.NOTIFY_GENERIC, db, 'del', key, 1)
         db2._data[key] = value
+        if deadline is not None:
+            db2._expires.add(key, deadline)
         self._signal(self._type_event_map[type(value)], db2, 'set', key, 1)
         client.reply_one()
 
-    @command('Keys', supported=False)
+    @command('Keys', subcommands=['encoding', 'refcount', 'idletime',
+                                  'freq'])
     def object(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N != 2)
+        subcommand = request[1].decode('utf-8').lower()
+        db = client.db
+        key = request[2]
+        if subcommand not in ('encoding', 'refcount', 'idletime', 'freq'):
+            client.reply_error(self.SYNTAX_ERROR)
+        elif not db.exists(key):
+            client.reply_bulk()
+        elif subcommand == 'refcount':
+            client.reply_int(1)
+        elif subcommand == 'idletime':
+            if not self._track_access or self._lfu:
+                client.reply_error('An LRU maxmemory policy is not selected, '
+                                   'access time not tracked')
+            else:
+                clock = db._access.get(key)
+                now = int(self._loop.time())
+                client.reply_int(0 if clock is None else now - clock)
+        elif subcommand == 'freq':
+            if not self._lfu:
+                client.reply_error('An LFU maxmemory policy is not selected, '
+                                   'access frequency not tracked')
+            else:
+                minutes = int(self._loop.time()/60)
+                client.reply_int(lfu_counter(db._access.get(key), minutes))
+        else:
+            # report the encoding the value has once packed
+            value = db._data[key]
+            if not isinstance(value, Packed):
+                value = self._pack(value) or value
+            if isinstance(value, Packed):
+                encoding = value.encoding
+            else:
+                encoding = full_encoding(value)
+            client.reply_bulk(encoding.encode('utf-8'))
 
     @command('Keys', True)
     def persist(self, client, request, N):
@@ -449,10 +742,13 @@ class Storage(object):
                 result = 0
                 if db.pop(key2) is not None:
                     self._signal(self.NOTIFY_GENERIC, db, 'del', key2)
+            deadline = db._expires.get(key1)
             db.pop(key1)
             event = self._type_event_map[type(value)]
             dirty = 1 if event == self.NOTIFY_STRING else len(value)
             db._data[key2] = value
+            if deadline is not None:
+                db._expires.add(key2, deadline)
             self._signal(event, db, request[0], key2, dirty)
             client.reply_one() if result else client.reply_ok()
 
@@ -479,7 +775,8 @@ class Storage(object):
             self._signal(self.NOTIFY_GENERIC, db, 'del', key)
         db._data[key] = value
         if ttl > 0:
-            db.expire(key, ttl)
+            db.expire(key, ttl/1000)
+        self._signal(self._type_event_map[type(value)], db, request[0], key, 1)
         client.reply_ok()
 
     @command('Keys', True)
@@ -507,9 +804,12 @@ class Storage(object):
             result = self._type_name_map[type(value)]
         client.reply_status(result)
 
-    @command('Keys', supported=False)
+    @command('Keys')
     def scan(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, not N)
+        db = client.db
+        cursor, keys = self._scan(request, 1, (db._num, None), db._data)
+        client.reply_multi_bulk((cursor, [k for k in keys if db.exists(k)]))
 
     # #########################################################################
     # #    STRING COMMANDS
@@ -1045,9 +1345,24 @@ class Storage(object):
         else:
             client.reply_wrongtype()
 
-    @command('Hashes', supported=False)
+    @command('Hashes')
     def hscan(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N < 2)
+        key = request[1]
+        db = client.db
+        value = db.get(key)
+        if value is None:
+            client.reply_multi_bulk((b'0', ()))
+        elif not isinstance(value, self.hash_type):
+            client.reply_wrongtype()
+        else:
+            cursor, fields = self._scan(request, 2, (db._num, key), value)
+            result = []
+            for field in fields:
+                if field in value:
+                    result.append(field)
+                    result.append(value[field])
+            client.reply_multi_bulk((cursor, result))
 
     # #########################################################################
     # #    LIST COMMANDS
@@ -1519,9 +1834,20 @@ class Storage(object):
         check_input(request, N < 2)
         self._setoper(client, 'union', request[2:], request[1])
 
-    @command('Sets', supported=False)
+    @command('Sets')
     def sscan(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N < 2)
+        key = request[1]
+        db = client.db
+        value = db.get(key)
+        if value is None:
+            client.reply_multi_bulk((b'0', ()))
+        elif not isinstance(value, set):
+            client.reply_wrongtype()
+        else:
+            cursor, members = self._scan(request, 2, (db._num, key), value)
+            client.reply_multi_bulk((cursor, [m for m in members
+                                              if m in value]))
 
     # #########################################################################
     # #    SORTED SETS COMMANDS
@@ -1782,9 +2108,26 @@ class Storage(object):
     def zunionstore(self, client, request, N):
         self._zsetoper(client, request, N)
 
-    @command('Sorted Sets', supported=False)
+    @command('Sorted Sets')
     def zscan(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N < 2)
+        key = request[1]
+        db = client.db
+        value = db.get(key)
+        if value is None:
+            client.reply_multi_bulk((b'0', ()))
+        elif not isinstance(value, self.zset_type):
+            client.reply_wrongtype()
+        else:
+            cursor, members = self._scan(request, 2, (db._num, key),
+                                         value._dict)
+            result = []
+            for member in members:
+                score = value.score(member)
+                if score is not None:
+                    result.append(member)
+                    result.append(str(score).encode('utf-8'))
+            client.reply_multi_bulk((cursor, result))
 
     # #########################################################################
     # #    PUBSUB COMMANDS
@@ -2030,9 +2373,19 @@ class Storage(object):
 
     # #########################################################################
     # #    SERVER COMMANDS
-    @command('Server', supported=False)
+    @command('Server')
     def bgrewriteaof(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N)
+        aof = self._aof
+        if aof is None:
+            client.reply_error('Append only file is not enabled')
+        elif aof.rewrite_in_progress:
+            client.reply_error('Background append only file rewriting '
+                               'already in progress')
+        else:
+            aof.rewrite(self._aof_dbs())
+            client.reply_status('Background append only file rewriting '
+                                'started')
 
     @command('Server')
     def bgsave(self, client, request, N):
@@ -2076,6 +2429,18 @@ class Storage(object):
             self._hit_keys = 0
             self._missed_keys = 0
             self._expired_keys = 0
+            self._expire_cycles = 0
+            self._expire_cycle_keys = 0
+            self._expire_cycle_time = 0
+            self._expire_cycle_time_total = 0
+            self._expire_cycle_timeouts = 0
+            self._replies = 0
+            self._reply_writes = 0
+            self._reply_batches = 0
+            self._packed_values = 0
+            self._unpacked_values = 0
+            self._evicted_keys = 0
+            self._rejected_commands = 0
             server = client._producer
             server._received = 0
             server._requests_processed = 0
@@ -2107,8 +2472,9 @@ class Storage(object):
 
     @command('Server')
     def info(self, client, request, N):
-        check_input(request, N)
-        info = '\n'.join(self._flat_info())
+        check_input(request, N > 1)
+        section = request[1].decode('utf-8').lower() if N else None
+        info = '\n'.join(self._flat_info(section))
         client.reply_bulk(info.encode('utf-8'))
 
     @command('Server')
@@ -2129,6 +2495,19 @@ class Storage(object):
         self._save(False)
         client.reply_ok()
 
+    @command('Server', subcommands=['usage'])
+    def memory(self, client, request, N):
+        check_input(request, N != 2)
+        if request[1].lower() != b'usage':
+            client.reply_error(self.SYNTAX_ERROR)
+        else:
+            key = request[2]
+            db = client.db
+            if db.exists(key):
+                client.reply_int(estimate(key, db._data[key]))
+            else:
+                client.reply_bulk()
+
     @command('Server', supported=False)
     def shutdown(self, client, request, N):
         client.reply_error(self.NOT_SUPPORTED)
@@ -2164,13 +2543,85 @@ class Storage(object):
                 if gap >= interval and dirty >= changes:
                     self._save()
                     break
+        if self._writer:
+            self._check_writer()
+        if self._aof:
+            self._aof.cron(self._aof_dbs)
+        self._pack_cycle()
         self._loop.call_later(1, self._cron)
 
+    def _pack_cycle(self, budget=0.025):
+        '''Pack the small collections written since the previous cycle.
+
+        The cycle runs once a second, within ``budget`` seconds, keys not
+        processed are packed by the following cycles.
+        '''
+        loop = self._loop
+        start = loop.time()
+        count = 0
+        for db in self.databases.values():
+            unpacked = db._unpacked
+            data = db._data
+            while unpacked:
+                key = unpacked.pop()
+                value = data.get(key)
+                if value is not None:
+                    packed = self._pack(value)
+                    if packed is not None:
+                        data[key] = packed
+                        self._packed_values += 1
+                        if db._sizes is not None:
+                            self._memory_update(db, key)
+                count += 1
+                if not count % 64 and loop.time() - start > budget:
+                    return
+
+    def _pack(self, value):
+        # The packed version of ``value`` if within the size thresholds
+        cls = packed_types.get(type(value))
+        if cls is not None and 0 < len(value) <= self._max_entries[cls]:
+            return cls.from_value(value, self.cfg.key_value_compact_entry_size)
+
+    def _active_expire_cycle(self):
+        '''Remove expired keys from all databases.
+
+        The cycle uses at most 25% of the ``1/key_value_hz`` interval.
+        When the time budget is exhausted with expired keys still
+        pending, the next cycle is scheduled after ``budget`` seconds
+        rather than waiting for the whole interval.
+        '''
+        loop = self._loop
+        interval = 1.0/max(self.cfg.key_value_hz, 1)
+        budget = 0.25*interval
+        start = now = loop.time()
+        expired = 0
+        timedout = False
+        for db in self.databases.values():
+            if not db._expires:
+                continue
+            for key in db._expires.expired(now):
+                db._do_expire(key)
+                expired += 1
+                if not expired % 64 and loop.time() - start > budget:
+                    timedout = True
+                    break
+            if timedout:
+                break
+        elapsed = loop.time() - start
+        self._expire_cycles += 1
+        self._expire_cycle_keys = expired
+        self._expire_cycle_time = elapsed
+        self._expire_cycle_time_total += elapsed
+        if timedout:
+            self._expire_cycle_timeouts += 1
+            interval = budget
+        loop.call_later(interval, self._active_expire_cycle)
+
     def _set(self, client, key, value, seconds=0, milliseconds=0,
              nx=False, xx=False):
         try:
             seconds = int(seconds)
-            milliseconds = 0.000001*int(milliseconds)
+            milliseconds = 0.001*int(milliseconds)
             if seconds < 0 or milliseconds < 0:
                 raise ValueError
         except Exception:
@@ -2183,12 +2634,10 @@ class Storage(object):
         if not skip:
             if exists:
                 db.pop(key)
+            db._data[key] = bytearray(value)
             if timeout > 0:
-                db._expires[key] = (self._loop.call_later(
-                    timeout, db._do_expire, key), bytearray(value))
+                db.expire(key, timeout)
                 self._signal(self.NOTIFY_STRING, db, 'expire', key)
-            else:
-                db._data[key] = bytearray(value)
             self._signal(self.NOTIFY_STRING, db, 'set', key, 1)
             return True
 
@@ -2225,6 +2674,47 @@ class Storage(object):
                 return True
         return False
 
+    def _scan(self, request, offset, owner, collection):
+        '''Advance a cursor over ``collection``.
+
+        The cursor, ``MATCH`` and ``COUNT`` options are read from
+        ``request`` starting at ``offset``. Return the next cursor, as
+        bytes, and the list of matching elements.
+        '''
+        try:
+            cursor = int(request[offset])
+            if cursor < 0:
+                raise ValueError
+        except ValueError:
+            raise CommandError('invalid cursor')
+        matcher, count = None, 10
+        N = len(request)
+        j = offset + 1
+        while j < N:
+            option = request[j].lower()
+            if j + 1 == N:
+                raise CommandError(self.SYNTAX_ERROR)
+            elif option == b'match':
+                matcher = pattern_matcher(request[j+1])
+            elif option == b'count':
+                try:
+                    count = int(request[j+1])
+                except ValueError:
+                    count = 0
+                if count < 1:
+                    raise CommandError(self.SYNTAX_ERROR)
+            else:
+                raise CommandError(self.SYNTAX_ERROR)
+            j += 2
+        try:
+            cursor, elements = self._scan_cursors.scan(cursor, owner,
+                                                       collection, count)
+        except InvalidCursor as exc:
+            raise CommandError(str(exc))
+        if matcher:
+            elements = [e for e in elements if matcher(e)]
+        return str(cursor).encode('utf-8'), elements
+
     def _block_callback(self, client, command, key, value, dest):
         db = client.db
         if command[:2] == 'br':
@@ -2243,6 +2733,12 @@ class Storage(object):
         else:
             elem = value.popleft()
             self._signal(self.NOTIFY_LIST, db, 'lpop', key, 1)
+        if self._aof is not None:
+            if dest is not None:
+                request = ('rpoplpush', key, dest)
+            else:
+                request = ('rpop' if command[:2] == 'br' else 'lpop', key)
+            self._aof.append(db._num, request)
         if not value:
             db.pop(key)
             self._signal(self.NOTIFY_GENERIC, db, 'del', key, 1)
@@ -2269,11 +2765,13 @@ class Storage(object):
         client.flag &= ~self.DIRTY_CAS
         self._watching.discard(client)
 
-    def _flat_info(self):
+    def _flat_info(self, section=None):
         info = self._server.info()
         info['server']['redis_version'] = self.version
         e = self._encode_info_value
         for k, values in info.items():
+            if section and k != section:
+                continue
             if isinstance(values, dict):
                 yield '#%s' % k
                 for key, value in values.items():
@@ -2415,80 +2913,385 @@ class Storage(object):
 
     def _info(self):
         keyspace = {}
+        saved = self._replies - self._reply_writes
         stats = {'keyspace_hits': self._hit_keys,
                  'keyspace_misses': self._missed_keys,
                  'expired_keys': self._expired_keys,
+                 'evicted_keys': self._evicted_keys,
+                 'rejected_oom_commands': self._rejected_commands,
+                 'packed_values': self._packed_values,
+                 'unpacked_values': self._unpacked_values,
+                 'expire_cycles': self._expire_cycles,
+                 'expire_cycle_keys': self._expire_cycle_keys,
+                 'expire_cycle_time_ms': 1000*self._expire_cycle_time,
+                 'expire_cycle_total_time_ms':
+                     1000*self._expire_cycle_time_total,
+                 'expire_cycle_timeouts': self._expire_cycle_timeouts,
+                 'replies': self._replies,
+                 'reply_writes': self._reply_writes,
+                 'reply_writes_saved': saved,
+                 'reply_writes_saved_per_batch':
+                     saved/self._reply_batches if self._reply_batches else 0,
                  'keys_changed': self._dirty,
                  'pubsub_channels': len(self._channels),
                  'pubsub_patterns': len(self._patterns),
                  'blocked_clients': self._bpop_blocked_clients}
-        persistance = {'rdb_changes_since_last_save': self._dirty,
-                       'rdb_last_save_time': self._last_save}
+        persistence = {'loading': int(bool(self._loading)),
+                       'rdb_changes_since_last_save': self._dirty,
+                       'rdb_bgsave_in_progress': int(bool(self._writer)),
+                       'rdb_last_save_time': self._last_save,
+                       'rdb_last_bgsave_status': self._last_save_status,
+                       'rdb_last_save_duration_sec': self._last_save_duration,
+                       'rdb_last_save_size': self._last_save_size,
+                       'rdb_last_load_duration_sec': self._last_load_duration,
+                       'aof_enabled': int(bool(self._aof))}
+        if self._aof:
+            aof = self._aof
+            persistence.update({
+                'aof_fsync': aof.fsync,
+                'aof_rewrite_in_progress': int(aof.rewrite_in_progress),
+                'aof_last_rewrite_status': aof.last_rewrite_status,
+                'aof_last_rewrite_duration_sec': aof.last_rewrite_duration,
+                'aof_current_size': aof.size,
+                'aof_base_size': aof.base_size,
+                'aof_commands': aof.commands,
+                'aof_writes': aof.writes,
+                'aof_fsyncs': aof.fsyncs})
+        if self._loading:
+            loaded = self._loading.loaded
+            size = self._loading_size
+            persistence.update({
+                'loading_start_time': int(self._loading_started),
+                'loading_total_bytes': size,
+                'loading_loaded_bytes': loaded,
+                'loading_loaded_perc': 100.0*loaded/size if size else 0,
+                'loading_loaded_keys': self._loading.keys})
         for db in self.databases.values():
             if len(db):
                 keyspace[str(db)] = db.info()
-        return {'keyspace': keyspace,
+        memory = {'maxmemory': self._maxmemory,
+                  'maxmemory_policy': self._maxmemory_policy}
+        if self._maxmemory:
+            memory['used_memory'] = self._used_memory
+            for name, used in self._used_memory_type.items():
+                memory['used_memory_%s' % name] = used
+        info = {'keyspace': keyspace,
                 'stats': stats,
-                'persistance': persistance}
+                'memory': memory,
+                'persistence': persistence}
+        if self._cluster:
+            info['cluster'] = self._cluster.info()
+        return info
 
     def _client_list(self, client):
         for client in client._producer._concurrent_connections:
             yield ' '.join(self._client_info(client))
 
     def _client_info(self, client):
-        yield 'addr=%s:%s' % client._transport.get_extra_info('addr')
+        address = client._transport.get_extra_info('peername')
+        yield 'addr=%s' % format_address(address)
         yield 'fd=%s' % client._transport._sock_fd
         yield 'age=%s' % int(time.time() - client.started)
         yield 'db=%s' % client.database
         yield 'sub=%s' % len(client.channels)
         yield 'psub=%s' % len(client.patterns)
         yield 'cmd=%s' % client.last_command
+        yield 'replies=%s' % client.replies
+        yield 'writes=%s' % client.writes
+        yield 'writes_saved=%s' % (client.replies - client.writes)
 
     def _save(self, async=True):
-        writer = self._writer
-        if writer and writer.is_alive():
+        if self._writer:
             self.logger.warning('Cannot save, background saving in progress')
+            return
+        self._dirty = 0
+        self._last_save = int(time.time())
+        self._save_started = time.time()
+        if async and hasattr(os, 'fork'):
+            self.logger.debug('Saving database in background process')
+            pid = os.fork()
+            if pid:
+                self._writer = pid
+                return
+            # Child process, write the copy-on-write data and exit
+            code = 1
+            try:
+                self._write_snapshot()
+                code = 0
+            except Exception:
+                self.logger.exception('Could not save database')
+            finally:
+                logging.shutdown()
+                os._exit(code)
         else:
-            from multiprocessing import Process
-            data = self._dbs()
-            self._dirty = 0
-            self._last_save = int(time.time())
-            if async:
-                self.logger.debug('Saving database in background process')
-                self._writer = Process(target=save_data,
-                                       args=(self.cfg, self._filename, data))
-                self._writer.start()
+            self.logger.debug('Saving database')
+            try:
+                self._write_snapshot()
+            except Exception:
+                self.logger.exception('Could not save database')
+                self._saved(False)
             else:
-                self.logger.debug('Saving database')
-                save_data(self.cfg, self._filename, data)
+                self._saved(True)
+
+    def _write_snapshot(self):
+        delta = time.time() - self._loop.time()
+        dbs = ((db._num, db._data, db._expires)
+               for db in self.databases.values() if db._data)
+        size = save_snapshot(self._filename, dbs, delta,
+                             self.cfg.key_value_compression)
+        self.logger.info('wrote %d bytes into "%s"', size, self._filename)
 
-    def _dbs(self):
-        data = [(db._num, db._data) for db in self.databases.values()
-                if len(db._data)]
-        return (1, data)
+    def _check_writer(self):
+        try:
+            pid, status = os.waitpid(self._writer, os.WNOHANG)
+        except ChildProcessError:
+            pid, status = self._writer, 1
+        if pid:
+            self._writer = None
+            self._saved(status == 0)
+
+    def _saved(self, success):
+        self._last_save_status = 'ok' if success else 'err'
+        if success:
+            stat = os.stat(self._filename)
+            self._last_save_size = stat.st_size
+            self._last_save_duration = max(
+                stat.st_mtime - self._save_started, 0)
+
+    def _snapshot_types(self):
+        return {TYPE_STRING: bytearray,
+                TYPE_LIST: self.list_type,
+                TYPE_SET: set,
+                TYPE_HASH: self.hash_type,
+                TYPE_ZSET: self.zset_type}
 
     def _loaddb(self):
+        # Load the data set from the append only file when enabled,
+        # otherwise from the DB dump
         filename = self._filename
-        if os.path.isfile(filename):
-            self.logger.info('loading data from "%s"', filename)
-            with open(filename, 'rb') as file:
-                data = pickle.load(file)
-            version, dbs = data
-            for num, data in dbs:
-                db = self.databases.get(num)
-                if db is not None:
-                    db._data = data
+        aof = self.cfg.key_value_appendonly
+        if aof and os.path.isfile(self._aof_filename):
+            filename = self._aof_filename
+        else:
+            aof = False
+        if not os.path.isfile(filename):
+            return self._open_aof()
+        self.logger.info('loading data from "%s"', filename)
+        file = open(filename, 'rb')
+        if not aof and not is_snapshot(file):
+            with file:
+                self._load_pickle(file)
+            return self._open_aof()
+        self._loading_size = os.fstat(file.fileno()).st_size
+        self._loading_started = time.time()
+        if aof:
+            self._loading = AofReader(file, self._server._parser_class())
+            self._replay(self._loading.requests(), ReplayClient(self))
+        else:
+            self._loading = SnapshotReader(file, self._snapshot_types())
+            self._load_records(self._loading.records())
+
+    def _load_records(self, records, batch=10000):
+        # Load a batch of records and schedule the next one so that the
+        # server can answer INFO while loading
+        delta = self._loop.time() - time.time()
+        now = time.time()
+        databases = self.databases
+        count = 0
+        try:
+            for num, key, value, expire in records:
+                db = databases.get(num)
+                if db is not None and (expire is None or expire > now):
+                    db._data[key] = self._pack(value) or value
+                    if db._sizes is not None:
+                        self._memory_update(db, key)
+                    if expire is not None:
+                        db._expires.add(key, expire + delta)
+                count += 1
+                if count == batch:
+                    break
+            else:
+                return self._loaded()
+        except Exception:
+            self.logger.exception('Could not load data')
+            return self._loaded(False)
+        self._loop.call_soon(self._load_records, records, batch)
+
+    def _replay(self, requests, client, batch=10000):
+        count = 0
+        try:
+            for request in requests:
+                client.execute(request)
+                count += 1
+                if count == batch:
+                    break
+            else:
+                return self._loaded()
+        except Exception:
+            self.logger.exception('Could not replay the append only file')
+            return self._loaded(False)
+        self._loop.call_soon(self._replay, requests, client, batch)
+
+    def _loaded(self, success=True):
+        reader = self._loading
+        reader._file.close()
+        self._loading = None
+        self._last_load_duration = time.time() - self._loading_started
+        self.logger.info('loaded %d records from "%s" in %.3f seconds',
+                         reader.keys, reader._file.name,
+                         self._last_load_duration)
+        if success:
+            self._open_aof()
+        else:
+            # Never serve, nor later save over the file, a partial data set
+            for db in self.databases.values():
+                db.flush()
+            self._dirty = 0
+            self.logger.error('Data set could not be fully loaded, '
+                              'databases cleared')
+            if self.cfg.key_value_appendonly:
+                self.logger.error('Append only file disabled')
+
+    def _open_aof(self):
+        cfg = self.cfg
+        if cfg.key_value_appendonly:
+            filename = self._aof_filename
+            exists = os.path.isfile(filename)
+            self._aof = AppendOnlyFile(filename, cfg.key_value_appendfsync,
+                                       self._loop, self._parser, self.logger)
+            if not exists and any((db._data for db in
+                                   self.databases.values())):
+                self._aof.rewrite(self._aof_dbs())
+
+    def _aof_dbs(self):
+        delta = time.time() - self._loop.time()
+        return [(db._num, db._data, db._expires, delta)
+                for db in self.databases.values() if db._data]
+
+    def _aof_append(self, db, request):
+        command = request[0]
+        if command in BLOCKING_COMMANDS:
+            return
+        aof = self._aof
+        if command not in EXPIRE_COMMANDS:
+            aof.append(db._num, request)
+        if command in EXPIRE_COMMANDS or command in TIMEOUT_COMMANDS:
+            key = request[1]
+            deadline = db._expires.get(key)
+            if deadline is not None:
+                deadline += time.time() - self._loop.time()
+                aof.append(db._num, ('pexpireat', key, int(1000*deadline)))
+
+    def _load_pickle(self, file):
+        version, dbs = pickle.load(file)
+        delta = self._loop.time() - time.time()
+        for entry in dbs:
+            db = self.databases.get(entry[0])
+            if db is not None:
+                db._data = entry[1]
+                if version > 1:
+                    for key, deadline in entry[2].items():
+                        db._expires.add(key, deadline + delta)
 
     def _signal(self, type, db, command, key=None, dirty=0):
         self._dirty += dirty
-        self._event_handlers[type](db, key, COMMANDS_INFO[command])
+        if db._sizes is not None and key is not None:
+            self._memory_update(db, key)
+        # events which are not commands, such as ``expired``, remove keys
+        info = COMMANDS_INFO.get(command)
+        if ((info is None or info.write) and
+                INVALIDATE_CHANNEL in self._channels):
+            self._invalidate(key)
+        self._event_handlers[type](db, key, info)
+
+    def _invalidate(self, key):
+        # Publish a written key, or nil when a database is flushed, to
+        # the clients caching values
+        msg = self._parser.multi_bulk((b'message', INVALIDATE_CHANNEL, key))
+        self._publish_clients(msg, self._channels[INVALIDATE_CHANNEL])
+
+    # MEMORY
+    def _memory_update(self, db, key):
+        # Refresh the memory estimate of ``key`` after it has been written
+        value = db._data.get(key)
+        if value is None:
+            return self._memory_forget(db, key)
+        old = db._sizes.get(key)
+        if old:
+            self._used_memory -= old[0]
+            self._used_memory_type[old[1]] -= old[0]
+        size = estimate(key, value)
+        name = self._type_name_map[type(value)]
+        db._sizes[key] = (size, name)
+        self._used_memory += size
+        self._used_memory_type[name] += size
+        if db._access is not None and key not in db._access:
+            db._touch(key)
+
+    def _memory_forget(self, db, key):
+        old = db._sizes.pop(key, None)
+        if old:
+            self._used_memory -= old[0]
+            self._used_memory_type[old[1]] -= old[0]
+        if db._access is not None:
+            db._access.pop(key, None)
+
+    def _free_memory(self):
+        '''Evict keys until the used memory is below the maxmemory limit.
+
+        Return ``False`` if the policy cannot free enough memory.
+        '''
+        while self._used_memory > self._maxmemory:
+            candidate = self._eviction_candidate()
+            if candidate is None:
+                return False
+            db, key = candidate
+            if db.pop(key) is None:
+                self._memory_forget(db, key)
+                continue
+            self._evicted_keys += 1
+            if self._aof is not None:
+                self._aof.append(db._num, ('del', key))
+            self._signal(self.NOTIFY_EVICTED, db, 'del', key, 1)
+        return True
+
+    def _eviction_candidate(self):
+        # The (db, key) pair to evict according to the maxmemory policy
+        policy = self._maxmemory_policy
+        samples = max(self.cfg.key_value_maxmemory_samples, 1)
+        minutes = int(self._loop.time()/60)
+        best = None
+        for db in self.databases.values():
+            if policy == 'volatile-ttl':
+                deadline = db._expires.next_deadline()
+                candidates = () if deadline is None else (
+                    (deadline, db._expires._heap[0][1]),)
+            elif policy == 'volatile-lru':
+                heap = db._expires._heap
+                candidates = []
+                for _ in range(samples if heap else 0):
+                    deadline, key = choice(heap)
+                    if db._expires.get(key) == deadline:
+                        candidates.append((db._access.get(key, 0), key))
+            elif policy == 'allkeys-lru':
+                candidates = ((clock, key) for key, clock
+                              in islice(db._access.items(), 1))
+            elif policy == 'allkeys-lfu':
+                candidates = ((lfu_counter(clock, minutes), key) for key, clock
+                              in islice(db._access.items(), samples))
+            else:
+                return None
+            for score, key in candidates:
+                if best is None or score < best[0]:
+                    best = (score, db, key)
+        return None if best is None else best[1:]
 
     def _publish_clients(self, msg, clients):
         remove = set()
         count = 0
         for client in clients:
             try:
-                client._transport.write(msg)
+                client._send(msg)
                 count += 1
             except Exception:
                 remove.add(client)
@@ -2506,22 +3309,25 @@ class Storage(object):
         if command.write:
             self._modified_key(key)
 
+    def _collection_event(self, db, key, command):
+        if command.write:
+            self._modified_key(key)
+            # collections may become small enough for the compact encoding
+            db._unpacked.add(key)
+
+    def _expired_event(self, db, key, command):
+        self._modified_key(key)
+
     _string_event = _generic_event
-    _set_event = _generic_event
-    _hash_event = _generic_event
-    _zset_event = _generic_event
+    _set_event = _collection_event
+    _hash_event = _collection_event
+    _zset_event = _collection_event
 
     def _list_event(self, db, key, command):
-        if command.write:
-            self._modified_key(key)
+        self._collection_event(db, key, command)
         # the key is blocking clients
         if key in db._blocking_keys:
-            if key in db._data:
-                value = db._data[key]
-            elif key in self._expires:
-                value = db._expires[key]
-            else:
-                value = None
+            value = db._data.get(key)
             for client in db._blocking_keys.pop(key):
                 client.blocked.unblock(client, key, value)
 
@@ -2538,6 +3344,13 @@ class Storage(object):
             if not p.clients:
                 self._patterns.pop(pattern)
 
+    def _scratch_db(self):
+        # A database outside the key space, used to execute commands on
+        # copies of keys owned by other shards
+        db = Db(-1, self)
+        db._sizes = db._access = None
+        return db
+
     def _write_to_monitors(self, client, request):
         # addr = '%s:%s' % self._transport.get_extra_info('addr')
         cmds = b'" "'.join(request)
@@ -2545,7 +3358,7 @@ class Storage(object):
         remove = set()
         for m in self._monitors:
             try:
-                m._transport.write(message)
+                m._send(message)
             except Exception:
                 remove.add(m)
         if remove:
@@ -2602,13 +3415,22 @@ class Storage(object):
 
 class Db(object):
     '''The database.
+
+    Values of all keys are stored in the ``_data`` dictionary while
+    deadlines of volatile keys are kept in the ``_expires``
+    :class:`.ExpiryIndex`.
     '''
     def __init__(self, num, store):
         self.store = store
         self._num = num
         self._loop = store._loop
         self._data = {}
-        self._expires = {}
+        self._expires = ExpiryIndex()
+        # keys of collections unpacked since the last pack cycle
+        self._unpacked = set()
+        # memory estimates and access clocks when maxmemory is set
+        self._sizes = {} if store._maxmemory else None
+        self._access = OrderedDict() if store._track_access else None
         self._events = {}
         self._blocking_keys = {}
 
@@ -2617,68 +3439,81 @@ class Db(object):
     __str__ = __repr__
 
     def __len__(self):
-        return len(self._data) + len(self._expires)
+        return len(self._data)
 
     def __iter__(self):
-        return chain(self._data, self._expires)
+        expires = self._expires
+        if not expires:
+            return iter(self._data)
+        now = self._loop.time()
+        return (key for key in self._data
+                if key not in expires or expires[key] > now)
 
     # #########################################################################
     # #    INTERNALS
     def flush(self):
         removed = len(self._data)
         self._data.clear()
-        [handle.cancel() for handle, _ in self._expires.values()]
         self._expires.clear()
+        self._unpacked.clear()
+        if self._sizes is not None:
+            store = self.store
+            for size, name in self._sizes.values():
+                store._used_memory -= size
+                store._used_memory_type[name] -= size
+            self._sizes.clear()
+            if self._access is not None:
+                self._access.clear()
         self.store._signal(self.store.NOTIFY_GENERIC, self, 'flushdb',
                            dirty=removed)
 
     def get(self, key, default=None):
-        if key in self._data:
-            self.store._hit_keys += 1
-            return self._data[key]
-        elif key in self._expires:
-            self.store._hit_keys += 1
-            return self._expires[key]
-        else:
+        value = self._data.get(key)
+        if value is None or (key in self._expires and
+                             self._expire_if_needed(key)):
             self.store._missed_keys += 1
             return default
+        else:
+            self.store._hit_keys += 1
+            if isinstance(value, Packed):
+                value = value.unpack()
+                # Only write commands replace the packed value, reads
+                # decode a copy
+                if self.store._writing:
+                    self._data[key] = value
+                    self._unpacked.add(key)
+                    self.store._unpacked_values += 1
+                    if self._sizes is not None:
+                        self.store._memory_update(self, key)
+            if self._access is not None:
+                self._touch(key)
+            return value
 
     def exists(self, key):
-        return key in self._data or key in self._expires
+        return key in self._data and not (key in self._expires and
+                                           self._expire_if_needed(key))
 
     def expire(self, key, timeout):
-        if key in self._expires:
-            handle, value = self._expires.pop(key)
-            handle.cancel()
-        elif key in self._data:
-            value = self._data.pop(key)
-        else:
-            return False
-        self._expires[key] = (self._loop.call_later(
-            timeout, self._do_expire, key), value)
-        return True
+        if self.exists(key):
+            self._expires.add(key, self._loop.time() + timeout)
+            return True
+        return False
 
     def persist(self, key):
-        if key in self._expires:
-            self.store._hit_keys += 1
-            handle, value = self._expires.pop(key)
-            handle.cancel()
-            self._data[key] = value
-            return True
-        elif key in self._data:
+        if self.exists(key):
             self.store._hit_keys += 1
+            return self._expires.pop(key, None) is not None
         else:
             self.store._missed_keys += 1
-        return False
+            return False
 
     def ttl(self, key, m=1):
-        if key in self._expires:
-            self.store._hit_keys += 1
-            handle, value = self._expires[key]
-            return max(0, int(m*(handle._when - self._loop.time())))
-        elif key in self._data:
+        if self.exists(key):
             self.store._hit_keys += 1
-            return -1
+            deadline = self._expires.get(key)
+            if deadline is None:
+                return -1
+            return max(0, int(m*(deadline - self._loop.time())))
         else:
             self.store._missed_keys += 1
             return -2
@@ -2688,33 +3523,45 @@ class Db(object):
                 'expires': len(self._expires)}
 
     def pop(self, key, value=None):
-        if not value:
-            if key in self._data:
-                value = self._data.pop(key)
-                return value
-            elif key in self._expires:
-                handle, value = self._expires.pop(key)
-                handle.cancel()
-                return value
+        if not value and key in self._data:
+            self._expires.pop(key, None)
+            if self._sizes is not None:
+                self.store._memory_forget(self, key)
+            return self._data.pop(key)
 
     def rem(self, key):
-        if key in self._data:
+        if self.exists(key):
             self.store._hit_keys += 1
-            self._data.pop(key)
-            self.store._signal(self.store.NOTIFY_GENERIC, self, 'del', key, 1)
-            return 1
-        elif key in self._expires:
-            self.store._hit_keys += 1
-            handle, _ = self._expires.pop(key)
-            handle.cancel()
+            self.pop(key)
             self.store._signal(self.store.NOTIFY_GENERIC, self, 'del', key, 1)
             return 1
         else:
             self.store._missed_keys += 1
             return 0
 
+    def _touch(self, key):
+        # Update the access clock of ``key``
+        access = self._access
+        if self.store._lfu:
+            access[key] = lfu_touch(access.get(key),
+                                    int(self._loop.time()/60))
+        else:
+            access[key] = int(self._loop.time())
+        access.move_to_end(key)
+
+    def _expire_if_needed(self, key):
+        if self._expires[key] <= self._loop.time():
+            self._do_expire(key)
+            return True
+        return False
+
     def _do_expire(self, key):
-        if key in self._expires:
-            handle, value, = self._expires.pop(key)
-            handle.cancel()
+        self._expires.pop(key, None)
+        if self._sizes is not None:
+            self.store._memory_forget(self, key)
+        if self._data.pop(key, None) is not None:
             self.store._expired_keys += 1
+            if self.store._aof is not None:
+                self.store._aof.append(self._num, ('del', key))
+            self.store._signal(self.store.NOTIFY_EXPIRED, self, 'expired',
+                               key, 1)
@@ -0,0 +1,268 @@
+'''Streaming snapshots of pulsar-ds databases.
+
+A snapshot file starts with a fixed header::
+
+    PULSARDS <version: 1 byte> <flags: 1 byte>
+
+followed by a stream of type-tagged records, optionally compressed with
+zlib. Each database starts with a ``SELECTDB`` record and each key is a
+single record, preceded by an ``EXPIRE`` record for volatile keys. The
+stream is terminated by an ``EOF`` record and the CRC32 checksum of the
+uncompressed record stream.
+
+Records are written and read in chunks of :data:`CHUNK_SIZE` bytes so
+that neither saving nor loading needs to hold a serialised copy of the
+whole data set in memory.
+'''
+import os
+import struct
+import zlib
+from collections import deque
+
+from pulsar.utils.structures import Zset
+
+from .encoding import Packed
+
+
+MAGIC = b'PULSARDS'
+VERSION = 1
+COMPRESSED = 1
+CHUNK_SIZE = 65536
+
+TYPE_STRING = 0
+TYPE_LIST = 1
+TYPE_SET = 2
+TYPE_HASH = 3
+TYPE_ZSET = 4
+OP_EXPIRE = 252
+OP_SELECTDB = 254
+OP_EOF = 255
+
+header = struct.Struct('>8sBB')
+uint32 = struct.Struct('>I')
+double = struct.Struct('>d')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def is_snapshot(file):
+    '''Check if ``file`` is a snapshot file, the file position is reset.
+    '''
+    start = file.read(len(MAGIC))
+    file.seek(0)
+    return start == MAGIC
+
+
+def save_snapshot(filename, dbs, delta=0, compress=False):
+    '''Write a snapshot of ``dbs`` into ``filename``.
+
+    :param dbs: iterable over ``(num, data, expires)`` triplets where
+        ``expires`` maps volatile keys to their deadline.
+    :param delta: number added to deadlines to obtain unix timestamps.
+    :return: the size of the snapshot in bytes.
+    '''
+    temp = '%s.tmp' % filename
+    with open(temp, 'wb') as file:
+        writer = SnapshotWriter(file, compress)
+        for num, data, expires in dbs:
+            writer.select(num)
+            for key, value in data.items():
+                deadline = expires.get(key)
+                writer.write(key, value, None if deadline is None
+                             else deadline + delta)
+        writer.close()
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, filename)
+    return writer.size
+
+
+class SnapshotWriter:
+    '''Write records into a binary ``file``
+    '''
+    def __init__(self, file, compress=False):
+        self._file = file
+        self._buffer = bytearray()
+        self._crc = 0
+        self._compressor = zlib.compressobj() if compress else None
+        self.size = 0
+        self.keys = 0
+        self._write(header.pack(MAGIC, VERSION,
+                                COMPRESSED if compress else 0))
+
+    def select(self, num):
+        '''Start records for database ``num``'''
+        self._buffer.append(OP_SELECTDB)
+        self._buffer.extend(uint32.pack(num))
+
+    def write(self, key, value, expire=None):
+        '''Write a ``key`` ``value`` record.
+
+        :param expire: optional unix timestamp when the key expires.
+        '''
+        b = self._buffer
+        if expire is not None:
+            b.append(OP_EXPIRE)
+            b.extend(double.pack(expire))
+        if isinstance(value, Packed):
+            value = value.unpack()
+        if isinstance(value, bytearray):
+            b.append(TYPE_STRING)
+            self._bytes(key)
+            self._bytes(value)
+        elif isinstance(value, dict):
+            b.append(TYPE_HASH)
+            self._bytes(key)
+            b.extend(uint32.pack(len(value)))
+            for field, v in value.items():
+                self._bytes(field)
+                self._bytes(v)
+        elif isinstance(value, Zset):
+            b.append(TYPE_ZSET)
+            self._bytes(key)
+            b.extend(uint32.pack(len(value)))
+            for score, member in value.items():
+                b.extend(double.pack(score))
+                self._bytes(member)
+        elif isinstance(value, (set, deque)):
+            b.append(TYPE_SET if isinstance(value, set) else TYPE_LIST)
+            self._bytes(key)
+            b.extend(uint32.pack(len(value)))
+            for v in value:
+                self._bytes(v)
+        else:
+            raise SnapshotError('Cannot write %s' % type(value))
+        self.keys += 1
+        if len(b) >= CHUNK_SIZE:
+            self._flush()
+
+    def close(self):
+        '''Terminate the snapshot with the ``EOF`` record and checksum'''
+        self._buffer.append(OP_EOF)
+        self._flush()
+        data = uint32.pack(self._crc & 0xffffffff)
+        if self._compressor:
+            data = self._compressor.compress(data) + self._compressor.flush()
+        self._write(data)
+
+    def _bytes(self, value):
+        self._buffer.extend(uint32.pack(len(value)))
+        self._buffer.extend(value)
+
+    def _flush(self):
+        data = bytes(self._buffer)
+        del self._buffer[:]
+        self._crc = zlib.crc32(data, self._crc)
+        if self._compressor:
+            data = self._compressor.compress(data)
+        self._write(data)
+
+    def _write(self, data):
+        if data:
+            self._file.write(data)
+            self.size += len(data)
+
+
+class SnapshotReader:
+    '''Read records from a binary ``file``.
+
+    :param types: dictionary mapping record types to the factories used
+        to build values from the decoded elements.
+    '''
+    def __init__(self, file, types):
+        self._file = file
+        self._types = types
+        self._buffer = bytearray()
+        self._offset = 0
+        self._crc = 0
+        self.loaded = 0
+        self.keys = 0
+        data = file.read(header.size)
+        self.loaded += len(data)
+        try:
+            magic, version, flags = header.unpack(data)
+        except struct.error:
+            magic = None
+        if magic != MAGIC:
+            raise SnapshotError('Not a pulsar-ds snapshot')
+        if version > VERSION:
+            raise SnapshotError('Cannot read snapshot version %s' % version)
+        self._decompressor = (zlib.decompressobj() if flags & COMPRESSED
+                              else None)
+
+    def records(self):
+        '''Generator of ``(db, key, value, expire)`` records.
+
+        It raises :class:`SnapshotError` if the snapshot is truncated or
+        the checksum does not match.
+        '''
+        read = self._read
+        db = 0
+        expire = None
+        while True:
+            op = read(1)[0]
+            if op == OP_EOF:
+                crc = self._crc & 0xffffffff
+                if uint32.unpack(self._read(4, False))[0] != crc:
+                    raise SnapshotError('Snapshot checksum does not match')
+                break
+            elif op == OP_SELECTDB:
+                db = uint32.unpack(read(4))[0]
+            elif op == OP_EXPIRE:
+                expire = double.unpack(read(8))[0]
+            else:
+                key = self._bytes()
+                if op == TYPE_STRING:
+                    value = self._types[op](self._bytes())
+                elif op == TYPE_ZSET:
+                    value = self._types[op](self._zset_items())
+                elif op == TYPE_HASH:
+                    value = self._types[op](self._pairs())
+                elif op in self._types:
+                    value = self._types[op](self._items())
+                else:
+                    raise SnapshotError('Unknown record type %s' % op)
+                self.keys += 1
+                yield db, key, value, expire
+                expire = None
+
+    def _items(self):
+        count = uint32.unpack(self._read(4))[0]
+        return [self._bytes() for _ in range(count)]
+
+    def _pairs(self):
+        count = uint32.unpack(self._read(4))[0]
+        return [(self._bytes(), self._bytes()) for _ in range(count)]
+
+    def _zset_items(self):
+        count = uint32.unpack(self._read(4))[0]
+        return [(double.unpack(self._read(8))[0], self._bytes())
+                for _ in range(count)]
+
+    def _bytes(self):
+        return self._read(uint32.unpack(self._read(4))[0])
+
+    def _read(self, n, checksum=True):
+        b = self._buffer
+        offset = self._offset
+        while len(b) - offset < n:
+            if offset:
+                del b[:offset]
+                offset = self._offset = 0
+            chunk = self._file.read(CHUNK_SIZE)
+            if not chunk:
+                raise SnapshotError('Snapshot file is truncated')
+            self.loaded += len(chunk)
+            if self._decompressor:
+                try:
+                    chunk = self._decompressor.decompress(chunk)
+                except zlib.error as exc:
+                    raise SnapshotError(str(exc))
+            b.extend(chunk)
+        data = bytes(b[offset:offset+n])
+        self._offset = offset + n
+        if checksum:
+            self._crc = zlib.crc32(data, self._crc)
+        return data
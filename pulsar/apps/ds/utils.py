@@ -1,16 +1,3 @@
-import shutil
-import pickle
-
-
-def save_data(cfg, filename, data):
-    logger = cfg.configured_logger('pulsar.ds')
-    temp = 'temp_%s' % filename
-    with open(temp, 'wb') as file:
-        pickle.dump(data, file, protocol=2)
-    shutil.move(temp, filename)
-    logger.info('wrote data into "%s"', filename)
-
-
 def sort_command(store, client, request, value):
     sort_type = type(value)
     right = 0
@@ -122,6 +122,39 @@ of the response and at the same time it flushes it.
 Check the :ref:`proxy server <tutorials-proxy-server>` example for an
 application using the :class:`HttpClient` streaming capabilities.
 
+Large bodies are better read with the ``stream`` parameter. The response
+is returned once the headers are received and the body is read from the
+:attr:`~.HttpResponse.stream`, which pauses the connection when the reader
+falls behind::
+
+    response = yield from http.get(..., stream=True)
+    while True:
+        data = yield from response.stream.read()
+        if not data:
+            break
+        # do something with this data
+
+or written to a file as it arrives::
+
+    response = yield from http.get(..., stream=True)
+    size = yield from response.download_to('/tmp/data.bin')
+
+The ``max_buffer`` parameter sets the maximum number of bytes a response
+without ``stream`` can hold in memory, larger bodies fail with
+:class:`.ResponseTooLarge`.
+
+A request body can be streamed too, by passing an iterator over bytes
+as ``data``. The iterator can also yield :class:`~asyncio.Future` which
+result in bytes. Chunks are written to the transport as they are produced
+and, when no ``Content-Length`` header is given, the body is sent with
+chunked transfer encoding::
+
+    def body():
+        for n in range(10):
+            yield ('chunk %s\n' % n).encode('utf-8')
+
+    response = yield from http.post(..., data=body())
+
 .. _http-websocket:
 
 WebSocket
@@ -148,6 +181,36 @@ Redirects & Decompression
 
 [TODO]
 
+Unix domain sockets
+=====================
+
+Servers listening on a unix domain socket are reached with the
+``http+unix`` scheme, the host is the quoted path of the socket file::
+
+    response = yield from client.get('http+unix://%2Ftmp%2Fpulsar.sock/path')
+
+Caching
+=====================
+
+Responses to ``GET`` and ``HEAD`` requests are cached when the client
+is created with the ``cache`` parameter, either ``True`` for an in memory
+:class:`.LRUCache` or a :class:`.HttpCache` instance such as the
+:class:`.StoreCache` which keeps responses in a redis or pulsar-ds store::
+
+    client = HttpClient(cache=True)
+    response = yield from client.get('http://...')
+    response.from_cache     # False
+    response = yield from client.get('http://...')
+    response.from_cache     # True if the response is fresh
+
+Stale responses are revalidated with the ``If-None-Match`` and
+``If-Modified-Since`` headers, concurrent identical requests are coalesced
+into one request to the server and the :attr:`~HttpClient.cache_stats`
+dictionary counts ``hits``, ``misses`` and ``revalidations``.
+A shared cache, such as the :class:`.StoreCache`, does not store private
+responses nor the responses to requests with an ``Authorization`` header.
+Event handlers are not invoked for responses served from the cache.
+
 Synchronous Mode
 =====================
 
@@ -250,6 +313,26 @@ HTTP Response
    :member-order: bysource
 
 
+HTTP Cache
+~~~~~~~~~~~~~~~~~~
+
+.. autoclass:: HttpCache
+   :members:
+   :member-order: bysource
+
+.. autoclass:: LRUCache
+
+.. autoclass:: StoreCache
+
+
+HTTP Stream
+~~~~~~~~~~~~~~~~~~
+
+.. autoclass:: HttpStream
+   :members:
+   :member-order: bysource
+
+
 .. _module:: pulsar.apps.http.oauth
 
 OAuth1
@@ -275,11 +358,13 @@ import os
 import platform
 from functools import partial
 from collections import namedtuple
+from collections.abc import Iterator
 from base64 import b64encode
 from io import StringIO, BytesIO
 
 import pulsar
-from pulsar import AbstractClient, Pool, Connection, ProtocolConsumer
+from pulsar import (AbstractClient, Pool, Connection, ProtocolConsumer,
+                    Future, is_async, asyncio, task)
 from pulsar.utils import websocket
 from pulsar.utils.system import json
 from pulsar.utils.pep import native_str, to_bytes
@@ -295,18 +380,24 @@ from pulsar.utils.httpurl import (urlparse, parse_qsl, responses,
                                   is_succesful, HTTPError, URLError,
                                   get_hostport, cookiejar_from_dict,
                                   host_no_default_port, DEFAULT_CHARSET,
-                                  JSON_CONTENT_TYPES)
+                                  JSON_CONTENT_TYPES, REDIRECT_CODES,
+                                  has_empty_content, unquote)
 from asyncio.events import new_event_loop
 
 from .plugins import (handle_cookies, handle_100, handle_101, handle_redirect,
                       Tunneling, TooManyRedirects)
 
 from .auth import Auth, HTTPBasicAuth, HTTPDigestAuth
+from .cache import (HttpCache, LRUCache, StoreCache, CacheEntry, cache_key,
+                    is_cacheable, must_revalidate, INVALIDATING_METHODS)
 from .oauth import OAuth1, OAuth2
+from .stream import HttpStream, ResponseTooLarge
 
 
 scheme_host = namedtuple('scheme_host', 'scheme netloc')
 tls_schemes = ('https', 'wss')
+# Schemes of urls whose host is the quoted path of a unix domain socket
+unix_schemes = ('http+unix',)
 
 
 def guess_filename(obj):
@@ -322,6 +413,7 @@ class RequestBase(object):
     history = None
     full_url = None
     scheme = None
+    data = None
 
     @property
     def unverifiable(self):
@@ -423,6 +515,15 @@ class HttpRequest(RequestBase):
         if ``True``, the :class:`HttpRequest` includes the
         ``Expect: 100-Continue`` header.
 
+    .. attribute:: stream
+
+        if ``True``, the body of the response is read from the
+        :attr:`HttpResponse.stream` as it arrives.
+
+    .. attribute:: max_buffer
+
+        Maximum number of body bytes a response can hold in memory.
+
     '''
     CONNECT = 'CONNECT'
     _proxy = None
@@ -435,7 +536,7 @@ class HttpRequest(RequestBase):
                  source_address=None, allow_redirects=False, max_redirects=10,
                  decompress=True, version=None, wait_continue=False,
                  websocket_handler=None, cookies=None, urlparams=None,
-                 **ignored):
+                 stream=False, max_buffer=None, **ignored):
         self.client = client
         self._data = None
         self.files = files
@@ -450,6 +551,8 @@ class HttpRequest(RequestBase):
         self.set_proxy(None)
         self.history = history
         self.wait_continue = wait_continue
+        self.stream = stream
+        self.max_buffer = max_buffer
         self.max_redirects = max_redirects
         self.allow_redirects = allow_redirects
         self.charset = charset or 'utf-8'
@@ -466,14 +569,18 @@ class HttpRequest(RequestBase):
         cookies = cookiejar_from_dict(client.cookies, cookies)
         if cookies:
             cookies.add_cookie_header(self)
-        self.unredirected_headers['host'] = host_no_default_port(self._scheme,
-                                                                 self._netloc)
+        if self._scheme in unix_schemes:
+            self.unredirected_headers['host'] = 'localhost'
+        else:
+            self.unredirected_headers['host'] = host_no_default_port(
+                self._scheme, self._netloc)
         client.set_proxy(self)
         self.data = data
 
     @property
     def address(self):
-        '''``(host, port)`` tuple of the HTTP resource'''
+        '''``(host, port)`` tuple of the HTTP resource, ``port`` is
+        ``None`` when ``host`` is a unix domain socket'''
         return self._tunnel.address if self._tunnel else (self.host, self.port)
 
     @property
@@ -566,7 +673,10 @@ class HttpRequest(RequestBase):
     def _set_hostport(self, scheme, host):
         self._tunnel = None
         self._proxy = None
-        self.host, self.port = get_hostport(scheme, host)
+        if scheme in unix_schemes:
+            self.host, self.port = unquote(host), None
+        else:
+            self.host, self.port = get_hostport(scheme, host)
 
     def encode(self):
         '''The bytes representation of this :class:`HttpRequest`.
@@ -577,7 +687,10 @@ class HttpRequest(RequestBase):
         # Call body before fist_line in case the query is changes.
         first_line = self.first_line()
         body = self.data
-        if body and self.wait_continue:
+        if isinstance(body, Iterator):
+            # streamed by the HttpResponse once the headers are sent
+            body = None
+        elif body and self.wait_continue:
             self.headers['expect'] = '100-continue'
             body = None
         headers = self.headers
@@ -627,6 +740,12 @@ class HttpRequest(RequestBase):
             assert self.files is None, ('data cannot be string when files are '
                                         'present')
             body = to_bytes(data, self.charset)
+        elif isinstance(data, Iterator):
+            assert self.files is None, ('data cannot be an iterator when '
+                                        'files are present')
+            if 'content-length' not in self.headers:
+                self.headers['transfer-encoding'] = 'chunked'
+            return data
         elif data or self.files:
             if self.files:
                 body, content_type = self._encode_files(data)
@@ -731,10 +850,15 @@ class HttpResponse(ProtocolConsumer):
     _tunnel_host = None
     _has_proxy = False
     _content = None
+    _buffer = None
+    _stream = None
     _data_sent = None
     _status_code = None
     _cookies = None
     request_again = None
+    from_cache = False
+    '''``True`` when the response is served by the :class:`.HttpClient`
+    cache.'''
     ONE_TIME_EVENTS = ProtocolConsumer.ONE_TIME_EVENTS + ('on_headers',)
 
     @property
@@ -776,6 +900,12 @@ class HttpResponse(ProtocolConsumer):
                 self._headers = Headers(self.parser.get_headers())
         return getattr(self, '_headers', None)
 
+    @property
+    def stream(self):
+        '''The :class:`.HttpStream` of the response body when the request
+        is sent with ``stream=True``, otherwise ``None``.'''
+        return self._stream
+
     @property
     def is_error(self):
         if self.status_code:
@@ -791,7 +921,11 @@ class HttpResponse(ProtocolConsumer):
 
     def recv_body(self):
         '''Flush the response body and return it.'''
-        return self.parser.recv_body()
+        body = self.parser.recv_body()
+        if self._buffer:
+            body = bytes(self._buffer + body)
+            self._buffer = None
+        return body
 
     def get_status(self):
         code = self.status_code
@@ -800,7 +934,9 @@ class HttpResponse(ProtocolConsumer):
 
     def get_content(self):
         '''Retrieve the body without flushing'''
-        b = self.parser.recv_body()
+        if self._stream is not None:
+            raise RuntimeError('The body of %s is streamed' % self)
+        b = self.recv_body()
         if b or self._content is None:
             self._content = self._content + b if self._content else b
         return self._content
@@ -828,6 +964,35 @@ class HttpResponse(ProtocolConsumer):
                 return self.content_string(charset)
         return self.get_content()
 
+    def download_to(self, path):
+        '''Write the body to the file at ``path`` as it arrives.
+
+        Return the number of bytes written. File operations run in the
+        default executor so that a slow disk does not block the event loop;
+        a chunk is written while the next one is read from the stream.
+        '''
+        executor = self._loop.run_in_executor
+        fp = yield from executor(None, open, path, 'wb')
+        writing = None
+        try:
+            if self._stream is None:
+                data = self.get_content() or b''
+                yield from executor(None, fp.write, data)
+                return len(data)
+            size = 0
+            while True:
+                data = yield from self._stream.read()
+                if writing:
+                    yield from writing
+                if not data:
+                    return size
+                writing = executor(None, fp.write, data)
+                size += len(data)
+        finally:
+            if writing:
+                yield from asyncio.wait((writing,), loop=self._loop)
+            yield from executor(None, fp.close)
+
     def raise_for_status(self):
         '''Raises stored :class:`HTTPError` or :class:`URLError`, if occured.
         '''
@@ -847,7 +1012,10 @@ class HttpResponse(ProtocolConsumer):
     # #####################################################################
     # #    PROTOCOL IMPLEMENTATION
     def start_request(self):
-        self.transport.write(self._request.encode())
+        request = self._request
+        self.transport.write(request.encode())
+        if isinstance(request.data, Iterator):
+            self._write_body(request)
 
     def data_received(self, data):
         request = self._request
@@ -857,9 +1025,11 @@ class HttpResponse(ProtocolConsumer):
             if request.parser.execute(data, len(data)) == len(data):
                 if request.parser.is_headers_complete():
                     self._status_code = request.parser.get_status_code()
-                    if not self.event('on_headers').fired():
+                    if not self.fired_event('on_headers'):
                         self.fire_event('on_headers')
-                    if (not self.event('post_request').fired() and
+                        self._headers_received(request)
+                    self._body_received(request)
+                    if (not self.fired_event('post_request') and
                             request.parser.is_message_complete()):
                         self.finished()
             else:
@@ -867,6 +1037,63 @@ class HttpResponse(ProtocolConsumer):
         except Exception as exc:
             self.finished(exc=exc)
 
+    @task
+    def _write_body(self, request):
+        # Write the chunks of a streamed request body, waiting for the
+        # transport to drain when needed
+        chunked = request.get_header('transfer-encoding') == 'chunked'
+        try:
+            for chunk in request.data:
+                if is_async(chunk):
+                    chunk = yield from chunk
+                if self.fired_event('post_request'):
+                    return
+                if chunk:
+                    if chunked:
+                        chunk = b''.join((('%X\r\n' % len(chunk)).encode(),
+                                          chunk, b'\r\n'))
+                    result = self.write(chunk)
+                    if is_async(result):
+                        yield from result
+            if chunked:
+                self.write(b'0\r\n\r\n')
+        except Exception as exc:
+            if not self.fired_event('post_request'):
+                if self._connection:
+                    self._connection.close()
+                self.finished(exc=exc)
+
+    def _headers_received(self, request):
+        if not getattr(request, 'stream', False):
+            method = getattr(request, 'method', None)
+            if not has_empty_content(self._status_code, method):
+                self._check_buffer(request,
+                                   self.headers.get('content-length'))
+        elif (self._status_code not in (100, 101) and not
+              (self._status_code in REDIRECT_CODES and
+               request.allow_redirects)):
+            self._stream = HttpStream(self)
+
+    def _body_received(self, request):
+        # Move the parsed body out of the parser, into the stream or into
+        # a buffer which grows in place
+        body = request.parser.recv_body()
+        if body:
+            if self._stream is not None:
+                self._stream.feed(body)
+            else:
+                if self._buffer is None:
+                    self._buffer = bytearray()
+                self._buffer.extend(body)
+                self._check_buffer(request, len(self._buffer))
+
+    def _check_buffer(self, request, size):
+        max_buffer = getattr(request, 'max_buffer', None)
+        if max_buffer and size and int(size) > max_buffer:
+            self.transport.close()
+            raise ResponseTooLarge('Body of %s larger than %d bytes' %
+                                   (self, max_buffer))
+
 
 class HttpClient(AbstractClient):
     '''A client for HTTP/HTTPS servers.
@@ -922,6 +1149,25 @@ class HttpClient(AbstractClient):
 
         Dictionary of connection pools for different hosts
 
+    .. attribute:: max_buffer
+
+        Default maximum number of body bytes a response can hold in memory,
+        it can be overwritten on :meth:`request`. Larger responses fail
+        with :class:`.ResponseTooLarge`, use ``stream=True`` to read them.
+
+        Default: ``None`` (no limit)
+
+    .. attribute:: cache
+
+        The :class:`.HttpCache` for responses or ``None``.
+
+        Default: ``None``
+
+    .. attribute:: cache_stats
+
+        Dictionary with the number of cache ``hits``, ``misses`` and
+        ``revalidations``.
+
     .. attribute:: DEFAULT_HTTP_HEADERS
 
         Default headers for this :class:`HttpClient`
@@ -956,7 +1202,7 @@ class HttpClient(AbstractClient):
         kind='client')
     request_parameters = ('encode_multipart', 'max_redirects', 'decompress',
                           'allow_redirects', 'multipart_boundary', 'version',
-                          'timeout', 'websocket_handler')
+                          'timeout', 'websocket_handler', 'max_buffer')
     # Default hosts not affected by proxy settings. This can be overwritten
     # by specifying the "no" key in the proxy_info dictionary
     no_proxy = set(('localhost', platform.node()))
@@ -968,7 +1214,7 @@ class HttpClient(AbstractClient):
                  max_redirects=10, decompress=True, version=None,
                  websocket_handler=None, parser=None, trust_env=True,
                  loop=None, client_version=None, timeout=None,
-                 pool_size=10, frame_parser=None):
+                 pool_size=10, frame_parser=None, max_buffer=None):
         super(HttpClient, self).__init__(loop)
         self.client_version = client_version or self.client_version
         self.connection_pools = {}
@@ -977,6 +1223,7 @@ class HttpClient(AbstractClient):
         self.timeout = timeout
         self.store_cookies = store_cookies
         self.max_redirects = max_redirects
+        self.max_buffer = max_buffer
         self.cookies = cookiejar_from_dict(cookies)
         self.decompress = decompress
         self.version = version or self.version
@@ -1000,6 +1247,13 @@ class HttpClient(AbstractClient):
                                'ca_certs': ca_certs}
         self.http_parser = parser or http_parser
         self.frame_parser = frame_parser or websocket.frame_parser
+        if cache is True:
+            cache = LRUCache()
+        elif cache is False:
+            cache = None
+        self.cache = cache
+        self.cache_stats = {'hits': 0, 'misses': 0, 'revalidations': 0}
+        self._cache_waiters = {}
         # Add hooks
         self.bind_event('pre_request', Tunneling(self._loop))
         self.bind_event('on_headers', handle_101)
@@ -1104,6 +1358,21 @@ class HttpClient(AbstractClient):
         nparams.update(((name, getattr(self, name)) for name in
                         self.request_parameters if name not in params))
         request = HttpRequest(self, url, method, params, **nparams)
+        if self.cache is None:
+            response = yield from self._send(request)
+        elif is_cacheable(request, self.cache.shared):
+            response = yield from self._coalesce(request)
+        else:
+            response = yield from self._send(request)
+            if (request.method in INVALIDATING_METHODS and
+                    not response.is_error):
+                yield from self._cache_invalidate(request)
+        if isinstance(response.request_again, tuple):
+            method, url, params = response.request_again
+            response = yield from self._request(method, url, **params)
+        return response
+
+    def _send(self, request):
         pool = self.connection_pools.get(request.key)
         if pool is None:
             host, port = request.address
@@ -1112,11 +1381,24 @@ class HttpClient(AbstractClient):
                 pool_size=self.pool_size, loop=self._loop)
             self.connection_pools[request.key] = pool
         conn = yield from pool.connect()
-        with conn:
+        try:
             consumer = conn.current_consumer()
             # bind request-specific events
             consumer.bind_events(**request.inp_params)
+            if request.stream:
+                # keep the connection until the body is received and
+                # release it before the stream signals completion
+                consumer.bind_event(
+                    'post_request',
+                    lambda _, exc=None: self._release(conn, consumer, exc))
             consumer.start(request)
+            if request.stream:
+                yield from asyncio.wait((consumer.event('on_headers'),
+                                         consumer.on_finished),
+                                        loop=self._loop,
+                                        return_when=asyncio.FIRST_COMPLETED)
+                if consumer.stream is not None:
+                    return consumer
             response = yield from consumer.on_finished
             if response is not None:
                 consumer = response
@@ -1125,16 +1407,92 @@ class HttpClient(AbstractClient):
                     raise consumer.request_again
                 elif isinstance(consumer.request_again, ProtocolConsumer):
                     consumer = consumer.request_again
-            headers = consumer.headers
-            if (not headers or
-                    not headers.has('connection', 'keep-alive') or
-                    consumer.status_code == 101):
-                conn.detach()
-        if isinstance(consumer.request_again, tuple):
-            method, url, params = consumer.request_again
-            consumer = yield from self._request(method, url, **params)
+        except Exception:
+            conn.detach()
+            raise
+        self._release(conn, consumer)
         return consumer
 
+    def _release(self, conn, consumer, exc=None):
+        headers = consumer.headers
+        if (exc or not headers or
+                not headers.has('connection', 'keep-alive') or
+                consumer.status_code == 101):
+            conn.detach()
+        else:
+            conn.close()
+
+    def _coalesce(self, request):
+        # Concurrent identical requests wait for the first one
+        key = (cache_key(request.method, request.full_url),
+               bytes(request.headers))
+        waiters = self._cache_waiters.get(key)
+        if waiters is not None:
+            waiter = Future(loop=self._loop)
+            waiters.append(waiter)
+            return (yield from waiter)
+        self._cache_waiters[key] = waiters = []
+        try:
+            response = yield from self._cached_request(request)
+        except Exception as exc:
+            for waiter in waiters:
+                waiter.set_exception(exc)
+            raise
+        else:
+            for waiter in waiters:
+                waiter.set_result(response)
+            return response
+        finally:
+            self._cache_waiters.pop(key)
+
+    def _cached_request(self, request):
+        cache = self.cache
+        stats = self.cache_stats
+        key = cache_key(request.method, request.full_url)
+        entry = cache.get(key)
+        if is_async(entry):
+            entry = yield from entry
+        if entry is not None:
+            if not entry.matches(request):
+                entry = None
+            elif entry.is_fresh() and not must_revalidate(request):
+                stats['hits'] += 1
+                return self._cached_response(request, entry)
+            else:
+                for name, value in entry.validators():
+                    request.add_header(name, value)
+        response = yield from self._send(request)
+        if entry is not None and response.status_code == 304:
+            stats['revalidations'] += 1
+            entry = entry.revalidated(response.headers)
+            response = self._cached_response(request, entry)
+        else:
+            stats['misses'] += 1
+            entry = CacheEntry.from_response(response, cache.shared)
+            if entry is None:
+                return response
+        result = cache.set(key, entry)
+        if is_async(result):
+            yield from result
+        return response
+
+    def _cached_response(self, request, entry):
+        request.new_parser()
+        response = HttpResponse(loop=self._loop)
+        response._request = request
+        response._status_code = entry.status_code
+        response._headers = Headers(entry.headers)
+        response._content = entry.body
+        response.from_cache = True
+        response.finished()
+        return response
+
+    def _cache_invalidate(self, request):
+        for method in ('GET', 'HEAD'):
+            result = self.cache.delete(cache_key(method, request.full_url))
+            if is_async(result):
+                yield from result
+
     def close(self, async=True, timeout=5):
         '''Close all connections.
 
@@ -1193,8 +1551,12 @@ class HttpClient(AbstractClient):
                 request.set_proxy(p.scheme, p.netloc)
 
     def _connect(self, host, port, ssl):
-        _, connection = yield from self._loop.create_connection(
-            self.create_protocol, host, port, ssl=ssl)
+        if port is None:
+            _, connection = yield from self._loop.create_unix_connection(
+                self.create_protocol, host, ssl=ssl)
+        else:
+            _, connection = yield from self._loop.create_connection(
+                self.create_protocol, host, port, ssl=ssl)
         # Wait for the connection made event
         yield from connection.event('connection_made')
         return connection
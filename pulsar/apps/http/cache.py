@@ -0,0 +1,327 @@
+'''HTTP response caching for :class:`.HttpClient`.
+
+A client created with the ``cache`` parameter keeps the responses to
+``GET`` and ``HEAD`` requests in a :class:`HttpCache` and serves them,
+without contacting the server, for as long as they are fresh according to
+the ``Cache-Control`` and ``Expires`` response headers. Stale responses
+carrying an ``ETag`` or ``Last-Modified`` validator are revalidated with a
+conditional request and a ``304 Not Modified`` reply reuses the cached body.
+
+Responses are selected by the request method and url and by the values of
+the request headers listed in the ``Vary`` response header.
+
+A :attr:`~HttpCache.shared` cache, such as the :class:`StoreCache`, does not
+store responses marked ``Cache-Control: private`` nor the responses to
+requests with an ``Authorization`` header.
+'''
+import time
+import base64
+from collections import OrderedDict
+from email.utils import parsedate_tz, mktime_tz
+
+from pulsar.utils.system import json
+from pulsar.utils.httpurl import Headers, parse_dict_header
+
+
+__all__ = ['HttpCache', 'LRUCache', 'StoreCache']
+
+
+CACHEABLE_METHODS = ('GET', 'HEAD')
+# Methods which invalidate the cached responses of their url
+INVALIDATING_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+# Status codes of responses which can be stored
+CACHEABLE_STATUS = (200, 203, 410)
+# Request headers which make the request conditional
+CONDITIONAL_HEADERS = ('if-none-match', 'if-modified-since', 'if-match',
+                       'if-unmodified-since', 'if-range')
+# Headers of a 304 response which don't replace the cached ones
+NOT_UPDATED_HEADERS = frozenset(('content-length', 'content-encoding',
+                                 'transfer-encoding', 'content-range'))
+
+
+def parse_cache_control(value):
+    '''Dictionary of ``Cache-Control`` directives with lower case keys'''
+    if not value:
+        return {}
+    return dict(((k.strip().lower(), v) for k, v in
+                 parse_dict_header(value).items()))
+
+
+def parse_http_date(value):
+    '''Seconds since epoch of an HTTP date or ``None`` if invalid'''
+    if value:
+        bits = parsedate_tz(value)
+        if bits:
+            try:
+                return mktime_tz(bits)
+            except (OverflowError, ValueError):
+                pass
+
+
+def cache_key(method, url):
+    return '%s %s' % (method, url)
+
+
+def is_cacheable(request, shared=False):
+    '''Check if the response to ``request`` can be served from a cache,
+    a ``shared`` one if required'''
+    if (request.method not in CACHEABLE_METHODS or request.stream or
+            request._scheme in ('ws', 'wss')):
+        return False
+    if shared and request.has_header('authorization'):
+        return False
+    for name in CONDITIONAL_HEADERS:
+        if request.has_header(name):
+            return False
+    cc = parse_cache_control(request.get_header('cache-control'))
+    return 'no-store' not in cc
+
+
+def must_revalidate(request):
+    '''Check if ``request`` asks to revalidate fresh responses'''
+    cc = parse_cache_control(request.get_header('cache-control'))
+    return ('no-cache' in cc or cc.get('max-age') == '0' or
+            'no-cache' in (request.get_header('pragma') or ''))
+
+
+def freshness_lifetime(headers):
+    '''Seconds a response with ``headers`` stays fresh.
+
+    ``None`` when the response must not be stored.
+    '''
+    cc = parse_cache_control(headers.get('cache-control'))
+    if 'no-store' in cc:
+        return None
+    elif 'no-cache' in cc:
+        return 0
+    elif 'max-age' in cc:
+        try:
+            return max(int(cc['max-age']), 0)
+        except (TypeError, ValueError):
+            return 0
+    elif 'expires' in headers:
+        expires = parse_http_date(headers['expires'])
+        if expires is None:
+            return 0
+        date = parse_http_date(headers.get('date')) or time.time()
+        return max(expires - date, 0)
+    else:
+        return 0
+
+
+class CacheEntry:
+    '''A response stored in a :class:`HttpCache`.
+
+    .. attribute:: vary
+
+        Dictionary of request header values the response was selected with
+
+    .. attribute:: expires
+
+        Seconds since epoch at which the response becomes stale
+    '''
+    __slots__ = ('status_code', 'headers', 'body', 'vary', 'expires')
+
+    def __init__(self, status_code, headers, body, vary, expires):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.vary = vary
+        self.expires = expires
+
+    @classmethod
+    def from_response(cls, response, shared=False):
+        '''Create a :class:`CacheEntry` from a :class:`.HttpResponse`.
+
+        Return ``None`` if the response cannot be stored, in a ``shared``
+        cache if required.
+        '''
+        headers = response.headers
+        if response.status_code not in CACHEABLE_STATUS or not headers:
+            return
+        if shared and 'private' in parse_cache_control(
+                headers.get('cache-control')):
+            return
+        lifetime = freshness_lifetime(headers)
+        vary = vary_values(response.request, headers)
+        if lifetime is None or vary is None:
+            return
+        if not lifetime and not validators(headers):
+            return
+        return cls(response.status_code, list(headers),
+                   response.get_content() or b'', vary,
+                   expiry(headers, lifetime))
+
+    @classmethod
+    def from_bytes(cls, data):
+        '''Create a :class:`CacheEntry` from the output of
+        :meth:`to_bytes`.'''
+        data = json.loads(data.decode('utf-8'))
+        return cls(data['status_code'],
+                   [tuple(header) for header in data['headers']],
+                   base64.b64decode(data['body']), data['vary'],
+                   data['expires'])
+
+    def to_bytes(self):
+        '''Serialise the entry as JSON encoded bytes'''
+        data = {'status_code': self.status_code,
+                'headers': self.headers,
+                'body': base64.b64encode(self.body).decode('ascii'),
+                'vary': self.vary,
+                'expires': self.expires}
+        return json.dumps(data).encode('utf-8')
+
+    def is_fresh(self):
+        return time.time() < self.expires
+
+    def matches(self, request):
+        '''Check if the response was selected by ``request`` headers'''
+        for name, value in self.vary.items():
+            if request.get_header(name) != value:
+                return False
+        return True
+
+    def validators(self):
+        return validators(Headers(self.headers))
+
+    def revalidated(self, headers):
+        '''A new :class:`CacheEntry` updated by the ``headers`` of a
+        ``304 Not Modified`` response.'''
+        fields = OrderedDict()
+        for key, value in self.headers:
+            fields.setdefault(key.lower(), []).append((key, value))
+        for key, value in headers:
+            name = key.lower()
+            if name not in NOT_UPDATED_HEADERS:
+                fields[name] = [(key, value)]
+        hdrs = [kv for values in fields.values() for kv in values]
+        updated = Headers(hdrs)
+        lifetime = freshness_lifetime(updated) or 0
+        return self.__class__(self.status_code, hdrs, self.body, self.vary,
+                              expiry(updated, lifetime))
+
+
+def validators(headers):
+    '''List of conditional request headers for response ``headers``'''
+    values = []
+    etag = headers.get('etag')
+    if etag:
+        values.append(('If-None-Match', etag))
+    modified = headers.get('last-modified')
+    if modified:
+        values.append(('If-Modified-Since', modified))
+    return values
+
+
+def vary_values(request, headers):
+    vary = headers.get('vary')
+    values = {}
+    if vary:
+        for name in vary.split(','):
+            name = name.strip().lower()
+            if name == '*':
+                return
+            elif name:
+                values[name] = request.get_header(name)
+    return values
+
+
+def expiry(headers, lifetime):
+    try:
+        age = int(headers.get('age') or 0)
+    except ValueError:
+        age = 0
+    return time.time() + lifetime - age
+
+
+class HttpCache:
+    '''Interface of :class:`.HttpClient` response caches.
+
+    Methods can either return a value or a coroutine.
+
+    .. attribute:: shared
+
+        ``True`` when the cache is shared by several users, in which case
+        private responses are not stored.
+    '''
+    shared = False
+
+    def get(self, key):
+        '''The :class:`CacheEntry` at ``key`` or ``None``.'''
+        raise NotImplementedError
+
+    def set(self, key, entry):
+        '''Store a :class:`CacheEntry` at ``key``.'''
+        raise NotImplementedError
+
+    def delete(self, key):
+        '''Remove the :class:`CacheEntry` at ``key``.'''
+        raise NotImplementedError
+
+
+class LRUCache(HttpCache):
+    '''An in memory :class:`HttpCache` which discards the least recently
+    used responses once it holds more than ``max_size`` of them.
+
+    This is the cache used by :class:`.HttpClient` when ``cache=True``.
+    '''
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def set(self, key, entry):
+        data = self._data
+        data[key] = entry
+        data.move_to_end(key)
+        while len(data) > self.max_size:
+            data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class StoreCache(HttpCache):
+    '''A :class:`HttpCache` in a redis or :ref:`pulsar-ds <pulsar-data-store>`
+    ``store``, which can be shared by several clients and processes.
+
+    :param namespace: prefix of the keys.
+    :param timeout: seconds a stale response with validators is kept for
+        revalidation.
+
+    Entries are stored as JSON.
+    '''
+    shared = True
+
+    def __init__(self, store, namespace='httpcache:', timeout=86400):
+        self.store = store
+        self.namespace = namespace
+        self.timeout = timeout
+        self._client = store.client()
+
+    def get(self, key):
+        value = yield from self._client.get(self.namespace + key)
+        if value:
+            return CacheEntry.from_bytes(value)
+
+    def set(self, key, entry):
+        ttl = max(entry.expires - time.time(), 0)
+        if entry.validators():
+            ttl += self.timeout
+        ttl = int(ttl) or 1
+        value = entry.to_bytes()
+        yield from self._client.setex(self.namespace + key, ttl, value)
+
+    def delete(self, key):
+        yield from self._client.delete(self.namespace + key)
@@ -0,0 +1,129 @@
+'''Streaming of :class:`.HttpResponse` bodies.
+
+When a request is sent with ``stream=True``, the :class:`.HttpClient`
+returns the response as soon as its headers are received and the body
+is read from the :attr:`.HttpResponse.stream` as it arrives.
+'''
+from collections import deque
+
+from pulsar import Future, PulsarException, coroutine
+
+
+__all__ = ['HttpStream', 'ResponseTooLarge']
+
+
+# Buffered bytes above which reading from the transport is paused
+HIGH_WATER = 2**18
+
+
+class ResponseTooLarge(PulsarException):
+    '''Raised when a response body exceeds the ``max_buffer`` parameter
+    of a :class:`.HttpClient` request.'''
+
+
+class HttpStream:
+    '''Asynchronous iterator over the body chunks of a :class:`.HttpResponse`.
+
+    Reading from the transport is paused once more than ``high_limit``
+    bytes are waiting to be read and resumed when the buffered bytes drop
+    below ``low_limit``::
+
+        response = yield from client.get(url, stream=True)
+        while True:
+            data = yield from response.stream.read()
+            if not data:
+                break
+            ...
+
+    or, in python 3.5 and above::
+
+        async for data in response.stream:
+            ...
+    '''
+    def __init__(self, response, high_limit=None, low_limit=None):
+        self.response = response
+        self.high_limit = high_limit or HIGH_WATER
+        self.low_limit = (self.high_limit // 4 if low_limit is None
+                          else low_limit)
+        self._loop = response._loop
+        self._chunks = deque()
+        self._size = 0
+        self._paused = False
+        self._waiter = None
+        self._exc = None
+        self._done = False
+        response.bind_event('post_request', self._finished)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.response)
+    __str__ = __repr__
+
+    @property
+    def buffered(self):
+        '''Number of bytes received and not yet read'''
+        return self._size
+
+    @property
+    def done(self):
+        '''``True`` when the body has been received'''
+        return self._done
+
+    def feed(self, data):
+        '''Add a chunk of ``data`` received from the transport'''
+        self._chunks.append(data)
+        self._size += len(data)
+        if not self._paused and self._size > self.high_limit:
+            transport = self.response.transport
+            if transport is not None:
+                self._paused = True
+                transport.pause_reading()
+        self._wakeup()
+
+    def read(self):
+        '''Read the next chunk of the body.
+
+        Return an empty bytes string once the whole body has been read.
+        '''
+        while not self._chunks:
+            if self._done:
+                if self._exc:
+                    raise self._exc
+                return b''
+            self._waiter = Future(loop=self._loop)
+            yield from self._waiter
+        data = self._chunks.popleft()
+        self._size -= len(data)
+        if self._paused and self._size <= self.low_limit:
+            self._resume()
+        return data
+
+    def __aiter__(self):
+        return self
+
+    @coroutine
+    def __anext__(self):
+        data = yield from self.read()
+        if not data:
+            raise StopAsyncIteration
+        return data
+
+    #    INTERNALS
+    def _finished(self, _, exc=None):
+        self._done = True
+        self._exc = exc
+        self._resume()
+        self._wakeup()
+
+    def _resume(self):
+        if self._paused:
+            self._paused = False
+            transport = self.response.transport
+            if transport is not None:
+                transport.resume_reading()
+
+    def _wakeup(self):
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
@@ -1,27 +1,254 @@
+'''A streaming reverse proxy :ref:`WSGI middleware <wsgi-middleware>`.
+
+The :class:`Proxy` middleware forwards requests matching a route to one
+of several upstream servers::
+
+    from pulsar.apps import wsgi
+    from pulsar.apps.proxy import Proxy
+
+    proxy = Proxy('api/', ['http://10.0.0.1:8000/',
+                           'http://10.0.0.2:8000/'],
+                  balancer='least_connections', health_path='/health')
+    server = wsgi.WSGIServer(wsgi.WsgiHandler([proxy]))
+
+Request and response bodies are streamed, a chunk at a time, in both
+directions. When the upstream server is slower than the client, reading
+from the client is paused, and vice versa, so that the proxy never holds
+more than a few chunks of a body in memory.
+
+Load balancing
+=================
+
+The upstream server of a request is selected by a balancer:
+
+* ``round_robin`` (default) cycles through the upstream servers.
+* ``least_connections`` selects the server with the fewest requests in
+  flight.
+* ``consistent_hash`` selects the server from a hash ring keyed by the
+  client address, so that a client is always served by the same upstream
+  while it is available.
+
+Health checks
+=================
+
+An upstream server which fails ``max_fails`` consecutive requests, either
+because it cannot be reached or because it responds with a ``502``,
+``503`` or ``504`` status code, is ejected from the balancer for
+``fail_timeout`` seconds.
+
+A request which fails before it is sent to an upstream server is retried
+on another server. Once sent, only ``GET``, ``HEAD``, ``OPTIONS`` and
+``TRACE`` requests are retried, so that a request which changes the state
+of the upstream server is never executed twice.
+
+When ``health_path`` is given, each upstream server is also checked every
+``health_interval`` seconds with a ``GET`` request to that path and it is
+removed from the balancer until it responds with a status code below
+``400``.
+
+Connections to upstream servers are kept alive in a pool of
+``pool_size`` connections for each server.
+
+Statistics
+=================
+
+The :meth:`Proxy.info` method returns the statistics of each
+:class:`Upstream` server in the worker process: requests in flight,
+total requests, errors and the average and maximum latency, in
+milliseconds, of the upstream response headers.
+
+API
+=================
+
+.. autoclass:: Proxy
+   :members:
+   :member-order: bysource
+
+.. autoclass:: Upstream
+   :members:
+   :member-order: bysource
+'''
+import time
+from asyncio import wait_for
+from bisect import bisect
+from hashlib import md5
+from collections import deque
+from functools import partial
 from urllib.parse import urljoin
 
-from pulsar import as_coroutine, task
+from pulsar import (as_coroutine, task, async, Future, HttpException,
+                    chain_future, get_event_loop)
 from pulsar.utils.httpurl import Headers
 from pulsar.utils.log import LocalMixin, local_property
-from pulsar.apps.wsgi import Route, wsgi_request
+from pulsar.apps.wsgi import Route, wsgi_request, HOP_HEADERS
 from pulsar.apps.http import HttpClient
 
 
+__all__ = ['Proxy', 'Upstream', 'RoundRobin', 'LeastConnections',
+           'ConsistentHash']
+
+
 ENVIRON_HEADERS = ('content-type', 'content-length')
+# Request headers not forwarded to upstream servers
+SKIP_HEADERS = HOP_HEADERS.union(('expect',))
+# Upstream status codes counted as failures
+FAILURE_STATUS = (502, 503, 504)
+# Safe methods retried on another upstream once sent
+RETRY_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'TRACE'))
+
+
+class Upstream:
+    '''An upstream server of a :class:`Proxy` and its statistics.
+
+    .. attribute:: url
+
+        The base url of the server.
+
+    .. attribute:: active
+
+        Number of requests in flight.
+
+    .. attribute:: failures
+
+        Number of consecutive failed requests.
+    '''
+    def __init__(self, url):
+        self.url = url
+        self.active = 0
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0
+        self.latency = 0
+        self.max_latency = 0
+        self.healthy = True
+        self.ejected_until = 0
+
+    def __repr__(self):
+        return self.url
+    __str__ = __repr__
+
+    def available(self, now=None):
+        '''``True`` if the server can receive requests.'''
+        return self.healthy and self.ejected_until <= (now or time.time())
+
+    def info(self):
+        return {'url': self.url,
+                'active': self.active,
+                'requests': self.requests,
+                'errors': self.errors,
+                'latency': round(1000*self.latency, 3),
+                'max_latency': round(1000*self.max_latency, 3),
+                'healthy': self.healthy,
+                'ejected': self.ejected_until > time.time()}
+
+    def record(self, latency):
+        '''Record the ``latency``, in seconds, of a response.'''
+        self.requests += 1
+        self.latency += (latency - self.latency)/min(self.requests, 100)
+        self.max_latency = max(self.max_latency, latency)
+
+
+class RoundRobin:
+    '''Select upstream servers in turn.'''
+    def __init__(self, upstreams):
+        self.upstreams = upstreams
+        self._next = 0
+
+    def select(self, request, available):
+        upstream = available[self._next % len(available)]
+        self._next += 1
+        return upstream
+
+
+class LeastConnections(RoundRobin):
+    '''Select the upstream server with the fewest requests in flight.'''
+    def select(self, request, available):
+        # rotate the servers so that ties are broken in turn
+        start = self._next % len(available)
+        self._next += 1
+        available = available[start:] + available[:start]
+        return min(available, key=lambda upstream: upstream.active)
+
+
+class ConsistentHash(RoundRobin):
+    '''Select upstream servers from a hash ring.
+
+    :param key: a callable returning the hash key of a
+        :class:`.WsgiRequest`. By default the client address.
+    :param replicas: number of points of each server on the ring.
+    '''
+    def __init__(self, upstreams, key=None, replicas=100):
+        super().__init__(upstreams)
+        self.key = key or client_address
+        ring = []
+        for upstream in upstreams:
+            for n in range(replicas):
+                ring.append((_hash('%s-%s' % (upstream.url, n)), upstream))
+        ring.sort(key=lambda point: point[0])
+        self._points = [point for point, _ in ring]
+        self._ring = [upstream for _, upstream in ring]
+
+    def select(self, request, available):
+        size = len(self._ring)
+        index = bisect(self._points, _hash(self.key(request) or ''))
+        for n in range(size):
+            upstream = self._ring[(index + n) % size]
+            if upstream in available:
+                return upstream
+        return available[0]
+
+
+BALANCERS = {'round_robin': RoundRobin,
+             'least_connections': LeastConnections,
+             'consistent_hash': ConsistentHash}
 
 
 class Proxy(LocalMixin):
-    '''Proxy requests to another server
+    '''Proxy requests to other servers.
+
+    :param route: the :class:`.Route` of requests to proxy. The remaining
+        path is appended to the url of the upstream server.
+    :param url: the url of the upstream server or a list of urls.
+    :param balancer: the name of the balancer (``round_robin``,
+        ``least_connections`` or ``consistent_hash``) or a balancer class.
+    :param max_fails: consecutive failures which eject a server.
+    :param fail_timeout: seconds an ejected server is out of the balancer.
+    :param health_path: optional path for active health checks.
+    :param health_interval: seconds between active health checks.
+    :param pool_size: keep-alive connections for each upstream server.
+    :param high_limit: bytes of a request body buffered before reading
+        from the client is paused.
     '''
-    def __init__(self, route, url):
+    def __init__(self, route, url, balancer=None, max_fails=3,
+                 fail_timeout=10, health_path=None, health_interval=5,
+                 pool_size=10, high_limit=2**18):
         self.route = Route(route)
-        self.url = url
+        urls = [url] if isinstance(url, str) else url
+        self.upstreams = [Upstream(u) for u in urls]
+        if not self.upstreams:
+            raise ValueError('Proxy requires at least one upstream url')
+        balancer = balancer or 'round_robin'
+        if isinstance(balancer, str):
+            balancer = BALANCERS[balancer]
+        self.balancer = balancer(self.upstreams)
+        self.max_fails = max_fails
+        self.fail_timeout = fail_timeout
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.pool_size = pool_size
+        self.high_limit = high_limit
+
+    @property
+    def url(self):
+        '''The url of the first upstream server.'''
+        return self.upstreams[0].url
 
     @local_property
     def http_client(self):
         '''The :class:`.HttpClient` used by this proxy middleware for
         accessing upstream resources'''
-        return HttpClient(decompress=False, store_cookies=False)
+        return HttpClient(decompress=False, store_cookies=False,
+                          pool_size=self.pool_size)
 
     def __call__(self, environ, start_response):
         request = wsgi_request(environ)
@@ -29,21 +256,26 @@ class Proxy(LocalMixin):
         match = self.route.match(path[1:])
         if match is not None:
             query = request.get('QUERY_STRING', '')
-            path = urljoin(self.url, match.pop('__remaining__', ''))
+            path = match.pop('__remaining__', '')
             if query:
                 path = '%s?%s' % (path, query)
             return self._call(request, path, start_response)
 
-    @task
-    def _call(self, request, path, start_response):
-        data, files = yield from as_coroutine(request.data_and_files())
-        response = yield from self.http_client.request(
-            request.method, path, data=data, files=files,
-            headers=self.request_headers(request.environ),
-            version=request.get('SERVER_PROTOCOL'))
-        response.raise_for_status()
-        start_response(response.get_status(), list(response.headers))
-        return [response.get_content()]
+    def info(self):
+        '''Statistics of the upstream servers.'''
+        return [upstream.info() for upstream in self.upstreams]
+
+    def select(self, request, exclude=()):
+        '''Select the :class:`Upstream` server for ``request``.
+
+        Raise a ``503`` :class:`.HttpException` if no server is available.
+        '''
+        now = time.time()
+        available = [upstream for upstream in self.upstreams
+                     if upstream not in exclude and upstream.available(now)]
+        if not available:
+            raise HttpException(status=503)
+        return self.balancer.select(request, available)
 
     def request_headers(self, environ):
         '''Fill request headers from the environ dictionary and
@@ -54,10 +286,203 @@ class Proxy(LocalMixin):
         for k in environ:
             if k.startswith('HTTP_'):
                 head = k[5:].replace('_', '-')
-                headers[head] = environ[k]
+                if head.lower() not in SKIP_HEADERS:
+                    headers[head] = environ[k]
         for head in ENVIRON_HEADERS:
             k = head.replace('-', '_').upper()
             v = environ.get(k)
             if v:
                 headers[head] = v
         return headers
+
+    def request_body(self, request):
+        '''The body to send upstream, ``None`` if there is no body.
+
+        A :class:`.StreamReader` input is streamed, any other input is
+        read in full.
+        '''
+        environ = request.environ
+        stream = environ.get('wsgi.input')
+        if not stream or not (
+                environ.get('CONTENT_LENGTH', '0') not in ('', '0') or
+                environ.get('HTTP_TRANSFER_ENCODING') == 'chunked'):
+            return None
+        elif hasattr(stream, 'consume'):
+            return RequestBody(stream, self.high_limit)
+        else:
+            return stream.read()
+
+    def failure(self, upstream):
+        '''Record a failed request to ``upstream``.'''
+        upstream.errors += 1
+        upstream.failures += 1
+        if upstream.failures >= self.max_fails:
+            upstream.ejected_until = time.time() + self.fail_timeout
+
+    #    INTERNALS
+    @task
+    def _call(self, request, path, start_response):
+        if self.health_path and 'health' not in self.local:
+            self.local.health = self.http_client._loop.call_soon(
+                self._health_checks)
+        body = self.request_body(request)
+        if body is not None and not isinstance(body, RequestBody):
+            body = yield from as_coroutine(body)
+        headers = self.request_headers(request.environ)
+        tried = set()
+        while True:
+            upstream = self.select(request, tried)
+            upstream.active += 1
+            start = time.time()
+            sent = []
+            try:
+                response = yield from self.http_client.request(
+                    request.method, urljoin(upstream.url, path), data=body,
+                    headers=headers, version=request.get('SERVER_PROTOCOL'),
+                    stream=True,
+                    pre_request=lambda r, exc=None: sent.append(True))
+                if response.status_code is None:
+                    raise ConnectionResetError(
+                        '%s closed the connection' % upstream)
+            except Exception:
+                upstream.active -= 1
+                self.failure(upstream)
+                tried.add(upstream)
+                # Try another upstream if the request was not sent yet,
+                # or if it is safe to send it again
+                if sent and request.method not in RETRY_METHODS:
+                    raise HttpException(status=502)
+                elif isinstance(body, RequestBody) and body.started:
+                    raise HttpException(status=502)
+                elif len(tried) == len(self.upstreams):
+                    raise HttpException(status=502)
+                continue
+            break
+        upstream.record(time.time() - start)
+        if response.status_code in FAILURE_STATUS:
+            self.failure(upstream)
+        else:
+            upstream.failures = 0
+        response.bind_event('post_request',
+                            partial(self._finished, upstream, body))
+        start_response(response.get_status(),
+                       [(name, value) for name, value in response.headers
+                        if name.lower() not in HOP_HEADERS])
+        return self._response_body(response)
+
+    def _response_body(self, response):
+        stream = response.stream
+        if stream is None:
+            yield response.get_content() or b''
+        else:
+            while not stream.done or stream.buffered:
+                yield async(stream.read(), loop=response._loop)
+
+    def _finished(self, upstream, body, response, exc=None):
+        upstream.active -= 1
+        if exc:
+            self.failure(upstream)
+        if isinstance(body, RequestBody):
+            body.close()
+
+    def _health_checks(self):
+        loop = self.http_client._loop
+        for upstream in self.upstreams:
+            self._health_check(upstream)
+        self.local.health = loop.call_later(self.health_interval,
+                                            self._health_checks)
+
+    @task
+    def _health_check(self, upstream):
+        try:
+            response = yield from wait_for(
+                self.http_client.get(urljoin(upstream.url, self.health_path)),
+                self.health_interval, self.http_client._loop)
+            upstream.healthy = response.status_code < 400
+        except Exception:
+            upstream.healthy = False
+        if upstream.healthy:
+            upstream.ejected_until = 0
+            upstream.failures = 0
+
+
+class RequestBody:
+    '''Iterator over the body of a request received by the :class:`Proxy`.
+
+    The body is read from the :class:`.StreamReader` of the request as it
+    arrives. Reading from the client is paused once more than
+    ``high_limit`` bytes are waiting to be sent upstream.
+    '''
+    started = False
+    _waiter = None
+    _drain = None
+    _closed = False
+
+    def __init__(self, stream, high_limit=2**18, loop=None):
+        self.high_limit = high_limit
+        self._loop = loop or get_event_loop()
+        self._chunks = deque()
+        self._size = 0
+        self._done = stream.consume(self._feed)
+        self._done.add_done_callback(self._wakeup)
+        self._reader = self._read()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.started = True
+        return next(self._reader)
+
+    def close(self):
+        '''Stop buffering the body and resume reading from the client.'''
+        self._closed = True
+        self._chunks.clear()
+        self._size = 0
+        self._release()
+
+    #    INTERNALS
+    def _read(self):
+        while self._chunks or not self._done.done():
+            if self._chunks:
+                yield self._pop()
+            else:
+                self._waiter = Future(loop=self._loop)
+                yield chain_future(self._waiter, lambda _: self._pop())
+        self._done.result()
+
+    def _feed(self, data):
+        if not self._closed:
+            self._chunks.append(data)
+            self._size += len(data)
+            self._wakeup()
+            if self._size > self.high_limit:
+                self._drain = Future(loop=self._loop)
+                return self._drain
+
+    def _pop(self):
+        if self._chunks:
+            data = self._chunks.popleft()
+            self._size -= len(data)
+            if self._size <= self.high_limit // 2:
+                self._release()
+            return data
+        return b''
+
+    def _release(self):
+        drain, self._drain = self._drain, None
+        if drain and not drain.done():
+            drain.set_result(None)
+
+    def _wakeup(self, _=None):
+        waiter, self._waiter = self._waiter, None
+        if waiter and not waiter.done():
+            waiter.set_result(None)
+
+
+def client_address(request):
+    return request.get_client_address()
+
+
+def _hash(key):
+    return int(md5(key.encode('utf-8')).hexdigest()[:8], 16)
@@ -35,6 +35,13 @@ This will listen for both ipv4 and ipv6 sockets on all hosts on port 8080::
 
     python script.py --bind :8080
 
+To listen on a unix domain socket, which avoids the TCP loopback overhead
+when clients run on the same host::
+
+    python script.py --bind unix:/tmp/pulsar.sock
+
+A stale socket file left by a previous server is removed.
+
 backlog
 ---------
 To specify the maximum number of queued connections you can use the
@@ -96,6 +103,7 @@ for:
 Check the :meth:`SocketServer.monitor_start` method for implementation details.
 '''
 import os
+import stat
 import socket
 from math import log
 from random import lognormvariate
@@ -104,7 +112,7 @@ from functools import partial
 import pulsar
 from pulsar import (asyncio, TcpServer, DatagramServer, Connection,
                     ImproperlyConfigured)
-from pulsar.utils.internet import parse_address, SSLContext
+from pulsar.utils.internet import SSLContext
 from pulsar.utils.config import pass_through
 
 
@@ -175,6 +183,15 @@ class CertFile(SocketSetting):
     """
 
 
+def remove_unix_socket(path):
+    '''Remove the unix domain socket file at ``path`` if it exists'''
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
 class WrapTransport:
 
     def __init__(self, transport):
@@ -229,10 +246,16 @@ class SocketServer(pulsar.Application):
                 raise ImproperlyConfigured('key_file "%s" does not exist' %
                                            cfg.key_file)
             ssl = SSLContext(keyfile=cfg.key_file, certfile=cfg.cert_file)
-        address = parse_address(self.cfg.address)
+        address = cfg.address
         # First create the sockets
         try:
-            server = yield from loop.create_server(asyncio.Protocol, *address)
+            if isinstance(address, tuple):
+                server = yield from loop.create_server(asyncio.Protocol,
+                                                       *address)
+            else:
+                remove_unix_socket(address)
+                server = yield from loop.create_unix_server(asyncio.Protocol,
+                                                            address)
         except socket.error as e:
             raise ImproperlyConfigured(e)
         else:
@@ -246,6 +269,11 @@ class SocketServer(pulsar.Application):
             monitor.ssl = ssl
             cfg.addresses = addresses
 
+    def monitor_stopping(self, monitor):
+        for address in getattr(self.cfg, 'addresses', None) or ():
+            if isinstance(address, str):
+                remove_unix_socket(address)
+
     def actorparams(self, monitor, params):
         params.update({'sockets': monitor.sockets, 'ssl': monitor.ssl})
 
@@ -332,7 +360,7 @@ class UdpSocketServer(SocketServer):
         if not cfg.address:
             raise pulsar.ImproperlyConfigured('Could not open a socket. '
                                               'No address to bind to')
-        address = parse_address(self.cfg.address)
+        address = cfg.address
         # First create the sockets
         t, _ = yield from loop.create_datagram_endpoint(
             asyncio.DatagramProtocol, address)
@@ -197,6 +197,27 @@ option should be used in conjunction with
 
     python runtests.py --sequential --concurrent-tasks 1
 
+.. _apps-test-distributed:
+
+distributed mode
+~~~~~~~~~~~~~~~~~~~
+By default, all test classes run in the test suite monitor. When the
+:ref:`--workers <setting-workers>` option is greater than one, the
+:class:`.TestSuite` runs in distributed mode: test classes are dispatched,
+one at a time, to the test workers and their results are merged by the
+monitor::
+
+    python runtests.py --workers 4
+
+Test classes are dispatched longest first, using the time taken by each
+test class in the previous run, which is stored in the
+:ref:`--test-timings <setting-test_timings>` file.
+Test classes decorated with :func:`.non_parallel` run in the monitor
+once all the other test classes have finished.
+
+The :ref:`--sequential <setting-sequential>` option disables the
+distributed mode.
+
 list labels
 ~~~~~~~~~~~~~~~~~~~
 By passing the ``-l`` or :ref:`--list-labels <setting-list_labels>` flag
@@ -314,6 +335,7 @@ Utilities
 .. automodule:: pulsar.apps.test.utils
 
 '''
+import os
 import sys
 import unittest
 from functools import partial
@@ -322,6 +344,7 @@ import pulsar
 from pulsar.utils.log import lazyproperty
 from pulsar.utils.config import section_docs, TestOption
 from pulsar.utils.pep import to_string
+from pulsar.utils.system import json
 
 from .populate import populate, random_string
 from .result import *
@@ -329,7 +352,7 @@ from .plugins.base import *
 from .loader import *
 from .utils import *
 from .wsgi import *
-from .runner import Runner
+from .runner import Runner, Dispatcher, next_testcls, testcls_id
 
 
 pyver = '%s.%s' % (sys.version_info[:2])
@@ -404,7 +427,24 @@ class TestSequential(TestOption):
     action = 'store_true'
     default = False
     validator = pulsar.validate_bool
-    desc = """Run test functions sequentially."""
+    desc = """Run test functions sequentially.
+
+    Test classes run in the test suite monitor, even when more than one
+    worker is available."""
+
+
+class TestTimings(TestOption):
+    name = "test_timings"
+    flags = ['--test-timings']
+    default = '.test-timings.json'
+    validator = pulsar.validate_string
+    desc = """\
+        File where the time taken by each test class is stored.
+
+        Used for dispatching the longest test classes first when running
+        in distributed mode, the only mode which writes the file. A
+        relative path is relative to the root directory of the test
+        suite."""
 
 
 class TestShowLeaks(TestOption):
@@ -449,6 +489,7 @@ class TestSuite(pulsar.Application):
     :parameter plugins: Optional list of :class:`.TestPlugin` instances.
     '''
     name = 'test'
+    dispatcher = None
     cfg = pulsar.Config(apps=['test'],
                         loglevel=['none'],
                         plugins=())
@@ -511,8 +552,8 @@ class TestSuite(pulsar.Application):
     def monitor_start(self, monitor):
         '''When the monitor starts load all test classes into the queue'''
         cfg = self.cfg
-        workers = min(0, cfg.workers)
-        cfg.set('workers', workers)
+        if cfg.workers < 2 or cfg.sequential:
+            cfg.set('workers', 0)
         loader = self.loader
 
         tags = self.cfg.labels
@@ -532,7 +573,8 @@ class TestSuite(pulsar.Application):
             self._time_start = None
             if tests:
                 self.logger.info('loading %s test classes', len(tests))
-                monitor._loop.call_soon(Runner, monitor, loader.runner, tests)
+                pulsar.async(self._run_tests(monitor, tests),
+                             loop=monitor._loop)
             else:   # pragma    nocover
                 raise ExitTest('Could not find any tests.')
         except ExitTest as e:   # pragma    nocover
@@ -543,6 +585,16 @@ class TestSuite(pulsar.Application):
                                     exc_info=True)
             monitor._loop.call_soon(self._exit, 3)
 
+    def monitor_task(self, monitor):
+        if self.dispatcher is not None:
+            self.dispatcher.check_workers()
+
+    def worker_start(self, worker, exc=None):
+        '''When running in distributed mode, ask the monitor for test
+        classes to run'''
+        if not exc and self.cfg.workers:
+            pulsar.async(self._run_worker(worker), loop=worker._loop)
+
     @classmethod
     def create_config(cls, *args, **kwargs):
         cfg = super(TestSuite, cls).create_config(*args, **kwargs)
@@ -556,3 +608,66 @@ class TestSuite(pulsar.Application):
         params = super(TestSuite, self).arbiter_params()
         params['concurrency'] = self.cfg.concurrency
         return params
+
+    #   INTERNALS
+    def _run_tests(self, monitor, tests):
+        loop = monitor._loop
+        start = loop.time()
+        runner = self.loader.runner
+        timings = self._load_timings()
+        if self.cfg.workers:
+            self.dispatcher = Dispatcher(monitor, runner, tests, timings)
+            yield from self.dispatcher.done
+            tests = self.dispatcher.local
+        local = yield from Runner(monitor, runner, tests).done
+        timings.update(local)
+        runner.on_end()
+        runner.printSummary(loop.time() - start)
+        if self.cfg.workers:
+            self._save_timings(timings)
+        if runner.result.errors or runner.result.failures:
+            exit_code = 2
+        else:
+            exit_code = 0
+        loop.call_soon(self._exit, exit_code)
+
+    def _run_worker(self, worker):
+        loader = self.loader
+        classes = dict(((testcls_id(tag, testcls), (tag, testcls)) for
+                        tag, testcls in loader.testclasses(
+                            self.cfg.labels, self.cfg.exclude_labels)))
+        executor = Runner(worker, loader.runner)
+        results = None
+        while True:
+            name = yield from worker.send('monitor', 'run', next_testcls,
+                                          worker.aid, results)
+            if not name:
+                break
+            if name in classes:
+                yield from executor.run_testcls(*classes[name])
+            else:   # pragma    nocover
+                self.logger.error('Could not find test class %s', name)
+            results = {'result': loader.runner.result.collect(),
+                       'timings': executor.timings}
+            executor.timings = {}
+        self.logger.info('No more test classes to run')
+
+    def _timings_path(self):
+        return os.path.join(self.root_dir, self.cfg.test_timings)
+
+    def _load_timings(self):
+        try:
+            with open(self._timings_path()) as fp:
+                return json.load(fp)
+        except (IOError, ValueError):
+            return {}
+
+    def _save_timings(self, timings):
+        try:
+            with open(self._timings_path(), 'w') as fp:
+                json.dump(timings, fp, indent=2, sort_keys=True)
+        except IOError:   # pragma    nocover
+            self.logger.warning('Could not save test timings')
+
+    def _exit(self, exit_code):
+        raise pulsar.HaltServer(exit_code=exit_code)
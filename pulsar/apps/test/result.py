@@ -13,6 +13,8 @@ __all__ = ['Plugin',
            'Plugin']
 
 
+RESULT_LISTS = ('failures', 'errors', 'skipped', 'expectedFailures',
+                'unexpectedSuccesses')
 STDOUT_LINE = '\nStdout:\n%s'
 STDERR_LINE = '\nStderr:\n%s'
 
@@ -351,6 +353,26 @@ class TestResult(Plugin):
         "Tells whether or not this result was a success"
         return len(self.failures) == len(self.errors) == 0
 
+    def collect(self):
+        '''Remove the results recorded so far and return them.
+
+        The returned dictionary can be sent to another actor and added
+        to its result via the :meth:`merge` method.
+        '''
+        results = {'testsRun': self._testsRun}
+        self._testsRun = 0
+        for name in RESULT_LISTS:
+            results[name] = getattr(self, name)
+            setattr(self, name, [])
+        return results
+
+    def merge(self, results):
+        '''Add ``results`` obtained from the :meth:`collect` method of
+        the result in another actor.'''
+        self._testsRun += results['testsRun']
+        for name in RESULT_LISTS:
+            getattr(self, name).extend(results[name])
+
 
 def testsafe(name, return_val=None):
     if not return_val:
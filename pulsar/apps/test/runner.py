@@ -1,64 +1,76 @@
 import asyncio
 from unittest import SkipTest
 
-from pulsar import async, is_async, HaltServer
+from pulsar import async, is_async, Future
 
 from .utils import (TestFailure, skip_test, skip_reason,
                     expecting_failure, AsyncAssert, get_test_timeout)
 
 
-class Runner(object):
+def testcls_id(tag, testcls):
+    return '%s.%s' % (tag, testcls.__name__)
 
-    def __init__(self, monitor, runner, tests):
-        self._loop = monitor._loop
-        self._time_start = self._loop.time()
-        self.logger = monitor.logger
-        self.monitor = monitor
+
+def next_testcls(monitor, aid, results=None):
+    '''Executed in the monitor when the test worker ``aid`` asks for the
+    next test class to run, after adding the ``results`` of the previous
+    one.'''
+    return monitor.app.dispatcher.next(aid, results)
+
+
+class Runner(object):
+    '''Execute test classes in a test actor.
+
+    When ``tests`` are given they are all executed, one class after the
+    other, and the :attr:`done` future is resolved once they are finished.
+    Test workers of a distributed test suite execute the test classes
+    dispatched by the monitor via the :meth:`run_testcls` method.
+    '''
+    def __init__(self, actor, runner, tests=None):
+        self._loop = actor._loop
+        self.logger = actor.logger
+        self.actor = actor
         self.runner = runner
         self.concurrent = set()
-        self.tests = list(reversed(tests))
-        async(self._run_all_tests(tests), loop=self._loop)
-        self._loop.call_soon(self._check_done)
+        self.timings = {}
+        self.tests = list(reversed(tests or ()))
+        self.done = Future(loop=self._loop)
+        if tests is not None:
+            async(self._run_all_tests(), loop=self._loop)
+            self._loop.call_soon(self._check_done)
+
+    def run_testcls(self, tag, testcls):
+        '''Run all test functions of ``testcls`` and record the time
+        taken in the :attr:`timings` dictionary.'''
+        runner = self.runner
+        testcls.tag = tag
+        testcls.cfg = self.actor.cfg
+        testcls.async = AsyncAssert(testcls)
+        try:
+            all_tests = runner.loadTestsFromTestCase(testcls)
+        except Exception:
+            self.logger.exception('Could not load tests', exc_info=True)
+            return
+        if not all_tests.countTestCases():
+            return
+
+        self.logger.info('Running Tests from %s', testcls)
+        start = self._loop.time()
+        runner.startTestClass(testcls)
+        self.concurrent.add(testcls)
+        yield from self._run_testcls(testcls, all_tests)
+        self.timings[testcls_id(tag, testcls)] = self._loop.time() - start
+        self.logger.info('Finished Tests from %s', testcls)
 
     def _check_done(self):
         if self.tests or self.concurrent:
             return self._loop.call_soon(self._check_done)
-        #
-        time_taken = self._loop.time() - self._time_start
-        runner = self.runner
-        runner.on_end()
-        runner.printSummary(time_taken)
-        if runner.result.errors or runner.result.failures:
-            exit_code = 2
-        else:
-            exit_code = 0
-        self._loop.call_soon(self._exit, exit_code)
-
-    def _exit(self, exit_code):
-        raise HaltServer(exit_code=exit_code)
-
-    def _run_all_tests(self, tests):
-        runner = self.runner
-        cfg = self.monitor.cfg
+        self.done.set_result(self.timings)
 
+    def _run_all_tests(self):
         while self.tests:
             tag, testcls = self.tests.pop()
-            testcls.tag = tag
-            testcls.cfg = cfg
-            testcls.async = AsyncAssert(testcls)
-            try:
-                all_tests = runner.loadTestsFromTestCase(testcls)
-            except Exception:
-                self.logger.exception('Could not load tests', exc_info=True)
-                continue
-            if not all_tests.countTestCases():
-                continue
-
-            self.logger.info('Running Tests from %s', testcls)
-            runner.startTestClass(testcls)
-            self.concurrent.add(testcls)
-            yield from self._run_testcls(testcls, all_tests)
-            self.logger.info('Finished Tests from %s', testcls)
+            yield from self.run_testcls(tag, testcls)
 
     def _run_testcls(self, testcls, all_tests):
         cfg = testcls.cfg
@@ -164,3 +176,61 @@ class Runner(object):
             runner.addFailure(test, failure)
         else:
             runner.addError(test, failure)
+
+
+class Dispatcher(object):
+    '''Dispatch test classes to the test workers of a monitor.
+
+    Test classes are dispatched one at a time, longest first according to
+    ``timings`` recorded in previous runs, and the results sent back by
+    the workers are merged into the monitor ``runner``.
+    Test classes flagged as :func:`.non_parallel` are not dispatched, they
+    are left in the :attr:`local` list.
+    '''
+    def __init__(self, monitor, runner, tests, timings):
+        self.monitor = monitor
+        self.runner = runner
+        self.timings = timings
+        self.pending = {}
+        self.local = []
+        queue = []
+        for tag, testcls in tests:
+            if getattr(testcls, '_non_parallel_execution', False):
+                self.local.append((tag, testcls))
+            else:
+                queue.append(testcls_id(tag, testcls))
+        # Test classes are popped from the end of the queue, classes without
+        # timings are assumed to be the longest
+        queue.sort(key=lambda name: timings.get(name, float('inf')))
+        self.queue = queue
+        self.done = Future(loop=monitor._loop)
+        self._check_done()
+
+    def next(self, aid, results=None):
+        '''Return the name of the next test class for worker ``aid``.
+
+        Return ``None`` when there are no more test classes to run.
+        '''
+        self.pending.pop(aid, None)
+        if results:
+            self.runner.result.merge(results['result'])
+            self.timings.update(results['timings'])
+        if self.queue:
+            name = self.queue.pop()
+            self.pending[aid] = name
+            return name
+        self._check_done()
+
+    def check_workers(self):
+        '''Fail test classes dispatched to workers which are not alive.'''
+        workers = self.monitor.managed_actors
+        for aid, name in list(self.pending.items()):
+            if aid not in workers:
+                self.pending.pop(aid)
+                self.runner.result.errors.append(
+                    (name, 'Test worker %s exited while running tests' % aid))
+        self._check_done()
+
+    def _check_done(self):
+        if not self.queue and not self.pending and not self.done.done():
+            self.done.set_result(self.timings)
@@ -11,6 +11,12 @@ sequential
 .. autofunction:: sequential
 
 
+non parallel
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+.. autofunction:: non_parallel
+
+
 ActorTestMixin
 ~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -45,6 +51,7 @@ from pulsar.apps.data import create_store
 
 
 __all__ = ['sequential',
+           'non_parallel',
            'NOT_TEST_METHODS',
            'ActorTestMixin',
            'AsyncAssert',
@@ -102,6 +109,27 @@ def sequential(cls):
     return cls
 
 
+def non_parallel(cls):
+    '''Decorator for a :class:`~unittest.TestCase` which must run in the
+    test suite monitor rather than in a test worker.
+
+    When the test suite runs in
+    :ref:`distributed mode <apps-test-distributed>`, test classes which
+    depend on the actor they run in, the arbiter for example, are run by
+    the monitor once all the other test classes have finished::
+
+        import unittest
+
+        from pulsar.apps.test import non_parallel
+
+        @non_parallel
+        class MyTests(unittest.TestCase):
+            ...
+    '''
+    cls._non_parallel_execution = True
+    return cls
+
+
 class test_timeout:
 
     def __init__(self, timeout):
@@ -73,11 +73,69 @@ from .routers import *
 from .auth import *
 
 
+class WsgiSetting(pulsar.Setting):
+    virtual = True
+    app = 'wsgi'
+    section = "WSGI Servers"
+
+
+class NoFqdn(WsgiSetting):
+    name = "no_fqdn"
+    flags = ["--no-fqdn"]
+    action = "store_true"
+    validator = pulsar.validate_bool
+    default = False
+    desc = """\
+        Use the ``Host`` header for the ``SERVER_NAME`` without resolving
+        the fully qualified domain name.
+        """
+
+
+class FqdnTtl(WsgiSetting):
+    name = "fqdn_ttl"
+    flags = ["--fqdn-ttl"]
+    validator = pulsar.validate_pos_int
+    type = int
+    default = 300
+    desc = """\
+        Seconds a fully qualified domain name used for the ``SERVER_NAME``
+        is cached by each worker.
+
+        Domain names are resolved in the event loop executor.
+        """
+
+
+class FormDataLimit(WsgiSetting):
+    name = "form_data_limit"
+    flags = ["--form-data-limit"]
+    validator = pulsar.validate_pos_int
+    type = int
+    default = 2**30
+    desc = """\
+        Maximum size in bytes of a ``multipart/form-data`` request body.
+
+        Larger bodies are rejected with a ``413`` response. File uploads
+        are parsed as they are received and written to temporary files.
+        """
+
+
+class FormFieldLimit(WsgiSetting):
+    name = "form_field_limit"
+    flags = ["--form-field-limit"]
+    validator = pulsar.validate_pos_int
+    type = int
+    default = 2**18
+    desc = """\
+        Maximum size in bytes of a ``multipart/form-data`` field which is
+        not a file upload.
+        """
+
+
 class WSGIServer(SocketServer):
     '''A WSGI :class:`.SocketServer`.
     '''
     name = 'wsgi'
-    cfg = pulsar.Config(apps=['socket'],
+    cfg = pulsar.Config(apps=['socket', 'wsgi'],
                         server_software=pulsar.SERVER_SOFTWARE)
 
     def protocol_factory(self):
@@ -28,10 +28,17 @@ AccessControl
 
 '''
 import re
+import zlib
 from gzip import GzipFile
+from hashlib import sha1
+from functools import partial
+from collections import OrderedDict
 
+from pulsar import isfuture, chain_future, get_event_loop, async
 from pulsar.utils.httpurl import BytesIO
 
+from .utils import FileWrapper
+
 
 re_accepts_gzip = re.compile(r'\bgzip\b')
 re_media_type = re.compile(r'^(image|audio|video)/.+')
@@ -95,47 +102,141 @@ class GZipMiddleware(ResponseMiddleware):
     """A :class:`ResponseMiddleware` for compressing content if the request
 allows gzip compression. It sets the Vary header accordingly.
 
-The compression implementation is from
-http://jython.xhaus.com/http-compression-in-python-and-jython
+Streamed responses are compressed incrementally, one chunk at a time, while
+payloads longer than ``executor_length`` are compressed in the event loop
+executor so that the loop is not blocked.
+
+Compressed payloads can be kept in a least recently used cache, so that
+identical payloads are compressed once only. The cache is off by default.
+
+:param min_length: responses shorter than this are not compressed.
+:param level: the compression level, from 1 (fastest) to 9 (smallest).
+:param executor_length: payloads longer than this are compressed in the
+    event loop executor.
+:param cache_size: maximum size in bytes of the compressed payloads kept
+    in the cache. ``0``, the default, switches the cache off.
     """
-    def __init__(self, min_length=200):
+    def __init__(self, min_length=200, level=6, executor_length=2**17,
+                 cache_size=0):
         self.min_length = min_length
+        self.level = level
+        self.executor_length = executor_length
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_used = 0
 
     def available(self, environ, response):
         # It's not worth compressing non-OK or really short responses
-        try:
-            if response.status_code == 200 and not response.is_streamed:
-                if response.length() < self.min_length:
-                    return False
-                headers = response.headers
-                ctype = headers.get('Content-Type', '').lower()
-                # Avoid gzipping if we've already got a content-encoding.
-                if 'Content-Encoding' in headers:
-                    return False
-                # MSIE have issues with gzipped response of various
-                # content types.
-                if "msie" in environ.get('HTTP_USER_AGENT', '').lower():
-                    if not ctype.startswith("text/") or "javascript" in ctype:
-                        return False
-                ae = environ.get('HTTP_ACCEPT_ENCODING', '')
-                if not re_accepts_gzip.search(ae):
+        if response.status_code == 200:
+            if isinstance(response.content, FileWrapper):
+                return False
+            if (not response.is_streamed and
+                    response.length() < self.min_length):
+                return False
+            headers = response.headers
+            ctype = headers.get('Content-Type', '').lower()
+            # Avoid gzipping if we've already got a content-encoding.
+            if 'Content-Encoding' in headers:
+                return False
+            # MSIE have issues with gzipped response of various
+            # content types.
+            if "msie" in environ.get('HTTP_USER_AGENT', '').lower():
+                if not ctype.startswith("text/") or "javascript" in ctype:
                     return False
-                if re_media_type.match(ctype):
-                    return False
-                return True
-        except Exception:
-            raise
+            ae = environ.get('HTTP_ACCEPT_ENCODING', '')
+            if not re_accepts_gzip.search(ae):
+                return False
+            if re_media_type.match(ctype):
+                return False
+            return True
 
     def execute(self, environ, response):
         headers = response.headers
         headers.add_header('Vary', 'Accept-Encoding')
-        content = b''.join(response.content)
-        response.content = (self.compress_string(content),)
+        if response.is_streamed:
+            headers.pop('Content-Length', None)
+            response.content = self.compress_stream(
+                response.content, response.encoding or 'utf-8')
+        else:
+            content = b''.join(response.content)
+            key = sha1(content).digest() if self.cache_size else None
+            compressed = self._cache.get(key) if key else None
+            if compressed is not None:
+                self._cache.move_to_end(key)
+                response.content = (compressed,)
+            elif len(content) > self.executor_length:
+                response.content = self._compress_executor(content, key)
+            else:
+                compressed = self.compress_string(content)
+                self._store(key, compressed)
+                response.content = (compressed,)
         response.headers['Content-Encoding'] = 'gzip'
 
     def compress_string(self, s):
         zbuf = BytesIO()
-        zfile = GzipFile(mode='wb', compresslevel=6, fileobj=zbuf)
+        zfile = GzipFile(mode='wb', compresslevel=self.level, fileobj=zbuf)
         zfile.write(s)
         zfile.close()
         return zbuf.getvalue()
+
+    def compress_stream(self, content, encoding):
+        '''Compress a streamed ``content`` chunk by chunk.
+
+        Each chunk is flushed, so that the client receives data as soon as
+        it is available. Once a chunk is a future, it and all the chunks
+        which follow it are compressed by coroutines which wait for the
+        previous chunk, so that the stream is compressed in order.
+        '''
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        compress = partial(compress_chunk, compressor, encoding)
+        previous = None
+        try:
+            for chunk in content:
+                if previous is None and not isfuture(chunk):
+                    yield compress(chunk)
+                else:
+                    previous = async(compress_after(previous, chunk,
+                                                    compress))
+                    yield previous
+            if previous is None:
+                yield compressor.flush()
+            else:
+                yield async(compress_after(previous, None,
+                                           lambda _: compressor.flush()))
+        finally:
+            if hasattr(content, 'close'):
+                content.close()
+
+    def _compress_executor(self, content, key):
+        loop = get_event_loop()
+        future = loop.run_in_executor(None, self.compress_string, content)
+        yield chain_future(future, callback=partial(self._store, key))
+
+    def _store(self, key, compressed):
+        if key and len(compressed) <= self.cache_size:
+            cache = self._cache
+            if key in cache:
+                self._cache_used -= len(cache.pop(key))
+            cache[key] = compressed
+            self._cache_used += len(compressed)
+            while self._cache_used > self.cache_size:
+                _, value = cache.popitem(last=False)
+                self._cache_used -= len(value)
+        return compressed
+
+
+def compress_after(previous, chunk, compress):
+    if previous is not None:
+        yield from previous
+    if isfuture(chunk):
+        chunk = yield from chunk
+    return compress(chunk)
+
+
+def compress_chunk(compressor, encoding, chunk):
+    if not isinstance(chunk, bytes):
+        chunk = chunk.encode(encoding)
+    if chunk:
+        return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return b''
@@ -54,11 +54,27 @@ Media Router
 
 The :class:`MediaRouter` is a specialised :class:`Router` for serving static
 files such ass ``css``, ``javascript``, images and so forth.
+Files are sent with :func:`os.sendfile` when the connection is not
+encrypted, so that they are never loaded into the worker memory, and
+``ETag``, ``If-None-Match`` and single ``Range`` requests are supported.
 
 .. autoclass:: MediaRouter
    :members:
    :member-order: bysource
 
+Media Cache
+~~~~~~~~~~~~~~~
+
+Both :class:`MediaRouter` and :class:`FileRouter` accept an optional
+``cache`` parameter which keeps small files, together with their headers
+and ``gzip`` compressed variant, in the memory of each worker::
+
+    MediaRouter('/media', path, cache=True)
+
+.. autoclass:: MediaCache
+   :members:
+   :member-order: bysource
+
 
 RouterParam
 =================
@@ -72,6 +88,8 @@ RouterParam
 import os
 import re
 import stat
+import time
+import gzip
 import mimetypes
 from email.utils import parsedate_tz, mktime_tz
 
@@ -81,12 +99,13 @@ from pulsar.utils.slugify import slugify
 from pulsar import Http404, HttpException
 
 from .route import Route
-from .utils import wsgi_request
+from .utils import wsgi_request, FileWrapper
+from .response import re_accepts_gzip, re_media_type
 from .content import Html
 
 
 __all__ = ['Router', 'MediaRouter', 'FileRouter', 'MediaMixin',
-           'RouterParam']
+           'MediaCache', 'RouterParam']
 
 
 def get_roule_methods(attrs):
@@ -100,6 +119,59 @@ def get_roule_methods(attrs):
     return sorted(rule_methods, key=lambda x: x[1].order)
 
 
+# url bits which are matched literally by the route regex
+_static_bit = re.compile(r'^[\w\-~]+$', re.UNICODE)
+
+
+class Dispatcher(object):
+    '''Compiled dispatch of a :class:`Router` to its children.
+
+    Child routers are stored in a prefix tree keyed on the static bits at
+    the start of their :attr:`~Router.route`, so that :meth:`Router.resolve`
+    only tries the children which can possibly match a path, in the same
+    order as the :attr:`~Router.routes` list.
+    '''
+    __slots__ = ('version', 'route', 'tree')
+
+    def __init__(self, router, version):
+        self.version = version
+        self.route = router.route
+        self.tree = tree = {}
+        for index, child in enumerate(router.routes):
+            node = tree
+            for dynamic, bit in child.route.breadcrumbs:
+                if dynamic or not _static_bit.match(bit):
+                    break
+                node = node.setdefault(bit, {})
+            node.setdefault(None, []).append((index, child))
+
+    def candidates(self, path):
+        '''Child routers which can match ``path``, in declaration order'''
+        node = self.tree
+        found = node.get(None)
+        routers = None
+        for bit in path.split('/'):
+            node = node.get(bit)
+            if node is None:
+                break
+            more = node.get(None)
+            if more:
+                if found:
+                    routers = (routers or found) + more
+                else:
+                    found = more
+        if routers:
+            routers.sort(key=_index)
+            return [child for _, child in routers]
+        elif found:
+            return [child for _, child in found]
+        return ()
+
+
+def _index(item):
+    return item[0]
+
+
 def update_args(urlargs, args):
     if urlargs:
         urlargs.update(args)
@@ -213,6 +285,9 @@ class Router(RouterType('RouterBase', (object,), {})):
     '''
     _creation_count = 0
     _parent = None
+    _dispatcher = None
+    # incremented when a router tree changes, invalidates dispatchers
+    _routes_version = 0
     name = None
 
     response_content_types = RouterParam(None)
@@ -357,9 +432,15 @@ class Router(RouterType('RouterBase', (object,), {})):
         '''Resolve a path and return a ``(handler, urlargs)`` tuple or
         ``None`` if the path could not be resolved.
         '''
-        match = self.route.match(path)
+        dispatcher = self._dispatcher
+        if (dispatcher is None or
+                dispatcher.version != Router._routes_version):
+            dispatcher = Dispatcher(self, Router._routes_version)
+            self._dispatcher = dispatcher
+        route = dispatcher.route
+        match = route.match(path)
         if match is None:
-            if not self.route.is_leaf:  # no match
+            if not route.is_leaf:  # no match
                 return
         elif '__remaining__' in match:
             path = match.pop('__remaining__')
@@ -367,7 +448,7 @@ class Router(RouterType('RouterBase', (object,), {})):
         else:
             return self, update_args(urlargs, match)
         #
-        for handler in self.routes:
+        for handler in dispatcher.candidates(path):
             view_args = handler.resolve(path, urlargs)
             if view_args is None:
                 continue
@@ -407,6 +488,7 @@ class Router(RouterType('RouterBase', (object,), {})):
             router.parent.remove_child(router)
         router._parent = self
         self.routes.append(router)
+        Router._routes_version += 1
         return router
 
     def remove_child(self, router):
@@ -414,6 +496,7 @@ class Router(RouterType('RouterBase', (object,), {})):
         if router in self.routes:
             self.routes.remove(router)
             router._parent = None
+            Router._routes_version += 1
 
     def get_route(self, name):
         '''Get a child :class:`Router` by its :attr:`name`.
@@ -487,9 +570,31 @@ class Router(RouterType('RouterBase', (object,), {})):
 
 
 class MediaMixin(object):
+    _cache = None
+
+    @property
+    def cache(self):
+        '''The :class:`MediaCache` of this router or ``None``'''
+        return self._cache
+
+    def cached_file(self, request):
+        '''The :class:`.CachedFile` for ``request`` or ``None``'''
+        if self._cache is not None:
+            return self._cache.get(request.path)
 
     def serve_file(self, request, fullpath, status_code=None):
-        # Respect the If-Modified-Since header.
+        '''Serve the file at ``fullpath``.
+
+        The file is not read into memory, the response content is a
+        :class:`.FileWrapper` which the server sends with :func:`os.sendfile`
+        when possible. Conditional requests with ``If-None-Match`` or
+        ``If-Modified-Since`` are answered with ``304 Not Modified`` and a
+        single ``Range`` is answered with ``206 Partial Content``.
+        '''
+        if self._cache is not None:
+            entry = self._cache.load(request.path, fullpath)
+            if entry is not None:
+                return self.serve_cached(request, entry, status_code)
         statobj = os.stat(fullpath)
         content_type, encoding = mimetypes.guess_type(fullpath)
         response = request.response
@@ -497,20 +602,104 @@ class MediaMixin(object):
             response.content_type = content_type
         if encoding:
             response.encoding = encoding
-        if not (status_code or self.was_modified_since(
-                request.environ.get('HTTP_IF_MODIFIED_SINCE'),
-                statobj[stat.ST_MTIME],
-                statobj[stat.ST_SIZE])):
+        size = statobj[stat.ST_SIZE]
+        if status_code:
+            response.status_code = status_code
+            return self.file_response(request, fullpath, 0, size)
+        mtime = statobj[stat.ST_MTIME]
+        etag = file_etag(statobj)
+        headers = response.headers
+        headers['ETag'] = etag
+        environ = request.environ
+        if not self.was_modified(environ, etag, mtime, size):
             response.status_code = 304
+            return response
+        last_modified = http_date(mtime)
+        headers['Last-Modified'] = last_modified
+        headers['Accept-Ranges'] = 'bytes'
+        if_range = environ.get('HTTP_IF_RANGE')
+        if if_range and if_range not in (etag, last_modified):
+            byte_range = None
         else:
-            response.content = open(fullpath, 'rb').read()
-            if status_code:
-                response.status_code = status_code
-            else:
-                response.headers["Last-Modified"] = http_date(
-                    statobj[stat.ST_MTIME])
+            byte_range = parse_range(environ.get('HTTP_RANGE'), size)
+        if byte_range:
+            start, stop = byte_range
+            response.status_code = 206
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (start, stop - 1,
+                                                          size)
+            return self.file_response(request, fullpath, start, stop - start)
+        return self.file_response(request, fullpath, 0, size)
+
+    def serve_cached(self, request, entry, status_code=None):
+        '''Serve a :class:`.CachedFile` from the :attr:`cache`.
+
+        The ``gzip`` variant is sent to clients accepting it, unless a
+        ``Range`` is requested.
+        '''
+        response = request.response
+        if entry.content_type:
+            response.content_type = entry.content_type
+        if entry.encoding:
+            response.encoding = entry.encoding
+        if status_code:
+            response.status_code = status_code
+            response.content = entry.body
+            return response
+        environ = request.environ
+        headers = response.headers
+        body = entry.body
+        etag = entry.etag
+        if entry.compressible:
+            headers.add_header('Vary', 'Accept-Encoding')
+            if ('HTTP_RANGE' not in environ and re_accepts_gzip.search(
+                    environ.get('HTTP_ACCEPT_ENCODING', ''))):
+                compressed = self._cache.gzip(entry)
+                if compressed:
+                    body = compressed
+                    etag = '%s-gzip"' % etag[:-1]
+                    headers['Content-Encoding'] = 'gzip'
+        headers['ETag'] = etag
+        if not self.was_modified(environ, etag, entry.mtime, len(body)):
+            headers.pop('Content-Encoding', None)
+            response.status_code = 304
+            return response
+        headers['Last-Modified'] = entry.last_modified
+        headers['Accept-Ranges'] = 'bytes'
+        if_range = environ.get('HTTP_IF_RANGE')
+        if not if_range or if_range in (etag, entry.last_modified):
+            byte_range = parse_range(environ.get('HTTP_RANGE'), len(body))
+            if byte_range:
+                start, stop = byte_range
+                response.status_code = 206
+                headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                    start, stop - 1, len(body))
+                body = body[start:stop]
+        response.content = body
+        return response
+
+    def file_response(self, request, fullpath, offset, count):
+        '''Set ``count`` bytes of the file at ``fullpath`` starting at
+        ``offset`` as the content of the response.'''
+        response = request.response
+        response.headers['Content-Length'] = str(count)
+        if request.method != 'HEAD':
+            wrapper = request.environ.get('wsgi.file_wrapper', FileWrapper)
+            response.content = wrapper(open(fullpath, 'rb'),
+                                       offset=offset, count=count)
         return response
 
+    def was_modified(self, environ, etag, mtime=0, size=0):
+        '''Check if an item was modified since the user last downloaded it.
+
+        The ``If-None-Match`` header, when available, takes precedence
+        over ``If-Modified-Since``.
+        '''
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            return not etag_matches(if_none_match, etag)
+        return self.was_modified_since(
+            environ.get('HTTP_IF_MODIFIED_SINCE'), mtime, size)
+
     def was_modified_since(self, header=None, mtime=0, size=0):
         '''Check if an item was modified since the user last downloaded it
 
@@ -555,6 +744,227 @@ class MediaMixin(object):
         return doc.http_response(request)
 
 
+def file_etag(statobj):
+    '''Strong ``ETag`` of a file from its inode, size and modification
+    time'''
+    return '"%x-%x-%x"' % (statobj.st_ino, statobj.st_size,
+                           int(statobj.st_mtime * 1000000))
+
+
+def etag_matches(header, etag):
+    '''Check if ``etag`` is in the ``If-None-Match`` ``header``.
+
+    The weak comparison function is used.
+    '''
+    if header.strip() == '*':
+        return True
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for value in header.split(','):
+        value = value.strip()
+        if value.startswith('W/'):
+            value = value[2:]
+        if value == etag:
+            return True
+    return False
+
+
+def parse_range(header, size):
+    '''Parse a ``Range`` ``header`` for a resource of ``size`` bytes.
+
+    Return a ``(start, stop)`` tuple or ``None`` if the header is not
+    available, invalid or it specifies more than one range, in which case
+    the whole resource is sent.
+
+    :raise HttpException: with status 416 if the range is not satisfiable.
+    '''
+    if not header:
+        return
+    unit, _, value = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in value:
+        return
+    first, sep, last = value.strip().partition('-')
+    try:
+        if not sep:
+            return
+        elif not first:
+            # suffix range, the last bytes of the resource
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            start, stop = max(size - length, 0), size
+        else:
+            start = int(first)
+            stop = min(int(last) + 1, size) if last else size
+            if stop <= start and start < size:
+                return
+    except ValueError:
+        return
+    if start < 0 or start >= size:
+        raise HttpException(status=416,
+                            headers=[('Content-Range', 'bytes */%d' % size)])
+    return start, stop
+
+
+class CachedFile(object):
+    '''A file stored in a :class:`MediaCache`'''
+    __slots__ = ('fullpath', 'body', 'stat', 'etag', 'last_modified',
+                 'content_type', 'encoding', 'checked', '_gzip')
+
+    def __init__(self, fullpath, body, statobj, gzip_body=None):
+        self.fullpath = fullpath
+        self.body = body
+        self.stat = file_key(statobj)
+        self.etag = file_etag(statobj)
+        self.last_modified = http_date(statobj[stat.ST_MTIME])
+        self.content_type, self.encoding = mimetypes.guess_type(fullpath)
+        self.checked = time.time()
+        self._gzip = gzip_body
+        if gzip_body is None and not self.compressible:
+            self._gzip = False
+
+    @property
+    def mtime(self):
+        return int(self.stat[2])
+
+    @property
+    def size(self):
+        return len(self.body) + len(self._gzip or b'')
+
+    @property
+    def compressible(self):
+        '''``True`` when a ``gzip`` variant can be sent'''
+        if self._gzip is None:
+            return not (self.encoding or
+                        re_media_type.match(self.content_type or ''))
+        return self._gzip is not False
+
+    def gzip(self, level=6):
+        '''The ``gzip`` compressed body or ``None``.
+
+        It is built on first access unless a ``.gz`` file was found next
+        to the original one.
+        '''
+        if self._gzip is None:
+            body = gzip.compress(self.body, level)
+            self._gzip = body if len(body) < len(self.body) else False
+        return self._gzip or None
+
+
+def file_key(statobj):
+    return (statobj.st_ino, statobj.st_size, statobj.st_mtime)
+
+
+class MediaCache(object):
+    '''An in memory cache of static files for :class:`MediaRouter` and
+    :class:`FileRouter`.
+
+    Files are looked up by request path, so that a cache hit does not
+    touch the file system. The least recently used files are discarded
+    once the cache holds more than ``max_entries`` files or ``max_size``
+    bytes.
+
+    :param max_size: maximum number of bytes stored, including the
+        ``gzip`` variants.
+    :param max_entries: maximum number of files stored.
+    :param max_file_size: files larger than this are not stored, they
+        are sent by the server with :func:`os.sendfile`.
+    :param check_interval: seconds after which the modification time of
+        a stored file is checked again. Files changed on disk are
+        removed from the cache.
+    :param level: ``gzip`` compression level.
+    '''
+    def __init__(self, max_size=2**25, max_entries=1000,
+                 max_file_size=2**20, check_interval=2, level=6):
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.max_file_size = max_file_size
+        self.check_interval = check_interval
+        self.level = level
+        self.size = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key):
+        '''The :class:`CachedFile` for request path ``key`` or ``None``'''
+        entry = self._data.get(key)
+        if entry is not None:
+            now = time.time()
+            if now - entry.checked >= self.check_interval:
+                try:
+                    statobj = os.stat(entry.fullpath)
+                except OSError:
+                    statobj = None
+                if statobj is None or file_key(statobj) != entry.stat:
+                    self.pop(key)
+                    return
+                entry.checked = now
+            self._data.move_to_end(key)
+        return entry
+
+    def load(self, key, fullpath):
+        '''Read the file at ``fullpath`` and store it at ``key``.
+
+        Return the :class:`CachedFile` or ``None`` if the file is too large.
+        A ``.gz`` file next to ``fullpath``, not older than it, is used as
+        the compressed variant.
+        '''
+        statobj = os.stat(fullpath)
+        if statobj[stat.ST_SIZE] > self.max_file_size:
+            return
+        with open(fullpath, 'rb') as f:
+            body = f.read()
+        gzip_body = None
+        gzpath = fullpath + '.gz'
+        try:
+            gzstat = os.stat(gzpath)
+        except OSError:
+            pass
+        else:
+            if gzstat.st_mtime >= statobj.st_mtime:
+                with open(gzpath, 'rb') as f:
+                    gzip_body = f.read()
+        entry = CachedFile(fullpath, body, statobj, gzip_body)
+        self.set(key, entry)
+        return entry
+
+    def set(self, key, entry):
+        self.pop(key)
+        self._data[key] = entry
+        self.size += entry.size
+        self._evict()
+
+    def pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+        return entry
+
+    def clear(self):
+        self._data.clear()
+        self.size = 0
+
+    def gzip(self, entry):
+        '''The ``gzip`` variant of a stored ``entry``'''
+        size = entry.size
+        body = entry.gzip(self.level)
+        if entry.size != size:
+            self.size += entry.size - size
+            self._evict()
+        return body
+
+    def _evict(self):
+        data = self._data
+        while data and (len(data) > self.max_entries or
+                        self.size > self.max_size):
+            _, entry = data.popitem(last=False)
+            self.size -= entry.size
+
+
 class MediaRouter(Router, MediaMixin):
     '''A :class:`Router` for serving static media files from a given
     directory.
@@ -576,18 +986,24 @@ class MediaRouter(Router, MediaMixin):
     .. attribute:: default_file
 
         The default file to serve when a directory is requested.
+
+    .. attribute:: cache
+
+        Optional :class:`MediaCache` of served files. Pass ``cache=True``
+        to use a :class:`MediaCache` with default parameters.
     '''
     cache_control = CacheControl(maxage=86400)
 
     def __init__(self, rule, path, show_indexes=False,
                  default_suffix=None, default_file='index.html',
-                 raise_404=True, **params):
+                 raise_404=True, cache=None, **params):
         super(MediaRouter, self).__init__('%s/<path:path>' % rule, **params)
         self._default_suffix = default_suffix
         self._default_file = default_file
         self._show_indexes = show_indexes
         self._file_path = path
         self._raise_404 = raise_404
+        self._cache = MediaCache() if cache is True else cache
 
     def filesystem_path(self, request):
         path = request.urlargs['path']
@@ -595,6 +1011,9 @@ class MediaRouter(Router, MediaMixin):
         return os.path.join(self._file_path, *bits)
 
     def get(self, request):
+        entry = self.cached_file(request)
+        if entry is not None:
+            return self.serve_cached(request, entry)
         fullpath = self.filesystem_path(request)
         if os.path.isdir(fullpath) and self._default_file:
             file = os.path.join(fullpath, self._default_file)
@@ -628,16 +1047,22 @@ class FileRouter(Router, MediaMixin):
                                           'text/html'))
     cache_control = CacheControl(maxage=86400)
 
-    def __init__(self, route, file_path, status_code=None, raise_404=True):
+    def __init__(self, route, file_path, status_code=None, raise_404=True,
+                 cache=None):
         super(FileRouter, self).__init__(route)
         self._status_code = status_code
         self._file_path = file_path
         self._raise_404 = raise_404
+        self._cache = MediaCache() if cache is True else cache
 
     def filesystem_path(self, request):
         return self._file_path
 
     def get(self, request):
+        entry = self.cached_file(request)
+        if entry is not None:
+            return self.serve_cached(request, entry,
+                                     status_code=self._status_code)
         fullpath = self.filesystem_path(request)
         if os.path.isfile(fullpath):
             return self.serve_file(request, fullpath,
@@ -7,6 +7,14 @@ HTTP Protocol Consumer
    :member-order: bysource
 
 
+Server Name Cache
+=========================
+
+.. autoclass:: FqdnCache
+   :members:
+   :member-order: bysource
+
+
 Testing WSGI Environ
 =========================
 
@@ -15,8 +23,11 @@ Testing WSGI Environ
 import sys
 import time
 import os
+import stat
 import socket
-from asyncio import wait_for
+from functools import partial
+from collections import OrderedDict
+from asyncio import wait_for, get_event_loop
 from wsgiref.handlers import format_date_time
 
 import pulsar
@@ -31,17 +42,90 @@ from pulsar.utils.internet import format_address, is_tls
 from pulsar.async.protocols import ProtocolConsumer
 
 from .utils import (handle_wsgi_error, wsgi_request, HOP_HEADERS,
-                    log_wsgi_info, LOGGER)
+                    log_wsgi_info, FileWrapper, LOGGER)
 
-__all__ = ['HttpServerResponse', 'MAX_CHUNK_SIZE', 'test_wsgi_environ']
+__all__ = ['HttpServerResponse', 'MAX_CHUNK_SIZE', 'test_wsgi_environ',
+           'FqdnCache']
 
 
 MAX_CHUNK_SIZE = 65536
 MAX_TIME_IN_LOOP = 0.5
 
 
+class FqdnCache(object):
+    '''A cache of fully qualified domain names used for the ``SERVER_NAME``
+    of the WSGI environ.
+
+    Names are resolved with :func:`socket.getfqdn` in the event loop
+    executor, the host is used as server name until the resolution is
+    done. Hosts which cannot be resolved are cached for ``negative_ttl``
+    seconds. Since hosts come from the ``Host`` header of requests, at most
+    ``max_pending`` resolutions run at once, so that the executor shared
+    with the rest of the server is not flooded.
+
+    :param ttl: seconds a resolved name is cached for.
+    :param negative_ttl: seconds an unresolved host is cached for.
+    :param max_size: maximum number of hosts in the cache.
+    :param max_pending: maximum number of concurrent resolutions.
+    '''
+    def __init__(self, ttl=300, negative_ttl=30, max_size=1000,
+                 max_pending=4):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.max_pending = max_pending
+        self._cache = OrderedDict()
+        self._pending = set()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __call__(self, host, loop=None):
+        '''The fully qualified domain name of ``host``.
+
+        Return ``host`` if the name is not yet available.
+        '''
+        entry = self._cache.get(host)
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+        if (host not in self._pending and
+                len(self._pending) < self.max_pending):
+            loop = loop or get_event_loop()
+            self._pending.add(host)
+            future = loop.run_in_executor(None, socket.getfqdn, host)
+            future.add_done_callback(partial(self._resolved, host))
+        return entry[0] if entry is not None else host
+
+    def clear(self):
+        self._cache.clear()
+
+    def _resolved(self, host, future):
+        self._pending.discard(host)
+        try:
+            name = future.result()
+        except Exception:
+            name = host
+        ttl = self.ttl if name != host else self.negative_ttl
+        cache = self._cache
+        cache.pop(host, None)
+        cache[host] = (name, time.time() + ttl)
+        while len(cache) > self.max_size:
+            cache.popitem(last=False)
+
+
+_fqdn_caches = {}
+
+
+def fqdn_cache(ttl=300):
+    '''The :class:`FqdnCache` of this process for ``ttl``'''
+    cache = _fqdn_caches.get(ttl)
+    if cache is None:
+        cache = _fqdn_caches[ttl] = FqdnCache(ttl)
+    return cache
+
+
 def test_wsgi_environ(path=None, method=None, headers=None, extra=None,
-                      secure=False, loop=None, body=None):
+                      secure=False, loop=None, body=None, resolver=None):
     '''An function to create a WSGI environment dictionary for testing.
 
     :param url: the resource in the ``PATH_INFO``.
@@ -49,6 +133,8 @@ def test_wsgi_environ(path=None, method=None, headers=None, extra=None,
     :param headers: optional request headers
     :params secure: a secure connection?
     :param extra: additional dictionary of parameters to add.
+    :param resolver: optional callable returning the ``SERVER_NAME``
+        from the request host.
     :return: a valid WSGI environ dictionary.
     '''
     parser = http_parser(kind=0)
@@ -73,12 +159,17 @@ def test_wsgi_environ(path=None, method=None, headers=None, extra=None,
     stream.on_message_complete.set_result(None)
     extra = extra or {}
     return wsgi_environ(stream, ('127.0.0.1', 8060), '777.777.777.777:8080',
-                        headers, https=secure, extra=extra)
+                        headers, https=secure, extra=extra,
+                        resolver=resolver)
 
 
 class StreamReader:
     _expect_sent = None
     _waiting = None
+    _consumer = None
+    _consumed = None
+    _writer = None
+    _paused = False
 
     def __init__(self, headers, parser, transport=None):
         self.headers = headers
@@ -140,11 +231,57 @@ class StreamReader:
         else:
             return self._waiting
 
+    def consume(self, callback):
+        '''Feed ``callback`` with the body as it is received.
+
+        ``callback`` is invoked with each chunk of bytes. If it returns a
+        :class:`~asyncio.Future`, reading from the :attr:`transport` is
+        paused until the future is done.
+
+        Return a :class:`~asyncio.Future` called back once the whole body
+        has been consumed.
+        '''
+        if self._waiting or self._consumer:
+            raise RuntimeError('%s body already read' % self)
+        self._consumer = callback
+        self._consumed = Future()
+        self._consume()
+        return self._consumed
+
     def fail(self):
         if self.waiting_expect():
             raise HttpException(status=417)
 
     #    INTERNALS
+    def _consume(self, writer=None):
+        consumed = self._consumed
+        try:
+            if writer is not None:
+                self._writer = None
+                if self._paused:
+                    self._paused = False
+                    self.transport.resume_reading()
+                writer.result()
+            while not (self._writer or consumed.done()):
+                body = self.recv()
+                if self.buffer:
+                    body, self.buffer = self.buffer + body, b''
+                if body:
+                    result = self._consumer(body)
+                    if isfuture(result):
+                        self._writer = result
+                        if not self.done() and self.transport:
+                            self._paused = True
+                            self.transport.pause_reading()
+                        result.add_done_callback(self._consume)
+                elif self.done():
+                    consumed.set_result(None)
+                else:
+                    break
+        except Exception as exc:
+            if not consumed.done():
+                consumed.set_exception(exc)
+
     def _getvalue(self, body, maxbuf):
         if self.buffer:
             body = self.buffer + body
@@ -155,7 +292,8 @@ class StreamReader:
 
 
 def wsgi_environ(stream, address, client_address, headers,
-                 server_software=None, https=False, extra=None):
+                 server_software=None, https=False, extra=None,
+                 resolver=None):
     protocol = stream.protocol()
     parser = stream.parser
     request_headers = stream.headers
@@ -178,13 +316,16 @@ def wsgi_environ(stream, address, client_address, headers,
                "wsgi.run_once": False,
                "wsgi.multithread": False,
                "wsgi.multiprocess": False,
+               "wsgi.file_wrapper": FileWrapper,
                "SERVER_SOFTWARE": server_software or pulsar.SERVER_SOFTWARE,
                "REQUEST_METHOD": native_str(parser.get_method()),
                "QUERY_STRING": parser.get_query_string(),
                "RAW_URI": raw_uri,
                "SERVER_PROTOCOL": protocol,
                "CONTENT_TYPE": ''}
-    forward = client_address
+    # unix domain sockets have no client address
+    unix = isinstance(address, str)
+    forward = ('', '') if unix else client_address
     script_name = os.environ.get("SCRIPT_NAME", "")
     for header, value in request_headers:
         header = header.lower()
@@ -224,10 +365,13 @@ def wsgi_environ(stream, address, client_address, headers,
     environ['REMOTE_ADDR'] = remote[0]
     environ['REMOTE_PORT'] = str(remote[1])
     if not host and protocol == 'HTTP/1.0':
-        host = format_address(address)
+        host = 'localhost' if unix else format_address(address)
     if host:
         h = host_and_port_default(url_scheme, host)
-        environ['SERVER_NAME'] = socket.getfqdn(h[0]) if h[0] else '0.0.0.0'
+        if not h[0]:
+            environ['SERVER_NAME'] = '0.0.0.0'
+        else:
+            environ['SERVER_NAME'] = (resolver or fqdn_cache())(h[0])
         environ['SERVER_PORT'] = h[1]
     path_info = request_uri.path
     if path_info is not None:
@@ -240,6 +384,10 @@ def wsgi_environ(stream, address, client_address, headers,
     return environ
 
 
+def _host_name(host):
+    return host
+
+
 def chunk_encoding(chunk):
     '''Write a chunk::
 
@@ -269,6 +417,11 @@ def keep_alive(headers, version):
         return False
 
 
+def _set_waiter(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
 def keep_alive_with_status(status, headers):
     code = int(status.split()[0])
     if code >= 400:
@@ -299,6 +452,10 @@ class HttpServerResponse(ProtocolConsumer):
         self.headers = Headers()
         self.keep_alive = False
         self.SERVER_SOFTWARE = server_software or self.SERVER_SOFTWARE
+        if cfg.get('no_fqdn'):
+            self._resolver = _host_name
+        else:
+            self._resolver = fqdn_cache(cfg.get('fqdn_ttl') or 300)
 
     @property
     def headers_sent(self):
@@ -339,6 +496,10 @@ class HttpServerResponse(ProtocolConsumer):
             # This is a parsing error, the client must have sent
             # bogus data
             raise ProtocolError
+        #
+        # Body streamed to a consumer, see StreamReader.consume
+        if self._stream and self._stream._consumer:
+            self._stream._consume()
 
     @property
     def status(self):
@@ -474,7 +635,11 @@ class HttpServerResponse(ProtocolConsumer):
                 # Do the actual writing
                 loop = self._loop
                 start = loop.time()
-                for chunk in response:
+                chunks = iter(response)
+                if isinstance(chunks, FileWrapper):
+                    yield from self._write_file(chunks, alive)
+                    chunks = ()
+                for chunk in chunks:
                     if isfuture(chunk):
                         chunk = yield from wait_for(chunk, alive)
                         start = loop.time()
@@ -562,6 +727,7 @@ class HttpServerResponse(ProtocolConsumer):
                                self.address, self.headers,
                                self.SERVER_SOFTWARE,
                                https=https,
+                               resolver=self._resolver,
                                extra={'pulsar.connection': self.connection,
                                       'pulsar.cfg': self.cfg,
                                       'wsgi.multiprocess': multiprocess})
@@ -570,6 +736,75 @@ class HttpServerResponse(ProtocolConsumer):
                              ('Date', format_date_time(time.time()))])
         return environ
 
+    def _write_file(self, wrapper, timeout):
+        # Send a file using sendfile when possible. Otherwise read it in
+        # the executor so that the event loop is never blocked on disk I/O
+        self.write(b'')
+        if self._can_sendfile(wrapper):
+            yield from self._sendfile(wrapper, timeout)
+        else:
+            loop = self._loop
+            while True:
+                data = yield from wait_for(
+                    loop.run_in_executor(None, wrapper.read), timeout)
+                if not data:
+                    break
+                result = self.write(data)
+                if isfuture(result):
+                    yield from wait_for(result, timeout)
+
+    def _can_sendfile(self, wrapper):
+        transport = self.transport
+        if (not hasattr(os, 'sendfile') or self.chunked or
+                wrapper.count is None or
+                transport.get_extra_info('sslcontext')):
+            return False
+        sock = transport.get_extra_info('socket')
+        if sock is None or is_tls(sock):
+            return False
+        try:
+            return stat.S_ISREG(os.fstat(wrapper.fileno()).st_mode)
+        except Exception:
+            return False
+
+    def _sendfile(self, wrapper, timeout):
+        loop = self._loop
+        transport = self.transport
+        # the connection idle timeout is suspended during the transfer
+        connection = self.connection
+        connection.fire_event('before_write')
+        if hasattr(loop, 'sendfile'):
+            # the event loop flushes the transport buffer first
+            sent = yield from loop.sendfile(transport, wrapper.file,
+                                            wrapper.offset, wrapper.count)
+            wrapper.offset += sent
+            wrapper.count -= sent
+            connection.fire_event('after_write')
+            return
+        # wait for the headers to leave the transport buffer
+        drained = connection.drained()
+        if drained:
+            yield from wait_for(drained, timeout)
+        fd = transport.get_extra_info('socket').fileno()
+        fileno = wrapper.fileno()
+        while wrapper.count > 0:
+            try:
+                sent = os.sendfile(fd, fileno, wrapper.offset, wrapper.count)
+            except (BlockingIOError, InterruptedError):
+                # the transport buffer is empty, it does not poll the socket
+                waiter = Future(loop=loop)
+                loop.add_writer(fd, _set_waiter, waiter)
+                try:
+                    yield from wait_for(waiter, timeout)
+                finally:
+                    loop.remove_writer(fd)
+            else:
+                if not sent:
+                    raise IOError('File truncated while sending')
+                wrapper.offset += sent
+                wrapper.count -= sent
+        connection.fire_event('after_write')
+
     def _new_request(self, _, exc=None):
         connection = self._connection
         connection.data_received(self._buffer)
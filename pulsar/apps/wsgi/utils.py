@@ -2,19 +2,23 @@
 The :mod:`pulsar.apps.wsgi.utils` module include several utilities used
 by various components in the :ref:`wsgi application <apps-wsgi>`
 '''
+import os
 import time
 import re
 import textwrap
 import logging
 from datetime import datetime, timedelta
 from email.utils import formatdate
+from functools import partial
 from asyncio import iscoroutinefunction, iscoroutine
 
-from pulsar import format_traceback, isfuture
+from pulsar import (format_traceback, isfuture, Future, chain_future,
+                    get_event_loop)
 from pulsar.utils.system import json
 from pulsar.utils.structures import MultiValueDict
 from pulsar.utils.html import escape
 from pulsar.utils.pep import to_string
+from pulsar.utils.multipart import MultipartFeedParser
 from pulsar.utils.httpurl import (has_empty_content, REDIRECT_CODES,
                                   parse_qsl, HTTPError, parse_dict_header,
                                   JSON_CONTENT_TYPES)
@@ -27,6 +31,8 @@ __all__ = ['handle_wsgi_error',
            'wsgi_request',
            'set_wsgi_request_class',
            'dump_environ',
+           'FileWrapper',
+           'AsyncMultipartParser',
            'HOP_HEADERS']
 
 DEFAULT_RESPONSE_CONTENT_TYPES = ('text/html', 'text/plain'
@@ -215,6 +221,161 @@ class dump_environ(object):
         return '\n%s\n' % '\n'.join(_())
 
 
+class FileWrapper(object):
+    '''The ``wsgi.file_wrapper`` of pulsar WSGI servers.
+
+    Iterate over ``count`` bytes of ``file`` starting at ``offset``, in
+    blocks of ``block_size`` bytes. When the file is a regular file on disk
+    and the connection is not encrypted, the :class:`.HttpServerResponse`
+    does not iterate but sends the file with :func:`os.sendfile`, so that
+    the file content is never copied into the worker memory.
+
+    :param file: a file-like object opened in binary mode.
+    :param block_size: size of the blocks read when iterating.
+    :param offset: position of the first byte to send.
+    :param count: number of bytes to send. If not given, the file is sent
+        until its end.
+    '''
+    def __init__(self, file, block_size=65536, offset=0, count=None):
+        self.file = file
+        self.block_size = block_size
+        self.offset = offset
+        if count is None:
+            try:
+                count = max(os.fstat(file.fileno()).st_size - offset, 0)
+            except Exception:
+                pass
+        self.count = count
+        self._seek = offset > 0
+
+    def fileno(self):
+        '''The file descriptor of the :attr:`file`'''
+        return self.file.fileno()
+
+    def read(self):
+        '''Read the next block of bytes from the file.
+
+        This is a blocking call, :class:`.HttpServerResponse` invokes it
+        in the event loop executor.
+        '''
+        if self._seek:
+            self._seek = False
+            self.file.seek(self.offset)
+        size = self.block_size
+        if self.count is not None:
+            size = min(size, self.count)
+            if not size:
+                return b''
+        data = self.file.read(size)
+        self.offset += len(data)
+        if self.count is not None:
+            self.count -= len(data)
+        return data
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        data = self.read()
+        if not data:
+            raise StopIteration
+        return data
+
+    def close(self):
+        if hasattr(self.file, 'close'):
+            self.file.close()
+
+
+class AsyncMultipartParser(MultipartFeedParser):
+    '''A :class:`.MultipartFeedParser` which writes to disk in the event
+    loop executor.
+
+    Parts larger than ``memfile_limit`` are written into their file by
+    the executor of ``loop`` so that the event loop is never blocked on
+    disk I/O. When more than ``high_limit`` bytes are waiting to be
+    written, :meth:`feed` returns a :class:`~asyncio.Future` called back
+    once less than ``low_limit`` bytes are pending.
+    '''
+    _writing = None
+    _waiter = None
+    _error = None
+
+    def __init__(self, boundary, loop=None, high_limit=2**22,
+                 low_limit=2**20, **kw):
+        super().__init__(boundary, **kw)
+        self._loop = loop or get_event_loop()
+        self.high_limit = high_limit
+        self.low_limit = min(low_limit, high_limit)
+        self._queue = []
+        self._pending = 0
+        self._on_disk = set()
+        self._resume = 0
+
+    def feed(self, data):
+        if self._error:
+            raise self._error
+        super().feed(data)
+        if self._pending > self.high_limit:
+            return self._wait(self.low_limit)
+
+    def close(self):
+        '''Return a :class:`~asyncio.Future` called back with the list of
+        parts once all pending data is written.'''
+        if self._error:
+            raise self._error
+        close = super().close
+        if self._pending:
+            return chain_future(self._wait(0), lambda _: close())
+        future = Future(loop=self._loop)
+        future.set_result(close())
+        return future
+
+    def write(self, file, data):
+        if (file in self._on_disk or
+                file.tell() + len(data) > self.memfile_limit):
+            self._on_disk.add(file)
+            self._queue.append((file, data))
+            self._pending += len(data)
+            if not self._writing:
+                self._flush()
+        else:
+            file.write(data)
+
+    #    INTERNALS
+    def _wait(self, limit):
+        self._resume = limit
+        if self._waiter is None:
+            self._waiter = Future(loop=self._loop)
+        return self._waiter
+
+    def _flush(self):
+        queue, self._queue = self._queue, []
+        size = sum((len(data) for _, data in queue))
+        self._writing = self._loop.run_in_executor(None, _write_files, queue)
+        self._writing.add_done_callback(partial(self._written, size))
+
+    def _written(self, size, future):
+        self._writing = None
+        self._pending -= size
+        exc = future.exception()
+        if exc:
+            self._error = exc
+        elif self._queue:
+            self._flush()
+        waiter = self._waiter
+        if waiter and (exc or self._pending <= self._resume):
+            self._waiter = None
+            if exc:
+                waiter.set_exception(exc)
+            else:
+                waiter.set_result(None)
+
+
+def _write_files(queue):
+    for file, data in queue:
+        file.write(data)
+
+
 def handle_wsgi_error(environ, exc):
     '''The default error handler while serving a WSGI request.
 
@@ -44,10 +44,11 @@ import re
 from functools import reduce, partial
 from io import BytesIO
 
-from pulsar import Future, chain_future
+from pulsar import Future, chain_future, isfuture, HttpException, BadRequest
 from pulsar.utils.system import json
-from pulsar.utils.multipart import parse_form_data, parse_options_header
-from pulsar.utils.structures import AttributeDictionary
+from pulsar.utils.multipart import (parse_form_data, parse_options_header,
+                                    MultipartError, MultipartLimitError)
+from pulsar.utils.structures import AttributeDictionary, MultiValueDict
 from pulsar.utils.httpurl import (Headers, SimpleCookie, responses,
                                   has_empty_content, REDIRECT_CODES,
                                   ENCODE_URL_METHODS, JSON_CONTENT_TYPES,
@@ -56,7 +57,7 @@ from pulsar.utils.httpurl import (Headers, SimpleCookie, responses,
 
 from .content import HtmlDocument
 from .utils import (set_wsgi_request_class, set_cookie, query_dict,
-                    parse_accept_header)
+                    parse_accept_header, FileWrapper, AsyncMultipartParser)
 from .structures import ContentAccept, CharsetAccept, LanguageAccept
 
 
@@ -87,7 +88,7 @@ def cached_property(method):
 
 def wsgi_encoder(gen, encoding):
     for data in gen:
-        if not isinstance(data, bytes):
+        if not isinstance(data, bytes) and not isfuture(data):
             yield data.encode(encoding)
         else:
             yield data
@@ -252,7 +253,9 @@ class WsgiResponse(object):
             raise RuntimeError('WsgiResponse can be iterated once only')
         self._started = True
         self._iterated = True
-        if self.is_streamed:
+        if isinstance(self.content, FileWrapper):
+            return self.content
+        elif self.is_streamed:
             return wsgi_encoder(self.content, self.encoding or 'utf-8')
         else:
             return iter(self.content)
@@ -543,6 +546,11 @@ class WsgiRequest(EnvironMixin):
         if future is None:
             stream = self.environ.get('wsgi.input')
             if self.method not in ENCODE_URL_METHODS and stream:
+                content_type = self.content_type_options[0]
+                if (content_type == 'multipart/form-data' and
+                        hasattr(stream, 'consume') and not stream.done()):
+                    return chain_future(self._stream_form_data(stream),
+                                        partial(self._form_data, data, files))
                 chunk = stream.read()
                 if isinstance(chunk, Future):
                     return chain_future(
@@ -563,6 +571,42 @@ class WsgiRequest(EnvironMixin):
         self.cache.data_and_files = result
         return self.data_and_files(data, files)
 
+    def _stream_form_data(self, stream):
+        # Parse multipart/form-data as the body is received
+        cfg = self.cache.cfg
+        connection = self.connection
+        options = self.content_type_options[1]
+        try:
+            parser = AsyncMultipartParser(
+                options.get('boundary', ''),
+                loop=connection._loop if connection else None,
+                content_length=int(self.get('CONTENT_LENGTH') or -1),
+                disk_limit=cfg.get('form_data_limit') or 2**30,
+                field_limit=cfg.get('form_field_limit') or 2**18,
+                charset=options.get('charset', 'utf-8'))
+        except MultipartError as exc:
+            self._form_data_error(exc)
+        parts = chain_future(stream.consume(parser.feed),
+                             lambda _: parser.close())
+        return chain_future(parts, errback=self._form_data_error)
+
+    def _form_data(self, data, files, parts):
+        forms, uploads = MultiValueDict(), MultiValueDict()
+        for part in parts:
+            if part.filename or not part.is_buffered():
+                uploads[part.name] = part
+            else:
+                forms[part.name] = part.string()
+        self.cache.data_and_files = forms, uploads
+        return self.data_and_files(data, files)
+
+    def _form_data_error(self, exc):
+        if isinstance(exc, MultipartLimitError):
+            raise HttpException(str(exc), status=413)
+        elif isinstance(exc, MultipartError):
+            raise BadRequest(str(exc))
+        raise exc
+
     @cached_property
     def url_data(self):
         '''A (cached) dictionary containing data from the ``QUERY_STRING``
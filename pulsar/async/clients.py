@@ -199,7 +199,8 @@ class AbstractClient(Producer):
     def close(self):
         '''Close all idle connections.
         '''
-        return self.fire_event('finish')
+        self.fire_event('finish')
+        return self.event('finish')
     abort = close
 
     def create_connection(self, address, protocol_factory=None, **kw):
@@ -233,7 +234,8 @@ class AbstractUdpClient(Producer):
     def close(self):
         '''Close all idle connections.
         '''
-        return self.fire_event('finish')
+        self.fire_event('finish')
+        return self.event('finish')
     abort = close
 
     def create_datagram_endpoint(self, protocol_factory=None, **kw):
@@ -228,7 +228,8 @@ class Concurrency(object):
                     actor.stream.writeln(str(exc))
             #
             actor.exit_code = exit_code
-            stopping = actor.fire_event('stopping')
+            actor.fire_event('stopping')
+            stopping = actor.event('stopping')
             if not stopping.done() and actor._loop.is_running():
                 actor.logger.debug('asynchronous stopping')
 
@@ -1,5 +1,6 @@
 from collections import deque
 from functools import partial
+from itertools import chain
 from inspect import isgeneratorfunction
 
 from asyncio import Future, iscoroutinefunction, InvalidStateError
@@ -8,7 +9,7 @@ from .access import _EVENT_LOOP_CLASSES
 from .futures import future_result_exc, AsyncObject
 
 
-__all__ = ['EventHandler', 'Event', 'OneTime']
+__all__ = ['EventHandler', 'Event', 'OneTime', 'FiredEvent']
 
 
 class AbstractEvent(AsyncObject):
@@ -160,48 +161,103 @@ class OneTime(Future, AbstractEvent):
             self.set_result(arg)
 
 
+class FiredEvent:
+    '''A :class:`OneTime` event fired before being accessed.
+
+    Returned by :meth:`EventHandler.fire_event` in place of the event, it
+    is already done and cheap to create. Yielding from it returns the
+    argument the event was fired with, or raises its exception.
+    '''
+    __slots__ = ('_result', '_exception')
+
+    def __init__(self, result, exception=None):
+        self._result = result
+        self._exception = exception
+
+    def __iter__(self):
+        yield from ()
+        return self.result()
+    __await__ = __iter__
+
+    def done(self):
+        return True
+
+    def cancelled(self):
+        return False
+
+    def fired(self):
+        return 1
+
+    def result(self):
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        return self._exception
+
+
 class EventHandler(AsyncObject):
     '''A Mixin for handling events on :ref:`async objects <async-object>`.
 
     It handles :class:`OneTime` events and :class:`Event` that occur
     several times.
+
+    Events are created lazily, the first time they are accessed via the
+    :meth:`event` method or a callback is bound to them. Firing an event
+    which was never accessed does not create it: a one time event records
+    its result so that it is available, already done, once accessed.
     '''
     ONE_TIME_EVENTS = ()
     '''Event names which occur once only.'''
     MANY_TIMES_EVENTS = ()
     '''Event names which occur several times.'''
+    _fired_events = None
+
     def __init__(self, loop=None, one_time_events=None,
                  many_times_events=None):
         assert isinstance(loop, _EVENT_LOOP_CLASSES)
         self._loop = loop
+        self._events = {}
         one = self.ONE_TIME_EVENTS
         if one_time_events:
             one = set(one)
             one.update(one_time_events)
-        events = dict(((name, OneTime(loop=loop, name=name)) for name in one))
+        self._one_time_events = one
         many = self.MANY_TIMES_EVENTS
         if many_times_events:
             many = set(many)
             many.update(many_times_events)
-        events.update(((name, Event(loop=loop, name=name)) for name in many))
-        self._events = events
+        self._many_times_events = many
 
     @property
     def events(self):
         '''The dictionary of all events.
+
+        Accessing this property creates all events not yet created.
         '''
-        return self._events
+        events = self._events
+        for name in chain(self._one_time_events, self._many_times_events):
+            if name not in events:
+                self._create_event(name)
+        return events
 
     def event(self, name):
         '''Returns the :class:`Event` at ``name``.
 
         If no event is registered for ``name`` returns nothing.
         '''
-        return self._events.get(name)
+        event = self._events.get(name)
+        if event is None:
+            event = self._create_event(name)
+        return event
 
     def fired_event(self, name):
         event = self._events.get(name)
-        return event._fired if event else 0
+        if event is not None:
+            return event._fired
+        fired = self._fired_events
+        return 1 if fired and name in fired else 0
 
     def bind_event(self, name, callback):
         '''Register a ``callback`` with ``event``.
@@ -223,9 +279,10 @@ class EventHandler(AsyncObject):
             can also be a list/tuple of callables.
         :return: nothing.
         '''
-        if name not in self._events:
-            self._events[name] = Event()
-        event = self._events[name]
+        event = self.event(name)
+        if event is None:
+            event = Event()
+            self._events[name] = event
         event.bind(callback)
 
     def remove_callback(self, name, callback):
@@ -241,8 +298,9 @@ class EventHandler(AsyncObject):
         The events callbacks can be specified as a single callable or as
         list/tuple of callabacks or (callback, erroback) tuples.
         '''
-        for name in self._events:
-            if name in events:
+        for name in events:
+            if (name in self._events or name in self._one_time_events or
+                    name in self._many_times_events):
                 self.bind_event(name, events[name])
 
     def fire_event(self, name, *args, **kwargs):
@@ -256,7 +314,10 @@ class EventHandler(AsyncObject):
         :param kwargs: optional key-valued parameters to pass to the event
             handler. Can only be used for
             :ref:`many times events <many-times-event>`.
-        :return: the :class:`Event` fired
+        :return: the :class:`Event` fired. A one time event which was
+            never accessed returns a :class:`FiredEvent` instead, a many
+            times event ``None`` (use the :meth:`event` method to obtain
+            the event itself).
         """
         if not args:
             arg = self
@@ -265,14 +326,23 @@ class EventHandler(AsyncObject):
         else:
             raise TypeError('fire_event expected at most 1 argument got %s' %
                             len(args))
-        event = self.event(name)
-        if event:
+        event = self._events.get(name)
+        if event is not None:
             try:
                 event.fire(arg, **kwargs)
             except InvalidStateError:
                 self.logger.error('Event %s already fired' % name)
             return event
-        else:
+        elif name in self._one_time_events:
+            fired = self._fired_events
+            if fired is None:
+                fired = self._fired_events = {}
+            elif name in fired:
+                self.logger.error('Event %s already fired' % name)
+                return
+            fired[name] = event = FiredEvent(arg, kwargs.get('exc'))
+            return event
+        elif name not in self._many_times_events:
             self.logger.warning('Unknown event "%s" for %s', name, self)
 
     def silence_event(self, name):
@@ -281,7 +351,7 @@ class EventHandler(AsyncObject):
         This causes the event not to fire at the :meth:`fire_event` method
         is invoked with the event ``name``.
         '''
-        event = self._events.get(name)
+        event = self.event(name)
         if event:
             event.silence()
 
@@ -292,11 +362,28 @@ class EventHandler(AsyncObject):
         provided the events handlers already exist.
         '''
         if isinstance(other, EventHandler):
-            events = self._events
             for name, event in other._events.items():
                 if isinstance(event, Event) and event._handlers:
-                    ev = events.get(name)
+                    ev = self.event(name)
                     # If the event is available add it
                     if ev:
                         for callback in event._handlers:
                             ev.bind(callback)
+
+    def _create_event(self, name):
+        if name in self._one_time_events:
+            event = OneTime(loop=self._loop, name=name)
+            fired = self._fired_events
+            if fired and name in fired:
+                done = fired.pop(name)
+                event._fired = 1
+                if done._exception:
+                    event.set_exception(done._exception)
+                else:
+                    event.set_result(done._result)
+        elif name in self._many_times_events:
+            event = Event(loop=self._loop, name=name)
+        else:
+            return
+        self._events[name] = event
+        return event
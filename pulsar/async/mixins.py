@@ -46,6 +46,26 @@ class FlowControl(object):
                     waiter.set_exception(exc)
         self._transport.resume_reading()
 
+    def drained(self):
+        '''Wait for the transport to write all the data in its buffer.
+
+        Return an empty tuple if the buffer is empty, otherwise a
+        :class:`~asyncio.Future` called back once it is.
+        '''
+        transport = self._transport
+        if not transport or not transport.get_write_buffer_size():
+            return ()
+        low, high = transport.get_write_buffer_limits()
+        # pause now and resume writing only once the buffer is empty
+        transport.set_write_buffer_limits(0)
+        waiter = self._write_waiter
+        if waiter is None or waiter.done():
+            waiter = Future(loop=self._loop)
+            self._write_waiter = waiter
+        waiter.add_done_callback(
+            lambda _: transport.set_write_buffer_limits(high, low))
+        return waiter
+
     # INTERNAL CALLBACKS
     def _set_flow_limits(self, _, exc=None):
         if not exc:
@@ -1,4 +1,5 @@
 import sys
+import socket
 
 import pulsar
 from pulsar.utils.internet import nice_address, format_address
@@ -151,7 +152,6 @@ class ProtocolConsumer(EventHandler):
         if conn._producer:
             p = getattr(conn._producer, '_requests_processed', 0)
             conn._producer._requests_processed = p + 1
-        self.bind_event('post_request', self._finished)
         self._request = request
         self.fire_event('pre_request')
         if self._request is not None:
@@ -174,7 +174,8 @@ class ProtocolConsumer(EventHandler):
     def finished(self, *arg, **kw):
         '''Fire the ``post_request`` event if it wasn't already fired.
         '''
-        if not self.event('post_request').fired():
+        if not self.fired_event('post_request'):
+            self._finished()
             return self.fire_event('post_request', *arg, **kw)
 
     def write(self, data):
@@ -200,7 +201,7 @@ class ProtocolConsumer(EventHandler):
         self.fire_event('data_processed', data=data)
         return result
 
-    def _finished(self, _, exc=None):
+    def _finished(self):
         c = self._connection
         if c and c._current_consumer is self:
             c._current_consumer = None
@@ -581,10 +582,13 @@ class TcpServer(Producer):
                 if sockets:
                     server = None
                     for sock in sockets:
-                        srv = yield from create_server(self.create_protocol,
-                                                       sock=sock,
-                                                       backlog=backlog,
-                                                       ssl=sslcontext)
+                        create = create_server
+                        if sock.family == getattr(socket, 'AF_UNIX', None):
+                            create = self._loop.create_unix_server
+                        srv = yield from create(self.create_protocol,
+                                                sock=sock,
+                                                backlog=backlog,
+                                                ssl=sslcontext)
                         if server:
                             server.sockets.extend(srv.sockets)
                         else:
@@ -597,7 +601,9 @@ class TcpServer(Producer):
                                                           backlog=backlog,
                                                           ssl=sslcontext)
                     else:
-                        raise NotImplementedError
+                        server = yield from self._loop.create_unix_server(
+                            self.create_protocol, address, backlog=backlog,
+                            ssl=sslcontext)
                 self._server = server
                 self._started = self._loop.time()
                 for sock in server.sockets:
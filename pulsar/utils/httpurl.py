@@ -745,17 +745,29 @@ class InvalidChunkSize(Exception):
 class HttpParser(object):
     '''A python HTTP parser.
 
+    Incoming data is appended to a single bytearray and parsed by moving
+    a read offset forward. The search for the end of the headers resumes
+    where the previous :meth:`execute` stopped and chunk boundaries are
+    found in place, so that slowly arriving messages are parsed in linear
+    time. Consumed bytes are discarded once the offset has moved past
+    :attr:`compact_size` bytes or past half of the buffer.
+
     Original code from https://github.com/benoitc/http-parser
 
     2011 (c) Benoit Chesneau <benoitc@e-engura.org>
     '''
+    compact_size = 65536
+
     def __init__(self, kind=2, decompress=False, method=None):
         self.decompress = decompress
         # errors vars
         self.errno = None
         self.errstr = ""
         # protected variables
-        self._buf = []
+        self._buf = bytearray()
+        self._pos = 0
+        self._scan = 0
+        self._chunk_rest = 0
         self._version = None
         self._method = method
         self._status_code = None
@@ -843,46 +855,47 @@ class HttpParser(object):
             self.__on_message_complete = True
             return length
         #
-        data = bytes(data)
+        buf = self._buf
+        pos = self._pos
+        if pos and (pos >= len(buf) or pos > self.compact_size or
+                    2*pos > len(buf)):
+            del buf[:pos]
+            self._scan = max(self._scan - pos, 0)
+            self._pos = pos = 0
+        base = len(buf)
+        buf.extend(data)
         # start to parse
-        nb_parsed = 0
         while True:
             if not self.__on_firstline:
-                idx = data.find(b'\r\n')
+                idx = buf.find(b'\r\n', max(self._scan, self._pos))
                 if idx < 0:
-                    self._buf.append(data)
-                    return len(data)
-                else:
-                    self.__on_firstline = True
-                    self._buf.append(data[:idx])
-                    first_line = to_string(b''.join(self._buf),
-                                           DEFAULT_CHARSET)
-                    rest = data[idx+2:]
-                    data = b''
-                    if self._parse_firstline(first_line):
-                        nb_parsed = nb_parsed + idx + 2
-                        self._buf = [rest]
-                    else:
-                        return nb_parsed
+                    self._scan = max(len(buf) - 1, self._pos)
+                    return length
+                self.__on_firstline = True
+                first_line = to_string(bytes(buf[self._pos:idx]),
+                                       DEFAULT_CHARSET)
+                if not self._parse_firstline(first_line):
+                    return max(self._pos - base, 0)
+                self._pos = self._scan = idx + 2
             elif not self.__on_headers_complete:
-                if data:
-                    self._buf.append(data)
-                    data = b''
-                try:
-                    to_parse = b''.join(self._buf)
-                    ret = self._parse_headers(to_parse)
-                    if ret is False:
+                pos = self._pos
+                if buf[pos:pos+2] == b'\r\n':
+                    idx, end = pos, pos + 2
+                else:
+                    idx = buf.find(b'\r\n\r\n', max(self._scan, pos))
+                    if idx < 0:  # we don't have all headers
+                        self._scan = max(len(buf) - 3, pos)
                         return length
-                    nb_parsed = nb_parsed + (len(to_parse) - ret)
+                    end = idx + 4
+                try:
+                    self._parse_headers(bytes(buf[pos:idx]))
                 except InvalidHeader as e:
                     self.errno = INVALID_HEADER
                     self.errstr = str(e)
-                    return nb_parsed
+                    return max(pos - base, 0)
+                self._pos = self._scan = end
             elif not self.__on_message_complete:
                 self.__on_message_begin = True
-                if data:
-                    self._buf.append(data)
-                    data = b''
                 ret = self._parse_body()
                 if ret is None:
                     return length
@@ -891,8 +904,6 @@ class HttpParser(object):
                 elif ret == 0:
                     self.__on_message_complete = True
                     return length
-                else:
-                    nb_parsed = max(length, ret)
             else:
                 return 0
 
@@ -954,36 +965,7 @@ class HttpParser(object):
         self._version = (int(match.group(1)), int(match.group(2)))
 
     def _parse_headers(self, data):
-        if data == b'\r\n':
-            self.__on_headers_complete = True
-            self._buf = []
-            return 0
-        idx = data.find(b'\r\n\r\n')
-        if idx < 0:  # we don't have all headers
-            return False
-        chunk = to_string(data[:idx], DEFAULT_CHARSET)
-        # Split lines on \r\n keeping the \r\n on each line
-        lines = deque(('%s\r\n' % line for line in chunk.split('\r\n')))
-        # Parse headers into key/value pairs paying attention
-        # to continuation lines.
-        while len(lines):
-            # Parse initial header name : value pair.
-            curr = lines.popleft()
-            if curr.find(":") < 0:
-                continue
-            name, value = curr.split(":", 1)
-            name = name.rstrip(" \t").upper()
-            if HEADER_RE.search(name):
-                raise InvalidHeader("invalid header name %s" % name)
-            name, value = header_field(name.strip()), [value.lstrip()]
-            # Consume value continuation lines
-            while len(lines) and lines[0].startswith((" ", "\t")):
-                value.append(lines.popleft())
-            value = ''.join(value).rstrip()
-            if name in self._headers:
-                self._headers[name].append(value)
-            else:
-                self._headers[name] = [value]
+        self._parse_header_lines(data, self._headers)
         # detect now if body is sent by chunks.
         clen = self._headers.get('Content-Length')
         if 'Transfer-Encoding' in self._headers:
@@ -1020,75 +1002,118 @@ class HttpParser(object):
                 self.__decompress_first_try = False
             elif encoding == "deflate":
                 self.__decompress_obj = zlib.decompressobj()
-
-        rest = data[idx+4:]
-        self._buf = [rest]
         self.__on_headers_complete = True
         self.__on_message_begin = True
-        return len(rest)
+
+    def _parse_header_lines(self, data, headers):
+        if not data:
+            return
+        chunk = to_string(data, DEFAULT_CHARSET)
+        # Split lines on \r\n keeping the \r\n on each line
+        lines = deque(('%s\r\n' % line for line in chunk.split('\r\n')))
+        # Parse headers into key/value pairs paying attention
+        # to continuation lines.
+        while len(lines):
+            # Parse initial header name : value pair.
+            curr = lines.popleft()
+            if curr.find(":") < 0:
+                continue
+            name, value = curr.split(":", 1)
+            name = name.rstrip(" \t").upper()
+            if HEADER_RE.search(name):
+                raise InvalidHeader("invalid header name %s" % name)
+            name, value = header_field(name.strip()), [value.lstrip()]
+            # Consume value continuation lines
+            while len(lines) and lines[0].startswith((" ", "\t")):
+                value.append(lines.popleft())
+            value = ''.join(value).rstrip()
+            if name in headers:
+                headers[name].append(value)
+            else:
+                headers[name] = [value]
 
     def _parse_body(self):
-        data = b''.join(self._buf)
-        #
+        buf = self._buf
         if not self._chunked:
             #
-            if not data and self._clen is None:
+            size = len(buf) - self._pos
+            if not size and self._clen is None:
                 if not self._status:    # message complete only for servers
                     self.__on_message_complete = True
             else:
-                if self._clen_rest is not None:
-                    self._clen_rest -= len(data)
-
-                # maybe decompress
-                data = self._decompress(data)
-
-                self._partial_body = True
-                if data:
-                    self._body.append(data)
-                self._buf = []
+                if size:
+                    data = bytes(buf[self._pos:])
+                    self._pos = len(buf)
+                    self._clen_rest -= size
+                    self._add_body(data)
                 if self._clen_rest <= 0:
                     self.__on_message_complete = True
             return
+        elif self._chunk_rest:
+            # in the middle of a chunk, take what is available
+            pos = self._pos
+            end = min(len(buf), pos + self._chunk_rest)
+            if end == pos:
+                return None
+            # the last two bytes of a chunk are the \r\n delimiter
+            data_end = min(end, pos + self._chunk_rest - 2)
+            self._chunk_rest -= end - pos
+            self._pos = end
+            if data_end > pos:
+                self._add_body(bytes(buf[pos:data_end]))
+            return end - pos
         else:
             try:
-                size, rest = self._parse_chunk_size(data)
+                size = self._parse_chunk_size()
             except InvalidChunkSize as e:
                 self.errno = INVALID_CHUNK
                 self.errstr = "invalid chunk size [%s]" % str(e)
                 return -1
-            if size == 0:
-                return size
-            if size is None or len(rest) < size + 2:
+            if size is None:
                 return None
-            body_part, rest = rest[:size], rest[size:]
-
-            # maybe decompress
-            body_part = self._decompress(body_part)
-            self._partial_body = True
-            self._body.append(body_part)
-            rest = rest[2:]
-            self._buf = [rest] if rest else []
-            return len(rest) + 2
-
-    def _parse_chunk_size(self, data):
-        idx = data.find(b'\r\n')
+            return size
+
+    def _parse_chunk_size(self):
+        # The chunk size line starts at the read offset. Return None if
+        # more data is needed, 0 for the last chunk, the chunk size
+        # otherwise
+        buf = self._buf
+        pos = self._pos
+        idx = buf.find(b'\r\n', pos)
         if idx < 0:
-            return None, None
-        line, rest_chunk = data[:idx], data[idx+2:]
+            return None
+        line = bytes(buf[pos:idx])
         chunk_size = line.split(b';', 1)[0].strip()
         try:
             chunk_size = int(chunk_size, 16)
         except ValueError:
             raise InvalidChunkSize(chunk_size)
         if chunk_size == 0:
-            self._parse_trailers(rest_chunk)
-            return 0, None
-        return chunk_size, rest_chunk
-
-    def _parse_trailers(self, data):
-        idx = data.find(b'\r\n\r\n')
-        if data[:2] == b'\r\n':
-            self._trailers = self._parse_headers(data[:idx])
+            return 0 if self._parse_trailers(idx + 2) else None
+        self._pos = idx + 2
+        self._chunk_rest = chunk_size + 2
+        return chunk_size
+
+    def _parse_trailers(self, pos):
+        # Return True once the trailers after the last chunk are received
+        buf = self._buf
+        if buf[pos:pos+2] == b'\r\n':
+            self._pos = pos + 2
+            return True
+        idx = buf.find(b'\r\n\r\n', pos)
+        if idx >= 0:
+            self._trailers = OrderedDict()
+            self._parse_header_lines(bytes(buf[pos:idx]), self._trailers)
+            self._pos = idx + 4
+            return True
+        return False
+
+    def _add_body(self, data):
+        # maybe decompress
+        data = self._decompress(data)
+        self._partial_body = True
+        if data:
+            self._body.append(data)
 
     def _decompress(self, data):
         deco = self.__decompress_obj
@@ -4,10 +4,13 @@ Parser for multipart/form-data
 
 This module provides a parser for the multipart/form-data format. It can read
 from a file, a socket or a WSGI environment.
+
+The :class:`MultipartFeedParser` parses the format incrementally, as the
+data is fed to it, without buffering the whole body.
 '''
 import re
 import sys
-from tempfile import TemporaryFile
+from tempfile import TemporaryFile, SpooledTemporaryFile
 from wsgiref.headers import Headers
 from base64 import b64encode
 from io import BytesIO
@@ -75,6 +78,10 @@ class MultipartError(ValueError):
     pass
 
 
+class MultipartLimitError(MultipartError):
+    '''Raised when a multipart body exceeds one of the parser limits'''
+
+
 class MultipartParser(object):
 
     def __init__(self, stream, boundary, content_length=-1,
@@ -211,6 +218,157 @@ class MultipartParser(object):
             raise MultipartError("Unexpected end of multipart stream.")
 
 
+class MultipartFeedParser(object):
+    '''Incremental parser of a multipart/form-data body.
+
+    The body is passed to the :meth:`feed` method, in chunks of any size,
+    as it arrives and the :meth:`close` method is called once the body is
+    complete. Only the data which may belong to a boundary is kept in
+    memory, the body of each part is written into a
+    :class:`~tempfile.SpooledTemporaryFile` which moves to disk once
+    larger than ``memfile_limit`` bytes.
+
+    Completed parts are available in the :attr:`parts` list.
+
+    :param boundary: The multipart boundary.
+    :param content_length: The length of the body or -1 if not known.
+    :param disk_limit: Maximum size of the body.
+    :param mem_limit: Maximum size of all parts without a filename.
+    :param field_limit: Maximum size of a part without a filename.
+    '''
+    def __init__(self, boundary, content_length=-1, disk_limit=2**30,
+                 mem_limit=2**20, field_limit=2**18, memfile_limit=2**18,
+                 buffer_size=2**16, charset='latin1'):
+        if isinstance(boundary, str):
+            boundary = boundary.encode('latin1')
+        if not boundary:
+            raise MultipartError('No boundary for multipart/form-data.')
+        self.content_length = content_length
+        self.disk_limit = disk_limit
+        self.mem_limit = min(mem_limit, disk_limit)
+        self.field_limit = min(field_limit, self.mem_limit)
+        self.memfile_limit = memfile_limit
+        self.buffer_size = buffer_size
+        self.charset = charset
+        if content_length > disk_limit:
+            raise MultipartLimitError('Disk limit reached.')
+        self.delimiter = b'\r\n--' + boundary
+        self.parts = []
+        self.size = 0
+        self._mem_used = 0
+        self._part = None
+        # The first boundary is not preceded by a line break
+        self._buffer = b'\r\n'
+        self._state = self._preamble
+
+    def feed(self, data):
+        '''Parse a chunk of the body.'''
+        self.size += len(data)
+        if self.size > self.disk_limit:
+            raise MultipartLimitError('Disk limit reached.')
+        if 0 <= self.content_length < self.size:
+            raise MultipartError(
+                'Size of body exceeds Content-Length header.')
+        self._buffer += data
+        while self._state():
+            pass
+
+    def close(self):
+        '''The body is complete, return the list of parts.'''
+        if self._state != self._epilogue:
+            raise MultipartError("Unexpected end of multipart stream.")
+        for part in self.parts:
+            part.file.seek(0)
+        return self.parts
+
+    def write(self, file, data):
+        '''Write ``data`` into the ``file`` of a part.'''
+        file.write(data)
+
+    #    INTERNALS
+    def _preamble(self):
+        return self._read_until_boundary(None)
+
+    def _body(self):
+        return self._read_until_boundary(self._part)
+
+    def _epilogue(self):
+        self._buffer = b''
+
+    def _read_until_boundary(self, part):
+        buffer = self._buffer
+        delimiter = self.delimiter
+        index = buffer.find(delimiter)
+        if index < 0:
+            # keep the bytes which may be the start of the delimiter
+            keep = len(delimiter) - 1
+            if len(buffer) > keep:
+                if part:
+                    self._write(part, buffer[:-keep])
+                self._buffer = buffer[-keep:]
+            return False
+        if part:
+            self._write(part, buffer[:index])
+            self.parts.append(part)
+            self._part = None
+        self._buffer = buffer[index+len(delimiter):]
+        self._state = self._boundary
+        return True
+
+    def _boundary(self):
+        buffer = self._buffer
+        if buffer[:2] == b'--':
+            self._state = self._epilogue
+            return True
+        index = buffer.find(b'\r\n')
+        if index < 0:
+            if len(buffer) > self.buffer_size:
+                raise MultipartError('Syntax error after boundary.')
+            return False
+        elif buffer[:index].strip(b' \t'):
+            raise MultipartError('Syntax error after boundary.')
+        self._buffer = buffer[index+2:]
+        self._part = MultipartPart(buffer_size=self.buffer_size,
+                                   memfile_limit=self.memfile_limit,
+                                   charset=self.charset)
+        self._state = self._headers
+        return True
+
+    def _headers(self):
+        buffer = self._buffer
+        if buffer[:2] == b'\r\n':
+            lines, index = (), 2
+        else:
+            index = buffer.find(b'\r\n\r\n')
+            if index < 0:
+                if len(buffer) > self.buffer_size:
+                    raise MultipartError('Header section too large.')
+                return False
+            lines, index = buffer[:index].split(b'\r\n'), index + 4
+        part = self._part
+        for line in lines:
+            part.write_header(line, b'\r\n')
+        part.write_header(b'', b'\r\n')
+        part.file = SpooledTemporaryFile(max_size=self.memfile_limit)
+        self._buffer = buffer[index:]
+        self._state = self._body
+        return True
+
+    def _write(self, part, data):
+        if data:
+            part.size += len(data)
+            if not part.filename:
+                if part.size > self.field_limit:
+                    raise MultipartLimitError('Field limit reached.')
+                self._mem_used += len(data)
+                if self._mem_used > self.mem_limit:
+                    raise MultipartLimitError('Memory limit reached.')
+            if 0 < part.content_length < part.size:
+                raise MultipartError(
+                    'Size of body exceeds Content-Length header.')
+            self.write(part.file, data)
+
+
 class MultipartPart(object):
     default_charset = 'latin1'
 
@@ -253,7 +411,8 @@ class MultipartPart(object):
         self.file.write(self._buf + line)
         self._buf = nl
         if self.content_length > 0 and self.size > self.content_length:
-            raise MultipartError('Size of body exceeds Content-Length header.')
+            raise MultipartError(
+                'Size of body exceeds Content-Length header.')
         if self.size > self.memfile_limit and isinstance(self.file, BytesIO):
             # TODO: What about non-file uploads that exceed the memfile_limit?
             self.file, old = TemporaryFile(mode='w+b'), self.file
@@ -277,6 +436,8 @@ class MultipartPart(object):
 
     def is_buffered(self):
         ''' Return true if the data is fully buffered in memory.'''
+        if isinstance(self.file, SpooledTemporaryFile):
+            return not self.file._rolled
         return isinstance(self.file, BytesIO)
 
     def bytes(self):
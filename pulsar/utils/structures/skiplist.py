@@ -28,7 +28,13 @@ inf = float('inf')
 
 class Skiplist(Sequence):
     '''Sorted collection supporting O(log n) insertion,
-    removal, and lookup by rank.'''
+    removal, and lookup by rank.
+
+    Elements are ``score``, ``value`` pairs ordered by ``score`` and, for
+    equal scores, by ``value`` so that values sharing a score must be
+    comparable. Each link stores its width, the number of elements it
+    skips, which allows to seek a rank in O(log n).
+    '''
     __slots__ = ('_unique', '_size', '_head', '_level')
 
     def __init__(self, data=None, unique=False):
@@ -47,15 +53,10 @@ class Skiplist(Sequence):
         return self._size
 
     def __getitem__(self, index):
-        node = self._head
-        traversed = 0
-        index += 1
-        for i in range(self._level-1, -1, -1):
-            while node.next[i] and (traversed + node.width[i]) <= index:
-                traversed += node.width[i]
-                node = node.next[i]
-            if traversed == index:
-                return node.value
+        if index < 0:
+            index += self._size
+        if 0 <= index < self._size:
+            return self._seek(index).value
         raise IndexError('skiplist index out of range')
 
     def clear(self):
@@ -75,21 +76,34 @@ class Skiplist(Sequence):
             i(*score_values)
     update = extend
 
-    def rank(self, score):
+    def rank(self, score, value=None):
         '''Return the 0-based index (rank) of ``score``.
 
-        If the score is not available it returns a negative integer which
+        When ``value`` is given, return the rank of the ``score``, ``value``
+        element rather than the rank of the first element with ``score``.
+
+        If the element is not available it returns a negative integer which
         absolute score is the right most closest index with score less than
         ``score``.
         '''
         node = self._head
         rank = 0
-        for i in range(self._level-1, -1, -1):
-            while node.next[i] and node.next[i].score < score:
-                rank += node.width[i]
-                node = node.next[i]
+        if value is None:
+            for i in range(self._level-1, -1, -1):
+                while node.next[i] and node.next[i].score < score:
+                    rank += node.width[i]
+                    node = node.next[i]
+        else:
+            for i in range(self._level-1, -1, -1):
+                next = node.next[i]
+                while next and (next.score < score or
+                                (next.score == score and next.value < value)):
+                    rank += node.width[i]
+                    node = next
+                    next = node.next[i]
         node = node.next[0]
-        if node and node.score == score:
+        if node and node.score == score and (value is None or
+                                             node.value == value):
             return rank
         else:
             return -2 - rank
@@ -99,7 +113,7 @@ class Skiplist(Sequence):
         if start < 0:
             start = max(N + start, 0)
         if start >= N:
-            raise StopIteration
+            return
         if end is None:
             end = N
         elif end < 0:
@@ -107,42 +121,43 @@ class Skiplist(Sequence):
         else:
             end = min(end, N)
         if start >= end:
-            raise StopIteration
-        node = self._head.next[0]
-        index = 0
-        while node:
-            if index >= start:
-                if index < end:
-                    yield (node.score, node.value) if scores else node.value
-                else:
-                    break
-            index += 1
+            return
+        node = self._seek(start)
+        for _ in range(end - start):
+            yield (node.score, node.value) if scores else node.value
             node = node.next[0]
 
     def range_by_score(self, minval, maxval, include_min=True,
                        include_max=True, start=0, num=None, scores=False):
         node = self._head
+        rank = 0
         if include_min:
             for i in range(self._level-1, -1, -1):
                 while node.next[i] and node.next[i].score < minval:
+                    rank += node.width[i]
                     node = node.next[i]
         else:
             for i in range(self._level-1, -1, -1):
                 while node.next[i] and node.next[i].score <= minval:
+                    rank += node.width[i]
                     node = node.next[i]
-        node = node.next[0]
-        if node and node.score >= minval:
-            index = 0
-            while node:
-                index += 1
-                if num is not None and index - start > num:
-                    break
-                if ((include_max and node.score > maxval) or
-                        (not include_max and node.score >= maxval)):
-                    break
-                if index > start:
-                    yield (node.score, node.value) if scores else node.value
-                node = node.next[0]
+        if start > 0:
+            # skip straight to the offset
+            if rank + start >= self._size:
+                return
+            node = self._seek(rank + start)
+        else:
+            node = node.next[0]
+        count = 0
+        while node:
+            if num is not None and count >= num:
+                break
+            if ((include_max and node.score > maxval) or
+                    (not include_max and node.score >= maxval)):
+                break
+            yield (node.score, node.value) if scores else node.value
+            count += 1
+            node = node.next[0]
 
     def insert(self, score, value):
         # find first node on each level where node.next[levels].score > score
@@ -154,12 +169,16 @@ class Skiplist(Sequence):
         for i in range(self._level-1, -1, -1):
             # store rank that is crossed to reach the insert position
             rank[i] = 0 if i == self._level-1 else rank[i+1]
-            while node.next[i] and node.next[i].score <= score:
+            next = node.next[i]
+            while next and (next.score < score or
+                            (next.score == score and next.value <= value)):
                 rank[i] += node.width[i]
-                node = node.next[i]
+                node = next
+                next = node.next[i]
             chain[i] = node
         # the score already exist
-        if chain[0].score == score and self._unique:
+        if self._unique and (chain[0].score == score or (
+                chain[0].next[0] and chain[0].next[0].score == score)):
             return
         # insert a link to the newnode at each level
         level = min(SKIPLIST_MAXLEVEL, 1 - int(log(random(), 2.0)))
@@ -187,6 +206,26 @@ class Skiplist(Sequence):
         self._size += 1
         return node
 
+    def remove(self, score, value):
+        '''Remove the ``score``, ``value`` element in O(log n).
+
+        Return ``True`` if the element was found and removed.
+        '''
+        node = self._head
+        chain = [None] * self._level
+        for i in range(self._level-1, -1, -1):
+            next = node.next[i]
+            while next and (next.score < score or
+                            (next.score == score and next.value < value)):
+                node = next
+                next = node.next[i]
+            chain[i] = node
+        node = node.next[0]
+        if node and node.score == score and node.value == value:
+            self._remove_node(node, chain)
+            return True
+        return False
+
     def remove_range(self, start, end, callback=None):
         '''Remove a range by rank.
 
@@ -272,16 +311,8 @@ class Skiplist(Sequence):
         '''Returns the number of elements in the skiplist with a score
         between min and max.
         '''
-        rank1 = self.rank(minval)
-        if rank1 < 0:
-            rank1 = -rank1 - 1
-        elif not include_min:
-            rank1 += 1
-        rank2 = self.rank(maxval)
-        if rank2 < 0:
-            rank2 = -rank2 - 1
-        elif include_max:
-            rank2 += 1
+        rank1 = self._count_below(minval, not include_min)
+        rank2 = self._count_below(maxval, include_max)
         return max(rank2 - rank1, 0)
 
     def __iter__(self):
@@ -301,6 +332,31 @@ class Skiplist(Sequence):
             yield node.value
             node = node.next[0]
 
+    def _count_below(self, score, inclusive):
+        # Number of elements with score less than (or equal to) ``score``
+        node = self._head
+        rank = 0
+        for i in range(self._level-1, -1, -1):
+            next = node.next[i]
+            while next and (next.score < score or
+                            (inclusive and next.score == score)):
+                rank += node.width[i]
+                node = next
+                next = node.next[i]
+        return rank
+
+    def _seek(self, index):
+        # The node at 0-based ``index``, found by skipping over link widths
+        node = self._head
+        traversed = 0
+        index += 1
+        for i in range(self._level-1, -1, -1):
+            while node.next[i] and (traversed + node.width[i]) <= index:
+                traversed += node.width[i]
+                node = node.next[i]
+            if traversed == index:
+                return node
+
     def _remove_node(self, node, chain):
         for i in range(self._level):
             if chain[i].next[i] == node:
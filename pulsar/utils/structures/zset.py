@@ -62,7 +62,7 @@ class Zset(object):
             sc = self._dict[val]
             if sc == score:
                 return 0
-            self.remove(val)
+            self._sl.remove(sc, val)
             r = 0
         self._dict[val] = score
         self._sl.insert(score, val)
@@ -89,13 +89,9 @@ scores and values.'''
         '''
         score = self._dict.pop(item, None)
         if score is not None:
-            index = self._sl.rank(score)
-            assert index >= 0, 'could not find start range'
-            for i, v in enumerate(self._sl.range(index)):
-                if v == item:
-                    assert self._sl.remove_range(index + i, index+i + 1) == 1
-                    return score
-            assert False, 'could not find element'
+            if not self._sl.remove(score, item):
+                raise KeyError('could not find element %r' % (item,))
+            return score
 
     def remove_range(self, start, end):
         '''Remove a range by score.
@@ -113,14 +109,14 @@ scores and values.'''
 
     def clear(self):
         '''Clear this :class:`zset`.'''
-        self._sl = skiplist()
+        self._sl = Skiplist()
         self._dict.clear()
 
     def rank(self, item):
         '''Return the rank (index) of ``item`` in this :class:`zset`.'''
         score = self._dict.get(item)
         if score is not None:
-            return self._sl.rank(score)
+            return self._sl.rank(score, item)
 
     def flat(self):
         return self._sl.flat()
@@ -131,15 +127,14 @@ scores and values.'''
         for zset, weight in zip(zsets, weights):
             if result is None:
                 result = cls()
-                sl = result._sl
                 for score, value in zset._sl:
                     result.add(score*weight, value)
             else:
                 for score, value in zset._sl:
                     score *= weight
-                    existing = sl.score(value)
+                    existing = result.score(value)
                     if existing is not None:
-                        score = oper(score, existing)
+                        score = oper((score, existing))
                     result.add(score, value)
         return result
 
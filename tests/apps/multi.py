@@ -5,6 +5,7 @@ import pulsar
 from pulsar import Config, get_actor
 from pulsar.apps import MultiApp
 from pulsar.apps.wsgi import WSGIServer
+from pulsar.apps.test import non_parallel
 
 
 def dummy(environ, start_response):
@@ -20,6 +21,7 @@ class MultiWsgi(MultiApp):
         yield self.new_app(WSGIServer, 'rpc', callable=dummy)
 
 
+@non_parallel
 class TestMultiApp(unittest.TestCase):
 
     def create(self, **params):
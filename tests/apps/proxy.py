@@ -0,0 +1,200 @@
+'''Tests the reverse proxy middleware. It uses the httpbin example.'''
+import time
+import asyncio
+import unittest
+
+from pulsar import send, get_event_loop, HttpException
+from pulsar.apps import wsgi
+from pulsar.apps.http import HttpClient
+from pulsar.apps.proxy import (Proxy, Upstream, RoundRobin, LeastConnections,
+                               ConsistentHash)
+
+
+class Request:
+
+    def __init__(self, address):
+        self.address = address
+
+    def get_client_address(self):
+        return self.address
+
+
+class TestBalancers(unittest.TestCase):
+
+    def upstreams(self, n=3):
+        return [Upstream('http://127.0.0.1:%s/' % (8000 + i))
+                for i in range(n)]
+
+    def test_round_robin(self):
+        upstreams = self.upstreams()
+        balancer = RoundRobin(upstreams)
+        selected = [balancer.select(None, upstreams) for _ in range(6)]
+        self.assertEqual(selected, upstreams + upstreams)
+
+    def test_least_connections(self):
+        upstreams = self.upstreams()
+        upstreams[0].active = 2
+        upstreams[2].active = 1
+        balancer = LeastConnections(upstreams)
+        self.assertEqual(balancer.select(None, upstreams), upstreams[1])
+        upstreams[1].active = 3
+        self.assertEqual(balancer.select(None, upstreams), upstreams[2])
+
+    def test_consistent_hash(self):
+        upstreams = self.upstreams(4)
+        balancer = ConsistentHash(upstreams)
+        request = Request('10.0.0.1')
+        upstream = balancer.select(request, upstreams)
+        for _ in range(5):
+            self.assertEqual(balancer.select(request, upstreams), upstream)
+        addresses = set(balancer.select(Request('10.0.0.%s' % i), upstreams)
+                        for i in range(100))
+        self.assertEqual(len(addresses), 4)
+        # When the upstream is not available, another one is selected
+        available = [u for u in upstreams if u is not upstream]
+        other = balancer.select(request, available)
+        self.assertNotEqual(other, upstream)
+        self.assertEqual(balancer.select(request, available), other)
+
+    def test_ejection(self):
+        proxy = Proxy('api/', ['http://127.0.0.1:8000/',
+                               'http://127.0.0.1:8001/'],
+                      max_fails=2, fail_timeout=10)
+        first, second = proxy.upstreams
+        proxy.failure(first)
+        self.assertTrue(first.available())
+        proxy.failure(first)
+        self.assertFalse(first.available())
+        self.assertEqual(first.errors, 2)
+        self.assertEqual(proxy.select(None), second)
+        self.assertEqual(proxy.select(None), second)
+        self.assertTrue(first.available(time.time() + 10))
+        second.healthy = False
+        self.assertRaises(HttpException, proxy.select, None)
+        info = proxy.info()
+        self.assertEqual(len(info), 2)
+        self.assertTrue(info[0]['ejected'])
+        self.assertFalse(info[1]['healthy'])
+
+    def test_balancer_name(self):
+        proxy = Proxy('api/', 'http://127.0.0.1:8000/',
+                      balancer='least_connections')
+        self.assertIsInstance(proxy.balancer, LeastConnections)
+        self.assertEqual(proxy.url, 'http://127.0.0.1:8000/')
+        self.assertRaises(KeyError, Proxy, 'api/', 'http://127.0.0.1:8000/',
+                          balancer='foo')
+
+
+class TestProxyServer(unittest.TestCase):
+    app = None
+    proxy_app = None
+
+    @classmethod
+    def setUpClass(cls):
+        from examples.httpbin import manage
+        name = cls.__name__.lower()
+        s = manage.server(bind='127.0.0.1:0', concurrency=cls.cfg.concurrency,
+                          name='httpbin-%s' % name, workers=1)
+        cfg = yield from send('arbiter', 'run', s)
+        cls.app = cfg.app()
+        upstream = 'http://%s:%s/' % cfg.addresses[0]
+        # The first upstream server is not listening
+        proxy = Proxy('api/', ['http://127.0.0.1:1/', upstream],
+                      high_limit=2**14)
+        s = wsgi.WSGIServer(wsgi.WsgiHandler([proxy]), bind='127.0.0.1:0',
+                            concurrency=cls.cfg.concurrency,
+                            name='proxy-%s' % name, workers=1)
+        cfg = yield from send('arbiter', 'run', s)
+        cls.proxy_app = cfg.app()
+        cls.uri = 'http://%s:%s/api/' % cfg.addresses[0]
+        cls.client = HttpClient()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.app is not None:
+            yield from send('arbiter', 'kill_actor', cls.app.name)
+        if cls.proxy_app is not None:
+            yield from send('arbiter', 'kill_actor', cls.proxy_app.name)
+
+    def test_get(self):
+        for _ in range(3):
+            response = yield from self.client.get(self.uri + 'get?a=1')
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(data['args'], {'a': '1'})
+
+    def test_post_stream(self):
+        text = 'x' * 2**17
+        response = yield from self.client.post(self.uri + 'post',
+                                               data={'text': text})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['args']['text'], [text])
+
+    def test_upstream_status(self):
+        response = yield from self.client.get(self.uri + 'status/404')
+        self.assertEqual(response.status_code, 404)
+
+
+class DropRequest(asyncio.Protocol):
+    """Read a request and close the connection without replying"""
+    def __init__(self, requests):
+        self.requests = requests
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        if b'\r\n\r\n' in self.buffer:
+            self.requests.append(self.buffer.split(b' HTTP/', 1)[0])
+            self.transport.close()
+
+
+class TestProxyRetry(unittest.TestCase):
+    proxy_app = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.requests = []
+        loop = get_event_loop()
+        cls.servers = []
+        upstreams = []
+        for _ in range(2):
+            server = yield from loop.create_server(
+                lambda: DropRequest(cls.requests), '127.0.0.1', 0)
+            cls.servers.append(server)
+            upstreams.append('http://%s:%s/' %
+                             server.sockets[0].getsockname())
+        proxy = Proxy('api/', upstreams, max_fails=100)
+        # request bodies are buffered before reaching the proxy
+        handler = wsgi.WsgiHandler([wsgi.wait_for_body_middleware, proxy])
+        s = wsgi.WSGIServer(handler, bind='127.0.0.1:0',
+                            concurrency=cls.cfg.concurrency,
+                            name='proxy-retry', workers=1)
+        cfg = yield from send('arbiter', 'run', s)
+        cls.proxy_app = cfg.app()
+        cls.uri = 'http://%s:%s/api/' % cfg.addresses[0]
+        cls.client = HttpClient()
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.close()
+        if cls.proxy_app is not None:
+            yield from send('arbiter', 'kill_actor', cls.proxy_app.name)
+
+    def received(self, request_line):
+        return len([r for r in self.requests if r == request_line])
+
+    def test_post_not_retried(self):
+        response = yield from self.client.post(self.uri + 'post',
+                                               data={'a': '1'})
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(self.received(b'POST /post'), 1)
+
+    def test_get_retried(self):
+        response = yield from self.client.get(self.uri + 'get')
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(self.received(b'GET /get'), 2)
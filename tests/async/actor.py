@@ -8,7 +8,8 @@ from functools import partial
 import pulsar
 from pulsar import (send, get_actor, CommandNotFound, async_while, TcpServer,
                     Connection)
-from pulsar.apps.test import ActorTestMixin, dont_run_with_thread
+from pulsar.apps.test import (ActorTestMixin, dont_run_with_thread,
+                              non_parallel)
 
 from examples.echo.manage import Echo, EchoServerProtocol
 
@@ -38,6 +39,7 @@ class create_echo_server(object):
         return actor
 
 
+@non_parallel
 class TestActorThread(ActorTestMixin, unittest.TestCase):
     concurrency = 'thread'
 
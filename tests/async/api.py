@@ -1,6 +1,8 @@
+import socket
 import unittest
 
 import pulsar
+from pulsar import get_event_loop, Protocol
 
 
 class Context(object):
@@ -36,3 +38,25 @@ class TestApi(unittest.TestCase):
         yield from self.async.assertRaises(pulsar.CommandNotFound,
                                            pulsar.send, 'arbiter',
                                            'sjdcbhjscbhjdbjsj', 'bla')
+
+    def test_drained(self):
+        loop = get_event_loop()
+        rsock, wsock = socket.socketpair()
+        rsock.setblocking(False)
+        transport, protocol = yield from loop.create_connection(
+            lambda: Protocol(loop), sock=wsock)
+        limits = transport.get_write_buffer_limits()
+        self.assertEqual(protocol.drained(), ())
+        data = 1024*1024*b'x'
+        protocol.write(data)
+        self.assertTrue(transport.get_write_buffer_size())
+        drained = protocol.drained()
+        self.assertFalse(drained.done())
+        received = 0
+        while received < len(data):
+            received += len((yield from loop.sock_recv(rsock, 65536)))
+        yield from drained
+        self.assertEqual(transport.get_write_buffer_size(), 0)
+        self.assertEqual(transport.get_write_buffer_limits(), limits)
+        transport.close()
+        rsock.close()
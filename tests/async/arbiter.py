@@ -8,7 +8,7 @@ from pulsar import (send, spawn, system, platform, ACTOR_ACTION_TIMEOUT,
                     MONITOR_TASK_PERIOD, multi_async)
 from pulsar.utils.pep import default_timer
 from pulsar.apps.test import (ActorTestMixin, dont_run_with_thread,
-                              test_timeout)
+                              test_timeout, non_parallel)
 
 
 def cause_timeout(actor):
@@ -48,6 +48,7 @@ def wait_for_stop(test, aid, terminating=False):
     return waiter
 
 
+@non_parallel
 class TestArbiterThread(ActorTestMixin, unittest.TestCase):
     concurrency = 'thread'
 
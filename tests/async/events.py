@@ -50,3 +50,29 @@ class TestFailure(unittest.TestCase):
         self.assertEqual(h.remove_callback('many', cbk), 1)
         self.assertEqual(h.remove_callback('many', cbk), 0)
         self.assertEqual(h.event('many').handlers, [])
+
+    def test_lazy_events(self):
+        h = Handler(one_time_events=('start', 'finish'),
+                    many_times_events=('data',))
+        self.assertEqual(h._events, {})
+        self.assertEqual(h.fire_event('data'), None)
+        fired = h.fire_event('finish', 'foo')
+        self.assertTrue(fired.done())
+        result = yield from fired
+        self.assertEqual(result, 'foo')
+        self.assertEqual(h._events, {})
+        self.assertEqual(h.fired_event('finish'), 1)
+        self.assertEqual(h.fired_event('start'), 0)
+        event = h.event('finish')
+        self.assertTrue(event.done())
+        self.assertEqual(event.fired(), 1)
+        result = yield from event
+        self.assertEqual(result, 'foo')
+        self.assertEqual(set(h.events), set(('start', 'finish', 'data')))
+
+    def test_fired_event_exception(self):
+        h = Handler(one_time_events=('finish',))
+        fired = h.fire_event('finish', exc=ValueError('bad'))
+        self.assertIsInstance(fired.exception(), ValueError)
+        self.assertRaises(ValueError, fired.result)
+        self.assertIsInstance(h.event('finish').exception(), ValueError)
@@ -0,0 +1,38 @@
+import unittest
+
+from pulsar import get_event_loop
+from pulsar.apps import wsgi
+
+
+def hello(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'Hello World!']
+
+
+class TestConsumerEvents(unittest.TestCase):
+    '''Events fired by the server consumer of a hello world WSGI request,
+    with events created lazily and with all events created upfront.'''
+    __benchmark__ = True
+    __number__ = 10000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cfg = wsgi.WSGIServer(no_fqdn=True).cfg
+        cls.loop = get_event_loop()
+
+    def _request(self, eager=False):
+        consumer = wsgi.HttpServerResponse(hello, self.cfg, loop=self.loop)
+        if eager:
+            consumer.events
+        consumer.fire_event('pre_request')
+        consumer.fire_event('data_received', data=b'')
+        consumer.fire_event('data_processed', data=b'')
+        consumer.fire_event('on_headers')
+        consumer.finished()
+
+    def test_request_lazy(self):
+        self._request()
+
+    def test_request_eager(self):
+        self._request(True)
+
@@ -0,0 +1,63 @@
+import unittest
+
+from pulsar.utils import httpurl
+
+try:
+    from http_parser.parser import HttpParser as CHttpParser
+except ImportError:     # pragma    nocover
+    CHttpParser = None
+
+
+class HttpPyParser(unittest.TestCase):
+    '''Parse a request line, headers and a chunked body split in
+    segments of different sizes.'''
+    __benchmark__ = True
+    __number__ = 100
+    _sizes = {'tiny': 2,
+              'small': 10,
+              'normal': 100,
+              'big': 1000,
+              'huge': 10000}
+
+    @classmethod
+    def setUpClass(cls):
+        nsize = cls._sizes[cls.cfg.size]
+        headers = b''.join((b'X-Header-' + str(n).encode('ascii') +
+                            b': ' + 40*b'v' + b'\r\n' for n in range(20)))
+        body = b''.join((b'40\r\n' + 64*b'x' + b'\r\n'
+                         for n in range(nsize)))
+        cls.message = (b'POST /bench?size=' + str(nsize).encode('ascii') +
+                       b' HTTP/1.1\r\nHost: localhost\r\n'
+                       b'Transfer-Encoding: chunked\r\n' + headers +
+                       b'\r\n' + body + b'0\r\n\r\n')
+
+    def parser(self):
+        return httpurl.HttpParser(kind=0)
+
+    def _parse(self, segment):
+        parser = self.parser()
+        data = self.message
+        for start in range(0, len(data), segment):
+            chunk = data[start:start+segment]
+            parser.execute(chunk, len(chunk))
+            parser.recv_body()
+        assert parser.is_message_complete()
+
+    def test_segments_16(self):
+        self._parse(16)
+
+    def test_segments_256(self):
+        self._parse(256)
+
+    def test_segments_4096(self):
+        self._parse(4096)
+
+    def test_whole_message(self):
+        self._parse(len(self.message))
+
+
+@unittest.skipUnless(CHttpParser, 'Requires the http-parser C extension')
+class HttpCParser(HttpPyParser):
+
+    def parser(self):
+        return CHttpParser(kind=0)
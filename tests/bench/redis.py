@@ -1,4 +1,4 @@
-from random import randint, choice
+from random import choice
 import string
 import unittest
 
@@ -28,6 +28,12 @@ class RedisPyParser(unittest.TestCase):
                            ).encode('utf-8') for s in range(nsize)]
         cls.parser = redis_parser(cls.redis_py_parser)()
         cls.chunk = cls.parser.multi_bulk(cls.data)
+        # A pipeline of SET commands and a large bulk string
+        cls.pipeline = cls.parser.pack_pipeline(
+            ((('set', key, value), None) for key, value in
+             zip(cls.data, cls.data_bytes))) * 10
+        cls.pipeline_size = 10*nsize
+        cls.large_bulk = cls.parser.bulk(100*nsize*b'x')
 
     def test_pack_command(self):
         self.parser.pack_command(self.data)
@@ -42,6 +48,27 @@ class RedisPyParser(unittest.TestCase):
         self.parser.feed(self.chunk)
         result = self.parser.get()
 
+    def test_decode_pipeline(self):
+        parser = self.parser
+        parser.feed(self.pipeline)
+        for _ in range(self.pipeline_size):
+            parser.get()
+
+    def test_decode_pipeline_segments(self):
+        parser = self.parser
+        data = self.pipeline
+        for start in range(0, len(data), 4096):
+            parser.feed(data[start:start+4096])
+            while parser.get() is not False:
+                pass
+
+    def test_decode_large_bulk(self):
+        parser = self.parser
+        data = self.large_bulk
+        for start in range(0, len(data), 65536):
+            parser.feed(data[start:start+65536])
+        parser.get()
+
 
 @unittest.skipUnless(HAS_C_EXTENSIONS, 'Requires C extensions')
 class RedisCParser(RedisPyParser):
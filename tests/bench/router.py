@@ -0,0 +1,35 @@
+import unittest
+
+from pulsar.apps.wsgi import Router
+
+
+class TestRouterResolve(unittest.TestCase):
+    '''Resolve paths in routers with 10, 100 and 1000 child routes'''
+    __benchmark__ = True
+    __number__ = 1000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.routers = {}
+        cls.paths = {}
+        for size in (10, 100, 1000):
+            router = Router('/')
+            for n in range(size):
+                router.add_child(Router('api/r%s/<int:id>' % n))
+            cls.routers[size] = router
+            cls.paths[size] = ['api/r%s/%s' % (n, n) for n in
+                               range(0, size, size // 10)]
+
+    def _resolve(self, size):
+        router = self.routers[size]
+        for path in self.paths[size]:
+            assert router.resolve(path)
+
+    def test_resolve_10(self):
+        self._resolve(10)
+
+    def test_resolve_100(self):
+        self._resolve(100)
+
+    def test_resolve_1000(self):
+        self._resolve(1000)
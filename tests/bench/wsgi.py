@@ -0,0 +1,27 @@
+import socket
+import unittest
+
+from pulsar.apps.wsgi import test_wsgi_environ, FqdnCache
+
+
+class TestWsgiEnviron(unittest.TestCase):
+    '''Build WSGI environ with and without the SERVER_NAME cache'''
+    __benchmark__ = True
+    __number__ = 1000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.headers = [('host', 'localhost:8080'),
+                       ('user-agent', 'pulsar'),
+                       ('accept', '*/*')]
+        cls.cache = FqdnCache()
+        test_wsgi_environ(headers=cls.headers, resolver=cls.cache)
+
+    def test_environ_no_cache(self):
+        test_wsgi_environ(headers=self.headers, resolver=socket.getfqdn)
+
+    def test_environ_cache(self):
+        test_wsgi_environ(headers=self.headers, resolver=self.cache)
+
+    def test_environ_no_fqdn(self):
+        test_wsgi_environ(headers=self.headers, resolver=str)
@@ -0,0 +1,57 @@
+import unittest
+from random import randint
+
+from pulsar.utils.structures import Zset
+
+
+def remove_linear(zset, member):
+    '''Member removal by scanning the members sharing its score, the
+    algorithm used before the skiplist was ordered by score and member.
+    '''
+    score = zset._dict.pop(member)
+    sl = zset._sl
+    index = sl.rank(score)
+    for i, value in enumerate(sl.range(index)):
+        if value == member:
+            sl.remove_range(index + i, index + i + 1)
+            return score
+
+
+class TestZset(unittest.TestCase):
+    '''Leaderboard like sorted set where members share a few scores
+    '''
+    __benchmark__ = True
+    __number__ = 100
+    _sizes = {'tiny': 100,
+              'small': 1000,
+              'normal': 10000,
+              'big': 50000,
+              'huge': 200000}
+
+    @classmethod
+    def setUpClass(cls):
+        size = cls._sizes[cls.cfg.size]
+        cls.members = [('member%s' % n).encode('utf-8') for n in range(size)]
+        cls.zset = Zset(((randint(0, 10), m) for m in cls.members))
+
+    def member(self):
+        return self.members[randint(0, len(self.members)-1)]
+
+    def test_remove(self):
+        member = self.member()
+        self.zset.add(self.zset.remove(member), member)
+
+    def test_remove_linear(self):
+        member = self.member()
+        self.zset.add(remove_linear(self.zset, member), member)
+
+    def test_rank(self):
+        self.zset.rank(self.member())
+
+    def test_range_offset(self):
+        start = len(self.zset) - 10
+        list(self.zset.range(start, start + 10))
+
+    def test_range_by_score_offset(self):
+        list(self.zset.range_by_score(5, 10, start=len(self.zset)//3,
+                                      num=10))
@@ -13,6 +13,8 @@ from pulsar.apps.http import (HttpClient, TooManyRedirects, HttpResponse,
                               HTTPError)
 
 __test__ = False
+ASSET_DIR = os.path.join(os.path.dirname(examples.__file__), 'httpbin',
+                         'assets')
 
 
 def dodgyhook(response, exc=None):
@@ -251,6 +253,15 @@ class TestHttpClient(TestHttpClientBase, unittest.TestCase):
         if 'content-encoding' in response.headers:
             self.assertTrue(response.headers['content-encoding'], 'gzip')
 
+    def test_200_gzip_stream(self):
+        http = self._client
+        response = yield from http.get(self.httpbin('gzip', 'stream',
+                                                    '1000', '10'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertTrue(response.parser.is_chunked())
+        self.assertEqual(response.get_content(), 10000*b'a')
+
     def test_post(self):
         data = (('bla', 'foo'), ('unz', 'whatz'),
                 ('numero', '1'), ('numero', '2'))
@@ -553,6 +564,72 @@ class TestHttpClient(TestHttpClientBase, unittest.TestCase):
         self.assertEqual(response.status_code, 304)
         self.assertFalse('Content-length' in response.headers)
 
+    def test_media_file_etag(self):
+        http = self._client
+        response = yield from http.get(self.httpbin('media/httpbin.js'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['accept-ranges'], 'bytes')
+        etag = response.headers['etag']
+        self.assertTrue(etag.startswith('"'))
+        with open(os.path.join(ASSET_DIR, 'httpbin.js'), 'rb') as f:
+            self.assertEqual(response.get_content(), f.read())
+        response = yield from http.get(self.httpbin('media/httpbin.js'),
+                                       headers=[('If-None-Match', etag)])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['etag'], etag)
+        response = yield from http.get(self.httpbin('media/httpbin.js'),
+                                       headers=[('If-None-Match', '"x"')])
+        self.assertEqual(response.status_code, 200)
+
+    def test_media_file_range(self):
+        http = self._client
+        with open(os.path.join(ASSET_DIR, 'httpbin.js'), 'rb') as f:
+            data = f.read()
+        response = yield from http.get(self.httpbin('media/httpbin.js'),
+                                       headers=[('Range', 'bytes=10-29')])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['content-range'],
+                         'bytes 10-29/%d' % len(data))
+        self.assertEqual(response.get_content(), data[10:30])
+        etag = response.headers['etag']
+        response = yield from http.get(self.httpbin('media/httpbin.js'),
+                                       headers=[('Range', 'bytes=-5'),
+                                                ('If-Range', etag)])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.get_content(), data[-5:])
+        response = yield from http.get(self.httpbin('media/httpbin.js'),
+                                       headers=[('Range', 'bytes=-5'),
+                                                ('If-Range', '"x"')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_content(), data)
+        response = yield from http.get(
+            self.httpbin('media/httpbin.js'),
+            headers=[('Range', 'bytes=%d-' % len(data))])
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['content-range'],
+                         'bytes */%d' % len(data))
+
+    def test_cached_media_file(self):
+        http = self._client
+        with open(os.path.join(ASSET_DIR, 'httpbin.js'), 'rb') as f:
+            data = f.read()
+        for _ in range(2):
+            response = yield from http.get(self.httpbin('cached/httpbin.js'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['content-encoding'], 'gzip')
+            self.assertEqual(response.headers['vary'], 'Accept-Encoding')
+            self.assertEqual(response.get_content(), data)
+        etag = response.headers['etag']
+        self.assertTrue(etag.endswith('-gzip"'))
+        response = yield from http.get(self.httpbin('cached/httpbin.js'),
+                                       headers=[('If-None-Match', etag)])
+        self.assertEqual(response.status_code, 304)
+        response = yield from http.get(self.httpbin('cached/httpbin.js'),
+                                       headers=[('Range', 'bytes=0-9')])
+        self.assertEqual(response.status_code, 206)
+        self.assertFalse('content-encoding' in response.headers)
+        self.assertEqual(response.get_content(), data[:10])
+
     def test_http_get_timeit(self):
         N = 10
         client = self._client
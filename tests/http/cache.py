@@ -0,0 +1,157 @@
+import time
+import unittest
+
+from pulsar import multi_async
+from pulsar.apps.http import LRUCache
+from pulsar.apps.http.cache import (CacheEntry, cache_key,
+                                    freshness_lifetime)
+from pulsar.utils.httpurl import Headers, http_date
+
+from . import base
+
+
+class TestHttpCache(base.TestHttpClientBase, unittest.TestCase):
+
+    @classmethod
+    def client(cls, **kwargs):
+        kwargs.setdefault('cache', True)
+        return super(TestHttpCache, cls).client(**kwargs)
+
+    def test_cache_default(self):
+        http = self.client()
+        self.assertIsInstance(http.cache, LRUCache)
+        self.assertEqual(http.cache_stats,
+                         {'hits': 0, 'misses': 0, 'revalidations': 0})
+        http = self.client(cache=None)
+        self.assertEqual(http.cache, None)
+
+    def test_fresh(self):
+        http = self.client()
+        response = yield from http.get(self.httpbin('cache', '60'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.from_cache)
+        data = response.json()
+        response = yield from http.get(self.httpbin('cache', '60'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.from_cache)
+        self.assertEqual(response.json(), data)
+        self.assertEqual(response.headers['cache-control'],
+                         'public, max-age=60')
+        self.assertEqual(http.cache_stats['hits'], 1)
+        self.assertEqual(http.cache_stats['misses'], 1)
+        self.assertEqual(http.requests_processed, 1)
+
+    def test_not_stored(self):
+        http = self.client()
+        response = yield from http.get(self.httpbin('get'))
+        self.assertEqual(response.status_code, 200)
+        response = yield from http.get(self.httpbin('get'))
+        self.assertFalse(response.from_cache)
+        self.assertEqual(http.cache_stats['misses'], 2)
+        self.assertEqual(len(http.cache), 0)
+
+    def test_revalidate(self):
+        http = self.client()
+        response = yield from http.get(self.httpbin('cache'))
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['etag']
+        data = response.json()
+        self.assertFalse('If-None-Match' in data['headers'])
+        response = yield from http.get(self.httpbin('cache'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.from_cache)
+        self.assertEqual(response.json(), data)
+        self.assertEqual(response.request.headers['if-none-match'], etag)
+        self.assertEqual(http.cache_stats['revalidations'], 1)
+        self.assertEqual(http.requests_processed, 2)
+
+    def test_no_cache_request(self):
+        http = self.client()
+        yield from http.get(self.httpbin('cache', '60'))
+        response = yield from http.get(self.httpbin('cache', '60'),
+                                       headers=[('cache-control',
+                                                 'no-store')])
+        self.assertFalse(response.from_cache)
+        self.assertEqual(http.cache_stats['hits'], 0)
+
+    def test_invalidate(self):
+        http = self.client()
+        url = self.httpbin('post')
+        http.cache.set(cache_key('GET', url),
+                       CacheEntry(200, [], b'', {}, time.time() + 60))
+        response = yield from http.post(url, data={'a': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(http.cache), 0)
+
+    def test_shared_authorization(self):
+        cache = LRUCache()
+        cache.shared = True
+        http = self.client(cache=cache)
+        url = self.httpbin('cache', '60')
+        headers = [('authorization', 'Basic YTpi')]
+        yield from http.get(url, headers=headers)
+        response = yield from http.get(url, headers=headers)
+        self.assertFalse(response.from_cache)
+        self.assertEqual(len(cache), 0)
+        yield from http.get(url)
+        self.assertEqual(len(cache), 1)
+
+    def test_shared_private(self):
+        http = self.client()
+        response = yield from http.get(self.httpbin('cache', '60'))
+        response.headers['cache-control'] = 'private, max-age=60'
+        self.assertTrue(CacheEntry.from_response(response))
+        self.assertEqual(CacheEntry.from_response(response, True), None)
+
+    def test_coalesce(self):
+        http = self.client()
+        url = self.httpbin('cache', '60')
+        responses = yield from multi_async([http.get(url) for _ in range(5)])
+        self.assertEqual(len(set(responses)), 1)
+        self.assertEqual(http.requests_processed, 1)
+        self.assertEqual(http.cache_stats['misses'], 1)
+
+    def test_lru(self):
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        cache.delete('a')
+        self.assertEqual(cache.get('a'), None)
+
+    def test_freshness_lifetime(self):
+        now = time.time()
+        self.assertEqual(freshness_lifetime(Headers()), 0)
+        headers = Headers([('cache-control', 'max-age=40')])
+        self.assertEqual(freshness_lifetime(headers), 40)
+        headers = Headers([('cache-control', 'no-store')])
+        self.assertEqual(freshness_lifetime(headers), None)
+        headers = Headers([('date', http_date(now)),
+                           ('expires', http_date(now + 100))])
+        self.assertEqual(freshness_lifetime(headers), 100)
+        headers = Headers([('expires', '0')])
+        self.assertEqual(freshness_lifetime(headers), 0)
+
+    def test_entry_revalidated(self):
+        entry = CacheEntry(200, [('ETag', '"a"'), ('Content-Length', '3')],
+                           b'abc', {}, 0)
+        self.assertFalse(entry.is_fresh())
+        self.assertEqual(entry.validators(), [('If-None-Match', '"a"')])
+        entry = entry.revalidated([('Cache-Control', 'max-age=60'),
+                                   ('Content-Length', '0')])
+        self.assertTrue(entry.is_fresh())
+        self.assertEqual(entry.body, b'abc')
+        self.assertEqual(Headers(entry.headers)['content-length'], '3')
+
+    def test_entry_bytes(self):
+        entry = CacheEntry(200, [('ETag', '"a"')], b'\x00\xff', {'a': None},
+                           time.time())
+        value = entry.to_bytes()
+        self.assertIsInstance(value, bytes)
+        copy = CacheEntry.from_bytes(value)
+        for name in CacheEntry.__slots__:
+            self.assertEqual(getattr(copy, name), getattr(entry, name))
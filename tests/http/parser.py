@@ -167,6 +167,34 @@ class TestPythonHttpParser(unittest.TestCase):
         data = b'HTTP/1.1 200 Connection established\r\n\r\n'
         self.assertEqual(p.execute(data, len(data)), len(data))
 
+    def test_segmented_chunked_message(self):
+        headers = b''.join((b'X-Header-' + str(n).encode('ascii') +
+                            b': value\r\n' for n in range(10)))
+        body = b''.join((b'%x\r\n' % n + n*b'x' + b'\r\n'
+                         for n in range(1, 30)))
+        data = (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n' +
+                headers + b'\r\n' + body + b'0\r\n\r\n')
+        for segment in (1, 2, 3, 7, 64):
+            p = self.parser(kind=1)
+            received = []
+            for start in range(0, len(data), segment):
+                chunk = data[start:start+segment]
+                self.assertEqual(p.execute(chunk, len(chunk)), len(chunk))
+                received.append(p.recv_body())
+            self.assertTrue(p.is_headers_complete())
+            self.assertTrue(p.is_chunked())
+            self.assertTrue(p.is_message_complete())
+            self.assertEqual(len(p.get_headers()), 11)
+            self.assertEqual(b''.join(received), 435*b'x')
+
+    def test_chunked_trailers(self):
+        p = self.parser(kind=1)
+        data = (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'5\r\nhello\r\n0\r\nX-Trailer: foo\r\n\r\n')
+        self.assertEqual(p.execute(data, len(data)), len(data))
+        self.assertTrue(p.is_message_complete())
+        self.assertEqual(p.recv_body(), b'hello')
+
 
 @unittest.skipUnless(hasextensions, 'Requires C extensions')
 class TestCHttpParser(TestPythonHttpParser):
@@ -0,0 +1,106 @@
+import os
+import asyncio
+import tempfile
+import unittest
+
+from pulsar.apps.http import HttpStream, ResponseTooLarge
+
+from . import base
+
+
+class TestHttpStream(base.TestHttpClientBase, unittest.TestCase):
+
+    def test_stream(self):
+        http = self.client()
+        response = yield from http.get(self.httpbin('stream/3000/20'),
+                                       stream=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.stream, HttpStream)
+        self.assertRaises(RuntimeError, response.get_content)
+        body = []
+        while True:
+            data = yield from response.stream.read()
+            if not data:
+                break
+            body.append(data)
+        self.assertEqual(b''.join(body), b'a' * 60000)
+        self.assertTrue(response.stream.done)
+        self.assertEqual(response.stream.buffered, 0)
+        yield from response.on_finished
+        # the connection is back in the pool
+        self._check_pool(http, response)
+
+    def test_stream_flow_control(self):
+        http = self.client()
+        response = yield from http.get(self.httpbin('stream/100000/20'),
+                                       stream=True)
+        stream = response.stream
+        stream.high_limit = 100000
+        stream.low_limit = 0
+        # without reading, the transport is paused once the buffer is full
+        while not (stream._paused or stream.done):
+            yield from asyncio.sleep(0.01)
+        self.assertTrue(stream._paused)
+        yield from asyncio.sleep(0.1)
+        self.assertTrue(stream.buffered < 2000000)
+        size = 0
+        while True:
+            data = yield from stream.read()
+            if not data:
+                break
+            size += len(data)
+        self.assertFalse(stream._paused)
+        self.assertEqual(size, 2000000)
+
+    def test_download_to(self):
+        http = self.client()
+        response = yield from http.get(self.httpbin('stream/3000/10'),
+                                       stream=True)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            size = yield from response.download_to(path)
+            self.assertEqual(size, 30000)
+            with open(path, 'rb') as fp:
+                self.assertEqual(fp.read(), b'a' * 30000)
+        finally:
+            os.remove(path)
+
+    def test_download_to_not_streamed(self):
+        http = self.client()
+        response = yield from http.get(self.httpbin('stream/3000/10'))
+        self.assertEqual(response.stream, None)
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            size = yield from response.download_to(path)
+            self.assertEqual(size, 30000)
+            with open(path, 'rb') as fp:
+                self.assertEqual(fp.read(), response.get_content())
+        finally:
+            os.remove(path)
+
+    def test_stream_redirect(self):
+        http = self.client()
+        response = yield from http.get(self.httpbin('redirect', '1'),
+                                       stream=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.history), 1)
+        self.assertEqual(response.history[0].stream, None)
+        self.assertIsInstance(response.stream, HttpStream)
+        size = yield from response.download_to(os.devnull)
+        self.assertTrue(size)
+
+    def test_max_buffer(self):
+        http = self.client(max_buffer=1000)
+        yield from self.async.assertRaises(
+            ResponseTooLarge, http.get, self.httpbin('getsize/5000'))
+        yield from self.async.assertRaises(
+            ResponseTooLarge, http.get, self.httpbin('stream/300/10'))
+        response = yield from http.get(self.httpbin('getsize/5000'),
+                                       max_buffer=None)
+        self.assertEqual(response.status_code, 200)
+        response = yield from http.get(self.httpbin('stream/300/10'),
+                                       stream=True)
+        size = yield from response.download_to(os.devnull)
+        self.assertEqual(size, 3000)
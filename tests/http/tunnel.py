@@ -1,4 +1,8 @@
+import unittest
+
+from pulsar import get_event_loop
 from pulsar.utils.httpurl import urlparse
+from pulsar.apps.http import HttpClient, HttpRequest, HttpResponse
 
 from . import base
 
@@ -8,3 +12,34 @@ from . import base
 class TestTlsHttpClientWithProxy(base.TestHttpClient):
     with_proxy = True
     with_tls = True
+
+
+class Transport:
+
+    def __init__(self):
+        self.data = []
+
+    def write(self, data):
+        self.data.append(data)
+
+
+class Connection:
+
+    def __init__(self):
+        self.transport = Transport()
+
+
+class TestHttpTunnel(unittest.TestCase):
+
+    def test_start_tunnel(self):
+        client = HttpClient(proxy_info={'https': 'http://127.0.0.1:8080'})
+        request = HttpRequest(client, 'https://www.example.com/', 'get')
+        tunnel = request._tunnel
+        self.assertTrue(tunnel)
+        self.assertEqual(tunnel.data, None)
+        response = HttpResponse(get_event_loop())
+        response._connection = Connection()
+        response._request = tunnel
+        response.start_request()
+        data = b''.join(response._connection.transport.data)
+        self.assertTrue(data.startswith(b'CONNECT www.example.com:443 '))
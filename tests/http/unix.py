@@ -0,0 +1,49 @@
+import os
+import socket
+import tempfile
+import unittest
+
+from pulsar import send
+from pulsar.utils.httpurl import quote
+from pulsar.utils.string import random_string
+
+from . import base
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'),
+                     'Requires unix domain sockets')
+class TestUnixSocketHttpClient(base.TestHttpClientBase, unittest.TestCase):
+    with_httpbin = False
+
+    @classmethod
+    def setUpClass(cls):
+        from examples.httpbin import manage
+        cls.socket_file = os.path.join(
+            tempfile.gettempdir(), '%s.sock' % random_string(8, 8))
+        s = manage.server(bind='unix:%s' % cls.socket_file,
+                          concurrency=cls.concurrency or cls.cfg.concurrency,
+                          name='httpbin-%s' % cls.__name__.lower(),
+                          workers=1)
+        cfg = yield from send('arbiter', 'run', s)
+        cls.app = cfg.app()
+        cls.uri = 'http+unix://%s/' % quote(cfg.addresses[0], safe='')
+        yield from super(TestUnixSocketHttpClient, cls).setUpClass()
+
+    def test_get(self):
+        http = self.client()
+        response = yield from http.get(self.httpbin('get'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.request.address, (self.socket_file, None))
+        result = response.json()
+        self.assertEqual(result['headers']['Host'], 'localhost')
+        self._check_pool(http, response)
+        response = yield from http.get(self.httpbin('get'))
+        self.assertEqual(response.status_code, 200)
+        self._check_pool(http, response, processed=2)
+
+    def test_post(self):
+        http = self.client()
+        data = (('numero', '1'), ('numero', '2'))
+        response = yield from http.post(self.httpbin('post'), data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['args']['numero'], ['1', '2'])
@@ -134,6 +134,34 @@ class TestParser(unittest.TestCase):
         self.assertEqual(res2[0], b'100')
         self.assertEqual(res2[1], result[1])
 
+    def test_pipeline_segments(self):
+        p = self.parser()
+        commands = [(('set', 'key%s' % n, 'value%s' % n), None)
+                    for n in range(1000)]
+        data = p.pack_pipeline(commands)
+        results = []
+        while data:
+            chunk, data = data[:7], data[7:]
+            p.feed(chunk)
+            result = p.get()
+            while result is not False:
+                results.append(result)
+                result = p.get()
+        self.assertEqual(len(results), 1000)
+        self.assertEqual(results[-1], [b'set', b'key999', b'value999'])
+        self.assertEqual(p.buffer(), b'')
+
+    def test_pending(self):
+        p = self.parser()
+        self.assertFalse(p.pending())
+        data = p.pack_command(('set', 'key', 'value'))
+        p.feed(data[:-4])
+        self.assertEqual(p.get(), False)
+        self.assertTrue(p.pending())
+        p.feed(data[-4:])
+        self.assertEqual(p.get(), [b'set', b'key', b'value'])
+        self.assertFalse(p.pending())
+
     # CLIENT ENCODERS
     def test_encode_commands(self):
         p = self.parser()
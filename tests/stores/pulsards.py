@@ -1,4 +1,7 @@
+import os
 import binascii
+import socket
+import tempfile
 import time
 import unittest
 import asyncio
@@ -7,6 +10,7 @@ import pulsar
 from pulsar.utils.string import random_string
 from pulsar.utils.structures import Zset
 from pulsar.apps.ds import PulsarDS, redis_parser, ResponseError
+from pulsar.apps.ds import snapshot
 from pulsar.apps.data import create_store
 
 
@@ -33,11 +37,14 @@ class StringProtocol:
 
 class StoreMixin(object):
     redis_py_parser = False
+    multiplex = False
 
     @classmethod
     def create_store(cls, address, namespace=None, pool_size=2, **kw):
         if cls.redis_py_parser:
             kw['parser_class'] = redis_parser(True)
+        if cls.multiplex:
+            kw['multiplex'] = True
         if not namespace:
             namespace = cls.randomkey(6).lower()
         return create_store(address, namespace=namespace,
@@ -80,6 +87,9 @@ class RedisCommands(StoreMixin):
             ResponseError, c.restore, key, 0, 'bla')
         yield from eq(c.restore(key+'2', 0, value), True)
         yield from eq(c.get(key+'2'), b'hello')
+        yield from eq(c.restore(key+'3', 50000, value), True)
+        ttl = yield from c.pttl(key+'3')
+        self.assertTrue(0 < ttl <= 50000)
 
     def test_exists(self):
         key = self.randomkey()
@@ -88,6 +98,7 @@ class RedisCommands(StoreMixin):
         yield from eq(c.exists(key), False)
         yield from eq(c.set(key, 'hello'), True)
         yield from eq(c.exists(key), True)
+        yield from eq(c.exists(key, key + '2', key), 2)
         yield from eq(c.delete(key), 1)
 
     def test_expire_persist_ttl(self):
@@ -121,6 +132,17 @@ class RedisCommands(StoreMixin):
         yield from eq(c.ttl(key), -1)
         yield from eq(c.persist(key), False)
 
+    def test_pexpire_lazy(self):
+        key = self.randomkey()
+        c = self.client
+        eq = self.async.assertEqual
+        yield from eq(c.set(key, 1), True)
+        yield from eq(c.pexpire(key, 50), True)
+        yield from asyncio.sleep(0.1)
+        yield from eq(c.exists(key), False)
+        yield from eq(c.ttl(key), -2)
+        yield from eq(c.get(key), None)
+
     def test_keys(self):
         key = self.randomkey()
         keya = '%s_a' % key
@@ -137,6 +159,60 @@ class RedisCommands(StoreMixin):
         self.assertEqual(set(k1), keys_with_underscores)
         self.assertEqual(set(k2), keys)
 
+    def _scan(self, command, *key, match=None, count=10):
+        cursor, result = b'0', []
+        options = ('count', count)
+        if match:
+            options += ('match', match)
+        while True:
+            cursor, elements = yield from self.client.execute(
+                command, *(key + (cursor,) + options))
+            result.extend(elements)
+            if cursor == b'0':
+                break
+        return result
+
+    def test_scan(self):
+        key = self.randomkey()
+        c = self.client
+        keys = set(('%s_%s' % (key, n)).encode('utf-8') for n in range(25))
+        yield from c.mset(*[v for k in keys for v in (k, 1)])
+        result = yield from self._scan('scan', match='%s_*' % key)
+        self.assertEqual(set(result), keys)
+        result = yield from self._scan('scan', match='%s_1?' % key)
+        self.assertEqual(len(result), 10)
+
+    def test_hscan(self):
+        key = self.randomkey()
+        c = self.client
+        fields = dict((('f%s' % n).encode('utf-8'), str(n).encode('utf-8'))
+                      for n in range(30))
+        yield from c.hmset(key, fields)
+        result = yield from self._scan('hscan', key, count=7)
+        self.assertEqual(len(result), 60)
+        self.assertEqual(dict(zip(result[::2], result[1::2])), fields)
+        result = yield from self._scan('hscan', key, match='f2*')
+        self.assertEqual(len(result), 22)
+
+    def test_sscan(self):
+        key = self.randomkey()
+        c = self.client
+        members = set(('m%s' % n).encode('utf-8') for n in range(30))
+        yield from c.sadd(key, *members)
+        result = yield from self._scan('sscan', key, count=4)
+        self.assertEqual(set(result), members)
+        yield from self.async.assertEqual(c.execute('sscan', 'foo', 0),
+                                          [b'0', []])
+
+    def test_zscan(self):
+        key = self.randomkey()
+        c = self.client
+        yield from c.zadd(key, *[v for n in range(20) for v in (n, n)])
+        result = yield from self._scan('zscan', key, count=6)
+        self.assertEqual(len(result), 40)
+        scores = dict(zip(result[::2], result[1::2]))
+        self.assertEqual(float(scores[b'7']), 7)
+
     def __test_move(self):
         key = self.randomkey()
         c = self.client
@@ -1095,6 +1171,87 @@ class TestPulsarStore(RedisCommands, unittest.TestCase):
         if cls.app_cfg is not None:
             return pulsar.send('arbiter', 'kill_actor', cls.app_cfg.name)
 
+    def test_info_expire_cycle(self):
+        info = yield from self.client.info()
+        self.assertTrue(info['expire_cycles'] >= 1)
+        self.assertTrue('expire_cycle_keys' in info)
+        self.assertTrue('expire_cycle_time_ms' in info)
+
+    def test_reply_coalescing(self):
+        key = self.randomkey()
+        pipe = self.client.pipeline()
+        for n in range(10):
+            pipe.rpush(key, n)
+        result = yield from pipe.commit()
+        self.assertEqual(result, list(range(1, 11)))
+        info = yield from self.client.info()
+        self.assertTrue(info['reply_writes_saved'] >= 11)
+        self.assertTrue(info['reply_writes_saved_per_batch'] > 0)
+        clients = yield from self.client.execute('client', 'list')
+        self.assertTrue(b'writes_saved=' in clients)
+
+    def test_object_encoding(self):
+        key = self.randomkey()
+        c = self.client
+        yield from c.hmset(key, {'a': '1', 'b': '2'})
+        yield from self.async.assertEqual(
+            c.execute('object', 'encoding', key), b'listpack')
+        yield from c.hset(key, 'c', 100*'x')
+        yield from self.async.assertEqual(
+            c.execute('object', 'encoding', key), b'hashtable')
+        yield from c.hdel(key, 'c')
+        yield from self.async.assertEqual(
+            c.execute('object', 'encoding', key), b'listpack')
+        yield from c.rpush(key + 'l', *range(200))
+        yield from self.async.assertEqual(
+            c.execute('object', 'encoding', key + 'l'), b'linkedlist')
+        yield from self.async.assertEqual(
+            c.execute('object', 'encoding', key + 'x'), None)
+
+    def test_memory_usage(self):
+        key = self.randomkey()
+        c = self.client
+        yield from c.set(key, 1000*'x')
+        usage = yield from c.execute('memory', 'usage', key)
+        self.assertTrue(usage > 1000)
+        yield from self.async.assertEqual(
+            c.execute('memory', 'usage', key + 'x'), None)
+        info = yield from c.execute('info', 'memory')
+        self.assertEqual(info['maxmemory'], 0)
+        self.assertEqual(info['maxmemory_policy'], 'noeviction')
+
+    def test_scan_while_deleting(self):
+        key = self.randomkey()
+        c = self.client
+        members = ['m%s' % n for n in range(40)]
+        yield from c.sadd(key, *members)
+        cursor, first = yield from c.execute('sscan', key, 0, 'count', 10)
+        self.assertNotEqual(cursor, b'0')
+        yield from c.srem(key, *members[:20])
+        yield from c.sadd(key, 'new')
+        result = list(first)
+        while cursor != b'0':
+            cursor, elements = yield from c.execute('sscan', key, cursor,
+                                                    'count', 10)
+            result.extend(elements)
+        self.assertTrue(set(m.encode('utf-8') for m in members[20:]) <=
+                        set(result))
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'sscan', key, 2**64)
+
+    def test_info_persistence(self):
+        info = yield from self.client.execute('info', 'persistence')
+        self.assertEqual(info['loading'], 0)
+        self.assertTrue('rdb_last_save_duration_sec' in info)
+        self.assertTrue('rdb_last_save_size' in info)
+        self.assertFalse('keyspace_hits' in info)
+        self.assertEqual(info['aof_enabled'], 0)
+
+    def test_bgrewriteaof_disabled(self):
+        yield from self.async.assertRaises(ResponseError,
+                                           self.client.execute,
+                                           'bgrewriteaof')
+
     def test_store_methods(self):
         store = self.create_store('%s/8' % self.pulsards_uri)
         self.assertEqual(store.database, 8)
@@ -1108,3 +1265,377 @@ class TestPulsarStore(RedisCommands, unittest.TestCase):
 @unittest.skipUnless(pulsar.HAS_C_EXTENSIONS, 'Requires cython extensions')
 class TestPulsarStorePyParser(TestPulsarStore):
     redis_py_parser = True
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'),
+                     'Requires unix domain sockets')
+class TestPulsarStoreUnixSocket(TestPulsarStore):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.socket_file = os.path.join(tempfile.gettempdir(),
+                                       '%s.sock' % cls.randomkey(8))
+        server = PulsarDS(name=cls.__name__.lower(),
+                          bind='unix:%s' % cls.socket_file,
+                          concurrency=cls.cfg.concurrency)
+        cls.app_cfg = yield from pulsar.send('arbiter', 'run', server)
+        cls.pulsards_uri = 'unix+pulsar://%s' % cls.app_cfg.addresses[0]
+        cls.store = cls.create_store('%s?database=9' % cls.pulsards_uri)
+        cls.client = cls.store.client()
+
+    def test_store_methods(self):
+        store = self.create_store('%s?database=8' % self.pulsards_uri)
+        self.assertEqual(store._host, self.socket_file)
+        self.assertEqual(store.database, 8)
+        store.database = 10
+        self.assertTrue(store.dns.startswith('%s?database=10' %
+                                             self.pulsards_uri))
+        store = self.create_store(store.dns)
+        self.assertEqual(store.database, 10)
+        yield from self.async.assertEqual(store.client().ping(), True)
+
+
+class TestPulsarStoreMultiplexed(TestPulsarStore):
+    multiplex = True
+
+    def test_multiplexed(self):
+        key = self.randomkey()
+        # A store of its own, other tests share the class multiplexer
+        store = self.create_store('%s/9' % self.pulsards_uri)
+        c = store.client()
+        multiplexer = store._multiplexer
+        commands, writes = multiplexer.commands, multiplexer.writes
+        result = yield from asyncio.gather(*[c.incr(key) for _ in range(100)])
+        self.assertEqual(sorted(result), list(range(1, 101)))
+        self.assertEqual(multiplexer.commands - commands, 100)
+        self.assertTrue(multiplexer.writes - writes < 10)
+        yield from self.async.assertRaises(ResponseError, c.lpush, key, 1)
+        yield from self.async.assertEqual(c.get(key), b'100')
+        store.close()
+
+
+class TestPulsarStoreEviction(StoreMixin, unittest.TestCase):
+    app_cfg = None
+
+    @classmethod
+    def setUpClass(cls):
+        server = PulsarDS(name=cls.__name__.lower(),
+                          bind='127.0.0.1:0',
+                          concurrency=cls.cfg.concurrency,
+                          key_value_maxmemory='1mb',
+                          key_value_maxmemory_policy='allkeys-lru')
+        cls.app_cfg = yield from pulsar.send('arbiter', 'run', server)
+        cls.pulsards_uri = 'pulsar://%s:%s' % cls.app_cfg.addresses[0]
+        cls.store = cls.create_store('%s/9' % cls.pulsards_uri)
+        cls.client = cls.store.client()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.app_cfg is not None:
+            return pulsar.send('arbiter', 'kill_actor', cls.app_cfg.name)
+
+    def test_evict(self):
+        c = self.client
+        key = self.randomkey()
+        yield from c.set(key, 'hot')
+        for n in range(2000):
+            yield from c.set('%s%s' % (key, n), 1000*'x')
+            yield from c.get(key)
+        info = yield from c.execute('info', 'memory')
+        self.assertTrue(info['used_memory'] <= 1024*1024)
+        self.assertTrue(info['used_memory_string'] > 0)
+        info = yield from c.info()
+        self.assertTrue(info['evicted_keys'] > 0)
+        yield from self.async.assertEqual(c.get(key), b'hot')
+        yield from self.async.assertEqual(c.get('%s0' % key), None)
+        idle = yield from c.execute('object', 'idletime', key)
+        self.assertEqual(idle, 0)
+
+
+class TestPulsarStoreClientCache(StoreMixin, unittest.TestCase):
+    app_cfg = None
+
+    @classmethod
+    def setUpClass(cls):
+        server = PulsarDS(name=cls.__name__.lower(),
+                          bind='127.0.0.1:0',
+                          concurrency=cls.cfg.concurrency)
+        cls.app_cfg = yield from pulsar.send('arbiter', 'run', server)
+        cls.pulsards_uri = 'pulsar://%s:%s' % cls.app_cfg.addresses[0]
+        cls.store = cls.create_store('%s/9' % cls.pulsards_uri,
+                                     cache_size='1mb')
+        cls.client = cls.store.client()
+        cls.other = cls.create_store('%s/9' % cls.pulsards_uri).client()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.app_cfg is not None:
+            return pulsar.send('arbiter', 'kill_actor', cls.app_cfg.name)
+
+    def wait(self, condition):
+        for _ in range(100):
+            if condition():
+                break
+            yield from asyncio.sleep(0.02)
+        self.assertTrue(condition())
+
+    def cached_get(self, key, value):
+        cache = self.store.cache
+        yield from self.async.assertEqual(self.client.get(key), value)
+        yield from self.wait(lambda: cache.ready)
+        yield from self.async.assertEqual(self.client.get(key), value)
+        hits = cache.hits
+        yield from self.async.assertEqual(self.client.get(key), value)
+        self.assertEqual(cache.hits, hits + 1)
+
+    def test_invalidate(self):
+        key = self.randomkey()
+        cache = self.store.cache
+        yield from self.other.set(key, 'a')
+        yield from self.cached_get(key, b'a')
+        invalidations = cache.invalidations
+        yield from self.other.set(key, 'b')
+        yield from self.wait(lambda: cache.invalidations > invalidations)
+        yield from self.cached_get(key, b'b')
+
+    def test_read_own_writes(self):
+        key = self.randomkey()
+        c = self.client
+        yield from c.hmset(key, {'a': 1})
+        yield from self.wait(lambda: self.store.cache.ready)
+        yield from self.async.assertEqual(c.hgetall(key), {b'a': b'1'})
+        yield from c.hset(key, 'b', 2)
+        yield from self.async.assertEqual(c.hgetall(key),
+                                          {b'a': b'1', b'b': b'2'})
+
+    def test_replies_not_shared(self):
+        key = self.randomkey()
+        c = self.client
+        yield from c.sadd(key, 1, 2)
+        yield from self.wait(lambda: self.store.cache.ready)
+        value = yield from c.smembers(key)
+        value.add(b'3')
+        yield from self.async.assertEqual(c.smembers(key), set((b'1', b'2')))
+
+    def test_expire(self):
+        key = self.randomkey()
+        cache = self.store.cache
+        yield from self.other.set(key, 'a')
+        yield from self.other.pexpire(key, 50)
+        yield from self.cached_get(key, b'a')
+        invalidations = cache.invalidations
+        yield from asyncio.sleep(0.1)
+        yield from self.other.get(key)
+        yield from self.wait(lambda: cache.invalidations > invalidations)
+        yield from self.async.assertEqual(self.client.get(key), None)
+
+    def test_eviction(self):
+        key = self.randomkey()
+        store = self.create_store('%s/9' % self.pulsards_uri,
+                                  cache_size=10000)
+        c = store.client()
+        cache = store.cache
+        yield from c.get(key)
+        yield from self.wait(lambda: cache.ready)
+        for n in range(20):
+            yield from self.other.set('%s%s' % (key, n), 1000*'x')
+            yield from c.get('%s%s' % (key, n))
+        self.assertTrue(cache.evictions > 0)
+        self.assertTrue(cache.used_memory <= 10000)
+        self.assertEqual(cache.info()['keys'], len(cache))
+        store.close()
+
+
+class TestPulsarStoreCorruptSnapshot(StoreMixin, unittest.TestCase):
+    app_cfg = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.filename = os.path.join(tempfile.gettempdir(),
+                                    '%s.rdb' % cls.randomkey(8))
+        with open(cls.filename, 'wb') as file:
+            writer = snapshot.SnapshotWriter(file)
+            writer.select(9)
+            for n in range(1000):
+                writer.write(('key%s' % n).encode('utf-8'), bytearray(b'a'))
+            writer.close()
+            file.truncate(file.tell() - 100)
+        with open(cls.filename, 'rb') as file:
+            cls.data = file.read()
+        server = PulsarDS(name=cls.__name__.lower(),
+                          bind='127.0.0.1:0',
+                          concurrency=cls.cfg.concurrency,
+                          key_value_filename=cls.filename)
+        cls.app_cfg = yield from pulsar.send('arbiter', 'run', server)
+        cls.pulsards_uri = 'pulsar://%s:%s' % cls.app_cfg.addresses[0]
+        cls.store = cls.create_store('%s/9' % cls.pulsards_uri)
+        cls.client = cls.store.client()
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.filename)
+        if cls.app_cfg is not None:
+            return pulsar.send('arbiter', 'kill_actor', cls.app_cfg.name)
+
+    def test_partial_data_cleared(self):
+        c = self.client
+        for _ in range(100):
+            info = yield from c.execute('info', 'persistence')
+            if not info['loading']:
+                break
+            yield from asyncio.sleep(0.02)
+        yield from self.async.assertEqual(c.dbsize(), 0)
+        with open(self.filename, 'rb') as file:
+            self.assertEqual(file.read(), self.data)
+
+
+class TestPulsarStoreSharded(StoreMixin, unittest.TestCase):
+    app_cfg = None
+
+    @classmethod
+    def setUpClass(cls):
+        server = PulsarDS(name=cls.__name__.lower(),
+                          bind='127.0.0.1:0',
+                          concurrency=cls.cfg.concurrency,
+                          workers=3,
+                          key_value_shards=True)
+        cls.app_cfg = yield from pulsar.send('arbiter', 'run', server)
+        cls.pulsards_uri = 'pulsar://%s:%s' % cls.app_cfg.addresses[0]
+        cls.store = cls.create_store('%s/9' % cls.pulsards_uri)
+        cls.client = cls.store.client()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.app_cfg is not None:
+            return pulsar.send('arbiter', 'kill_actor', cls.app_cfg.name)
+
+    def keys(self, n):
+        key = self.randomkey()
+        return ['%s_%s' % (key, i) for i in range(n)]
+
+    def test_mset_mget(self):
+        c = self.client
+        keys = self.keys(20)
+        yield from self.async.assertEqual(
+            c.mset(*[v for k in keys for v in (k, k)]), True)
+        values = yield from c.mget(*(keys + ['%s_x' % keys[0]]))
+        self.assertEqual(values, [k.encode('utf-8') for k in keys] + [None])
+        for key in keys:
+            yield from self.async.assertEqual(c.get(key), key.encode('utf-8'))
+        yield from self.async.assertEqual(c.exists(*keys), 20)
+        yield from self.async.assertEqual(c.delete(*keys), 20)
+        yield from self.async.assertEqual(c.exists(*keys), 0)
+
+    def test_sunionstore(self):
+        c = self.client
+        keys = self.keys(6)
+        for n, key in enumerate(keys[1:]):
+            yield from c.sadd(key, n, n + 1)
+        yield from self.async.assertEqual(c.sunionstore(*keys), 6)
+        yield from self.async.assertEqual(
+            c.smembers(keys[0]), set((str(n).encode('utf-8')
+                                      for n in range(6))))
+        yield from self.async.assertEqual(c.sinter(*keys[1:3]), set([b'1']))
+
+    def test_rename(self):
+        c = self.client
+        keys = self.keys(10)
+        yield from c.set(keys[0], 'hello')
+        for key1, key2 in zip(keys, keys[1:]):
+            yield from self.async.assertEqual(c.rename(key1, key2), True)
+            yield from self.async.assertEqual(c.exists(key1), 0)
+        yield from self.async.assertEqual(c.get(keys[-1]), b'hello')
+
+    def test_rename_ttl(self):
+        c = self.client
+        keys = self.keys(10)
+        yield from c.set(keys[0], 'hello')
+        yield from c.pexpire(keys[0], 100000)
+        for key1, key2 in zip(keys, keys[1:]):
+            yield from self.async.assertEqual(c.rename(key1, key2), True)
+        ttl = yield from c.pttl(keys[-1])
+        self.assertTrue(0 < ttl <= 100000)
+
+    def test_rpoplpush_ttl(self):
+        c = self.client
+        keys = self.keys(10)
+        for key in keys:
+            yield from c.rpush(key, 1)
+            yield from c.pexpire(key, 100000)
+        for key1, key2 in zip(keys, keys[1:]):
+            yield from self.async.assertEqual(c.rpoplpush(key2, key1), b'1')
+        ttl = yield from c.pttl(keys[0])
+        self.assertTrue(0 < ttl <= 100000)
+
+    def test_transaction(self):
+        c = self.client
+        key = self.randomkey()
+        keys = ['{%s}%s' % (key, n) for n in range(10)]
+        pipe = c.pipeline()
+        for key in keys:
+            pipe.set(key, key)
+            pipe.get(key)
+        result = yield from pipe.commit()
+        self.assertEqual(result[1::2], [k.encode('utf-8') for k in keys])
+        info = yield from c.execute('info', 'cluster')
+        if info:
+            pipe = c.pipeline()
+            for key in self.keys(10):
+                pipe.set(key, key)
+            yield from self.async.assertRaises(ResponseError, pipe.commit)
+
+    def test_hash_tags(self):
+        c = self.client
+        key = self.randomkey()
+        keys = ['{%s}%s' % (key, n) for n in range(5)]
+        yield from c.rpush(keys[0], 1, 2, 3)
+        for key1, key2 in zip(keys, keys[1:]):
+            yield from self.async.assertEqual(c.rpoplpush(key1, key2), b'3')
+            yield from c.rpush(key2, 2, 3)
+        yield from self.async.assertEqual(c.lrange(keys[-1], 0, -1),
+                                          [b'3', b'2', b'3'])
+
+    def test_scan(self):
+        c = self.client
+        keys = set((k.encode('utf-8') for k in self.keys(50)))
+        yield from c.mset(*[v for k in keys for v in (k, 1)])
+        pattern = '%s_*' % keys.pop().decode('utf-8').split('_')[0]
+        cursor, result = b'0', set()
+        while True:
+            cursor, elements = yield from c.execute('scan', cursor, 'match',
+                                                    pattern, 'count', 5)
+            result.update(elements)
+            if cursor == b'0':
+                break
+        self.assertEqual(len(result), 50)
+
+    def test_info(self):
+        info = yield from self.client.execute('info', 'cluster')
+        if info:
+            self.assertEqual(info['cluster_enabled'], 1)
+            self.assertEqual(info['shards'], 3)
+
+    def test_client_cache(self):
+        store = self.create_store('%s/9' % self.pulsards_uri,
+                                  cache_size='1mb')
+        c, cache = store.client(), store.cache
+        keys = self.keys(10)
+        for key in keys:
+            yield from self.client.set(key, 'a')
+            yield from c.get(key)
+        for _ in range(100):
+            if cache.ready:
+                break
+            yield from asyncio.sleep(0.02)
+        for key in keys:
+            yield from self.async.assertEqual(c.get(key), b'a')
+        self.assertEqual(len(cache), 10)
+        for key in keys:
+            yield from self.client.set(key, 'b')
+        for _ in range(100):
+            if not len(cache):
+                break
+            yield from asyncio.sleep(0.02)
+        for key in keys:
+            yield from self.async.assertEqual(c.get(key), b'b')
+        store.close()
@@ -1,7 +1,23 @@
+import os
 import re
+import tempfile
 import unittest
+from io import BytesIO
 
+from pulsar.utils.structures import Dict, Deque, Zset
 from pulsar.apps.ds import redis_to_py_pattern
+from pulsar.apps.ds.expiry import ExpiryIndex
+from pulsar.apps.ds import snapshot
+from pulsar.apps.ds.parser import PyRedisParser
+from pulsar.apps.ds.aof import AofReader, rewrite_aof
+from pulsar.apps.ds.scan import ScanCursors, InvalidCursor, pattern_matcher
+from pulsar.apps.ds import encoding
+from pulsar.apps.ds import memory
+from pulsar.apps.ds import cluster
+from pulsar.apps.ds.server import Db
+from pulsar import ImproperlyConfigured
+from pulsar.apps.data import create_store
+from pulsar.apps.data.redis.cache import ClientCache
 
 
 class TestUtils(unittest.TestCase):
@@ -33,3 +49,453 @@ class TestUtils(unittest.TestCase):
         self.match(c, 'hello')
         self.match(c, 'hallo')
         self.not_match(c, 'hollo')
+
+
+class TestExpiryIndex(unittest.TestCase):
+
+    def test_expired(self):
+        index = ExpiryIndex()
+        index.add(b'a', 3)
+        index.add(b'b', 1)
+        index.add(b'c', 2)
+        self.assertEqual(index.next_deadline(), 1)
+        self.assertEqual(list(index.expired(2)), [b'b', b'c'])
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.next_deadline(), 3)
+
+    def test_stale_entries(self):
+        index = ExpiryIndex()
+        index.add(b'a', 1)
+        index.add(b'a', 5)
+        index.add(b'b', 2)
+        index.pop(b'b')
+        self.assertEqual(index.stale, 2)
+        self.assertEqual(list(index.expired(4)), [])
+        self.assertEqual(list(index.expired(5)), [b'a'])
+        self.assertFalse(index)
+
+    def test_compact(self):
+        index = ExpiryIndex()
+        for n in range(200):
+            index.add(b'a', n)
+        self.assertEqual(len(index), 1)
+        self.assertTrue(index.stale < 70)
+        index.clear()
+        self.assertEqual(index.next_deadline(), None)
+
+
+class TestSnapshot(unittest.TestCase):
+    types = {snapshot.TYPE_STRING: bytearray,
+             snapshot.TYPE_LIST: Deque,
+             snapshot.TYPE_SET: set,
+             snapshot.TYPE_HASH: Dict,
+             snapshot.TYPE_ZSET: Zset}
+
+    def dump(self, compress=False):
+        file = BytesIO()
+        writer = snapshot.SnapshotWriter(file, compress)
+        writer.select(0)
+        writer.write(b'string', bytearray(b'hello'))
+        writer.write(b'hash', Dict(((b'a', b'1'), (b'b', b'2'))), 1000.5)
+        writer.select(3)
+        writer.write(b'zset', Zset(((1.5, b'a'), (-2, b'b'))))
+        writer.write(b'set', set((b'x', b'y')))
+        for n in range(5000):
+            writer.write(('list%s' % n).encode('utf-8'),
+                         Deque((b'foo', b'bar')))
+        writer.close()
+        self.assertEqual(writer.size, len(file.getvalue()))
+        file.seek(0)
+        return file
+
+    def _test_roundtrip(self, compress):
+        file = self.dump(compress)
+        self.assertTrue(snapshot.is_snapshot(file))
+        reader = snapshot.SnapshotReader(file, self.types)
+        records = list(reader.records())
+        self.assertEqual(len(records), 5004)
+        self.assertEqual(records[0], (0, b'string', b'hello', None))
+        self.assertEqual(records[1], (0, b'hash', {b'a': b'1', b'b': b'2'},
+                                      1000.5))
+        self.assertEqual(records[2][:2], (3, b'zset'))
+        self.assertEqual(list(records[2][2].items()),
+                         [(-2, b'b'), (1.5, b'a')])
+        self.assertEqual(records[3][2], set((b'x', b'y')))
+        self.assertEqual(records[-1][2], Deque((b'foo', b'bar')))
+        self.assertEqual(reader.keys, 5004)
+
+    def test_roundtrip(self):
+        self._test_roundtrip(False)
+
+    def test_roundtrip_compressed(self):
+        self._test_roundtrip(True)
+        self.assertTrue(len(self.dump(True).getvalue()) <
+                        len(self.dump().getvalue()))
+
+    def test_checksum(self):
+        data = bytearray(self.dump().getvalue())
+        data[len(data)//2] ^= 1
+        reader = snapshot.SnapshotReader(BytesIO(bytes(data)), self.types)
+        self.assertRaises(snapshot.SnapshotError, list, reader.records())
+
+    def test_truncated(self):
+        data = self.dump().getvalue()[:-100]
+        reader = snapshot.SnapshotReader(BytesIO(data), self.types)
+        self.assertRaises(snapshot.SnapshotError, list, reader.records())
+
+    def test_not_a_snapshot(self):
+        self.assertRaises(snapshot.SnapshotError, snapshot.SnapshotReader,
+                          BytesIO(b'bla'), self.types)
+
+
+class TestAof(unittest.TestCase):
+
+    def rewrite(self, dbs):
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, filename)
+        rewrite_aof(filename, dbs, PyRedisParser())
+        with open(filename, 'rb') as file:
+            return file.read()
+
+    def requests(self, data):
+        reader = AofReader(BytesIO(data), PyRedisParser())
+        return list(reader.requests())
+
+    def test_rewrite(self):
+        hash = Dict(((('f%s' % n).encode('utf-8'), str(n).encode('utf-8'))
+                     for n in range(100)))
+        data = {b'string': bytearray(b'hello'),
+                b'hash': hash}
+        data = self.rewrite([(2, data, {b'string': 10.5}, 1000)])
+        requests = self.requests(data)
+        self.assertEqual(requests[0], [b'select', b'2'])
+        commands = [r[0] for r in requests]
+        self.assertEqual(commands.count(b'hmset'), 2)
+        self.assertEqual(commands.count(b'set'), 1)
+        self.assertTrue([b'pexpireat', b'string', b'1010500'] in requests)
+        fields = {}
+        for request in requests:
+            if request[0] == b'hmset':
+                self.assertEqual(request[1], b'hash')
+                items = request[2:]
+                fields.update(zip(items[::2], items[1::2]))
+        self.assertEqual(fields, hash)
+
+    def test_truncated(self):
+        data = self.rewrite([(0, {b'list': Deque((b'a', b'b'))}, {}, 0)])
+        self.assertEqual(len(self.requests(data)), 2)
+        self.assertRaises(ValueError, self.requests, data[:-3])
+
+
+class TestScan(unittest.TestCase):
+
+    def test_pattern_matcher(self):
+        self.assertEqual(pattern_matcher(b'*'), None)
+        match = pattern_matcher(b'foo')
+        self.assertTrue(match(b'foo'))
+        self.assertFalse(match(b'foox'))
+        match = pattern_matcher(b'foo:*')
+        self.assertTrue(match(b'foo:'))
+        self.assertTrue(match(b'foo:bla'))
+        self.assertFalse(match(b'xfoo:bla'))
+        match = pattern_matcher(b'f?o*')
+        self.assertTrue(match(b'fxo'))
+        self.assertFalse(match(b'xfxo'))
+
+    def test_small_collection(self):
+        cursors = ScanCursors()
+        self.assertEqual(cursors.scan(0, 'a', set((1, 2, 3)), 10)[0], 0)
+        self.assertEqual(len(cursors), 0)
+
+    def scan_all(self, cursors, owner, data, count, callback=None):
+        cursor, result = cursors.scan(0, owner, data, count)
+        while cursor:
+            if callback:
+                callback()
+            cursor, elements = cursors.scan(cursor, owner, data, count)
+            result.extend(elements)
+        return result
+
+    def test_stable_cursor(self):
+        cursors = ScanCursors()
+        data = dict(((n, n) for n in range(100)))
+        cursor, result = cursors.scan(0, 'a', data, 30)
+        self.assertTrue(cursor)
+        self.assertEqual(len(cursors), 1)
+        for n in range(100, 1000):
+            data[n] = n
+        while cursor:
+            cursor, elements = cursors.scan(cursor, 'a', data, 30)
+            result.extend(elements)
+        self.assertTrue(set(range(100)).issubset(result))
+        self.assertEqual(len(cursors), 0)
+
+    def test_removed_elements(self):
+        cursors = ScanCursors()
+        data = dict(((n, n) for n in range(100)))
+        removed = iter(range(0, 100, 7))
+
+        def remove():
+            data.pop(next(removed, None), None)
+
+        result = set(self.scan_all(cursors, 'a', data, 5, remove))
+        self.assertTrue(set(data).issubset(result))
+
+    def test_added_and_removed_elements(self):
+        cursors = ScanCursors()
+        data = dict(((n, n) for n in range(100)))
+        added = iter(range(100, 1000))
+
+        def change():
+            data.pop(min(data), None)
+            data.pop(min(data), None)
+            for _ in range(3):
+                n = next(added)
+                data[n] = n
+
+        first = set(data)
+        result = set(self.scan_all(cursors, 'a', data, 5, change))
+        self.assertTrue((first & set(data)).issubset(result))
+
+    def test_returned_elements_removed(self):
+        cursors = ScanCursors()
+        data = dict(((n, n) for n in range(100)))
+        cursor, result = cursors.scan(0, 'a', data, 10)
+        for n in result:
+            data.pop(n)
+        for n in range(100, 120):
+            data[n] = n
+        while cursor:
+            cursor, elements = cursors.scan(cursor, 'a', data, 10)
+            result.extend(elements)
+        self.assertTrue(set(range(10, 100)).issubset(result))
+
+    def test_no_cached_iterator(self):
+        cursors = ScanCursors()
+        data = dict(((n, n) for n in range(100)))
+
+        def clear():
+            cursors.clear()
+            data.pop(len(data) - 1)
+
+        result = self.scan_all(cursors, 'a', data, 10, clear)
+        self.assertTrue(set(data).issubset(result))
+
+    def test_interleaved(self):
+        cursors = ScanCursors()
+        cursors.max_cursors = 4
+        collections = [dict(((n, n) for n in range(50*i, 50*i + 50)))
+                       for i in range(10)]
+        iterations = [cursors.scan(0, i, data, 3)
+                      for i, data in enumerate(collections)]
+        results = [list(r) for _, r in iterations]
+        cursor_list = [c for c, _ in iterations]
+        while any(cursor_list):
+            for i, data in enumerate(collections):
+                if cursor_list[i]:
+                    cursor_list[i], elements = cursors.scan(
+                        cursor_list[i], i, data, 3)
+                    results[i].extend(elements)
+            self.assertTrue(len(cursors) <= 4)
+        for data, result in zip(collections, results):
+            self.assertEqual(sorted(result), sorted(data))
+
+    def test_invalid_cursor(self):
+        cursors = ScanCursors()
+        self.assertRaises(InvalidCursor, cursors.scan, 2**64, 'a',
+                          list(range(100)), 10)
+
+
+class TestEncoding(unittest.TestCase):
+
+    def _test_roundtrip(self, value):
+        cls = encoding.packed_types[type(value)]
+        packed = cls.from_value(value, 300)
+        self.assertTrue(isinstance(packed, encoding.Packed))
+        self.assertEqual(packed.unpack(), value)
+        self.assertEqual(type(packed.unpack()), type(value))
+        return packed
+
+    def test_hash(self):
+        value = Dict(((b'a', b'1'), (b'bb', b''), (b'c', 256*b'x')))
+        self._test_roundtrip(value)
+        self.assertEqual(encoding.PackedHash.from_value(value, 64), None)
+
+    def test_list(self):
+        packed = self._test_roundtrip(Deque((b'a', b'b', b'a')))
+        self.assertEqual(list(packed.entries()), [b'a', b'b', b'a'])
+
+    def test_set(self):
+        self._test_roundtrip(set((b'a', b'b', b'c')))
+
+    def test_zset(self):
+        packed = self._test_roundtrip(Zset(((1.5, b'a'), (-3, b'b'),
+                                            (1e100, b'c'))))
+        self.assertEqual(list(packed.unpack().items()),
+                         [(-3, b'b'), (1.5, b'a'), (1e100, b'c')])
+
+    def test_compact(self):
+        value = Dict(((('field%s' % n).encode('utf-8'),
+                       ('value%s' % n).encode('utf-8')) for n in range(10)))
+        packed = encoding.PackedHash.from_value(value, 64)
+        self.assertTrue(len(packed) < 200)
+
+    def test_read_packed(self):
+        store = type('Store', (), {'_loop': None, '_maxmemory': 0,
+                                   '_track_access': False, '_writing': False,
+                                   '_hit_keys': 0, '_missed_keys': 0,
+                                   '_unpacked_values': 0})()
+        db = Db(0, store)
+        value = Dict(((b'a', b'1'), (b'b', b'2')))
+        packed = encoding.PackedHash.from_value(value, 64)
+        db._data[b'h'] = packed
+        self.assertEqual(db.get(b'h'), value)
+        self.assertIs(db._data[b'h'], packed)
+        self.assertFalse(db._unpacked)
+        store._writing = True
+        self.assertEqual(db.get(b'h'), value)
+        self.assertEqual(db._data[b'h'], value)
+        self.assertEqual(db._unpacked, set((b'h',)))
+        self.assertEqual(store._unpacked_values, 1)
+
+
+class TestMemory(unittest.TestCase):
+
+    def test_parse_memory(self):
+        self.assertEqual(memory.parse_memory(100), 100)
+        self.assertEqual(memory.parse_memory('100'), 100)
+        self.assertEqual(memory.parse_memory('2kb'), 2048)
+        self.assertEqual(memory.parse_memory('1.5mb'), 1572864)
+        self.assertEqual(memory.parse_memory('1G'), 10**9)
+        self.assertRaises(TypeError, memory.parse_memory, '1tb')
+
+    def test_estimate(self):
+        small = memory.estimate(b'key', bytearray(10))
+        large = memory.estimate(b'key', bytearray(10000))
+        self.assertTrue(large - small >= 9990)
+        hash = Dict(((str(n).encode('utf-8'), 100*b'x')
+                     for n in range(1000)))
+        self.assertTrue(memory.estimate(b'key', hash) > 100000)
+        zset = Zset(((n, str(n).encode('utf-8')) for n in range(1000)))
+        self.assertTrue(memory.estimate(b'key', zset) > 200000)
+        self.assertTrue(memory.estimate(b'key', Deque()) > 0)
+
+    def test_lfu(self):
+        clock = memory.lfu_touch(None, 10)
+        self.assertEqual(clock >> 8, 10)
+        counter = memory.lfu_counter(clock, 10)
+        self.assertTrue(counter >= memory.LFU_INIT_VAL)
+        for _ in range(1000):
+            clock = memory.lfu_touch(clock, 10)
+        self.assertTrue(memory.lfu_counter(clock, 10) > counter)
+        self.assertTrue(memory.lfu_counter(clock, 12) <
+                        memory.lfu_counter(clock, 10))
+
+
+class TestCluster(unittest.TestCase):
+
+    def test_key_slot(self):
+        # same values as redis cluster
+        self.assertEqual(cluster.key_slot(b'123456789'), 0x31c3)
+        self.assertEqual(cluster.key_slot(b'foo'), 12182)
+        self.assertEqual(cluster.key_slot(b'{user1000}.following'),
+                         cluster.key_slot(b'user1000'))
+        self.assertEqual(cluster.key_slot(b'foo{}{bar}'),
+                         cluster.key_slot(b'foo{}{bar}'))
+        self.assertNotEqual(cluster.key_slot(b'foo{}{bar}'),
+                            cluster.key_slot(b'bar'))
+
+    def test_command_keys(self):
+        keys = cluster.command_keys
+        self.assertEqual(keys(['get', b'a']), [b'a'])
+        self.assertEqual(keys(['get']), [])
+        self.assertEqual(keys(['ping']), ())
+        self.assertEqual(keys(['mset', b'a', b'1', b'b', b'2']), [b'a', b'b'])
+        self.assertEqual(keys(['blpop', b'a', b'b', b'0']), [b'a', b'b'])
+        self.assertEqual(keys(['bitop', b'and', b'd', b'a']), [b'd', b'a'])
+        self.assertEqual(keys(['zunionstore', b'd', b'2', b'a', b'b',
+                               b'weights', b'1', b'2']),
+                         [b'd', b'a', b'b'])
+        self.assertEqual(keys(['eval', b'return 1', b'1', b'a', b'b']),
+                         [b'a'])
+        self.assertEqual(keys(['eval', b'return 1', b'x']), ())
+        self.assertEqual(keys(['sort', b'a', b'limit', b'0', b'1',
+                               b'store', b'd']), [b'a', b'd'])
+        self.assertEqual(keys(['object', b'encoding', b'a']), [b'a'])
+
+    def test_reply_end(self):
+        end = cluster.reply_end
+        self.assertEqual(end(b'+OK\r\n'), 5)
+        self.assertEqual(end(b'+OK\r'), -1)
+        self.assertEqual(end(b'$3\r\nfoo\r\n:1\r\n'), 9)
+        self.assertEqual(end(b'$3\r\nfoo\r'), -1)
+        self.assertEqual(end(b'$-1\r\n'), 5)
+        reply = b'*2\r\n$1\r\na\r\n*1\r\n:5\r\n'
+        self.assertEqual(end(reply + b'+OK\r\n'), len(reply))
+        self.assertEqual(end(reply[:-1]), -1)
+        self.assertEqual(end(b'*-1\r\n'), 5)
+        self.assertEqual(end(b'-ERR x\r\n+OK\r\n', 8), 13)
+
+    def test_shards(self):
+        shards = [cluster.Cluster(i, [('127.0.0.1', 7000 + n)
+                                      for n in range(3)])
+                  for i in range(3)]
+        self.assertEqual(shards[0].first_slot, 0)
+        self.assertEqual(shards[2].last_slot, cluster.SLOTS - 1)
+        for a, b in zip(shards, shards[1:]):
+            self.assertEqual(a.last_slot + 1, b.first_slot)
+        c = shards[0]
+        for n in range(100):
+            key = ('key%s' % n).encode('utf-8')
+            owner = shards[c.shard(key)]
+            slot = cluster.key_slot(key)
+            self.assertTrue(owner.first_slot <= slot <= owner.last_slot)
+        self.assertEqual(c.owner([b'{a}1', b'{a}2']), c.shard(b'a'))
+        keys = [('key%s' % n).encode('utf-8') for n in range(20)]
+        self.assertEqual(c.owner(keys), None)
+        groups = c.split(keys)
+        self.assertEqual(sorted(i for g in groups.values() for i in g),
+                         list(range(20)))
+        self.assertEqual(cluster.shard_filename('pulsards.rdb', 2),
+                         'pulsards.2.rdb')
+
+
+class CacheStore:
+    _loop = None
+    _database = 3
+
+
+class TestClientCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = ClientCache(CacheStore(), 3000)
+        for n in range(10):
+            cache.set((3, str(n).encode('utf-8')), ('GET', ()), 500*b'x')
+            self.assertEqual(cache.get((3, b'0'), ('GET', ())), 500*b'x')
+        self.assertTrue(cache.used_memory <= 3000)
+        self.assertTrue(cache.evictions > 0)
+        self.assertEqual(cache.get((3, b'0'), ('GET', ())), 500*b'x')
+        self.assertEqual(cache.get((3, b'1'), ('GET', ())), None)
+
+    def test_invalidate(self):
+        cache = ClientCache(CacheStore(), 100000)
+        cache.set((3, b'a'), ('GET', ()), b'1')
+        cache.set((3, b'a'), ('STRLEN', ()), 1)
+        cache.set((3, b'b'), ('SMEMBERS', ()), set((b'1', b'2')))
+        self.assertEqual(len(cache), 2)
+        cache.invalidate(b'a')
+        self.assertEqual(cache.get((3, b'a'), ('GET', ())), None)
+        self.assertEqual(cache.invalidations, 1)
+        cache.written([(('sadd', 'b', 'c'), {})])
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.used_memory, 0)
+        cache.set((3, b'a'), ('GET', ()), b'1')
+        cache.written([(('get', 'a'), {})])
+        self.assertEqual(len(cache), 1)
+        cache.written([(('flushdb',), {})])
+        self.assertEqual(len(cache), 0)
+
+    def test_pulsards_only(self):
+        self.assertRaises(ImproperlyConfigured, create_store,
+                          'redis://127.0.0.1:6379/3', cache_size='1mb')
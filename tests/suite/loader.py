@@ -6,9 +6,10 @@ import unittest
 from threading import current_thread
 
 from pulsar import get_actor, get_application
-from pulsar.apps.test import TestLoader
+from pulsar.apps.test import TestLoader, non_parallel
 
 
+@non_parallel
 class TestTestLoader(unittest.TestCase):
 
     def test_testsuite(self):
@@ -5,7 +5,9 @@ from threading import current_thread
 
 import pulsar
 from pulsar import asyncio, send, multi_async, get_event_loop, Future
-from pulsar.apps.test import TestSuite, sequential
+from pulsar.apps.test import (TestSuite, TestResult, sequential,
+                              non_parallel)
+from pulsar.apps.test.runner import Dispatcher
 from pulsar.apps.test.plugins import bench, profile
 from pulsar.utils.version import get_version
 
@@ -20,6 +22,7 @@ def wait(actor, period=0.5):
     return actor._loop.time() - start
 
 
+@non_parallel
 class TestTestWorker(unittest.TestCase):
 
     def test_TestSuiteMonitor(self):
@@ -66,3 +69,69 @@ class TestTestWorker(unittest.TestCase):
     def test_meta(self):
         for m in ("__author__", "__contact__", "__homepage__", "__doc__"):
             self.assertTrue(getattr(pulsar, m, None))
+
+
+class Monitor:
+
+    def __init__(self, loop):
+        self._loop = loop
+        self.managed_actors = {}
+
+
+class Runner:
+
+    def __init__(self):
+        self.result = TestResult()
+
+
+@non_parallel
+class FakeTest(unittest.TestCase):
+    pass
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def dispatcher(self, timings=None):
+        tests = [('a', TestDispatcher), ('b', unittest.FunctionTestCase),
+                 ('c', unittest.TestCase), ('d', FakeTest)]
+        return Dispatcher(Monitor(get_event_loop()), Runner(), tests,
+                          timings or {})
+
+    def test_longest_first(self):
+        d = self.dispatcher({'a.TestDispatcher': 5,
+                             'b.FunctionTestCase': 1,
+                             'c.TestCase': 3})
+        self.assertEqual(d.local, [('d', FakeTest)])
+        self.assertEqual(d.next(1), 'a.TestDispatcher')
+        self.assertEqual(d.next(2), 'c.TestCase')
+        self.assertEqual(d.next(1), 'b.FunctionTestCase')
+        self.assertEqual(d.next(1), None)
+        self.assertFalse(d.done.done())
+        self.assertEqual(d.next(2), None)
+        self.assertTrue(d.done.done())
+
+    def test_merge_results(self):
+        d = self.dispatcher()
+        name = d.next(1)
+        result = TestResult()
+        result.startTest(self)
+        result.startTest(self)
+        result.addSkip(self, 'no reason')
+        d.next(1, {'result': result.collect(), 'timings': {name: 2}})
+        self.assertEqual(result.testsRun, 0)
+        self.assertFalse(result.skipped)
+        self.assertEqual(d.runner.result.testsRun, 2)
+        self.assertEqual(len(d.runner.result.skipped), 1)
+        self.assertEqual(d.timings, {name: 2})
+
+    def test_dead_worker(self):
+        d = self.dispatcher()
+        d.monitor.managed_actors[1] = None
+        name = d.next(1)
+        d.next(2)
+        d.check_workers()
+        self.assertEqual(list(d.pending), [1])
+        errors = d.runner.result.errors
+        self.assertEqual(len(errors), 1)
+        self.assertNotEqual(errors[0][0], name)
+        self.assertFalse(d.runner.result.wasSuccessful())
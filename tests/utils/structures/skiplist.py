@@ -84,6 +84,34 @@ class TestSkiplist(unittest.TestCase):
             self.assertEqual(sl.remove_range(index, index+1), 1)
         self.assertEqual(c, 100)
 
+    def test_ties(self):
+        sl = self.skiplist(((1, 'b'), (0, 'z'), (1, 'c'), (1, 'a')))
+        self.assertEqual(list(sl), [(0, 'z'), (1, 'a'), (1, 'b'), (1, 'c')])
+        self.assertEqual(sl.rank(1), 1)
+        self.assertEqual(sl.rank(1, 'c'), 3)
+        self.assertTrue(sl.rank(1, 'd') < 0)
+        self.assertEqual(sl.count(1, 1), 3)
+        self.assertTrue(sl.remove(1, 'b'))
+        self.assertFalse(sl.remove(1, 'b'))
+        self.assertEqual(list(sl), [(0, 'z'), (1, 'a'), (1, 'c')])
+
+    def test_remove(self):
+        sl = self.random()
+        items = list(sl)
+        while items:
+            score, value = items.pop(randint(0, len(items)-1))
+            self.assertTrue(sl.remove(score, value))
+            self.assertEqual(list(sl), sorted(items))
+
+    def test_range(self):
+        sl = self.random()
+        items = [value for _, value in sl]
+        self.assertEqual(list(sl.range(37, 52)), items[37:52])
+        self.assertEqual(list(sl.range(-10)), items[-10:])
+        self.assertEqual(list(sl.range(200)), [])
+        self.assertEqual(sl[63], items[63])
+        self.assertEqual(sl[-1], items[-1])
+
     def test_remove_range_by_score(self):
         sl = self.skiplist()
         self.assertEqual(sl.remove_range_by_score(0, 3), 0)
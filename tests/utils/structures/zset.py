@@ -39,6 +39,17 @@ class TestZset(unittest.TestCase):
         self.assertEqual(s.rank('pippo'), 3)
         self.assertEqual(s.rank('xxxx'), None)
 
+    def test_rank_ties(self):
+        s = self.zset()
+        s.update(((1, 'c'), (1, 'a'), (0, 'z'), (1, 'b')))
+        self.assertEqual(list(s), ['z', 'a', 'b', 'c'])
+        self.assertEqual(s.rank('b'), 2)
+        self.assertEqual(s.rank('c'), 3)
+        self.assertEqual(s.remove('b'), 1)
+        self.assertEqual(s.rank('c'), 2)
+        s.add(2, 'a')
+        self.assertEqual(list(s), ['z', 'c', 'a'])
+
     def test_update(self):
         s = self.random()
         self.assertTrue(s)
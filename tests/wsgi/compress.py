@@ -0,0 +1,105 @@
+'''Tests the GZipMiddleware'''
+import os
+import gzip
+import asyncio
+import unittest
+
+from pulsar import Future
+from pulsar.apps.wsgi import GZipMiddleware, WsgiResponse, test_wsgi_environ
+
+
+class TestGZipMiddleware(unittest.TestCase):
+
+    def environ(self):
+        return test_wsgi_environ(headers=[('accept-encoding', 'gzip')])
+
+    def test_not_available(self):
+        gz = GZipMiddleware(10)
+        response = WsgiResponse(200, b'xxx', content_type='text/plain')
+        self.assertFalse(gz.available(self.environ(), response))
+        response = WsgiResponse(200, 100*b'x', content_type='text/plain')
+        self.assertFalse(gz.available(test_wsgi_environ(), response))
+        self.assertTrue(gz.available(self.environ(), response))
+        response = WsgiResponse(200, 100*b'x', content_type='image/png')
+        self.assertFalse(gz.available(self.environ(), response))
+
+    def test_compress(self):
+        gz = GZipMiddleware(10, level=9, cache_size=1000)
+        data = 100*b'x'
+        response = gz(self.environ(),
+                      WsgiResponse(200, data, content_type='text/plain'))
+        self.assertEqual(response['content-encoding'], 'gzip')
+        self.assertEqual(response['vary'], 'Accept-Encoding')
+        compressed = b''.join(response.content)
+        self.assertEqual(gzip.decompress(compressed), data)
+        self.assertEqual(len(gz._cache), 1)
+        response = gz(self.environ(),
+                      WsgiResponse(200, data, content_type='text/plain'))
+        self.assertEqual(response.content, (compressed,))
+        self.assertEqual(len(gz._cache), 1)
+
+    def test_no_cache(self):
+        gz = GZipMiddleware(10)
+        response = gz(self.environ(),
+                      WsgiResponse(200, 100*b'x', content_type='text/plain'))
+        self.assertEqual(response['content-encoding'], 'gzip')
+        self.assertEqual(len(gz._cache), 0)
+
+    def test_cache_size(self):
+        gz = GZipMiddleware(10, level=1, cache_size=500)
+        payloads = [os.urandom(200) for _ in range(4)]
+        for data in payloads:
+            gz(self.environ(),
+               WsgiResponse(200, data, content_type='text/plain'))
+            self.assertTrue(gz._cache_used <= 500)
+        self.assertEqual(len(gz._cache), 2)
+        self.assertEqual(gz._cache_used,
+                         sum(len(v) for v in gz._cache.values()))
+        # payloads larger than the cache are not stored
+        gz(self.environ(),
+           WsgiResponse(200, os.urandom(1000), content_type='text/plain'))
+        self.assertEqual(len(gz._cache), 2)
+
+    def test_stream(self):
+        gz = GZipMiddleware(10)
+        response = WsgiResponse(200, (b'x'*n for n in range(1, 30)),
+                                content_type='text/plain')
+        response['content-length'] = str(sum(range(1, 30)))
+        response = gz(self.environ(), response)
+        self.assertFalse('content-length' in response)
+        chunks = list(response)
+        self.assertEqual(len(chunks), 30)
+        # each chunk is flushed and can be decompressed immediately
+        self.assertTrue(chunks[0])
+        self.assertEqual(gzip.decompress(b''.join(chunks)),
+                         b''.join((b'x'*n for n in range(1, 30))))
+
+    def test_stream_future(self):
+        gz = GZipMiddleware(10)
+        future = Future()
+        response = WsgiResponse(200, iter([b'a', future, 'c']),
+                                content_type='text/plain')
+        response = gz(self.environ(), response)
+        chunks = list(response)
+        self.assertEqual(len(chunks), 4)
+        self.assertIsInstance(chunks[0], bytes)
+        # chunks following a future wait for it
+        yield from asyncio.sleep(0.01)
+        self.assertFalse(chunks[1].done())
+        self.assertFalse(chunks[2].done())
+        self.assertFalse(chunks[3].done())
+        future.set_result(b'b')
+        for n in range(1, 4):
+            chunks[n] = yield from chunks[n]
+        self.assertEqual(gzip.decompress(b''.join(chunks)), b'abc')
+
+    def test_executor(self):
+        gz = GZipMiddleware(10, executor_length=100, cache_size=1000)
+        data = 1000*b'x'
+        response = gz(self.environ(),
+                      WsgiResponse(200, data, content_type='text/plain'))
+        chunks = list(response)
+        self.assertEqual(len(chunks), 1)
+        compressed = yield from chunks[0]
+        self.assertEqual(gzip.decompress(compressed), data)
+        self.assertEqual(len(gz._cache), 1)
@@ -0,0 +1,93 @@
+'''Tests the MediaCache of static files'''
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+from pulsar.apps.wsgi import MediaCache
+
+
+class TestMediaCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name, data):
+        fullpath = os.path.join(self.path, name)
+        with open(fullpath, 'wb') as f:
+            f.write(data)
+        return fullpath
+
+    def test_load(self):
+        cache = MediaCache()
+        fullpath = self.write('test.css', b'body {color: red}')
+        entry = cache.load('/test.css', fullpath)
+        self.assertEqual(entry.body, b'body {color: red}')
+        self.assertEqual(entry.content_type, 'text/css')
+        self.assertTrue(entry.etag.startswith('"'))
+        self.assertTrue(entry.last_modified)
+        self.assertEqual(cache.get('/test.css'), entry)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, entry.size)
+
+    def test_max_file_size(self):
+        cache = MediaCache(max_file_size=10)
+        fullpath = self.write('big.js', 20*b'x')
+        self.assertEqual(cache.load('/big.js', fullpath), None)
+        self.assertEqual(len(cache), 0)
+
+    def test_lru(self):
+        cache = MediaCache(max_entries=2)
+        for name in ('a.js', 'b.js', 'c.js'):
+            cache.load('/' + name, self.write(name, b'x'))
+        self.assertEqual(len(cache), 2)
+        self.assertFalse('/a.js' in cache)
+        cache = MediaCache(max_size=25)
+        for name in ('a.js', 'b.js', 'c.js'):
+            cache.load('/' + name, self.write(name, 10*b'x'))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size, 20)
+
+    def test_gzip(self):
+        cache = MediaCache()
+        data = 100*b'body {color: red}\n'
+        entry = cache.load('/test.css', self.write('test.css', data))
+        self.assertTrue(entry.compressible)
+        size = cache.size
+        body = cache.gzip(entry)
+        self.assertEqual(gzip.decompress(body), data)
+        self.assertEqual(cache.size, size + len(body))
+        self.assertEqual(cache.gzip(entry), body)
+
+    def test_gzip_sibling(self):
+        cache = MediaCache()
+        fullpath = self.write('test.js', b'var a = 1;')
+        self.write('test.js.gz', b'precompressed')
+        entry = cache.load('/test.js', fullpath)
+        self.assertEqual(cache.gzip(entry), b'precompressed')
+
+    def test_not_compressible(self):
+        cache = MediaCache()
+        entry = cache.load('/test.png', self.write('test.png', 100*b'x'))
+        self.assertFalse(entry.compressible)
+        self.assertEqual(cache.gzip(entry), None)
+        entry = cache.load('/test.txt', self.write('test.txt', b'x'))
+        self.assertEqual(cache.gzip(entry), None)
+        self.assertFalse(entry.compressible)
+
+    def test_invalidate(self):
+        cache = MediaCache(check_interval=0)
+        fullpath = self.write('test.js', b'var a = 1;')
+        cache.load('/test.js', fullpath)
+        entry = cache.get('/test.js')
+        self.assertTrue(entry)
+        self.write('test.js', b'var a = 12;')
+        self.assertEqual(cache.get('/test.js'), None)
+        self.assertEqual(cache.size, 0)
+        cache.load('/test.js', fullpath)
+        os.remove(fullpath)
+        self.assertEqual(cache.get('/test.js'), None)
@@ -117,6 +117,34 @@ class TestRouter(unittest.TestCase):
         self.assertEqual(child.parent, router)
         self.assertEqual(child.path(), '/root/a')
 
+    def test_resolve_order(self):
+        router = Router('/',
+                        Router('<name>'),
+                        Router('blog/<int:year>'),
+                        Router('blog/<slug>'),
+                        Router('blog/feed'))
+        child, args = router.resolve('blog')
+        self.assertEqual(child.rule, '<name>')
+        self.assertEqual(args, {'name': 'blog'})
+        child, args = router.resolve('blog/2015')
+        self.assertEqual(child.rule, 'blog/<int:year>')
+        self.assertEqual(args, {'year': 2015})
+        child, args = router.resolve('blog/feed')
+        self.assertEqual(child.rule, 'blog/<slug>')
+        self.assertEqual(router.resolve('blog/feed/'), None)
+
+    def test_resolve_invalidation(self):
+        router = Router('/', Router('a'))
+        self.assertEqual(router.resolve('b'), None)
+        child = router.add_child(Router('b'))
+        self.assertEqual(router.resolve('b'), (child, {}))
+        router.remove_child(child)
+        self.assertEqual(router.resolve('b'), None)
+        parent = Router('c/')
+        parent.add_child(child)
+        router.add_child(parent)
+        self.assertEqual(router.resolve('c/b'), (child, {}))
+
     def test_router_count(self):
         self.assertTrue(HttpBin2.rule_methods)
         async = HttpBin2.rule_methods.get('async')
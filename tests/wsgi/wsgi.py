@@ -1,6 +1,9 @@
 '''Tests the wsgi middleware in pulsar.apps.wsgi'''
+import os
 import time
 import sys
+import socket
+import asyncio
 import pickle
 import unittest
 from unittest import mock
@@ -9,8 +12,9 @@ from datetime import datetime, timedelta
 import pulsar
 from pulsar.apps import wsgi
 from pulsar.apps import http
-from pulsar.utils.multipart import parse_form_data, MultipartError
-from pulsar.utils.httpurl import urlparse, unquote
+from pulsar.utils.multipart import (parse_form_data, MultipartError,
+                                    MultipartFeedParser, MultipartLimitError)
+from pulsar.utils.httpurl import urlparse, unquote, encode_multipart_formdata
 from pulsar.apps.wsgi.utils import cookie_date
 
 
@@ -41,10 +45,97 @@ class WsgiRequestTests(unittest.TestCase):
         self.assertRaises(MultipartError, parse_form_data, environ,
                           strict=True)
 
+    def test_multipart_feed_parser(self):
+        data = os.urandom(300000)
+        body, ct = encode_multipart_formdata(
+            [('a', 'foo'), ('file', ('data.bin', data)), ('b', 'bar')],
+            boundary='pulsar')
+        for size in (1, 7, 4096, len(body)):
+            parser = MultipartFeedParser('pulsar', content_length=len(body))
+            parser.feed(body[:1000])
+            for i in range(1000, len(body), size):
+                parser.feed(body[i:i+size])
+            parts = parser.close()
+            self.assertEqual([p.name for p in parts], ['a', 'file', 'b'])
+            self.assertEqual(parts[0].string(), 'foo')
+            self.assertEqual(parts[1].filename, 'data.bin')
+            self.assertEqual(parts[1].bytes(), data)
+            self.assertFalse(parts[1].is_buffered())
+            self.assertEqual(parts[2].string(), 'bar')
+
+    def test_multipart_feed_parser_limits(self):
+        body, ct = encode_multipart_formdata(
+            [('a', 'foo'), ('file', ('data.bin', b'x'*1000))],
+            boundary='pulsar')
+        parser = MultipartFeedParser('pulsar', field_limit=2)
+        self.assertRaises(MultipartLimitError, parser.feed, body)
+        parser = MultipartFeedParser('pulsar', disk_limit=500)
+        self.assertRaises(MultipartLimitError, parser.feed, body)
+        self.assertRaises(MultipartLimitError, MultipartFeedParser, 'pulsar',
+                          content_length=1000, disk_limit=500)
+        parser = MultipartFeedParser('pulsar')
+        parser.feed(body[:-10])
+        self.assertRaises(MultipartError, parser.close)
+
+    def test_async_multipart_parser(self):
+        data = os.urandom(2**20)
+        body, ct = encode_multipart_formdata(
+            [('a', 'foo'), ('file', ('data.bin', data))], boundary='pulsar')
+        parser = wsgi.AsyncMultipartParser('pulsar', high_limit=2**16,
+                                           low_limit=2**14)
+        waited = 0
+        for i in range(0, len(body), 2**14):
+            waiter = parser.feed(body[i:i+2**14])
+            if waiter:
+                waited += 1
+                yield from waiter
+        self.assertTrue(waited)
+        parts = yield from parser.close()
+        self.assertEqual(parts[0].string(), 'foo')
+        self.assertEqual(parts[1].bytes(), data)
+
     def test_get_host(self):
         request = self.request(headers=[('host', 'blaa.com')])
         self.assertEqual(request.get_host(), 'blaa.com')
 
+    def test_server_name(self):
+        request = self.request(headers=[('host', 'blaa.com:8080')],
+                               resolver=lambda host: host.upper())
+        self.assertEqual(request.environ['SERVER_NAME'], 'BLAA.COM')
+        self.assertEqual(request.environ['SERVER_PORT'], '8080')
+
+    def test_fqdn_cache(self):
+        cache = wsgi.FqdnCache(ttl=60, negative_ttl=5)
+        host = 'localhost'
+        self.assertEqual(cache(host), host)
+        while cache._pending:
+            yield from asyncio.sleep(0.01)
+        self.assertEqual(len(cache), 1)
+        name, expiry = cache._cache[host]
+        self.assertEqual(cache(host), name)
+        self.assertEqual(name, socket.getfqdn(host))
+        ttl = 60 if name != host else 5
+        self.assertTrue(expiry - time.time() <= ttl)
+        self.assertFalse(cache._pending)
+
+    def test_fqdn_cache_max_pending(self):
+        cache = wsgi.FqdnCache(max_pending=2)
+        for n in range(5):
+            host = 'host%s.invalid' % n
+            self.assertEqual(cache(host), host)
+        self.assertEqual(len(cache._pending), 2)
+        while cache._pending:
+            yield from asyncio.sleep(0.01)
+        self.assertEqual(len(cache), 2)
+
+    def test_no_fqdn(self):
+        cfg = wsgi.WSGIServer(no_fqdn=True, fqdn_ttl=20).cfg
+        self.assertEqual(cfg.no_fqdn, True)
+        self.assertEqual(cfg.fqdn_ttl, 20)
+        response = wsgi.HttpServerResponse(None, cfg,
+                                           loop=pulsar.get_event_loop())
+        self.assertEqual(response._resolver('blaa.com'), 'blaa.com')
+
     def test_full_path(self):
         request = self.request(headers=[('host', 'blaa.com')])
         self.assertEqual(request.full_path(), '/')